@@ -62,6 +62,23 @@ Your extension can also define a hook for other extensions to use.  You can
 use the hook_invoke() method to call all functions registered for a hook you
 define.
 
+Hook functions run on the thread that invokes the hook, so they should be
+quick.  Each hook has a time budget (0.2 seconds by default, less for hooks
+called from the UI).  If a hook function raises an exception or goes over
+its budget several times in a row, the extension gets disabled.  Use
+hook_stats() to see how long hook functions take.
+
+Hooks that don't deal with UI objects can be run in the worker process
+instead, by listing them in the extension section of your config file::
+
+    [extension]
+    sandboxed_hooks = hook1, hook2
+
+Sandboxed hook functions are only used when the hook is invoked with
+hook_invoke_async().  They get imported in the worker process, so they can't
+rely on state set up by your load() function, and their arguments and return
+values must be picklable.
+
 
 .. Note::
 
@@ -81,12 +98,13 @@ __all__ = [
     "get_frontend",
     "get_support_directory",
     "hook_invoke",
+    "hook_invoke_async",
+    "hook_stats",
     ]
 
 # increase this by 1 every time the API changes
-APIVERSION = 0
+APIVERSION = 1
 
-import logging
 import os
 
 import sqlite3
@@ -308,14 +326,29 @@ def hook_invoke(hook_name, *args, **kwargs):
 
     We will return a list of return values, one for each registered hook.
     """
-    results = []
-    for ext in app.extension_manager.extensions_for_hook(hook_name):
-        try:
-            retval = ext.invoke_hook(hook_name, *args, **kwargs)
-        except StandardError:
-            # hook func raised an error.  Log it, then ignore
-            logging.exception("exception calling hook function %s ", ext.name)
-            continue
-        else:
-            results.append(retval)
-    return results
+    return app.extension_manager.invoke_hook(hook_name, *args, **kwargs)
+
+def hook_invoke_async(hook_name, callback, *args, **kwargs):
+    """Call all functions registered for a hook, running sandboxed hook
+    functions in the worker process.
+
+    callback will be called with a list of return values, one for each
+    registered hook, once they have all finished.
+    """
+    app.extension_manager.invoke_hook_async(hook_name, callback, *args,
+            **kwargs)
+
+def hook_stats():
+    """Get timing stats for hook functions.
+
+    Returns a list of dicts, one for each hook function that has been
+    called, with the slowest functions first.  The dicts have these keys:
+
+    - hook: name of the hook
+    - extension: name of the extension
+    - calls: number of times the function was called
+    - errors: number of calls that raised an exception
+    - over_budget: number of calls that went over the hook's time budget
+    - total_time, average_time, max_time: time spent in seconds
+    """
+    return app.extension_manager.get_hook_stats()
@@ -48,6 +48,9 @@ item_info_cache = None
 # command line arguments for thumbnailer (linux)
 movie_data_program_info = None
 
+# command line arguments for the long-running thumbnailer (linux)
+movie_data_server_info = None
+
 # configuration data
 config = None
 
@@ -77,6 +80,9 @@ downloader_config_watcher = None
 # download state manager
 download_state_manager = None
 
+# records play sessions (PlaybackStats)
+playback_stats = None
+
 # sends MetadataProgressUpdate messages to the frontend
 metadata_progress_updater = None
 
@@ -115,6 +121,9 @@ menu_manager = None
 # manages playback
 playback_manager = None
 
+# reports play sessions to the backend
+play_session_tracker = None
+
 # manages watched folders
 watched_folder_manager = None
 
@@ -97,6 +97,9 @@ class Controller:
         logging.info("Shutting down event loop thread")
         eventloop.shutdown()
         logging.info("Saving cached ItemInfo objects")
+        if app.playback_stats is not None:
+            logging.info("Writing play sessions")
+            app.playback_stats.flush()
         logging.info("Commiting DB changes")
         app.db.finish_transaction()
         if app.item_info_cache is not None:
@@ -249,6 +249,10 @@ class ViewTrackerManager(object):
         for tracker in self.trackers_for_table(table_name):
             tracker.check_all_objects()
 
+    def bulk_check_view_trackers(self, table_name, objects):
+        for tracker in self.trackers_for_table(table_name):
+            tracker.check_objects(objects)
+
     def bulk_remove_from_view_trackers(self, table_name, objects):
         for tracker in self.trackers_for_table(table_name):
             tracker.remove_objects(objects)
@@ -328,6 +332,18 @@ class ViewTracker(signals.SignalEmitter):
         elif before and now:
             self.emit('changed', self.fetcher.fetch_obj_for_ddb_object(obj))
 
+    def check_objects(self, objects):
+        """Check a list of changed objects.
+
+        This runs a single query for the entire view, rather than one query
+        per object like check_object() does.
+        """
+        old_ids = self.current_ids
+        self._update_current_ids(self._view_object_ids())
+        self._emit_for_objects('changed',
+            [self.fetcher.fetch_obj_for_ddb_object(obj) for obj in objects
+             if obj.id in old_ids and obj.id in self.current_ids])
+
     def _emit_for_objects(self, signal, objects):
         if self.bulk_mode:
             self.emit('bulk-' + signal, objects)
@@ -369,8 +385,10 @@ class BulkSQLManager(object):
         self.active = False
         self.to_insert = {}
         self.to_remove = {}
+        self.to_change = {}
         self.pending_inserts = set()
         self.pending_removes = set()
+        self.pending_changes = set()
 
         self.last_call = None
 
@@ -403,11 +421,15 @@ class BulkSQLManager(object):
         for x in range(100):
             to_insert = self.to_insert
             to_remove = self.to_remove
+            to_change = self.to_change
             self.to_insert = {}
             self.to_remove = {}
+            self.to_change = {}
+            self.pending_changes = set()
             self._commit_sql(to_insert, to_remove)
-            self._update_view_trackers(to_insert, to_remove)
-            if len(self.to_insert) == len(self.to_remove) == 0:
+            self._update_view_trackers(to_insert, to_remove, to_change)
+            if (len(self.to_insert) == len(self.to_remove) ==
+                    len(self.to_change) == 0):
                 break
             # inside _commit_sql() or _update_view_trackers(), we were
             # asked to insert or remove more items, repeat the
@@ -417,8 +439,10 @@ class BulkSQLManager(object):
                     "have items to commit.  Are we in a circular loop?")
         self.to_insert = {}
         self.to_remove = {}
+        self.to_change = {}
         self.pending_inserts = set()
         self.pending_removes = set()
+        self.pending_changes = set()
 
     def _commit_sql(self, to_insert, to_remove):
         for table_name, objects in to_insert.items():
@@ -433,19 +457,22 @@ class BulkSQLManager(object):
             for obj in objects:
                 obj.removed_from_db()
 
-    def _update_view_trackers(self, to_insert, to_remove):
+    def _update_view_trackers(self, to_insert, to_remove, to_change):
         # figure out the total number of objects that have changed
         changed_objs = set()
         for table_name, objects in to_insert.items():
             changed_objs.update(objects)
         for table_name, objects in to_remove.items():
             changed_objs.update(objects)
+        for table_name, objects in to_change.items():
+            changed_objs.update(objects)
         # Figure out which strategy is fastest based on the number of objects
         # that have changed
         if len(changed_objs) < 100:
             self._update_view_trackers_by_object(changed_objs)
         else:
-            self._update_view_trackers_by_table(to_insert, to_remove)
+            self._update_view_trackers_by_table(to_insert, to_remove,
+                                                to_change)
 
     def _update_view_trackers_by_object(self, changed_objs):
         """Update view trackers by checking each changed object.
@@ -456,7 +483,7 @@ class BulkSQLManager(object):
             app.view_tracker_manager.update_view_trackers(obj)
 
 
-    def _update_view_trackers_by_table(self, to_insert, to_remove):
+    def _update_view_trackers_by_table(self, to_insert, to_remove, to_change):
         """Update view trackers by checking each table
 
         This method is fastest when there are many changed objects
@@ -464,6 +491,13 @@ class BulkSQLManager(object):
         for table_name in to_insert:
             app.view_tracker_manager.bulk_update_view_trackers(table_name)
 
+        for table_name, objects in to_change.items():
+            if table_name in to_insert:
+                # already updated the view above
+                continue
+            app.view_tracker_manager.bulk_check_view_trackers(table_name,
+                                                              objects)
+
         for table_name, objects in to_remove.items():
             if table_name in to_insert:
                 # already updated the view above
@@ -487,8 +521,29 @@ class BulkSQLManager(object):
     def will_remove(self, id_):
         return id_ in self.pending_removes
 
+    def add_change(self, obj):
+        """Queue up a view tracker check for an object that changed.
+
+        The SQL UPDATE is still run immediately, but view trackers get
+        checked once for all changed objects when commit() is called.
+        """
+        if (obj.id in self.pending_changes or self.will_insert(obj.id) or
+                self.will_remove(obj.id)):
+            return
+        table_name = app.db.table_name(obj.__class__)
+        try:
+            changes_for_table = self.to_change[table_name]
+        except KeyError:
+            changes_for_table = []
+            self.to_change[table_name] = changes_for_table
+        changes_for_table.append(obj)
+        self.pending_changes.add(obj.id)
+
     def add_remove(self, obj):
         table_name = app.db.table_name(obj.__class__)
+        if obj.id in self.pending_changes:
+            self.to_change[table_name].remove(obj)
+            self.pending_changes.remove(obj.id)
         if self.will_insert(obj.id):
             self.to_insert[table_name].remove(obj)
             self.pending_inserts.remove(obj.id)
@@ -716,7 +771,12 @@ class DDBObject(signals.SignalEmitter):
             return
         if needs_save:
             app.db.update_obj(self)
-        app.view_tracker_manager.update_view_trackers(self)
+        if app.bulk_sql_manager.active:
+            # Let BulkSQLManager check the view trackers for all changed
+            # objects at once.
+            app.bulk_sql_manager.add_change(self)
+        else:
+            app.view_tracker_manager.update_view_trackers(self)
 
     def on_signal_change(self):
         pass
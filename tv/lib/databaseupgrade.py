@@ -56,6 +56,9 @@ from miro import prefs
 # looks nicer as a return value
 NO_CHANGES = set()
 
+# number of rows that iter_row_batches() loads into memory at once
+UPGRADE_BATCH_SIZE = 1000
+
 class DatabaseTooNewError(Exception):
     """Error that we raise when we see a database that is newer than
     the version that we can update too.
@@ -175,6 +178,37 @@ def get_next_id(cursor):
         max_id = max(max_id, cursor.fetchone()[0])
     return max_id + 1
 
+def iter_row_batches(cursor, table, columns, batch_size=None):
+    """Iterate through the rows of a table in batches.
+
+    Rows are selected in id order, batch_size rows at a time, so that big
+    tables never have to be loaded into memory all at once.  Each row
+    starts with the id column, followed by columns.  Since each batch is
+    a separate query, the cursor can be used to update rows between
+    batches.
+
+    Progress is reported to dbupgradeprogress after each batch.
+    """
+    if batch_size is None:
+        batch_size = UPGRADE_BATCH_SIZE
+    cursor.execute("SELECT COUNT(*), MIN(id) FROM %s" % table)
+    total, min_id = cursor.fetchone()
+    if total == 0:
+        return
+    sql = "SELECT id, %s FROM %s WHERE id > ? ORDER BY id LIMIT ?" % (
+            ', '.join(columns), table)
+    done = 0
+    last_id = min_id - 1
+    while True:
+        cursor.execute(sql, (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        yield rows
+        last_id = rows[-1][0]
+        done += len(rows)
+        dbupgradeprogress.new_style_step_progress(done, total)
+
 _upgrade_overide = {}
 def get_upgrade_func(version):
     if version in _upgrade_overide:
@@ -182,7 +216,7 @@ def get_upgrade_func(version):
     else:
         return globals()['upgrade%d' % version]
 
-def new_style_upgrade(cursor, saved_version, upgrade_to):
+def new_style_upgrade(cursor, saved_version, upgrade_to, checkpoint=None):
     """Upgrade a database using new-style upgrade functions.
 
     This method replaces the upgrade() method.  However, we still need
@@ -197,6 +231,12 @@ def new_style_upgrade(cursor, saved_version, upgrade_to):
 
         upgrade3(cursor)
         upgrade4(cursor)
+
+    Each upgrade function runs in its own transaction.  If checkpoint is
+    given, it's called with the cursor and the new version number before
+    each transaction is committed.  LiveStorage uses that to store the
+    database version, which lets an interrupted upgrade pick up after the
+    last finished step.
     """
 
     if saved_version > upgrade_to:
@@ -211,6 +251,8 @@ def new_style_upgrade(cursor, saved_version, upgrade_to):
             logging.info("upgrading database to version %s", version)
         cursor.execute("BEGIN TRANSACTION")
         get_upgrade_func(version)(cursor)
+        if checkpoint is not None:
+            checkpoint(cursor, version)
         cursor.execute("COMMIT TRANSACTION")
         dbupgradeprogress.new_style_progress(saved_version, version,
                                              upgrade_to)
@@ -2296,20 +2338,18 @@ def upgrade89(cursor):
 def upgrade90(cursor):
     """Add the was_downloaded column to downloader."""
     cursor.execute("ALTER TABLE remote_downloader ADD main_item_id integer")
-    for row in cursor.execute("SELECT id FROM remote_downloader").fetchall():
-        downloader_id = row[0]
-        cursor.execute("SELECT id FROM item WHERE downloader_id=? LIMIT 1",
-                (downloader_id,))
-        row = cursor.fetchone()
-        if row is not None:
-            # set main_item_id to one of the item ids, it doesn't matter which
-            item_id = row[0]
-            cursor.execute("UPDATE remote_downloader SET main_item_id=? "
-                    "WHERE id=?", (item_id, downloader_id))
-        else:
-            # no items for a downloader, delete the downloader
-            cursor.execute("DELETE FROM remote_downloader WHERE id=?",
-                    (downloader_id,))
+    # item.downloader_id isn't indexed until upgrade91.  Without a
+    # temporary index, finding the items for each downloader means a scan
+    # of the item table per downloader.
+    cursor.execute("CREATE INDEX upgrade90_item_downloader "
+            "ON item (downloader_id)")
+    # set main_item_id to one of the item ids, it doesn't matter which
+    cursor.execute("UPDATE remote_downloader SET main_item_id="
+            "(SELECT MIN(id) FROM item "
+            "WHERE item.downloader_id=remote_downloader.id)")
+    # no items for a downloader, delete the downloader
+    cursor.execute("DELETE FROM remote_downloader WHERE main_item_id IS NULL")
+    cursor.execute("DROP INDEX upgrade90_item_downloader")
 
 def upgrade91(cursor):
     """Add lots of indexes."""
@@ -2557,28 +2597,27 @@ def upgrade105(cursor):
     cursor.execute("ALTER TABLE remote_downloader ADD metainfo BLOB")
     cursor.execute("ALTER TABLE remote_downloader ADD fast_resume_data BLOB")
     # move things
-    cursor.execute("SELECT id, status FROM remote_downloader")
-    for row in cursor.fetchall():
-        id, status_repr = row
-        try:
-            status = eval_container(status_repr)
-        except StandardError:
-            status = {}
-        metainfo = status.pop('metainfo', None)
-        fast_resume_data = status.pop('fastResumeData', None)
-        new_status = repr(status)
-        if metainfo is not None:
-            metainfo_value = buffer(metainfo)
-        else:
-            metainfo_value = None
-        if fast_resume_data is not None:
-            fast_resume_data_value = buffer(fast_resume_data)
-        else:
-            fast_resume_data_value = None
-        cursor.execute("UPDATE remote_downloader "
-                "SET status=?, metainfo=?, fast_resume_data=? "
-                "WHERE id=?",
-                (new_status, metainfo_value, fast_resume_data_value, id))
+    for rows in iter_row_batches(cursor, 'remote_downloader', ['status']):
+        for id, status_repr in rows:
+            try:
+                status = eval_container(status_repr)
+            except StandardError:
+                status = {}
+            metainfo = status.pop('metainfo', None)
+            fast_resume_data = status.pop('fastResumeData', None)
+            new_status = repr(status)
+            if metainfo is not None:
+                metainfo_value = buffer(metainfo)
+            else:
+                metainfo_value = None
+            if fast_resume_data is not None:
+                fast_resume_data_value = buffer(fast_resume_data)
+            else:
+                fast_resume_data_value = None
+            cursor.execute("UPDATE remote_downloader "
+                    "SET status=?, metainfo=?, fast_resume_data=? "
+                    "WHERE id=?",
+                    (new_status, metainfo_value, fast_resume_data_value, id))
 
 
 def upgrade106(cursor):
@@ -2755,33 +2794,33 @@ def upgrade115(cursor):
 
 def upgrade116(cursor):
     """Convert filenames in the status container to unicode."""
-    cursor.execute("SELECT id, status FROM remote_downloader")
     filename_fields = ('channelName', 'shortFilename', 'filename')
-    for row in cursor.fetchall():
-        id, status = row
-        status = eval(status, __builtins__,
-                {'datetime': datetime, 'time': time})
-        changed = False
-        for key in filename_fields:
-            value = status.get(key)
-            if value is not None and not isinstance(value, unicode):
-                try:
-                    status[key] = value.decode("utf-8")
-                except UnicodeError:
-                    # for channelNames with bad unicode, try some kludges to
-                    # get things working.  (#14003)
+    for rows in iter_row_batches(cursor, 'remote_downloader', ['status']):
+        for id, status in rows:
+            status = eval(status, __builtins__,
+                    {'datetime': datetime, 'time': time})
+            changed = False
+            for key in filename_fields:
+                value = status.get(key)
+                if value is not None and not isinstance(value, unicode):
                     try:
-                        # kludge 1: latin-1 charset
-                        status[key] = value.decode("iso-8859-1")
+                        status[key] = value.decode("utf-8")
                     except UnicodeError:
-                        # kludge 2: replace bad values
-                        logging.warn("replacing invalid unicode for status "
-                                "dict %r (id: %s, key: %s)", value, id, key)
-                        status[key] = value.decode("utf-8", 'replace')
-                changed = True
-        if changed:
-            cursor.execute("UPDATE remote_downloader SET status=? "
-                    "WHERE id=?", (repr(status), id))
+                        # for channelNames with bad unicode, try some
+                        # kludges to get things working.  (#14003)
+                        try:
+                            # kludge 1: latin-1 charset
+                            status[key] = value.decode("iso-8859-1")
+                        except UnicodeError:
+                            # kludge 2: replace bad values
+                            logging.warn("replacing invalid unicode for "
+                                    "status dict %r (id: %s, key: %s)",
+                                    value, id, key)
+                            status[key] = value.decode("utf-8", 'replace')
+                    changed = True
+            if changed:
+                cursor.execute("UPDATE remote_downloader SET status=? "
+                        "WHERE id=?", (repr(status), id))
 
 def upgrade117(cursor):
     """Add the subtitle_encoding column to items."""
@@ -3062,30 +3101,31 @@ def upgrade133(cursor):
 def upgrade134(cursor):
     """Split item.metadata into scalar fields.
     """
-    cursor.execute("SELECT id, metadata FROM item")
-    items = []
-    for id_, metadata in cursor.fetchall():
-        try:
-            data = eval(metadata)
-        except TypeError:
-            data = {}
-        album = data.get('album', None)
-        artist = data.get('artist', None)
-        title_tag = data.get('title', None)
-        track = data.get('track', None)
-        year = data.get('year', None)
-        genre = data.get('genre', None)
-        items.append((album, artist, title_tag, track, year, genre, id_))
-    remove_column(cursor, 'item', ['metadata'])
     cursor.execute("ALTER TABLE item ADD COLUMN album text")
     cursor.execute("ALTER TABLE item ADD COLUMN artist text")
     cursor.execute("ALTER TABLE item ADD COLUMN title_tag text")
     cursor.execute("ALTER TABLE item ADD COLUMN track integer")
     cursor.execute("ALTER TABLE item ADD COLUMN year integer")
     cursor.execute("ALTER TABLE item ADD COLUMN genre text")
-    for data in items:
-        cursor.execute("UPDATE item SET album=?, artist=?, title_tag=?,"
-            "track=?, year=?, genre=? WHERE id=?", data)
+    for rows in iter_row_batches(cursor, 'item', ['metadata']):
+        items = []
+        for id_, metadata in rows:
+            try:
+                data = eval(metadata)
+            except TypeError:
+                data = {}
+            album = data.get('album', None)
+            artist = data.get('artist', None)
+            title_tag = data.get('title', None)
+            track = data.get('track', None)
+            year = data.get('year', None)
+            genre = data.get('genre', None)
+            items.append((album, artist, title_tag, track, year, genre, id_))
+        cursor.executemany("UPDATE item SET album=?, artist=?, title_tag=?,"
+            "track=?, year=?, genre=? WHERE id=?", items)
+    # drop metadata after the new columns are filled in, so that we don't
+    # need to hold on to every item's metadata while the table is rebuilt.
+    remove_column(cursor, 'item', ['metadata'])
  
 def upgrade135(cursor):
     """Basic metadata versioning
@@ -3455,3 +3495,120 @@ def upgrade164(cursor):
     # drop old columns
     remove_column(cursor, 'display_state', ['list_view_columns'])
     remove_column(cursor, 'display_state', ['list_view_widths'])
+
+def upgrade165(cursor):
+    """Add an index for downloader dlids."""
+    cursor.execute("CREATE INDEX downloader_dlid ON remote_downloader (dlid)")
+
+def upgrade166(cursor):
+    """Add the metadata cache table."""
+    cursor.execute("CREATE TABLE metadata_cache_entry (id integer PRIMARY KEY, "
+            "path text, size integer, mtime real, tags_version integer, "
+            "tags pythonrepr, cover_art text, mdp_state integer, "
+            "mdp_duration integer, mdp_file_type text, screenshot text)")
+    cursor.execute("CREATE INDEX metadata_cache_entry_path ON "
+            "metadata_cache_entry (path)")
+
+def upgrade167(cursor):
+    """Add the directory snapshot table."""
+    cursor.execute("CREATE TABLE directory_snapshot (id integer PRIMARY KEY, "
+            "feed_impl_id integer, path text, mtime real, "
+            "files pythonrepr, subdirs pythonrepr)")
+    cursor.execute("CREATE INDEX directory_snapshot_feed_impl ON "
+            "directory_snapshot (feed_impl_id)")
+
+def upgrade168(cursor):
+    """Add covering indexes for the download and metadata views."""
+    cursor.execute("DROP INDEX item_downloader")
+    cursor.execute("CREATE INDEX item_downloader ON item "
+            "(downloader_id, seen, parent_id, autoDownloaded, "
+            "pendingManualDL)")
+    cursor.execute("CREATE INDEX item_mdp_state ON item "
+            "(mdp_state, isContainerItem, is_file_item, deleted, "
+            "downloader_id)")
+
+def upgrade169(cursor):
+    """Add indexes to the playlist item map tables."""
+    for table in ('playlist_item_map', 'playlist_folder_item_map'):
+        cursor.execute("CREATE INDEX %s_playlist ON %s (playlist_id, item_id)"
+                % (table, table))
+        cursor.execute("CREATE INDEX %s_item ON %s (item_id)" %
+                (table, table))
+
+def upgrade170(cursor):
+    """Add columns to track when feeds should next be updated."""
+    for table in ('feed_impl', 'rss_feed_impl', 'saved_search_feed_impl',
+            'scraper_feed_impl', 'search_feed_impl',
+            'directory_watch_feed_impl', 'directory_feed_impl',
+            'search_downloads_feed_impl', 'manual_feed_impl'):
+        cursor.execute("ALTER TABLE %s ADD COLUMN next_update timestamp" %
+                table)
+        cursor.execute("ALTER TABLE %s ADD COLUMN unchanged_updates integer"
+                % table)
+        cursor.execute("ALTER TABLE %s ADD COLUMN publish_interval real" %
+                table)
+        cursor.execute("UPDATE %s SET unchanged_updates=0" % table)
+
+def upgrade171(cursor):
+    """Add the iTunes track table."""
+    cursor.execute("CREATE TABLE itunes_track (id integer PRIMARY KEY, "
+            "persistent_id text, item_id integer, date_modified timestamp, "
+            "play_count integer, skip_count integer)")
+    cursor.execute("CREATE INDEX itunes_track_persistent_id ON "
+            "itunes_track (persistent_id)")
+
+def upgrade172(cursor):
+    """Add the play session table."""
+    cursor.execute("CREATE TABLE play_session (id integer PRIMARY KEY, "
+            "item_id integer, feed_id integer, start_time timestamp, "
+            "end_time timestamp, duration real, watched_time real, "
+            "position real, completion real, completed integer, "
+            "skipped integer, pause_count integer, seek_count integer)")
+    cursor.execute("CREATE INDEX play_session_item_id ON "
+            "play_session (item_id)")
+    cursor.execute("CREATE INDEX play_session_feed_id ON "
+            "play_session (feed_id)")
+    cursor.execute("CREATE INDEX play_session_end_time ON "
+            "play_session (end_time)")
+
+def upgrade173(cursor):
+    """Add the scrape cache table."""
+    cursor.execute("CREATE TABLE scrape_cache (id integer PRIMARY KEY, "
+            "url text, resolved_url text, content_type text, title text, "
+            "source_url text, etag text, modified text, "
+            "expires timestamp)")
+    cursor.execute("CREATE INDEX scrape_cache_url ON scrape_cache (url)")
+
+def upgrade174(cursor):
+    """Add columns to store the stripped item descriptions.
+
+    They start out NULL, Item fills them in the next time it's changed.
+    """
+    cursor.execute("ALTER TABLE item ADD COLUMN description_hash text")
+    cursor.execute("ALTER TABLE item ADD COLUMN description_stripped text")
+    cursor.execute("ALTER TABLE item ADD COLUMN "
+            "description_links pythonrepr")
+
+def upgrade175(cursor):
+    """Add the created_item column to itunes_track.
+
+    We can't tell which of the existing tracks' items the importer made,
+    so assume none of them were.  That way we never remove an item the
+    user added themselves.
+    """
+    cursor.execute("ALTER TABLE itunes_track ADD COLUMN "
+            "created_item integer")
+    cursor.execute("UPDATE itunes_track SET created_item=0")
+
+def upgrade176(cursor):
+    """Count movie data program failures in the metadata cache.
+
+    Forget the failures we stored before, some of them were probably
+    temporary.
+    """
+    cursor.execute("ALTER TABLE metadata_cache_entry ADD COLUMN "
+            "mdp_failures integer")
+    cursor.execute("UPDATE metadata_cache_entry SET mdp_failures=0")
+    # 2 is moviedata.State.FAILED
+    cursor.execute("UPDATE metadata_cache_entry SET mdp_state=NULL "
+            "WHERE mdp_state=2")
@@ -37,6 +37,9 @@ from miro import messages
 _doing_20_upgrade = False
 _doing_new_style_upgrade = False
 _sent_upgrade_start = False
+# (start_version, current_version, end_version) from the last call to
+# new_style_progress()
+_new_style_versions = None
 
 def doing_20_upgrade():
     """Call this if we are upgrading from a 2.0-style database.
@@ -81,7 +84,25 @@ def convert20_progress(current_step, total_step):
 
 def new_style_progress(start_version, current_version, end_version):
     """Call while stepping through new-style upgrades"""
+    global _new_style_versions
+    _new_style_versions = (start_version, current_version, end_version)
     progress = _calc_progress(start_version, current_version, end_version)
+    _send_new_style_message(progress)
+
+def new_style_step_progress(current_row, total_rows):
+    """Call while an upgrade function works through the rows of a table.
+
+    This moves the progress bar part of the way towards the next version.
+    """
+    if _new_style_versions is None:
+        return
+    start_version, current_version, end_version = _new_style_versions
+    step = _calc_progress(0, current_row, total_rows)
+    progress = _calc_progress(start_version, current_version + step,
+            end_version)
+    _send_new_style_message(progress)
+
+def _send_new_style_message(progress):
     if _doing_20_upgrade:
         # new style upgrades take us from 50% to %75
         total = 0.50 + 0.25 * progress
@@ -0,0 +1,213 @@
+# Miro - an RSS based video player application
+# Copyright (C) 2005, 2006, 2007, 2008, 2009, 2010, 2011
+# Participatory Culture Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# In addition, as a special exception, the copyright holders give
+# permission to link the code of portions of this program with the OpenSSL
+# library.
+#
+# You must obey the GNU General Public License in all respects for all of
+# the code used other than OpenSSL. If you modify file(s) with this
+# exception, you may extend this exception to your version of the file(s),
+# but you are not obligated to do so. If you do not wish to do so, delete
+# this exception statement from your version. If you delete this exception
+# statement from all source files in the program, then also delete it here.
+
+"""``miro.directorysnapshot`` -- Scan directories incrementally.
+
+DirectoryScannerImplBase used to walk its whole directory tree on every
+update, stat-ing every file it found.  For large libraries, especially on
+network filesystems, that is very slow.
+
+Instead, we store a snapshot of each directory's contents along with the
+directory's mtime.  Adding, removing or renaming an entry updates the mtime
+of the directory that contains it, so if the mtime hasn't changed since the
+last scan we can reuse the snapshot without listing the directory or looking
+at its files.
+"""
+
+import logging
+import os
+import time
+
+from miro import fileutil
+from miro.database import DDBObject
+from miro.plat.filebundle import is_file_bundle
+from miro.plat.utils import filename_to_unicode
+
+# Some filesystems (FAT, many network filesystems) only store mtimes with a
+# granularity of a couple seconds.  If a directory's mtime is this close to
+# the time we scanned it, the directory could have changed without the
+# mtime changing, so we don't trust the snapshot.
+MTIME_GRANULARITY = 2.0
+
+class DirectorySnapshot(DDBObject):
+    """Contents of a single directory the last time we scanned it.
+
+    files and subdirs are lists of paths, in the same form that
+    fileutil.miro_allfiles() returns.  mtime is None if the snapshot
+    shouldn't be trusted for the next scan.
+    """
+    def setup_new(self, feed_impl_id, path, mtime, files, subdirs):
+        self.feed_impl_id = feed_impl_id
+        self.path = path
+        self.mtime = mtime
+        self.files = files
+        self.subdirs = subdirs
+
+    @classmethod
+    def feed_impl_view(cls, feed_impl_id):
+        return cls.make_view('feed_impl_id=?', (feed_impl_id,))
+
+def remove_snapshots(feed_impl_id):
+    """Remove all snapshots stored for a FeedImpl."""
+    for snapshot in DirectorySnapshot.feed_impl_view(feed_impl_id):
+        snapshot.remove()
+
+def invalidate_paths(feed_impl_id, paths):
+    """Make the next scan list the directories that contain paths.
+
+    Call this when something other than a scan tells us that files were
+    added or removed, for example the directory watcher.
+    """
+    for directory in set(os.path.dirname(p) for p in paths):
+        view = DirectorySnapshot.make_view('feed_impl_id=? AND path=?',
+                (feed_impl_id, filename_to_unicode(directory)))
+        for snapshot in view:
+            if snapshot.mtime is not None:
+                snapshot.mtime = None
+                snapshot.signal_change()
+
+def _skip_name(name):
+    name_lower = name.lower()
+    # thumbs.db is a windows file that speeds up thumbnails.  We know it's not
+    # a movie file.
+    return (name.startswith('.') or name_lower == 'thumbs.db' or
+            name_lower == "incomplete downloads")
+
+class SnapshotScanner(object):
+    """Find all files in a directory tree, using the stored snapshots.
+
+    This finds the same files as fileutil.miro_allfiles(), but only lists
+    directories that have changed since the last scan.  Call save() once
+    iter_files() is exhausted to store the new snapshots.
+
+    Member variables:
+
+    * ``dirs_listed`` -- number of directories that we had to list
+    * ``dirs_reused`` -- number of directories we used the snapshot for
+    """
+    def __init__(self, feed_impl_id, root):
+        self.feed_impl_id = feed_impl_id
+        self.root = root
+        self.old_snapshots = dict((s.path, s) for s in
+                DirectorySnapshot.feed_impl_view(feed_impl_id))
+        # maps path -> (mtime, files, subdirs) for directories we listed
+        self.new_snapshots = {}
+        self.seen_dirs = set()
+        self.dirs_listed = self.dirs_reused = 0
+
+    def iter_files(self):
+        checked = set()
+        to_scan = [self.root]
+        while to_scan:
+            directory = to_scan.pop()
+            contents = self._get_contents(directory, checked)
+            if contents is None:
+                continue
+            files, subdirs = contents
+            for path in files:
+                if (fileutil.expand_filename(path) not in
+                        fileutil.deletes_in_progress):
+                    yield path
+            # reverse so that we scan subdirectories in order
+            to_scan.extend(reversed(subdirs))
+
+    def _get_contents(self, directory, checked):
+        expanded_directory = fileutil.expand_filename(directory)
+        expanded_directory = os.path.abspath(
+                os.path.normcase(expanded_directory))
+        real_directory = os.path.realpath(expanded_directory)
+        if real_directory in checked:
+            logging.debug('%s is a symlink to a directory that has '
+                'already been checked; skipping', repr(expanded_directory))
+            return None
+        checked.add(real_directory)
+        if expanded_directory in fileutil.deletes_in_progress:
+            return None
+        try:
+            mtime = os.stat(expanded_directory).st_mtime
+        except OSError:
+            return None
+        self.seen_dirs.add(directory)
+        snapshot = self.old_snapshots.get(directory)
+        if (snapshot is not None and snapshot.mtime is not None and
+                snapshot.mtime == mtime):
+            self.dirs_reused += 1
+            return snapshot.files, snapshot.subdirs
+        self.dirs_listed += 1
+        return self._list_directory(directory, expanded_directory, mtime)
+
+    def _list_directory(self, directory, expanded_directory, mtime):
+        scan_time = time.time()
+        try:
+            listing = os.listdir(expanded_directory)
+        except OSError:
+            logging.debug('OSError walking directory; continuing', exc_info=1)
+            return None
+        files = []
+        subdirs = []
+        for name in sorted(listing):
+            if _skip_name(name):
+                continue
+            path = os.path.join(directory, os.path.normcase(name))
+            expanded_path = os.path.join(expanded_directory,
+                    os.path.normcase(name))
+            try:
+                if (os.path.isdir(expanded_path) and
+                        not is_file_bundle(expanded_path)):
+                    subdirs.append(path)
+                elif os.path.isfile(expanded_path):
+                    files.append(path)
+            except OSError:
+                logging.debug('OSError walking directory; continuing',
+                        exc_info=1)
+        if mtime >= scan_time - MTIME_GRANULARITY:
+            # the directory changed recently, it might change again without
+            # the mtime changing
+            mtime = None
+        self.new_snapshots[directory] = (mtime, files, subdirs)
+        return files, subdirs
+
+    def save(self):
+        """Store the snapshots for the directories we listed.
+
+        This should be called inside a BulkSQLManager transaction.
+        """
+        for path, (mtime, files, subdirs) in self.new_snapshots.items():
+            snapshot = self.old_snapshots.get(path)
+            if snapshot is None:
+                DirectorySnapshot(self.feed_impl_id, path, mtime, files,
+                        subdirs)
+            else:
+                snapshot.mtime = mtime
+                snapshot.files = files
+                snapshot.subdirs = subdirs
+                snapshot.signal_change()
+        for path, snapshot in self.old_snapshots.items():
+            if path not in self.seen_dirs:
+                snapshot.remove()
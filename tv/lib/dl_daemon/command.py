@@ -116,8 +116,8 @@ class BatchUpdateDownloadStatus(Command):
         from miro.messages import DownloaderSyncCommandComplete
 
         cmd_done = self.args[1]
-        fresh = all(RemoteDownloader.update_status(status, cmd_done=cmd_done)
-                    for status in self.args[0])
+        fresh = RemoteDownloader.bulk_update_status(self.args[0],
+                                                    cmd_done=cmd_done)
         if cmd_done and fresh:
             DownloaderSyncCommandComplete().send_to_frontend()
 
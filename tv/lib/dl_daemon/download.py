@@ -1586,7 +1586,10 @@ class BTDownloader(BGDownloader):
                 self.description_client = httpclient.grab_url(self.url,
                         self.on_metainfo_download,
                         self.on_metainfo_download_error,
-                        content_check_callback=self.check_description)
+                        content_check_callback=self.check_description,
+                        # check_description() needs to see more than
+                        # MAX_TORRENT_SIZE bytes to catch oversized files
+                        content_check_window=MAX_TORRENT_SIZE + 1)
         else:
             self.got_metainfo()
 
@@ -210,6 +210,28 @@ def get_downloader_by_dlid(dlid):
     except ObjectNotFoundError:
         return None
 
+def get_downloaders_by_dlid(dlids):
+    """Get a dict mapping download ids to RemoteDownloader objects.
+
+    Download ids that don't have a downloader are left out of the dict.
+    """
+    from miro.storedatabase import split_values_for_sqlite
+    downloaders = {}
+    dlids = list(set(dlids))
+    for dlid_chunk in split_values_for_sqlite(dlids):
+        view = RemoteDownloader.make_view('dlid IN (%s)' %
+                                          ', '.join('?' for d in dlid_chunk),
+                                          tuple(dlid_chunk))
+        for downloader in view:
+            downloaders[downloader.dlid] = downloader
+    return downloaders
+
+def _unicodify_status(data):
+    for field in data:
+        if field not in ['filename', 'shortFilename', 'channelName',
+                         'metainfo']:
+            data[field] = unicodify(data[field])
+
 @returns_unicode
 def generate_dlid():
     dlid = u"download%08d" % random.randint(0, 99999999)
@@ -262,6 +284,12 @@ class RemoteDownloader(DDBObject):
         return cls.make_view("state in ('finished', 'uploading', "
                              "'uploading-paused')")
 
+    @classmethod
+    def restart_at_startup_view(cls):
+        """Downloaders that may need to be restarted when we start up."""
+        return cls.make_view("state in ('downloading', 'offline', "
+                             "'uploading')")
+
     @classmethod
     def auto_uploader_view(cls):
         return cls.make_view("state == 'uploading' AND NOT manualUpload")
@@ -384,142 +412,169 @@ class RemoteDownloader(DDBObject):
 
     @classmethod
     def update_status(cls, data, cmd_done=False):
-        for field in data:
-            if field not in ['filename', 'shortFilename', 'channelName',
-                             'metainfo']:
-                data[field] = unicodify(data[field])
-
+        _unicodify_status(data)
         self = get_downloader_by_dlid(dlid=data['dlid'])
+        if self is None:
+            return True
+        return self._apply_status(data, cmd_done)
+
+    @classmethod
+    def bulk_update_status(cls, status_list, cmd_done=False):
+        """Update the status for a list of downloaders at once.
+
+        This works like calling update_status() for each status dict, but
+        we look up all the downloaders with a single query and apply the
+        changes inside a BulkSQLManager transaction, so that the view
+        trackers get checked once for the whole batch.
+
+        :returns: True if none of the updates were stale
+        """
+        for data in status_list:
+            _unicodify_status(data)
+        downloaders = get_downloaders_by_dlid(
+            [data['dlid'] for data in status_list])
+        fresh = True
+        app.bulk_sql_manager.start()
+        try:
+            for data in status_list:
+                downloader = downloaders.get(data['dlid'])
+                if downloader is None or not downloader.id_exists():
+                    continue
+                if not downloader._apply_status(data, cmd_done):
+                    fresh = False
+        finally:
+            app.bulk_sql_manager.finish()
+        return fresh
+
+    def _apply_status(self, data, cmd_done):
+        now = time.time()
+        last_update = self.last_update
+        rate_limit = False
+        state = self.get_state()
+        new_state = data.get('state', u'downloading')
+
+        # If this item was marked as pending update, then any update
+        # which comes in now which does not have cmd_done set is void.
+        if not cmd_done and self.status_updates_frozen:
+            logging.debug('self = %s, '
+                          'saved state = %s '
+                          'downloader state = %s.  '
+                          'Discard.',
+                          self, state, new_state)
+            # treat as stale
+            return False
 
-        if self is not None:
-            now = time.time()
-            last_update = self.last_update
-            rate_limit = False
-            state = self.get_state()
-            new_state = data.get('state', u'downloading')
-
-            # If this item was marked as pending update, then any update
-            # which comes in now which does not have cmd_done set is void.
-            if not cmd_done and self.status_updates_frozen:
-                logging.debug('self = %s, '
-                              'saved state = %s '
-                              'downloader state = %s.  '
-                              'Discard.',
+        # If the timing between the status updates is too narrow,
+        # try to skip it because it makes the UI jerky otherwise.
+        if now < last_update:
+            logging.debug('time.time() gone backwards last = %s now = %s',
+                          last_update, now)
+        else:
+            diff = now - last_update
+            if diff < self.MIN_STATUS_UPDATE_SPACING:
+                logging.debug('Rate limit: '
+                              'self = %s, now - last_update = %s, '
+                              'MIN_STATUS_UPDATE_SPACING = %s.',
+                              self, diff, self.MIN_STATUS_UPDATE_SPACING)
+                rate_limit = True
+
+        # If the state is one which we set and was meant to be passed
+        # through to the downloader (valid_states), and the downloader
+        # replied with something that was a response to a previous
+        # download command, and state was also a part of valid_states,
+        # but the saved state and the new state do not match
+        # then it means the message is stale.
+        #
+        # Have a think about why this is true: when you set a state,
+        # which is authoritative, to the downloader you expect it
+        # to reply with that same state.  If they do not match then it
+        # means the message is stale.
+        #
+        # The exception to this rule is if the downloader replies with
+        # an error state, or if downloading has transitioned to finished
+        # state.
+        #
+        # This also does not apply to any state which we set on the
+        # downloader via a restore command.  A restore command before
+        # a pause/resume/cancel will work as intended, and no special
+        # trickery is required.  A restore command which happens after
+        # a pause/resume/cancel is void, so no work is required.
+        #
+        # I hope this makes sense and is clear!
+        valid_states = (u'downloading', u'paused', u'stopped',
+                        u'uploading-paused', u'finished')
+        if (cmd_done and
+          state in valid_states and new_state in valid_states and
+          state != new_state):
+            if not (state == u'downloading' and new_state == u'finished'):
+                logging.debug('self = %s STALE.  '
+                              'Saved state %s, got state %s.  Discarding.',
                               self, state, new_state)
-                # treat as stale
                 return False
 
-            # If the timing between the status updates is too narrow,
-            # try to skip it because it makes the UI jerky otherwise.
-            if now < last_update:
-                logging.debug('time.time() gone backwards last = %s now = %s',
-                              last_update, now)
-            else:
-                diff = now - last_update
-                if diff < self.MIN_STATUS_UPDATE_SPACING:
-                    logging.debug('Rate limit: '
-                                  'self = %s, now - last_update = %s, '
-                                  'MIN_STATUS_UPDATE_SPACING = %s.',
-                                  self, diff, self.MIN_STATUS_UPDATE_SPACING)
-                    rate_limit = True
-
-            # If the state is one which we set and was meant to be passed
-            # through to the downloader (valid_states), and the downloader
-            # replied with something that was a response to a previous
-            # download command, and state was also a part of valid_states,
-            # but the saved state and the new state do not match
-            # then it means the message is stale.
-            #
-            # Have a think about why this is true: when you set a state,
-            # which is authoritative, to the downloader you expect it
-            # to reply with that same state.  If they do not match then it
-            # means the message is stale.
-            #
-            # The exception to this rule is if the downloader replies with
-            # an error state, or if downloading has transitioned to finished
-            # state.
-            #
-            # This also does not apply to any state which we set on the
-            # downloader via a restore command.  A restore command before
-            # a pause/resume/cancel will work as intended, and no special
-            # trickery is required.  A restore command which happens after
-            # a pause/resume/cancel is void, so no work is required.
-            #
-            # I hope this makes sense and is clear!
-            valid_states = (u'downloading', u'paused', u'stopped',
-                            u'uploading-paused', u'finished')
-            if (cmd_done and
-              state in valid_states and new_state in valid_states and
-              state != new_state):
-                if not (state == u'downloading' and new_state == u'finished'):
-                    logging.debug('self = %s STALE.  '
-                                  'Saved state %s, got state %s.  Discarding.',
-                                  self, state, new_state)
-                    return False
-
-            # We are updating!  Reset the status_updates_frozen flag.
-            self.status_updates_frozen = False
- 
-            # FIXME - this should get fixed.
-            metainfo = data.pop('metainfo', self.metainfo)
-
-            # For metainfo, the downloader process doesn't send the
-            # keys if they haven't changed.  Therefore, use our
-            # current values if the key isn't present.
-            current = (self.status, self.metainfo)
-            new = (data, metainfo)
-            if current == new:
-                return True
-
-            # We have something to update: update the last updated timestamp.
-            self.last_update = now
-
-            was_finished = self.is_finished()
-            old_filename = self.get_filename()
-            self.before_changing_status()
+        # We are updating!  Reset the status_updates_frozen flag.
+        self.status_updates_frozen = False
 
-            # FIXME: how do we get all of the possible bit torrent
-            # activity strings into gettext? --NN
-            if data.has_key('activity') and data['activity']:
-                data['activity'] = _(data['activity'])
-
-            # only set attributes if something's changed.  This makes our
-            # UPDATE statments contain less data
-            if data != self.status:
-                self.status = data
-            if metainfo != self.metainfo:
-                self.metainfo = metainfo
-            self._recalc_state()
-
-            # Store the time the download finished
-            finished = self.is_finished() and not was_finished
-            file_migrated = (self.is_finished() and
-                             self.get_filename() != old_filename)
-            needs_signal_item = not (finished or file_migrated or rate_limit)
-            self.after_changing_status()
+        # FIXME - this should get fixed.
+        metainfo = data.pop('metainfo', self.metainfo)
 
-            if ((self.get_state() == u'uploading'
-                 and not self.manualUpload
-                 and (app.config.get(prefs.LIMIT_UPLOAD_RATIO)
-                      and self.get_upload_ratio() > app.config.get(prefs.UPLOAD_RATIO)))):
-                self.stop_upload()
+        # For metainfo, the downloader process doesn't send the
+        # keys if they haven't changed.  Therefore, use our
+        # current values if the key isn't present.
+        current = (self.status, self.metainfo)
+        new = (data, metainfo)
+        if current == new:
+            return True
 
-            if self.changed_attributes == set(('status',)):
-                # if we just changed status, then we can wait a while
-                # to store things to disk.  Since we go through
-                # update_status() often, this results in a fairly
-                # large performance gain and alleviates #12101
-                self._save_later()
-                self.signal_change(needs_signal_item=needs_signal_item,
-                                   needs_save=False)
-            else:
-                self.signal_change()
+        # We have something to update: update the last updated timestamp.
+        self.last_update = now
+
+        was_finished = self.is_finished()
+        old_filename = self.get_filename()
+        self.before_changing_status()
+
+        # FIXME: how do we get all of the possible bit torrent
+        # activity strings into gettext? --NN
+        if data.has_key('activity') and data['activity']:
+            data['activity'] = _(data['activity'])
+
+        # only set attributes if something's changed.  This makes our
+        # UPDATE statments contain less data
+        if data != self.status:
+            self.status = data
+        if metainfo != self.metainfo:
+            self.metainfo = metainfo
+        self._recalc_state()
+
+        # Store the time the download finished
+        finished = self.is_finished() and not was_finished
+        file_migrated = (self.is_finished() and
+                         self.get_filename() != old_filename)
+        needs_signal_item = not (finished or file_migrated or rate_limit)
+        self.after_changing_status()
+
+        if ((self.get_state() == u'uploading'
+             and not self.manualUpload
+             and (app.config.get(prefs.LIMIT_UPLOAD_RATIO)
+                  and self.get_upload_ratio() > app.config.get(prefs.UPLOAD_RATIO)))):
+            self.stop_upload()
+
+        if self.changed_attributes == set(('status',)):
+            # if we just changed status, then we can wait a while
+            # to store things to disk.  Since we go through
+            # update_status() often, this results in a fairly
+            # large performance gain and alleviates #12101
+            self._save_later()
+            self.signal_change(needs_signal_item=needs_signal_item,
+                               needs_save=False)
+        else:
+            self.signal_change()
 
-            if finished:
-                for item in self.item_list:
-                    item.on_download_finished()
-            elif file_migrated:
-                self._file_migrated(old_filename)
+        if finished:
+            for item in self.item_list:
+                item.on_download_finished()
+        elif file_migrated:
+            self._file_migrated(old_filename)
 
         return True
 
@@ -719,6 +774,7 @@ class RemoteDownloader(DDBObject):
         app.download_state_manager.total_up_rate -= rates[1]
         self.stop(self.delete_files)
         DDBObject.remove(self)
+        _forget_unloaded_count_state(self.id)
 
     def get_type(self):
         """Get the type of download.  Will return either "http" or
@@ -980,6 +1036,62 @@ class RemoteDownloader(DDBObject):
         self.after_changing_status()
         self.signal_change()
 
+# (db, dict) -- see get_unloaded_count_state()
+_unloaded_count_states = (None, {})
+
+def get_unloaded_count_state(id_):
+    """Get (state, main_item_id) for a downloader that isn't loaded.
+
+    Item._calc_count_key() needs these for every item it restores, and
+    most downloaders aren't loaded.  Rather than query for each one, the
+    first call reads the values for every downloader in one query.  That
+    snapshot stays correct for downloaders that haven't been loaded since,
+    which are the only ones we use it for.
+
+    :returns: (state, main_item_id), or (None, None) if there's no
+        downloader with id_
+    """
+    global _unloaded_count_states
+    db, states = _unloaded_count_states
+    if db is not app.db:
+        states = {}
+        for row_id, state, main_item_id in RemoteDownloader.select(
+                ['id', 'state', 'main_item_id']):
+            states[row_id] = (state, main_item_id)
+        _unloaded_count_states = (app.db, states)
+    return states.get(id_, (None, None))
+
+def _forget_unloaded_count_state(id_):
+    db, states = _unloaded_count_states
+    if db is app.db:
+        states.pop(id_, None)
+
+def iter_downloader_filenames(states):
+    """Iterate through the filenames of downloaders in states.
+
+    This reads the status column directly instead of restoring every
+    RemoteDownloader, which is slow for large libraries.  Downloaders that
+    are already loaded are checked in memory, since they may have changes
+    that haven't been saved yet.
+    """
+    where = 'state IN (%s)' % ', '.join('?' for state in states)
+    values = tuple(states)
+    try:
+        rows = RemoteDownloader.select(['id', 'status'], where, values)
+    except StandardError:
+        # Malformed status data.  Restoring the objects will fix it up.
+        logging.exception("error reading downloader status")
+        rows = [(d.id, d.status)
+                for d in RemoteDownloader.make_view(where, values)]
+    for id_, status in rows:
+        if app.db.id_alive(id_):
+            downloader = app.db.get_obj_by_id(id_)
+            if downloader.get_state() not in states:
+                continue
+            yield downloader.get_filename()
+        else:
+            yield status.get('filename', FilenameType(''))
+
 def cleanup_incomplete_downloads():
     download_dir = os.path.join(app.config.get(prefs.MOVIES_DIRECTORY),
                                 'Incomplete Downloads')
@@ -987,15 +1099,12 @@ def cleanup_incomplete_downloads():
         return
 
     files_in_use = set()
-    for downloader in RemoteDownloader.make_view():
-        if downloader.get_state() in ('downloading', 'paused',
-                                     'offline', 'uploading', 'finished',
-                                     'uploading-paused'):
-            filename = downloader.get_filename()
-            if len(filename) > 0:
-                if not fileutil.isabs(filename):
-                    filename = os.path.join(download_dir, filename)
-                files_in_use.add(filename)
+    for filename in iter_downloader_filenames((u'downloading', u'paused',
+            u'offline', u'uploading', u'finished', u'uploading-paused')):
+        if len(filename) > 0:
+            if not fileutil.isabs(filename):
+                filename = os.path.join(download_dir, filename)
+            files_in_use.add(filename)
 
     try:
         entries = fileutil.listdir(download_dir)
@@ -1028,7 +1137,10 @@ def _on_config_change(obj, key, value):
 class DownloadDaemonStarter(object):
     def __init__(self):
         RemoteDownloader.initialize_daemon()
-        self.downloads_at_startup = list(RemoteDownloader.make_view())
+        # Only remember the ids here.  Restoring the downloaders can wait
+        # until restart_downloads() runs, after the frontend is up.
+        self.downloads_at_startup = \
+                RemoteDownloader.restart_at_startup_view().id_list()
         self.started = False
         self._config_callback_handle = None
         self._download_tracker = None
@@ -1057,7 +1169,11 @@ class DownloadDaemonStarter(object):
         self.started = True
 
     def restart_downloads(self):
-        for downloader in self.downloads_at_startup:
+        for id_ in self.downloads_at_startup:
+            try:
+                downloader = RemoteDownloader.get_by_id(id_)
+            except ObjectNotFoundError:
+                continue
             downloader.restart_on_startup_if_needed()
 
     def shutdown(self, callback):
@@ -36,15 +36,23 @@ TODO: handle user setting clock back
 """
 
 import threading
+import bisect
 import errno
+import os
 import select
 import socket
 import heapq
+import time
 import Queue
 import logging
 import traceback
+try:
+    import simplejson as json
+except ImportError:
+    import json
 from miro import app
 from miro import config
+from miro import prefs
 from miro import trapcall
 from miro import signals
 from miro import util
@@ -55,6 +63,117 @@ from miro.plat.utils import thread_body
 
 cumulative = {}
 
+# upper bounds for the buckets in our latency histograms (in seconds).  There's
+# also an extra bucket for anything slower than the last bound.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+# max number of different callback names to keep histograms for.  Callbacks
+# after that get lumped together under OTHER_CALLBACKS_NAME.
+MAX_METRICS_NAMES = 1000
+OTHER_CALLBACKS_NAME = "other callbacks"
+
+class LatencyHistogram(object):
+    """Tracks how long something took to run."""
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def to_dict(self):
+        bounds = list(LATENCY_BUCKETS) + [None]
+        return {
+            'count': self.count,
+            'total': self.total,
+            'max': self.max,
+            'buckets': zip(bounds, self.bucket_counts),
+        }
+
+class EventLoopMetrics(object):
+    """Keeps stats on how the event loop is doing.
+
+    We track:
+      - latency histograms for each callback name
+      - the peak depths of the idle, urgent, timeout and thread pool queues
+      - how long calls wait in the ThreadPool queue before they get run
+
+    Stats can be recorded from any thread.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.lock.acquire()
+        try:
+            self.callbacks = {}
+            self.peak_queue_depths = {}
+            self.thread_pool_wait = LatencyHistogram()
+            self.start_time = time.time()
+        finally:
+            self.lock.release()
+
+    def record_callback(self, name, duration):
+        self.lock.acquire()
+        try:
+            try:
+                histogram = self.callbacks[name]
+            except KeyError:
+                if len(self.callbacks) >= MAX_METRICS_NAMES:
+                    name = OTHER_CALLBACKS_NAME
+                histogram = self.callbacks.setdefault(name,
+                                                      LatencyHistogram())
+            histogram.add(duration)
+        finally:
+            self.lock.release()
+
+    def record_queue_depth(self, queue_name, depth):
+        if depth <= self.peak_queue_depths.get(queue_name, 0):
+            return
+        self.lock.acquire()
+        try:
+            self.peak_queue_depths[queue_name] = max(depth,
+                    self.peak_queue_depths.get(queue_name, 0))
+        finally:
+            self.lock.release()
+
+    def record_thread_pool_wait(self, wait):
+        self.lock.acquire()
+        try:
+            self.thread_pool_wait.add(wait)
+        finally:
+            self.lock.release()
+
+    def snapshot(self, queue_depths):
+        """Get a dict with all of our stats.
+
+        The dict only contains basic python types, so it can be sent in a
+        message or written out as JSON.
+
+        :param queue_depths: dict mapping queue names to their current depths
+        """
+        self.lock.acquire()
+        try:
+            callbacks = dict((name, histogram.to_dict())
+                             for name, histogram in self.callbacks.items())
+            return {
+                'time': time.time(),
+                'since': self.start_time,
+                'callbacks': callbacks,
+                'queue_depths': dict(queue_depths),
+                'peak_queue_depths': dict(self.peak_queue_depths),
+                'thread_pool_wait': self.thread_pool_wait.to_dict(),
+            }
+        finally:
+            self.lock.release()
+
+metrics = EventLoopMetrics()
+
 class DelayedCall(object):
     def __init__(self, function, name, args, kwargs):
         self.function = function
@@ -82,6 +201,7 @@ class DelayedCall(object):
             success = trapcall.trap_call(when, self.function, *self.args,
                     **self.kwargs)
             end = clock()
+            metrics.record_callback(self.name, end - start)
             if end-start > 0.5:
                 logging.timing("%s too slow (%.3f secs)",
                                self.name, end-start)
@@ -110,6 +230,7 @@ class Scheduler(object):
         scheduled_time = clock() + delay
         dc = DelayedCall(function,  "timeout (%s)" % (name,), args, kwargs)
         heapq.heappush(self.heap, (scheduled_time, dc))
+        metrics.record_queue_depth('timeout', len(self.heap))
         return dc
 
     def next_timeout(self):
@@ -126,7 +247,8 @@ class Scheduler(object):
         return dc.dispatch()
 
 class CallQueue(object):
-    def __init__(self):
+    def __init__(self, name='idle'):
+        self.name = name
         self.queue = Queue.Queue()
         self.quit_flag = False
         self.queue_size_warning_count = 0
@@ -138,6 +260,8 @@ class CallQueue(object):
             kwargs = {}
         dc = DelayedCall(function, "idle (%s)" % (name,), args, kwargs)
         self.queue.put(dc)
+        queue_size = self.queue.qsize()
+        metrics.record_queue_depth(self.name, queue_size)
 
         # Check if our queue size is too big and log a warning if so.  Only do
         # this a few times.  That should be enough to track down errors, but
@@ -146,7 +270,7 @@ class CallQueue(object):
         # NOTE: the code below doesn't take into account that this method
         # runs on multiple threads.  However, the worst that can happen is
         # we log an extra warning or two, so this doesn't seem bad.
-        if self.queue_size_warning_count < 5 and self.queue.qsize() > 1000:
+        if self.queue_size_warning_count < 5 and queue_size > 1000:
             if self.queue_size_warning_count < 5:
                 logging.stacktrace("Queued called size too large")
                 self.queue_size_warning_count += 1
@@ -194,7 +318,9 @@ class ThreadPool(object):
             if next_item == "QUIT":
                 break
             else:
-                callback, errback, func, name, args, kwargs, = next_item
+                (callback, errback, func, name, args, kwargs,
+                        queued_at) = next_item
+            metrics.record_thread_pool_wait(clock() - queued_at)
             try:
                 result = func(*args, **kwargs)
             except KeyboardInterrupt:
@@ -215,7 +341,9 @@ class ThreadPool(object):
                 self.event_loop.wakeup()
 
     def queue_call(self, callback, errback, function, name, *args, **kwargs):
-        self.queue.put((callback, errback, function, name, args, kwargs))
+        self.queue.put((callback, errback, function, name, args, kwargs,
+                        clock()))
+        metrics.record_queue_depth('thread pool', self.queue.qsize())
 
     def close_threads(self):
         for x in xrange(len(self.threads)):
@@ -287,8 +415,8 @@ class EventLoop(SimpleEventLoop):
         SimpleEventLoop.__init__(self)
         self.create_signal('event-finished')
         self.scheduler = Scheduler()
-        self.idle_queue = CallQueue()
-        self.urgent_queue = CallQueue()
+        self.idle_queue = CallQueue('idle')
+        self.urgent_queue = CallQueue('urgent')
         self.threadpool = ThreadPool(self)
         self.read_callbacks = {}
         self.write_callbacks = {}
@@ -318,6 +446,14 @@ class EventLoop(SimpleEventLoop):
         self.threadpool.queue_call(callback, errback, function, name,
                                   *args, **kwargs)
 
+    def get_queue_depths(self):
+        return {
+            'idle': self.idle_queue.queue.qsize(),
+            'urgent': self.urgent_queue.queue.qsize(),
+            'timeout': len(self.scheduler.heap),
+            'thread pool': self.threadpool.queue.qsize(),
+        }
+
     def run_idle_next_loop(self, function, name, args=None, kwargs=None):
         """Add an idle callback to be called on the next event loop."""
         self.idles_for_next_loop.append((function, name, args, kwargs))
@@ -395,7 +531,10 @@ class EventLoop(SimpleEventLoop):
                     continue
                 when = "While talking to the network"
                 def callback_event():
+                    start = clock()
                     success = trapcall.trap_call(when, function)
+                    metrics.record_callback("network callback",
+                                            clock() - start)
                     if not success:
                         del map_[fd]
                     return success
@@ -484,6 +623,46 @@ def call_in_thread(callback, errback, function, name, *args, **kwargs):
     _eventloop.call_in_thread(
         callback, errback, function, name, *args, **kwargs)
 
+def get_metrics():
+    """Get a snapshot of the event loop metrics.
+
+    See EventLoopMetrics.snapshot() for the format.
+    """
+    return metrics.snapshot(_eventloop.get_queue_depths())
+
+def dump_metrics(path):
+    """Write a snapshot of the event loop metrics to path as JSON."""
+    tmp_path = path + '.tmp'
+    f = open(tmp_path, 'w')
+    try:
+        json.dump(get_metrics(), f, indent=1)
+    finally:
+        f.close()
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+def metrics_dump_path():
+    return os.path.join(app.config.get(prefs.SUPPORT_DIRECTORY),
+                        'eventloop-metrics.json')
+
+def start_metrics_dump():
+    """Start periodically dumping the event loop metrics.
+
+    The interval comes from the EVENTLOOP_METRICS_DUMP_INTERVAL pref.  If it's
+    0, this does nothing.
+    """
+    interval = app.config.get(prefs.EVENTLOOP_METRICS_DUMP_INTERVAL)
+    if interval <= 0:
+        return
+    def dump_then_reschedule():
+        try:
+            dump_metrics(metrics_dump_path())
+        except (IOError, OSError), e:
+            logging.warn("error writing event loop metrics: %s", e)
+        add_timeout(interval, dump_then_reschedule, "dump event loop metrics")
+    add_timeout(interval, dump_then_reschedule, "dump event loop metrics")
+
 lt = None
 
 profile_file = None
@@ -43,6 +43,8 @@ import ConfigParser
 from miro import app
 from miro import prefs
 from miro import util
+from miro import workerprocess
+from miro.clock import clock
 
 # need to do this otherwise py2exe won't pick up the api module
 from miro import api
@@ -55,6 +57,30 @@ class ExtensionParseError(StandardError):
     """
     pass
 
+def load_hook_func(hook_string):
+    """Find the function object for a hook string.
+
+    hook_string is in the form of package.module:path.to.obj.  See api.py
+    for details.
+
+    :raises ExtensionParseError: hook_string is invalid
+    """
+    try:
+        module_string, object_string = hook_string.split(":")
+    except ValueError:
+        raise ExtensionParseError("Invalid hook string: %s" % hook_string)
+    try:
+        module = util.import_module(module_string)
+    except ImportError:
+        raise ExtensionParseError("Can't import module: %s" % module_string)
+    try:
+        # We allow extensions to execute arbirary code, so calling eval is
+        # not any more of a security risk.
+        return eval(object_string, module.__dict__)
+    except StandardError, e:
+        raise ExtensionParseError("Error loading hook object: %s (%s)" %
+                (object_string, e))
+
 class Extension:
     def __init__(self):
         self.name = "Unknown"
@@ -67,6 +93,12 @@ class Extension:
         self.loaded = False
         # maps hook names -> hook functions
         self.hooks = {}
+        # maps hook names -> hook strings
+        self.hook_strings = {}
+        # hooks that should be run in the worker process
+        self.sandboxed_hooks = set()
+        # directory that the extension was loaded from
+        self.ext_dir = None
 
     def module_obj(self):
         """Gets the module object for this extension.
@@ -86,22 +118,8 @@ class Extension:
 
         See api.py for the format for hook_string.
         """
-        try:
-            module_string, object_string = hook_string.split(":")
-        except ValueError:
-            raise ExtensionParseError("Invalid hook string: %s" % hook_string)
-        try:
-            module = util.import_module(module_string)
-        except ImportError:
-            raise ExtensionParseError("Can't import module: %s" % module_string)
-        try:
-            # We allow extensions to execute arbirary code, so calling eval is
-            # not any more of a security risk.
-            hook_func = eval(object_string, module.__dict__)
-        except StandardError, e:
-            raise ExtensionParseError("Error loading hook object: %s (%s)" %
-                    (object_string, e))
-        self.hooks[hook_name] = hook_func
+        self.hooks[hook_name] = load_hook_func(hook_string)
+        self.hook_strings[hook_name] = hook_string
 
     def invoke_hook(self, hook_name, *args, **kwargs):
         """Invoke a hook for this extension.
@@ -128,6 +146,8 @@ def get_extensions(ext_dir):
     * extension.module (string)
     * [optional] extension.description (string)
     * [optional] extension.enabled_by_default (bool)
+    * [optional] extension.sandboxed_hooks (comma separated list of hook
+      names)
     """
     if not os.path.isdir(ext_dir):
         # skip directories that don't exist
@@ -152,6 +172,7 @@ def get_extensions(ext_dir):
             e.name = cf.get("extension", "name")
             e.version = cf.get("extension", "version")
             e.ext_module = cf.get("extension", "module")
+            e.ext_dir = ext_dir
 
             if cf.has_option("extension", "description"):
                 e.description = cf.get("extension", "description")
@@ -160,6 +181,10 @@ def get_extensions(ext_dir):
                 e.enabled_by_default = cf.getboolean(
                     "extension", "enabled_by_default")
                 e.enabled = e.enabled_by_default
+            if cf.has_option("extension", "sandboxed_hooks"):
+                e.sandboxed_hooks = set(name.strip() for name in
+                        cf.get("extension", "sandboxed_hooks").split(",")
+                        if name.strip())
             if cf.has_section("hooks"):
                 for hook_name in cf.options("hooks"):
                     e.add_hook(hook_name, cf.get('hooks', hook_name))
@@ -174,12 +199,69 @@ def get_extensions(ext_dir):
 
     return extensions
 
+class HookStats(object):
+    """Tracks how long one extension's function for a hook takes.
+
+    strikes counts the calls in a row that either raised an exception or
+    went over the time budget for the hook.  A good call resets it.
+    """
+    def __init__(self, hook_name, ext_name):
+        self.hook_name = hook_name
+        self.ext_name = ext_name
+        self.calls = 0
+        self.errors = 0
+        self.over_budget = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.strikes = 0
+
+    def record(self, elapsed, budget, error=False):
+        self.calls += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        if error:
+            self.errors += 1
+        if elapsed > budget:
+            self.over_budget += 1
+        if error or elapsed > budget:
+            self.strikes += 1
+        else:
+            self.strikes = 0
+
+    def average_time(self):
+        if self.calls == 0:
+            return 0.0
+        return self.total_time / self.calls
+
+    def to_dict(self):
+        return {
+            'hook': self.hook_name,
+            'extension': self.ext_name,
+            'calls': self.calls,
+            'errors': self.errors,
+            'over_budget': self.over_budget,
+            'total_time': self.total_time,
+            'average_time': self.average_time(),
+            'max_time': self.max_time,
+        }
+
 class ExtensionManager(object):
+    # time budgets for hooks that are called from the UI, where the
+    # default budget is too generous.
+    DEFAULT_HOOK_BUDGETS = {
+        'item_list_filters': 0.05,
+        'item_context_menu': 0.05,
+    }
+
     def __init__(self, core_ext_dirs, user_ext_dirs):
         self.core_ext_dirs = core_ext_dirs
         self.user_ext_dirs = user_ext_dirs
-        self.enabled_extensions = app.config.get(prefs.ENABLED_EXTENSIONS)
-        self.disabled_extensions = app.config.get(prefs.DISABLED_EXTENSIONS)
+        # copy the lists, we change them in place and they might be the
+        # default values for the prefs
+        self.enabled_extensions = list(
+                app.config.get(prefs.ENABLED_EXTENSIONS))
+        self.disabled_extensions = list(
+                app.config.get(prefs.DISABLED_EXTENSIONS))
 
         # list of core extensions--we keep this list to know whether we
         # can make this extension enabled_by_default
@@ -191,6 +273,12 @@ class ExtensionManager(object):
         # maps hook names to set of extensions that implement the hook
         self.hook_map = collections.defaultdict(set)
 
+        # maps hook names to max seconds a hook function should take.  Hooks
+        # not in the dict use prefs.EXTENSION_HOOK_TIME_BUDGET
+        self.hook_budgets = self.DEFAULT_HOOK_BUDGETS.copy()
+        # maps (hook name, extension name) to HookStats
+        self.hook_stats = {}
+
     def get_extension_by_name(self, name):
         for mem in self.extensions:
             if mem.name == name:
@@ -214,6 +302,153 @@ class ExtensionManager(object):
         """Get a set of all extensions that implement a hook."""
         return self.hook_map[hook_name]
 
+    def get_hook_budget(self, hook_name):
+        """Get the max seconds a function for hook_name should take."""
+        try:
+            return self.hook_budgets[hook_name]
+        except KeyError:
+            return app.config.get(prefs.EXTENSION_HOOK_TIME_BUDGET)
+
+    def set_hook_budget(self, hook_name, budget):
+        """Set the max seconds a function for hook_name should take.
+
+        Pass in None to go back to the default budget.
+        """
+        if budget is None:
+            self.hook_budgets.pop(hook_name, None)
+        else:
+            self.hook_budgets[hook_name] = budget
+
+    def invoke_hook(self, hook_name, *args, **kwargs):
+        """Call all functions registered for a hook.
+
+        Each call is timed against the budget for the hook.  Exceptions are
+        logged and left out of the results.
+
+        :returns: list of return values, one for each hook function that
+                  didn't raise an exception
+        """
+        results = []
+        # _record_hook_call() can disable extensions, which changes the set
+        # we're iterating over, so make a copy.
+        for ext in list(self.extensions_for_hook(hook_name)):
+            results.extend(self._invoke_single_hook(ext, hook_name, args,
+                kwargs))
+        return results
+
+    def invoke_hook_async(self, hook_name, callback, *args, **kwargs):
+        """Call all functions registered for a hook, allowing extensions to
+        run them in the worker process.
+
+        Extensions that list hook_name in sandboxed_hooks get their hook
+        function called in the worker process, so they can't block us and
+        they don't share our state.  args, kwargs and their return values
+        must be picklable.  Other extensions get called right away, like
+        with invoke_hook().
+
+        callback will be passed the list of return values once all hook
+        functions have finished.  It will be called from the backend event
+        loop if any hook function was sandboxed.
+        """
+        results = []
+        sandboxed = []
+        for ext in list(self.extensions_for_hook(hook_name)):
+            if hook_name in ext.sandboxed_hooks:
+                sandboxed.append(ext)
+            else:
+                results.extend(self._invoke_single_hook(ext, hook_name,
+                    args, kwargs))
+        if not sandboxed:
+            callback(results)
+            return
+        pending = set(sandboxed)
+        # The worker process times the hook calls itself, so that time
+        # spent waiting for the worker doesn't count against the budget.
+        def make_callbacks(ext):
+            def on_success(result):
+                retval, elapsed = result
+                self._record_hook_call(ext, hook_name, elapsed)
+                results.append(retval)
+                finished()
+            def on_error(error):
+                logging.error("exception calling sandboxed hook function "
+                        "%s: %s", ext.name, error)
+                # errors from before the hook function was called don't
+                # have a time
+                self._record_hook_call(ext, hook_name,
+                        getattr(error, 'hook_time', 0.0), error=True)
+                finished()
+            def finished():
+                pending.discard(ext)
+                if not pending:
+                    callback(results)
+            return on_success, on_error
+        for ext in sandboxed:
+            on_success, on_error = make_callbacks(ext)
+            workerprocess.run_hook(ext.ext_dir, ext.hook_strings[hook_name],
+                    args, kwargs, on_success, on_error)
+
+    def _invoke_single_hook(self, ext, hook_name, args, kwargs):
+        # Call a single hook function in this process.  Returns a list
+        # containing the return value, or an empty list if it failed.
+        start = clock()
+        try:
+            retval = ext.invoke_hook(hook_name, *args, **kwargs)
+        except StandardError:
+            # hook func raised an error.  Log it, then ignore
+            logging.exception("exception calling hook function %s ",
+                    ext.name)
+            self._record_hook_call(ext, hook_name, clock() - start,
+                    error=True)
+            return []
+        else:
+            self._record_hook_call(ext, hook_name, clock() - start)
+            return [retval]
+
+    def _record_hook_call(self, ext, hook_name, elapsed, error=False):
+        key = (hook_name, ext.name)
+        try:
+            stats = self.hook_stats[key]
+        except KeyError:
+            stats = self.hook_stats[key] = HookStats(hook_name, ext.name)
+        budget = self.get_hook_budget(hook_name)
+        stats.record(elapsed, budget, error)
+        if elapsed > budget:
+            logging.timing("hook %s for extension %s took %0.3fs "
+                    "(budget: %0.3fs)", hook_name, ext.name, elapsed, budget)
+        if stats.strikes >= app.config.get(prefs.EXTENSION_HOOK_MAX_STRIKES):
+            self._disable_misbehaving_extension(ext, stats)
+
+    def _disable_misbehaving_extension(self, ext, stats):
+        # Only unload the extension for this session.  The problem may be
+        # temporary (a slow disk or network), so we don't want to change
+        # the user's extension prefs.
+        logging.warning("unloading extension %s until the next restart: %d "
+                "calls in a row to its %s hook failed or went over budget",
+                ext.name, stats.strikes, stats.hook_name)
+        stats.strikes = 0
+        try:
+            self.unload_extension(ext)
+        except StandardError:
+            logging.exception("error unloading extension %s", ext.name)
+        # make sure we stop calling the extension, even if its unload
+        # function failed
+        self._unregister_hooks(ext)
+        ext.loaded = False
+
+    def get_hook_stats(self):
+        """Get timing stats for each hook function that has been called.
+
+        :returns: list of dicts (see HookStats.to_dict()), slowest total
+                  time first
+        """
+        stats = [s.to_dict() for s in self.hook_stats.values()]
+        stats.sort(key=lambda d: d['total_time'], reverse=True)
+        return stats
+
+    def reset_hook_stats(self):
+        self.hook_stats = {}
+
     def should_load(self, ext):
         if ext.name in self.disabled_extensions:
             return False
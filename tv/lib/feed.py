@@ -36,6 +36,7 @@ import os
 import re
 import time
 import xml
+from collections import deque
 from urlparse import urljoin
 from HTMLParser import HTMLParser, HTMLParseError
 from cStringIO import StringIO
@@ -44,8 +45,7 @@ import logging
 
 from miro.gtcache import gettext as _
 from miro.feedparser import FeedParserDict
-from miro.xhtmltools import (unescape, xhtmlify, fix_xml_header,
-                             fix_html_header)
+from miro.xhtmltools import unescape, fix_xml_header, fix_html_header
 
 from miro.database import DDBObject, ObjectNotFoundError
 from miro.httpclient import grab_url
@@ -53,6 +53,7 @@ from miro import app
 from miro import autodler
 from miro import iconcache
 from miro import databaselog
+from miro import directorysnapshot
 from miro import dialogs
 from miro import download_utils
 from miro import eventloop
@@ -60,6 +61,8 @@ from miro import feedupdate
 from miro import flashscraper
 from miro import models
 from miro import prefs
+from miro import sanitizer
+from miro import scraping
 from miro.plat import resources
 from miro import downloader
 from miro.util import (returns_unicode, returns_filename, unicodify, check_u,
@@ -82,6 +85,11 @@ WHITESPACE_PATTERN = re.compile(r"^[ \t\r\n]*$")
 
 DEFAULT_FEED_ICON = "images/icon-podcast-small.png"
 
+# how often reconcile_counts() runs (in seconds) and how many feeds it
+# checks each time
+COUNT_RECONCILE_INTERVAL = 60
+COUNT_RECONCILE_FEEDS = 10
+
 @returns_unicode
 def default_feed_icon_url():
     return resources.url(DEFAULT_FEED_ICON)
@@ -258,6 +266,9 @@ class FeedImpl(DDBObject):
         self.thumbURL = None
         self.initialUpdate = True
         self.updateFreq = app.config.get(prefs.CHECK_CHANNELS_EVERY_X_MN) * 60
+        self.next_update = None
+        self.unchanged_updates = 0
+        self.publish_interval = None
 
     @classmethod
     def orphaned_view(cls):
@@ -322,6 +333,9 @@ class FeedImpl(DDBObject):
             self.scheduler.cancel()
             self.scheduler = None
 
+    def schedule_update_after_restore(self):
+        self.schedule_update_events(INITIAL_FEED_UPDATE_DELAY)
+
     def update(self):
         """Subclasses should override this
         """
@@ -408,9 +422,19 @@ class Feed(DDBObject, iconcache.IconCacheOwnerMixin):
     It works by passing on attributes to the actual feed.
     """
     ICON_CACHE_VITAL = True
+    # Attributes that store our cached item counts.  These are kept up to
+    # date as items change by update_item_counts().
+    COUNT_ATTRS = ('_num_downloaded', '_num_downloading', '_num_unwatched',
+            '_num_available')
 
     def setup_new(self, url, initiallyAutoDownloadable=None,
-                 search_term=None, title=None):
+                 search_term=None, title=None, queue_generate=False):
+        """Create a new feed.
+
+        If queue_generate is True, we don't fetch the feed right away when
+        it's added to the DB.  Instead the first fetch waits its turn in
+        the feed update queue.  Use this when adding lots of feeds at once.
+        """
         check_u(url)
         if initiallyAutoDownloadable == None:
             mode = app.config.get(prefs.CHANNEL_AUTO_DEFAULT)
@@ -452,6 +476,7 @@ class Feed(DDBObject, iconcache.IconCacheOwnerMixin):
         self.searchTerm = search_term
         self.userTitle = None
         self.visible = True
+        self._queue_generate = queue_generate
         self.setup_common()
 
     def setup_restored(self):
@@ -531,7 +556,19 @@ class Feed(DDBObject, iconcache.IconCacheOwnerMixin):
         return cls.make_view("origURL LIKE 'dtv:directoryfeed:%'")
 
     def on_db_insert(self):
-        self.generate_feed(True)
+        if self._queue_generate:
+            feedupdate.queue_update(self, self._generate_queued_feed)
+        else:
+            self.generate_feed(True)
+
+    def _generate_queued_feed(self):
+        def finished():
+            # lets the update queue start the next feed
+            self.emit('update-finished')
+        if not self.id_exists():
+            finished()
+            return
+        self.generate_feed(True, finished_callback=finished)
 
     def in_folder(self):
         return self.folder_id is not None
@@ -550,6 +587,7 @@ class Feed(DDBObject, iconcache.IconCacheOwnerMixin):
         DDBObject.signal_change(self, needs_save=needs_save)
 
     def on_signal_change(self):
+        self._check_available_count()
         is_updating = bool(self.actualFeed.updating)
         if self.wasUpdating and not is_updating:
             self.emit('update-finished')
@@ -571,60 +609,168 @@ class Feed(DDBObject, iconcache.IconCacheOwnerMixin):
             self.loading = True
             eventloop.add_idle(lambda: self.generate_feed(True), "generate_feed")
         else:
-            self.schedule_update_events(INITIAL_FEED_UPDATE_DELAY)
+            self.actualFeed.schedule_update_after_restore()
 
     def clean_old_items(self):
         if self.actualFeed:
             return self.actualFeed.clean_old_items()
 
     def invalidate_counts(self):
-        for cached_count_attr in ('_num_available', '_num_unwatched',
-                '_num_downloaded', '_num_downloading'):
+        """Throw away our cached counts, they will be recalculated with SQL
+        queries the next time they're needed.
+        """
+        for cached_count_attr in self.COUNT_ATTRS:
             if cached_count_attr in self.__dict__:
                 del self.__dict__[cached_count_attr]
+        folder = self._get_loaded_folder()
+        if folder is not None:
+            folder.invalidate_counts()
 
     def recalc_counts(self):
-        self.invalidate_counts()
+        """Let the frontend know that our counts may have changed.
+
+        The counts themselves are kept up to date by update_item_counts().
+        """
         self.signal_change(needs_save=False)
         if self.in_folder():
             self.get_folder().signal_change(needs_save=False)
 
+    def _get_loaded_folder(self):
+        if self.folder_id is None:
+            return None
+        try:
+            return app.db.get_obj_by_id(self.folder_id)
+        except KeyError:
+            # folder isn't loaded, so it doesn't have any counts cached
+            return None
+
+    def _count_feed_state(self):
+        return (self.last_viewed, self.autoDownloadable, self.getEverything)
+
+    def _check_available_count(self):
+        # The available count depends on our attributes as well as our
+        # items'.  If they change, we need to recalculate it.
+        if ('_num_available' in self.__dict__ and
+                self._available_count_state != self._count_feed_state()):
+            del self._num_available
+            folder = self._get_loaded_folder()
+            if folder is not None:
+                folder.invalidate_counts()
+
+    def _query_count(self, attr):
+        if attr == '_num_downloaded':
+            return self.downloaded_items.count()
+        elif attr == '_num_downloading':
+            return self.downloading_items.count()
+        elif attr == '_num_unwatched':
+            return self.unwatched_items.count()
+        elif attr == '_num_available':
+            return (self.available_items.count() -
+                    self.auto_pending_items.count())
+        else:
+            raise ValueError("Unknown count: %s" % attr)
+
+    def _get_count(self, attr):
+        try:
+            return self.__dict__[attr]
+        except KeyError:
+            if attr == '_num_available':
+                self._available_count_state = self._count_feed_state()
+            count = self.__dict__[attr] = self._query_count(attr)
+            return count
+
+    def _item_count_values(self, key):
+        """Calculate how much an item adds to each of our counts.
+
+        :param key: count key from Item._calc_count_key()
+        :returns: list of values in the same order as COUNT_ATTRS
+        """
+        (feed_id, downloaded, downloading, unwatched, available,
+                creation_time, not_downloaded, eligible) = key
+        available = available and self.last_viewed <= creation_time
+        auto_pending = (self.autoDownloadable and not_downloaded and
+                (eligible or self.getEverything))
+        return [int(downloaded), int(downloading), int(unwatched),
+                int(bool(available)) - int(bool(auto_pending))]
+
+    @classmethod
+    def update_item_counts(cls, old_key, new_key):
+        """Update the cached counts for an item that changed.
+
+        :param old_key: count key for the item before the change, or None
+            for new items
+        :param new_key: count key for the item after the change, or None
+            for removed items
+        """
+        for key, sign in ((old_key, -1), (new_key, 1)):
+            if key is None:
+                continue
+            try:
+                feed = app.db.get_obj_by_id(key[0])
+            except KeyError:
+                # feed isn't loaded, so it doesn't have any counts cached
+                continue
+            feed._change_counts(key, sign)
+
+    def _change_counts(self, key, sign):
+        if key[1] is None:
+            # We don't know what the item's state is, we have to recalculate
+            # our counts from scratch.
+            self.invalidate_counts()
+            return
+        self._check_available_count()
+        values = self._item_count_values(key)
+        for attr, value in zip(self.COUNT_ATTRS, values):
+            if value and attr in self.__dict__:
+                self.__dict__[attr] += value * sign
+        folder = self._get_loaded_folder()
+        if folder is not None:
+            folder.change_counts(values, sign)
+
+    def reconcile_counts(self):
+        """Check our cached counts against the database.
+
+        Our counts should be kept up to date by update_item_counts(), but
+        they can drift if the database is changed behind our back.
+
+        :returns: True if any of the counts were wrong
+        """
+        self._check_available_count()
+        wrong_counts = []
+        for attr in self.COUNT_ATTRS:
+            if attr in self.__dict__:
+                count = self._query_count(attr)
+                if count != self.__dict__[attr]:
+                    wrong_counts.append((attr, self.__dict__[attr], count))
+                    self.__dict__[attr] = count
+        if not wrong_counts:
+            return False
+        logging.debug("fixed item counts for %s: %s", self, wrong_counts)
+        folder = self._get_loaded_folder()
+        if folder is not None:
+            folder.invalidate_counts()
+        self.recalc_counts()
+        return True
+
     def num_downloaded(self):
         """Returns the number of downloaded items in the feed.
         """
-        try:
-            return self._num_downloaded
-        except AttributeError:
-            self._num_downloaded = self.downloaded_items.count()
-            return self._num_downloaded
+        return self._get_count('_num_downloaded')
 
     def num_downloading(self):
         """Returns the number of downloading items in the feed.
         """
-        try:
-            return self._num_downloading
-        except AttributeError:
-            self._num_downloading = self.downloading_items.count()
-            return self._num_downloading
+        return self._get_count('_num_downloading')
 
     def num_unwatched(self):
         """Returns string with number of unwatched videos in feed
         """
-        try:
-            return self._num_unwatched
-        except AttributeError:
-            self._num_unwatched = self.unwatched_items.count()
-            return self._num_unwatched
+        return self._get_count('_num_unwatched')
 
     def num_available(self):
         """Returns string with number of available videos in feed
         """
-        try:
-            return self._num_available
-        except AttributeError:
-            self._num_available = (self.available_items.count() -
-                    self.auto_pending_items.count())
-            return self._num_available
+        return self._get_count('_num_available')
 
     def get_viewed(self):
         """Returns true iff this feed has been looked at
@@ -637,10 +783,7 @@ class Feed(DDBObject, iconcache.IconCacheOwnerMixin):
         # get the list of available items before we reset the time
         available_items = list(self.available_items)
         self.last_viewed = datetime.now()
-        try:
-            del self._num_available
-        except AttributeError:
-            pass
+        self._check_available_count()
         if self.in_folder():
             self.get_folder().signal_change()
         self.signal_change()
@@ -840,6 +983,9 @@ class Feed(DDBObject, iconcache.IconCacheOwnerMixin):
             self.folder_id = new_folder.get_id()
         else:
             self.folder_id = None
+        for folder in (old_folder, new_folder):
+            if folder is not None:
+                folder.invalidate_counts()
         self.signal_change()
         if update_trackers:
             models.Item.update_folder_trackers()
@@ -859,7 +1005,13 @@ class Feed(DDBObject, iconcache.IconCacheOwnerMixin):
             child.set_folder(folder, update_trackers=False)
         models.Item.update_folder_trackers()
 
-    def generate_feed(self, removeOnError=False):
+    def generate_feed(self, removeOnError=False, finished_callback=None):
+        """Figure out what kind of FeedImpl we need and create it.
+
+        For most URLs this means downloading the feed first.
+        finished_callback, if given, is called once we're done, whether or
+        not we succeeded.
+        """
         newFeed = None
         if self.origURL == u"dtv:directoryfeed":
             newFeed = DirectoryFeedImpl(self)
@@ -880,13 +1032,25 @@ class Feed(DDBObject, iconcache.IconCacheOwnerMixin):
         elif SEARCH_URL_MATCH_RE.match(self.origURL):
             newFeed = SavedSearchFeedImpl(self.origURL, self)
         else:
-            self.download = grab_url(self.origURL,
-                    lambda info: self._generate_feed_callback(info, removeOnError),
-                    lambda error: self._generate_feed_errback(error, removeOnError),
+            def callback(info):
+                try:
+                    self._generate_feed_callback(info, removeOnError)
+                finally:
+                    if finished_callback is not None:
+                        finished_callback()
+            def errback(error):
+                try:
+                    self._generate_feed_errback(error, removeOnError)
+                finally:
+                    if finished_callback is not None:
+                        finished_callback()
+            self.download = grab_url(self.origURL, callback, errback,
                     default_mime_type=u'application/rss+xml')
             logging.debug("added async callback to create feed %s", self.origURL)
         if newFeed:
             self.finish_generate_feed(newFeed)
+            if finished_callback is not None:
+                finished_callback()
 
     def is_watched_folder(self):
         return self.origURL.startswith("dtv:directoryfeed:")
@@ -1173,6 +1337,7 @@ class Feed(DDBObject, iconcache.IconCacheOwnerMixin):
         DDBObject.remove(self)
         self.actualFeed.remove()
         if self.in_folder():
+            self.get_folder().invalidate_counts()
             self.get_folder().signal_change()
 
     def thumbnail_valid(self):
@@ -1199,17 +1364,66 @@ class ThrottledUpdateFeedImpl(FeedImpl):
     """Feed Impl that uses the feedupdate module to schedule it's
     updates.  Only a limited number of ThrottledUpdateFeedImpl objects
     will be updating at any given time.
+
+    We also keep track of how often the feed changes and use that to
+    decide how long to wait between updates.  The time of the next
+    update gets saved, so that restarting Miro doesn't make us update
+    every feed at once.
     """
 
     def schedule_update_events(self, firstTriggerDelay):
         feedupdate.cancel_update(self.ufeed)
         if firstTriggerDelay >= 0:
-            feedupdate.schedule_update(firstTriggerDelay, self.ufeed,
-                    self.update)
+            delay = firstTriggerDelay
+        elif self.updateFreq > 0:
+            delay = self.calc_update_delay()
         else:
-            if self.updateFreq > 0:
-                feedupdate.schedule_update(self.updateFreq, self.ufeed,
-                        self.update)
+            return
+        feedupdate.schedule_update(delay, self.ufeed, self.update)
+        self.next_update = datetime.now() + timedelta(seconds=delay)
+
+    def calc_update_delay(self):
+        return feedupdate.calc_update_delay(self.updateFreq,
+                self.publish_interval, self.unchanged_updates)
+
+    def schedule_update_after_restore(self):
+        delay = INITIAL_FEED_UPDATE_DELAY
+        if self.next_update is not None and self.updateFreq > 0:
+            time_left = self.next_update - datetime.now()
+            time_left = time_left.days * 86400 + time_left.seconds
+            # Don't trust next_update too much, the clock may have
+            # changed since we saved it.
+            delay = max(delay, min(time_left, self.calc_update_delay()))
+        self.schedule_update_events(delay)
+
+    def record_update_result(self, new_entries, entry_dates=None):
+        """Remember the results of an update.
+
+        :param new_entries: number of new entries we found
+        :param entry_dates: list of datetimes for the feed's entries
+        """
+        if new_entries > 0:
+            self.unchanged_updates = 0
+        else:
+            self.unchanged_updates += 1
+        if entry_dates:
+            publish_interval = feedupdate.estimate_publish_interval(
+                    entry_dates)
+            if publish_interval is not None:
+                self.publish_interval = publish_interval
+
+def get_entry_dates(parsed):
+    """Get the publish dates for the entries in a parsed feed."""
+    dates = []
+    for entry in parsed.entries:
+        for key in ('published_parsed', 'updated_parsed'):
+            try:
+                dates.append(datetime(*entry[key][:6]))
+            except (KeyError, TypeError, ValueError):
+                continue
+            else:
+                break
+    return dates
 
 class RSSFeedImplBase(ThrottledUpdateFeedImpl):
     """
@@ -1238,10 +1452,13 @@ class RSSFeedImplBase(ThrottledUpdateFeedImpl):
         self.old_items = set(self.items)
 
     def create_items_for_parsed(self, parsed):
-        """Update the feed using parsed XML passed in"""
+        """Update the feed using parsed XML passed in
+
+        :returns: the number of new entries in parsed
+        """
         app.bulk_sql_manager.start()
         try:
-            self._create_items_for_parsed(parsed)
+            return self._create_items_for_parsed(parsed)
         finally:
             app.bulk_sql_manager.finish()
 
@@ -1267,6 +1484,7 @@ class RSSFeedImplBase(ThrottledUpdateFeedImpl):
         items_byid = {}
         items_byURLTitle = {}
         items_nokey = []
+        new_entries = 0
         for item in self.items:
             rate_limiter.check_for_sleep()
             try:
@@ -1313,6 +1531,8 @@ class RSSFeedImplBase(ThrottledUpdateFeedImpl):
                             pass
             if new and fp_values.first_video_enclosure is not None:
                 self._handle_new_entry(entry, fp_values, channel_title)
+                new_entries += 1
+        return new_entries
 
     def _allow_feed_to_override_title(self):
         """Should the RSS feed override the default title?
@@ -1436,7 +1656,8 @@ class RSSFeedImpl(RSSFeedImplBase):
         start = clock()
         self.parsed = parsed
         self.remember_old_items()
-        self.create_items_for_parsed(parsed)
+        new_entries = self.create_items_for_parsed(parsed)
+        self.record_update_result(new_entries, get_entry_dates(parsed))
 
         try:
             updateFreq = self.parsed["feed"]["ttl"]
@@ -1499,9 +1720,11 @@ class RSSFeedImpl(RSSFeedImplBase):
         if info.get('status') == 304:
             logging.debug("RSSFeedImpl: _update_callback: "
                           "status 304 (%s)", self.ufeed)
+            self.record_update_result(0)
             self.schedule_update_events(-1)
             self.updating = False
-            self.ufeed.signal_change()
+            # save our new next_update value
+            self.signal_change()
             return
         html = info['body']
         if info.has_key('charset'):
@@ -1746,10 +1969,15 @@ class ScraperFeedImpl(ThrottledUpdateFeedImpl):
         self.tempHistory = {}
 
     def get_html(self, urlList, depth=0, linkNumber=0, top=False):
-        """Grabs HTML at the given URL, then processes it
+        """Grabs HTML at the given URLs, then processes it
+
+        The pages are fetched through the scraping queue, which runs
+        several requests at once while limiting the load on each host.
         """
-        url = urlList.pop(0)
-        #print "Grabbing %s" % url
+        for url in urlList:
+            self._get_html(url, depth, linkNumber, top)
+
+    def _get_html(self, url, depth, linkNumber, top):
         etag = None
         modified = None
         if self.linkHistory.has_key(url):
@@ -1760,8 +1988,7 @@ class ScraperFeedImpl(ThrottledUpdateFeedImpl):
                 return
             self.downloads.discard(download)
             try:
-                self.process_downloaded_html(info, urlList, depth, linkNumber,
-                                           top)
+                self.process_downloaded_html(info, depth, linkNumber, top)
             finally:
                 self.check_done()
         def errback(error):
@@ -1771,12 +1998,11 @@ class ScraperFeedImpl(ThrottledUpdateFeedImpl):
             logging.warning("unhandled error for ScraperFeedImpl.get_html: %s",
                             error)
             self.check_done()
-        download = grab_url(url, callback, errback, etag=etag,
+        download = scraping.grab_url(url, callback, errback, etag=etag,
                 modified=modified, default_mime_type='text/html')
         self.downloads.add(download)
 
-    def process_downloaded_html(self, info, urlList, depth, linkNumber,
-                              top=False):
+    def process_downloaded_html(self, info, depth, linkNumber, top=False):
         self.ufeed.confirm_db_thread()
         #print "Done grabbing %s" % info['updated-url']
 
@@ -1796,8 +2022,6 @@ class ScraperFeedImpl(ThrottledUpdateFeedImpl):
                 self.process_links(subLinks, 0, linkNumber)
             else:
                 self.process_links(subLinks, depth+1, linkNumber)
-        if len(urlList) > 0:
-            self.get_html(urlList, depth, linkNumber)
 
     def check_done(self):
         if len(self.downloads) == 0:
@@ -2039,6 +2263,9 @@ class DirectoryScannerImplBase(FeedImpl):
     def default_thumbnail_path(self):
         return resources.path('images/icon-watched-folder.png')
 
+    def on_remove(self):
+        directorysnapshot.remove_snapshots(self.id)
+
     def start_watching_directory(self):
         if app.directory_watcher is not None:
             scan_dir = self._scan_dir()
@@ -2111,6 +2338,10 @@ class DirectoryScannerImplBase(FeedImpl):
                 item.remove()
             for path in to_add:
                 self._make_child(path)
+            # make sure our next scan sees the changes, even if the directory
+            # mtimes don't reflect them.
+            directorysnapshot.invalidate_paths(self.id,
+                    self._watcher_paths_added | self._watcher_paths_deleted)
         finally:
             app.bulk_sql_manager.finish()
         # cleanup and prepare for the next change
@@ -2142,16 +2373,37 @@ class DirectoryScannerImplBase(FeedImpl):
 
         self._before_update()
 
+        # find the files on the filesystem.  The scanner only lists
+        # directories that changed since our last update.
+        scan_dir = self._scan_dir()
+        scanner = None
+        all_files = []
+        if fileutil.isdir(scan_dir) and not is_file_bundle(scan_dir):
+            THRESHOLD = 128
+            scanner = directorysnapshot.SnapshotScanner(self.id, scan_dir)
+            for f in scanner.iter_files():
+                all_files.append(f)
+                length = len(all_files)
+                if not (length % THRESHOLD):
+                    yield
+            if not self.id_exists():
+                # we were removed while scanning
+                return
+        found_files = set(all_files)
+
         known_files = self.calc_known_files()
         my_files = set()
 
-        # Remove items with deleted files or that that are in feeds
+        # Remove items with deleted files or that that are in feeds.  We
+        # only need to check the filesystem for files that the scan didn't
+        # find.
         to_remove = []
         duplicate_paths = []
         for item in self.items:
             filename = item.get_filename()
             if (filename is None or
-                not fileutil.isfile(filename) or
+                (filename not in found_files and
+                    not fileutil.isfile(filename)) or
                 known_files.contains_path(filename)):
                 to_remove.append(item)
             if filename not in my_files:
@@ -2167,6 +2419,8 @@ class DirectoryScannerImplBase(FeedImpl):
         try:
             for item in to_remove:
                 item.remove()
+            if scanner is not None:
+                scanner.save()
         finally:
             app.bulk_sql_manager.finish()
 
@@ -2177,16 +2431,10 @@ class DirectoryScannerImplBase(FeedImpl):
             known_files.add_path(path)
 
         # adds any files we don't know about
-        # files on the filesystem
-        scan_dir = self._scan_dir()
-        if fileutil.isdir(scan_dir) and not is_file_bundle(scan_dir):
-            THRESHOLD = 128
-            all_files = []
-            for f in fileutil.miro_allfiles(scan_dir):
-                all_files.append(f)
-                length = len(all_files)
-                if not (length % THRESHOLD):
-                    yield
+        if scanner is not None:
+            logging.debug("scanned %s: listed %d directories, reused "
+                    "snapshots for %d", scan_dir, scanner.dirs_listed,
+                    scanner.dirs_reused)
             to_add = self._filter_paths(all_files, known_files)
             for path in to_add:
                 app.metadata_progress_updater.will_process_path(path)
@@ -2555,7 +2803,8 @@ class RSSLinkGrabber(xml.sax.handler.ContentHandler,
         if tag.lower() == 'description':
             lg = HTMLLinkGrabber()
             try:
-                html = xhtmlify(unescape(self.descHTML), add_top_tags=True)
+                html = sanitizer.xhtmlify(unescape(self.descHTML),
+                        add_top_tags=True)
                 if not self.charset is None:
                     html = fix_html_header(html, self.charset)
                 self.links[:0] = lg.get_links(html, self.baseurl)
@@ -2625,6 +2874,27 @@ def expire_items():
     finally:
         eventloop.add_timeout(300, expire_items, "Expire Items")
 
+_reconcile_queue = deque()
+def reconcile_counts():
+    """Check the cached item counts for a few feeds against the database.
+
+    We go through all the feeds, COUNT_RECONCILE_FEEDS at a time, so that we
+    don't run lots of COUNT queries at once.
+    """
+    try:
+        if not _reconcile_queue:
+            _reconcile_queue.extend(Feed.make_view().id_list())
+        for i in xrange(min(COUNT_RECONCILE_FEEDS, len(_reconcile_queue))):
+            feed_id = _reconcile_queue.popleft()
+            try:
+                feed = Feed.get_by_id(feed_id)
+            except ObjectNotFoundError:
+                continue
+            feed.reconcile_counts()
+    finally:
+        eventloop.add_timeout(COUNT_RECONCILE_INTERVAL, reconcile_counts,
+                "Reconcile Feed Counts")
+
 def lookup_feed(url, search_term=None):
     try:
         return Feed.get_by_url_and_search(url, search_term)
@@ -31,14 +31,82 @@
 
 Our basic strategy is to limit the number of feeds that are
 simultaniously updating at any given time.  Right now the limit is set
-to 3.
+to 3.  We also limit how many updates hit the same host at once and how
+quickly we start them, so that a bunch of feeds from one site don't
+hammer it.
+
+How often a feed gets updated adapts to the feed.  calc_update_delay()
+starts with the feed's update frequency, then waits longer for feeds
+that rarely publish new entries and for feeds that keep coming back
+unchanged.
 """
 
 import collections
+import urlparse
 
 from miro import eventloop
+from miro.clock import clock
 
 MAX_UPDATES = 3
+# Max number of updates to run on a single host at once
+MAX_UPDATES_PER_HOST = 1
+# Wait at least this many seconds between starting updates on a host
+HOST_UPDATE_SPACING = 2.0
+
+# Never wait longer than this between updates (unless the feed asks us to)
+MAX_UPDATE_DELAY = 24 * 60 * 60
+# Every update in a row that finds nothing new makes us wait this much
+# longer before the next one...
+BACKOFF_FACTOR = 1.5
+# ...up to this many times
+MAX_BACKOFF_STEPS = 6
+# Number of entries to look at when figuring out how often a feed publishes
+PUBLISH_INTERVAL_SAMPLE_SIZE = 10
+
+def _total_seconds(delta):
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
+
+def estimate_publish_interval(dates):
+    """Estimate how often a feed publishes new entries.
+
+    :param dates: list of datetimes for the entries in the feed
+    :returns: median number of seconds between the most recent entries,
+              or None if we can't tell
+    """
+    dates = sorted(set(dates), reverse=True)[:PUBLISH_INTERVAL_SAMPLE_SIZE]
+    if len(dates) < 2:
+        return None
+    intervals = [_total_seconds(dates[i] - dates[i+1])
+                 for i in xrange(len(dates) - 1)]
+    intervals.sort()
+    return intervals[len(intervals) // 2]
+
+def calc_update_delay(update_freq, publish_interval, unchanged_updates):
+    """Calculate how long to wait before updating a feed.
+
+    :param update_freq: normal number of seconds between updates.  We
+                        never update more often than this.
+    :param publish_interval: estimate of how often the feed publishes new
+                             entries, or None
+    :param unchanged_updates: number of updates in a row that didn't find
+                              anything new
+    """
+    delay = update_freq
+    if publish_interval is not None:
+        # check about twice as often as the feed publishes
+        delay = max(delay, publish_interval / 2.0)
+    delay *= BACKOFF_FACTOR ** min(unchanged_updates, MAX_BACKOFF_STEPS)
+    return min(delay, max(MAX_UPDATE_DELAY, update_freq))
+
+def get_host(feed):
+    """Get the host that we contact to update a feed.
+
+    Returns None for feeds that don't use the network.
+    """
+    scheme, host = urlparse.urlsplit(feed.get_url())[:2]
+    if scheme not in ('http', 'https') or not host:
+        return None
+    return host.lower()
 
 class FeedUpdateQueue(object):
     def __init__(self):
@@ -46,6 +114,13 @@ class FeedUpdateQueue(object):
         self.timeouts = {}
         self.callback_handles = {}
         self.currently_updating = set()
+        # maps feed ids -> host for updates in progress
+        self.update_hosts = {}
+        # maps hosts -> number of updates in progress
+        self.host_update_counts = collections.defaultdict(int)
+        # maps hosts -> time we last started an update on them
+        self.host_last_update = {}
+        self.retry_timeout = None
 
     def schedule_update(self, delay, feed, update_callback):
         name = "Feed update (%s)" % feed.get_title()
@@ -62,6 +137,9 @@ class FeedUpdateQueue(object):
 
     def do_update(self, feed, update_callback):
         del self.timeouts[feed.id]
+        self.queue_update(feed, update_callback)
+
+    def queue_update(self, feed, update_callback):
         self.update_queue.append((feed, update_callback))
         self.run_update_queue()
 
@@ -69,22 +147,73 @@ class FeedUpdateQueue(object):
         for callback_handle in self.callback_handles.pop(feed.id):
             feed.disconnect(callback_handle)
         self.currently_updating.remove(feed)
+        host = self.update_hosts.pop(feed.id)
+        if host is not None:
+            self.host_update_counts[host] -= 1
+            if self.host_update_counts[host] == 0:
+                del self.host_update_counts[host]
         # call run_update_queue in an idle to avoid re-updating the feed that
         # just finished.  That could cause weird effects since we are in the
         # update-finished callback right now.  See #16277
         eventloop.add_idle(self.run_update_queue, 'run feed update queue')
 
+    def _host_wait_time(self, host, now):
+        """Get how long we need to wait before updating a feed on host.
+
+        :returns: 0 if we can update now, a number of seconds to wait, or
+                  None if we need to wait for an update to finish
+        """
+        if host is None:
+            return 0
+        if self.host_update_counts[host] >= MAX_UPDATES_PER_HOST:
+            return None
+        try:
+            last_update = self.host_last_update[host]
+        except KeyError:
+            return 0
+        return max(0, last_update + HOST_UPDATE_SPACING - now)
+
+    def _schedule_retry(self, delay):
+        if self.retry_timeout is None:
+            self.retry_timeout = eventloop.add_timeout(delay,
+                    self._retry_update_queue, 'retry feed update queue')
+
+    def _retry_update_queue(self):
+        self.retry_timeout = None
+        self.run_update_queue()
+
     def run_update_queue(self):
+        now = clock()
+        # feeds that we have to wait on because of their host
+        waiting = []
+        retry_delay = None
         while (len(self.update_queue) > 0 and 
                len(self.currently_updating) < MAX_UPDATES):
             feed, update_callback = self.update_queue.popleft()
             if feed in self.currently_updating:
                 continue
+            host = get_host(feed)
+            wait_time = self._host_wait_time(host, now)
+            if wait_time != 0:
+                waiting.append((feed, update_callback))
+                if wait_time is not None:
+                    if retry_delay is None or wait_time < retry_delay:
+                        retry_delay = wait_time
+                continue
             handle = feed.connect('update-finished', self.update_finished)
             handle2 = feed.connect('removed', self.update_finished)
             self.callback_handles[feed.id] = (handle, handle2)
             self.currently_updating.add(feed)
+            self.update_hosts[feed.id] = host
+            if host is not None:
+                self.host_update_counts[host] += 1
+                self.host_last_update[host] = now
             update_callback()
+        # put the feeds we skipped back at the front of the queue, in their
+        # original order
+        self.update_queue.extendleft(reversed(waiting))
+        if retry_delay is not None:
+            self._schedule_retry(retry_delay)
 
 global_update_queue = FeedUpdateQueue()
 
@@ -97,3 +226,12 @@ def schedule_update(delay, feed, update_callback):
     the future.
     """
     global_update_queue.schedule_update(delay, feed, update_callback)
+
+def queue_update(feed, update_callback):
+    """Update a feed as soon as the update queue lets us.
+
+    update_callback should start the update.  The feed must emit
+    update-finished (or removed) when it's done, to make room for the next
+    update.
+    """
+    global_update_queue.queue_update(feed, update_callback)
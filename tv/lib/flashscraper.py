@@ -33,12 +33,21 @@ to a media url.
 
 import logging
 import re
-from miro import httpclient
 import urlparse
 import cgi
+from datetime import timedelta
 from xml.dom import minidom
 from urllib import unquote_plus
-from miro.util import check_u
+from miro import scraping
+from miro.util import check_u, unicodify
+
+# How long we trust a scraped URL before checking it again.  Sites that
+# hand out signed URLs need a short time; the rest rarely change.
+DEFAULT_TTL = timedelta(days=7)
+SIGNED_URL_TTL = timedelta(hours=1)
+
+# maps URLs being scraped to the callbacks waiting for them
+_in_progress = {}
 
 def is_maybe_flashscrapable(url):
     """Returns whether or not the given url is possibly handled by one
@@ -52,28 +61,112 @@ def is_maybe_flashscrapable(url):
     return _get_scrape_function_for(url) is not None
 
 def try_scraping_url(url, callback):
-    check_u(url)
-    scrape = _get_scrape_function_for(url)
+    """Convert a web page url to a media url.
 
-    if scrape is not None:
-        scrape(url,
-               lambda newurl, content_type=u"video/x-flv", title=None: _actual_url_callback(url, callback, newurl, content_type, title))
-    else:
+    callback is called with the new url (None if scraping failed) and the
+    contentType and title keyword arguments.  Results are cached in the
+    database, and if we're already scraping url, we wait for that to
+    finish instead of starting over.
+    """
+    check_u(url)
+    scrape_info = _get_scrape_info_for(url)
+    if scrape_info is None:
         callback(url)
+        return
+
+    entry = scraping.ScrapeCacheEntry.get_by_url(url)
+    if entry is not None and entry.is_fresh():
+        callback(entry.resolved_url, contentType=entry.content_type,
+                title=entry.title)
+        return
+    if url in _in_progress:
+        _in_progress[url].append(callback)
+        return
+    _in_progress[url] = [callback]
+    result = _ScrapeResult(url, entry, scrape_info.get('ttl', DEFAULT_TTL))
+    try:
+        scrape_info['func'](url, result)
+    except StandardError:
+        logging.exception("error scraping %s", url)
+        result(None)
 
 # =============================================================================
 
-# The callback is wrapped in this for flv videos
-def _actual_url_callback(url, callback, new_url, content_type, title):
-    if new_url:
-        check_u(new_url)
-    callback(new_url, contentType=content_type, title=title)
+class _ScrapeResult(object):
+    """Callback that the scrape functions call with their result.
 
-def _get_scrape_function_for(url):
-    check_u(url)
+    It caches the result and passes it on to everyone waiting for the url.
+    """
+    def __init__(self, url, cached, ttl):
+        self.url = url
+        self.cached = cached
+        self.ttl = ttl
+        self.source_url = self.etag = self.modified = None
+
+    def set_source(self, source_url, info):
+        """Remember the first page we fetched, so that we can revalidate
+        the cache entry later.
+        """
+        if self.source_url is None:
+            self.source_url = source_url
+            self.etag = unicodify(info.get('etag'))
+            self.modified = unicodify(info.get('last-modified'))
+
+    def __call__(self, new_url, content_type=u"video/x-flv", title=None):
+        if new_url:
+            check_u(new_url)
+            scraping.store_cache_entry(self.url, new_url, content_type,
+                    title, self.ttl, self.source_url, self.etag,
+                    self.modified)
+        self._finish(new_url, content_type, title)
+
+    def not_modified(self):
+        """The page we scraped last time hasn't changed, so reuse the
+        cached result.
+        """
+        self.cached.refresh(self.ttl)
+        self._finish(self.cached.resolved_url, self.cached.content_type,
+                self.cached.title)
+
+    def _finish(self, new_url, content_type, title):
+        for callback in _in_progress.pop(self.url, []):
+            callback(new_url, contentType=content_type, title=title)
+
+def _grab_url(url, result, callback, errback, headers_only=False):
+    """Fetch a page for a scrape function.
+
+    If result has a stale cache entry that was scraped from url, we send a
+    conditional request and skip the scraping if the page is unchanged.
+    """
+    cached = result.cached
+    if (cached is not None and not headers_only and cached.can_revalidate()
+            and cached.source_url == url):
+        etag, modified = cached.etag, cached.modified
+    else:
+        cached = etag = modified = None
+    def on_info(info):
+        if cached is not None and info.get('status') == 304:
+            result.not_modified()
+            return
+        result.set_source(url, info)
+        callback(info)
+    if headers_only:
+        scraping.grab_headers(url, on_info, errback)
+    else:
+        scraping.grab_url(url, on_info, errback, etag=etag,
+                modified=modified)
+
+def _get_scrape_info_for(url):
     for scrape_info in SCRAPER_INFO_MAP:
         if scrape_info['pattern'].match(url) is not None:
-            return scrape_info['func']
+            return scrape_info
+    return None
+
+def _get_scrape_function_for(url):
+    check_u(url)
+    scrape_info = _get_scrape_info_for(url)
+    if scrape_info is not None:
+        return scrape_info['func']
     return None
 
 def _scrape_youtube_url(url, callback):
@@ -100,8 +193,8 @@ def _scrape_youtube_url(url, callback):
 
     try:
         url = u"http://www.youtube.com/get_video_info?video_id=%s&el=embedded&ps=default&eurl=" % video_id
-        httpclient.grab_url(
-            url,
+        _grab_url(
+            url, callback,
             lambda x: _youtube_callback_step2(x, video_id, callback),
             lambda x: _youtube_errback(x, callback))
 
@@ -192,8 +285,8 @@ def _scrape_vmix_video_url(url, callback):
         l = params['l'][0]
         url = (u"http://sdstage01.vmix.com/videos.php?type=%s&id=%s&l=%s" %
                (type_, id_, l))
-        httpclient.grab_url(url, lambda x: _scrape_vmix_callback(x, callback),
-                           lambda x: _scrape_vmix_errback(x, callback))
+        _grab_url(url, callback, lambda x: _scrape_vmix_callback(x, callback),
+                  lambda x: _scrape_vmix_errback(x, callback))
 
     except StandardError:
         logging.warning("unable to scrape VMix Video URL: %s", url)
@@ -231,8 +324,9 @@ def _scrape_veohtv_video_url(url, callback):
         t = params['type'][0]
         permalink_id = params['permalinkId'][0]
         url = u'http://www.veoh.com/movieList.html?type=%s&permalinkId=%s&numResults=45' % (t, permalink_id)
-        httpclient.grab_url(url, lambda x: _scrape_veohtv_callback(x, callback),
-                           lambda x: _scrape_veohtv_errback(x, callback))
+        _grab_url(url, callback,
+                  lambda x: _scrape_veohtv_callback(x, callback),
+                  lambda x: _scrape_veohtv_errback(x, callback))
     except StandardError:
         logging.warning("unable to scrape Veoh URL: %s", url)
         callback(None)
@@ -256,8 +350,8 @@ def _scrape_veohtv_errback(err, callback):
     callback(None)
 
 def _scrape_break_video_url(url, callback):
-    httpclient.grab_headers(url, lambda x: _scrape_break_callback(x, callback),
-                           lambda x: _scrape_break_errback(x, callback))
+    _grab_url(url, callback, lambda x: _scrape_break_callback(x, callback),
+              lambda x: _scrape_break_errback(x, callback), headers_only=True)
 
 def _scrape_break_callback(info, callback):
     url = info['redirected-url']
@@ -284,8 +378,8 @@ def _scrape_vimeo_video_url(url, callback):
     try:
         id_ = VIMEO_RE.match(url).group(2)
         url = u"http://www.vimeo.com/moogaloop/load/clip:%s" % id_
-        httpclient.grab_url(
-            url,
+        _grab_url(
+            url, callback,
             lambda x: _scrape_vimeo_callback(x, callback),
             lambda x: _scrape_vimeo_errback(x, callback))
     except StandardError:
@@ -298,8 +392,8 @@ def _scrape_vimeo_moogaloop_url(url, callback):
     try:
         id_ = MEGALOOP_RE.match(url).group(2)
         url = u"http://www.vimeo.com/moogaloop/load/clip:%s" % id_
-        httpclient.grab_url(
-            url,
+        _grab_url(
+            url, callback,
             lambda x: _scrape_vimeo_callback(x, callback),
             lambda x: _scrape_vimeo_errback(x, callback))
     except StandardError:
@@ -319,9 +413,9 @@ def _scrape_vimeo_callback(info, callback):
                (id_, req_sig, req_sig_expires))
         hd_url = url + 'hd'
         sd_url = url + 'sd'
-        httpclient.grab_headers(hd_url,
-                                lambda x: callback(hd_url),
-                                lambda x: callback(sd_url))
+        _grab_url(hd_url, callback,
+                  lambda x: callback(hd_url),
+                  lambda x: callback(sd_url), headers_only=True)
     except StandardError:
         logging.exception("Unable to scrape XML for vimeo.com video URL: %s", url)
         callback(None)
@@ -333,7 +427,7 @@ def _scrape_vimeo_errback(err, callback):
 # =============================================================================
 
 SCRAPER_INFO_MAP = [
-    {'pattern': re.compile(r'https?://([^/]+\.)?youtube.com/(watch|v)'), 'func': _scrape_youtube_url},
+    {'pattern': re.compile(r'https?://([^/]+\.)?youtube.com/(watch|v)'), 'func': _scrape_youtube_url, 'ttl': SIGNED_URL_TTL},
     {'pattern': re.compile(r'http://video.google.com/googleplayer.swf'), 'func': _scrape_google_video_url},
     {'pattern': re.compile(r'http://([^/]+\.)?lulu.tv/wp-content/flash_play/flvplayer'), 'func': _scrape_lulu_video_url},
     {'pattern': re.compile(r'http://([^/]+\.)?vmix.com/flash/super_player.swf'), 'func': _scrape_vmix_video_url},
@@ -341,6 +435,6 @@ SCRAPER_INFO_MAP = [
     {'pattern': re.compile(r'http://([^/]+\.)?veoh.com/multiplayer.swf'), 'func': _scrape_veohtv_video_url},
     {'pattern': re.compile(r'http://([^/]+\.)?greenpeaceweb.org/GreenpeaceTV1Col.swf'), 'func': _scrape_green_peace_video_url},
     {'pattern': re.compile(r'http://([^/]+\.)?break.com/'), 'func': _scrape_break_video_url},
-    {'pattern': re.compile(r'http://([^/]+\.)?vimeo.com/\d+'), 'func': _scrape_vimeo_video_url},
-    {'pattern': re.compile(r'http://([^/]+\.)?vimeo.com/moogaloop.swf'), 'func': _scrape_vimeo_moogaloop_url},
+    {'pattern': re.compile(r'http://([^/]+\.)?vimeo.com/\d+'), 'func': _scrape_vimeo_video_url, 'ttl': SIGNED_URL_TTL},
+    {'pattern': re.compile(r'http://([^/]+\.)?vimeo.com/moogaloop.swf'), 'func': _scrape_vimeo_moogaloop_url, 'ttl': SIGNED_URL_TTL},
 ]
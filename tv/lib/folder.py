@@ -130,37 +130,65 @@ class ChannelFolder(FolderBase):
         """
         return feed.Feed.folder_view(self.id)
 
+    def invalidate_counts(self):
+        """Throw away our cached counts, they will be recalculated from our
+        children the next time they're needed.
+        """
+        for cached_count_attr in feed.Feed.COUNT_ATTRS:
+            if cached_count_attr in self.__dict__:
+                del self.__dict__[cached_count_attr]
+
+    def change_counts(self, values, sign):
+        """Update our cached counts after one of our children's items
+        changed.
+
+        :param values: values to change our counts by, in the same order as
+            Feed.COUNT_ATTRS
+        :param sign: 1 to add the values, -1 to subtract them
+        """
+        for attr, value in zip(feed.Feed.COUNT_ATTRS, values):
+            if value and attr in self.__dict__:
+                self.__dict__[attr] += value * sign
+
+    def _get_count(self, attr):
+        try:
+            return self.__dict__[attr]
+        except KeyError:
+            count = 0
+            for child in self.get_children_view():
+                count += child._get_count(attr)
+            self.__dict__[attr] = count
+            return count
+
     def has_downloaded_items(self):
         """True if this folder has feeds with downloaded items.
         """
-        for mem in self.get_children_view():
-            if mem.has_downloaded_items():
-                return True
-        return False
+        return self.num_downloaded() > 0
 
     def has_downloading_items(self):
         """True if this folder has feeds with downloading items.
         """
-        for mem in self.get_children_view():
-            if mem.has_downloading_items():
-                return True
-        return False
+        return self.num_downloading() > 0
+
+    def num_downloaded(self):
+        """Returns number of downloaded items in the folder's feeds.
+        """
+        return self._get_count('_num_downloaded')
+
+    def num_downloading(self):
+        """Returns number of downloading items in the folder's feeds.
+        """
+        return self._get_count('_num_downloading')
 
     def num_unwatched(self):
         """Returns number of unwatched items in feed.
         """
-        unwatched = 0
-        for child in self.get_children_view():
-            unwatched += child.num_unwatched()
-        return unwatched
+        return self._get_count('_num_unwatched')
 
     def num_available(self):
         """Returns number of available items in feed
         """
-        available = 0
-        for child in self.get_children_view():
-            available += child.num_available()
-        return available
+        return self._get_count('_num_available')
 
     def mark_as_viewed(self):
         """Marks all children as viewed.
@@ -172,8 +200,9 @@ class PlaylistFolderItemMap(playlist.PlaylistItemMap):
     """Single row in the map that associates playlist folders with their 
     child items.
     """
-    def setup_new(self, playlist_id, item_id):
-        playlist.PlaylistItemMap.setup_new(self, playlist_id, item_id)
+    def setup_new(self, playlist_id, item_id, position=None):
+        playlist.PlaylistItemMap.setup_new(self, playlist_id, item_id,
+                position)
         self.count = 1
 
     def inc_count(self):
@@ -197,6 +226,18 @@ class PlaylistFolderItemMap(playlist.PlaylistItemMap):
         except ObjectNotFoundError:
             cls(playlist_id, item_id)
 
+    @classmethod
+    def add_item_ids(cls, playlist_id, item_ids):
+        maps = dict((map_.item_id, map_)
+                for map_ in cls.playlist_view(playlist_id))
+        position = cls.next_position(playlist_id)
+        for item_id in item_ids:
+            if item_id in maps:
+                maps[item_id].inc_count()
+            else:
+                maps[item_id] = cls(playlist_id, item_id, position)
+                position += 1
+
     @classmethod
     def remove_item_id(cls, playlist_id, item_id):
         view = cls.make_view('playlist_id=? AND item_id=?',
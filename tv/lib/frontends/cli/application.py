@@ -52,8 +52,10 @@ def setup_logging():
     logger.setLevel(logging.WARN)    
 
 def setup_movie_data_program_info():
-    from miro.plat.renderers.gstreamerrenderer import movie_data_program_info
+    from miro.plat.renderers.gstreamerrenderer import (movie_data_program_info,
+                                                       movie_data_server_info)
     app.movie_data_program_info = movie_data_program_info
+    app.movie_data_server_info = movie_data_server_info
 
 def run_application():
     setup_logging()
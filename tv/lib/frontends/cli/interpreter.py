@@ -423,3 +423,33 @@ class MiroInterpreter(cmd.Cmd):
         def callback(dialog):
             print "TEST CHOICE: %s" % dialog.choice
         d.run(callback)
+
+    def do_loopstats(self, line):
+        """loopstats [count|reset] -- Shows event loop latency stats."""
+        # Don't use run_in_event_loop here, we want this to work even if the
+        # event loop is stalled.
+        line = line.strip()
+        if line == 'reset':
+            eventloop.metrics.reset()
+            print "Event loop stats reset"
+            return
+        try:
+            count = int(line or 20)
+        except ValueError:
+            print "Error: count must be a number"
+            return
+        stats = eventloop.get_metrics()
+        print "QUEUES (current/peak)"
+        for name in sorted(stats['queue_depths']):
+            print " * %s: %d/%d" % (name, stats['queue_depths'][name],
+                    stats['peak_queue_depths'].get(name, 0))
+        wait = stats['thread_pool_wait']
+        if wait['count']:
+            print "THREAD POOL WAIT: %d calls, avg %.3fs, max %.3fs" % (
+                    wait['count'], wait['total'] / wait['count'], wait['max'])
+        print "SLOWEST CALLBACKS (total secs, calls, max secs)"
+        callbacks = stats['callbacks'].items()
+        callbacks.sort(key=lambda (name, h): h['total'], reverse=True)
+        for name, histogram in callbacks[:count]:
+            print " * %8.3f %6d %8.3f  %s" % (histogram['total'],
+                    histogram['count'], histogram['max'], name)
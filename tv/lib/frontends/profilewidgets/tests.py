@@ -46,6 +46,7 @@ from miro.plat.frontends.widgets import widgetset
 from miro.frontends.widgets import dialogs
 from miro.frontends.widgets import itemlistwidgets
 from miro.frontends.widgets import itemlist
+from miro.frontends.widgets import itemrenderer
 
 def startup():
     threads.call_on_ui_thread(_startup)
@@ -64,6 +65,7 @@ def pick_test():
         ProfileItemViewAdd,
         ProfileItemViewRemove,
         ProfileItemViewResort,
+        ProfileItemViewScrollHover,
     ]
     labels = [c.friendly_name() for c in choices]
     index = dialogs.ask_for_choice('Pick Test',
@@ -312,3 +314,48 @@ class ProfileItemViewResort(ProfileItemView):
     def profiled_code(self):
         self.item_list.set_sort(itemlist.NameSort(False))
         self.item_view.model_changed()
+
+class ProfileItemViewScrollHover(ProfileItemView):
+    initial_items = 10000
+    scroll_steps = 500
+    hover_passes = 20
+
+    @classmethod
+    def friendly_name(cls):
+        return "Profile scrolling and hovering over lots of items"
+
+    def make_item_view(self):
+        self.renderer = itemrenderer.ItemRenderer(display_channel=True)
+        self.item_view = itemlistwidgets.StandardView(self.item_list,
+                self.renderer)
+
+    def profiled_code(self):
+        self.profile_scroll()
+        self.profile_hover()
+
+    def profile_scroll(self):
+        # Scroll down the list and then back up.  Coming back up, we should be
+        # able to reuse the layouts for rows that are still cached.
+        total_height = self.initial_items * self.renderer.HEIGHT
+        step = total_height // self.scroll_steps
+        positions = range(0, total_height, step)
+        positions.extend(reversed(positions))
+        for y in positions:
+            self.item_view.set_scroll_position((0, y))
+            self.item_view.redraw_now()
+
+    def profile_hover(self):
+        # Move the mouse across a screenful of rows, like hotspot tracking
+        # does on motion events.
+        width = self.renderer.MIN_WIDTH
+        height = self.renderer.HEIGHT
+        layout_manager = self.item_view.layout_manager
+        rows = list(itertools.islice(self.item_list, 10))
+        for i in xrange(self.hover_passes):
+            for info in rows:
+                self.renderer.info = info
+                self.renderer.attrs = {}
+                self.renderer.group_info = None
+                for x in xrange(0, width, 4):
+                    self.renderer.hotspot_test(None, layout_manager, x,
+                            height // 2, width, height)
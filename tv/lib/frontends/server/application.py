@@ -0,0 +1,99 @@
+# Miro - an RSS based video player application
+# Copyright (C) 2005, 2006, 2007, 2008, 2009, 2010, 2011
+# Participatory Culture Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# In addition, as a special exception, the copyright holders give
+# permission to link the code of portions of this program with the OpenSSL
+# library.
+#
+# You must obey the GNU General Public License in all respects for all of
+# the code used other than OpenSSL. If you modify file(s) with this
+# exception, you may extend this exception to your version of the file(s),
+# but you are not obligated to do so. If you do not wish to do so, delete
+# this exception statement from your version. If you delete this exception
+# statement from all source files in the program, then also delete it here.
+
+"""``miro.frontends.server.application`` -- Headless frontend.
+
+Runs the full backend (feeds, downloads, sharing, ...) without a GUI and
+makes it available through the local JSON API in
+``miro.frontends.server.jsonapi``.  Start it with ``--frontend=server``.
+"""
+
+import logging
+import os
+
+from miro import app
+from miro import controller
+from miro import messages
+from miro import prefs
+from miro import signals
+from miro import startup
+from miro.frontends.server.jsonapi import (APIServer, TOKEN_FILENAME,
+        write_token_file)
+
+def setup_movie_data_program_info():
+    try:
+        from miro.plat.renderers.gstreamerrenderer import (
+                movie_data_program_info, movie_data_server_info)
+    except ImportError:
+        logging.warn("Can't import movie data program info, "
+                "movie data extraction is disabled")
+        return
+    app.movie_data_program_info = movie_data_program_info
+    app.movie_data_server_info = movie_data_server_info
+
+def handle_first_time(callback):
+    # there's nobody to ask about the first time setup, just go with the
+    # defaults
+    callback()
+
+def run_application():
+    app.controller = controller.Controller()
+    host = app.config.get(prefs.SERVER_API_HOST)
+    port = app.config.get(prefs.SERVER_API_PORT)
+    server = APIServer(host, port)
+    support_dir = app.config.get(prefs.SUPPORT_DIRECTORY)
+    if not os.path.isdir(support_dir):
+        os.makedirs(support_dir)
+    token_path = os.path.join(support_dir, TOKEN_FILENAME)
+    write_token_file(token_path, server.token)
+    server.connect_to_backend()
+    signals.system.connect('shutdown',
+            lambda obj: server.shutdown_event.set())
+    # start listening right away, so clients can watch startup progress
+    server.start()
+    logging.info("JSON API listening on http://%s:%d/api/ (token in %s)",
+            host, server.get_port(), token_path)
+
+    startup.install_first_time_handler(handle_first_time)
+    startup.startup()
+    server.message_handler.startup_event.wait()
+    if server.message_handler.startup_failure:
+        logging.error("Error starting up: %s\n%s",
+                *server.message_handler.startup_failure)
+    else:
+        setup_movie_data_program_info()
+        messages.FrontendStarted().send_to_backend()
+        try:
+            # wait with a timeout so that KeyboardInterrupt gets through
+            while not server.shutdown_event.isSet():
+                server.shutdown_event.wait(1.0)
+        except KeyboardInterrupt:
+            pass
+    server.stop()
+    app.controller.shutdown()
@@ -0,0 +1,563 @@
+# Miro - an RSS based video player application
+# Copyright (C) 2005, 2006, 2007, 2008, 2009, 2010, 2011
+# Participatory Culture Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# In addition, as a special exception, the copyright holders give
+# permission to link the code of portions of this program with the OpenSSL
+# library.
+#
+# You must obey the GNU General Public License in all respects for all of
+# the code used other than OpenSSL. If you modify file(s) with this
+# exception, you may extend this exception to your version of the file(s),
+# but you are not obligated to do so. If you do not wish to do so, delete
+# this exception statement from your version. If you delete this exception
+# statement from all source files in the program, then also delete it here.
+
+"""``miro.frontends.server.jsonapi`` -- Local HTTP+JSON API for the
+headless server frontend.
+
+The API maps directly onto the frontend/backend messages:
+
+GET /api/status
+    ``{"started": true/false, "failure": null or [summary, description]}``
+GET /api/messages
+    Lists the backend messages that can be sent, with their arguments.
+POST /api/messages/<name>
+    Sends a backend message.  The body is a JSON object of keyword
+    arguments for the message's constructor, for example
+    ``POST /api/messages/TrackItems {"typ": "feed", "id_": 12}``.
+GET /api/events?since=<seq>&timeout=<secs>
+    Long-polls for frontend messages (ItemList, ItemsChanged, TabsChanged,
+    ...).  Returns ``{"events": [...], "last": <seq>, "missed": bool}``.
+    Pass the ``last`` value as ``since`` in the next request.  ``missed``
+    is true if events were dropped because the client fell too far behind.
+GET /api/events/stream?since=<seq>
+    The same events, as a server-sent event stream.
+GET /api/dialogs
+    Lists the dialogs waiting for an answer.
+POST /api/dialogs/<id>
+    Answers a dialog.  The body is ``{"button": <button text or index>}``
+    plus any extra values the dialog takes (``value``, ``username``, ...).
+POST /api/shutdown
+    Shuts down the server.
+
+Every event is ``{"seq": <n>, "type": <message class name>, "data": {...}}``.
+
+Every request must send the API token in an ``X-Miro-Token`` header.  The
+server writes the token to ``server-api-token`` in the support directory
+when it starts.  POST requests must use ``Content-Type: application/json``
+and the Host header must name the local machine.  Together these keep web
+pages in the user's browser from talking to the API.
+"""
+
+import BaseHTTPServer
+import SocketServer
+import collections
+import datetime
+import inspect
+import logging
+import os
+import threading
+import urlparse
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from miro import dialogs
+from miro import messages
+from miro import signals
+
+# Number of events we keep around for clients that are catching up
+MAX_EVENTS = 5000
+# Longest time we hold a long-poll request open
+MAX_POLL_TIMEOUT = 60.0
+# How often we send a comment on idle event streams, so that we notice when
+# the client goes away
+STREAM_KEEPALIVE = 15.0
+# Don't follow references deeper than this when converting objects to JSON
+MAX_JSON_DEPTH = 8
+# Header that clients send the API token in
+TOKEN_HEADER = 'X-Miro-Token'
+# Name of the file in the support directory that holds the API token
+TOKEN_FILENAME = 'server-api-token'
+
+def generate_token():
+    return os.urandom(16).encode('hex')
+
+def write_token_file(path, token):
+    """Write the API token to path, readable only by the current user."""
+    if os.path.exists(path):
+        os.remove(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0600)
+    f = os.fdopen(fd, 'w')
+    try:
+        f.write(token)
+    finally:
+        f.close()
+
+def tokens_match(expected, given):
+    """Compare tokens in constant time, so timing doesn't leak them."""
+    if given is None or len(given) != len(expected):
+        return False
+    result = 0
+    for x, y in zip(expected, given):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+def host_name(host_header):
+    """Get the host name from a Host header, without the port."""
+    host = host_header.strip().lower()
+    if host.startswith('['):
+        # IPv6 address
+        return host[1:].partition(']')[0]
+    return host.partition(':')[0]
+
+def to_json_value(obj, depth=0):
+    """Convert obj to something that json can encode.
+
+    Message objects and the info objects they carry get converted to dicts
+    of their public attributes.  Other objects (for example the ItemSource
+    inside ItemInfo) get converted to None, since they're backend
+    internals.
+    """
+    if obj is None or isinstance(obj, (bool, int, long, float, unicode)):
+        return obj
+    elif isinstance(obj, str):
+        return obj.decode('utf-8', 'replace')
+    elif isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    elif isinstance(obj, datetime.timedelta):
+        return obj.days * 86400 + obj.seconds + obj.microseconds / 1e6
+    elif depth >= MAX_JSON_DEPTH:
+        return None
+    elif isinstance(obj, dict):
+        return dict((unicode(to_json_value(key, depth + 1)),
+                     to_json_value(value, depth + 1))
+                    for key, value in obj.iteritems())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        return [to_json_value(value, depth + 1) for value in obj]
+    elif isinstance(obj, dialogs.DialogButton):
+        return to_json_value(obj.text)
+    elif getattr(obj.__class__, '__module__', None) == 'miro.messages':
+        return dict((name, to_json_value(value, depth + 1))
+                    for name, value in obj.__dict__.iteritems()
+                    if not name.startswith('_'))
+    else:
+        return None
+
+def encode_message(message):
+    return {
+        'type': message.__class__.__name__,
+        'data': to_json_value(message),
+    }
+
+def backend_message_class(name):
+    """Get the BackendMessage subclass called name, or None."""
+    klass = getattr(messages, name, None)
+    if (isinstance(klass, type) and issubclass(klass, messages.BackendMessage)
+            and klass is not messages.BackendMessage):
+        return klass
+    return None
+
+def describe_backend_messages():
+    """Get a dict mapping backend message names to their arguments."""
+    rv = {}
+    for name in dir(messages):
+        klass = backend_message_class(name)
+        if klass is None:
+            continue
+        init = klass.__init__
+        if inspect.ismethod(init) and inspect.isfunction(init.im_func):
+            args = inspect.getargspec(init.im_func)[0][1:]
+        else:
+            args = []
+        rv[name] = {'args': args, 'doc': inspect.getdoc(klass)}
+    return rv
+
+class EventQueue(object):
+    """Numbered list of recent events that clients can wait on.
+
+    Events get increasing sequence numbers, starting at 1.  Only the last
+    max_events events are kept.
+    """
+    def __init__(self, max_events=MAX_EVENTS):
+        self.events = collections.deque()
+        self.max_events = max_events
+        self.last_seq = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def add(self, event_type, data):
+        self.condition.acquire()
+        try:
+            self.last_seq += 1
+            self.events.append({'seq': self.last_seq, 'type': event_type,
+                'data': data})
+            if len(self.events) > self.max_events:
+                self.events.popleft()
+            self.condition.notifyAll()
+        finally:
+            self.condition.release()
+
+    def close(self):
+        """Wake up everyone waiting for events; used at shutdown."""
+        self.condition.acquire()
+        try:
+            self.closed = True
+            self.condition.notifyAll()
+        finally:
+            self.condition.release()
+
+    def get_since(self, since, timeout=0):
+        """Get the events after the since sequence number.
+
+        If there aren't any, wait up to timeout seconds for some.
+
+        :returns: (events, last_seq, missed) tuple.  missed is True if
+                  some events after since were already dropped.
+        """
+        self.condition.acquire()
+        try:
+            if since > self.last_seq:
+                # the client is from before a restart, start over
+                since = 0
+            if self.last_seq == since and timeout > 0 and not self.closed:
+                self.condition.wait(timeout)
+            events = [e for e in self.events if e['seq'] > since]
+            missed = bool(events) and events[0]['seq'] > since + 1
+            if not events and self.events and self.events[0]['seq'] > since + 1:
+                missed = True
+            return events, self.last_seq, missed
+        finally:
+            self.condition.release()
+
+class PendingDialogs(object):
+    """Tracks dialogs waiting for an answer from an API client."""
+    def __init__(self, event_queue):
+        self.event_queue = event_queue
+        self.dialogs = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    def add(self, dialog):
+        self.lock.acquire()
+        try:
+            dialog_id = self.next_id
+            self.next_id += 1
+            self.dialogs[dialog_id] = dialog
+        finally:
+            self.lock.release()
+        self.event_queue.add('Dialog', self.describe(dialog_id, dialog))
+
+    def describe(self, dialog_id, dialog):
+        return {
+            'id': dialog_id,
+            'class': dialog.__class__.__name__,
+            'title': to_json_value(dialog.title),
+            'description': to_json_value(dialog.description),
+            'buttons': [to_json_value(b.text) for b in dialog.buttons],
+        }
+
+    def list(self):
+        self.lock.acquire()
+        try:
+            return [self.describe(dialog_id, dialog)
+                    for dialog_id, dialog in sorted(self.dialogs.items())]
+        finally:
+            self.lock.release()
+
+    def answer(self, dialog_id, button, **kwargs):
+        """Answer a dialog.
+
+        :param button: the text or index of the button to choose, or None
+                       to close the dialog without choosing one
+        :raises KeyError: if dialog_id or button are unknown
+        """
+        self.lock.acquire()
+        try:
+            dialog = self.dialogs[dialog_id]
+            if button is None:
+                choice = None
+            elif isinstance(button, (int, long)):
+                choice = dialog.buttons[button]
+            else:
+                for choice in dialog.buttons:
+                    if choice.text == button:
+                        break
+                else:
+                    raise KeyError(button)
+            del self.dialogs[dialog_id]
+        finally:
+            self.lock.release()
+        dialog.run_callback(choice, **kwargs)
+        self.event_queue.add('DialogAnswered', {'id': dialog_id})
+
+class ServerMessageHandler(messages.MessageHandler):
+    """Frontend message handler that turns every message into an event."""
+    def __init__(self, event_queue):
+        messages.MessageHandler.__init__(self)
+        self.event_queue = event_queue
+        self.startup_event = threading.Event()
+        self.startup_failure = None
+
+    def handle(self, message):
+        if isinstance(message, messages.StartupSuccess):
+            self.startup_event.set()
+        elif isinstance(message, messages.StartupFailure):
+            self.startup_failure = (message.summary, message.description)
+            self.startup_event.set()
+        try:
+            event = encode_message(message)
+        except StandardError:
+            logging.exception("Error encoding %s", message)
+            return
+        self.event_queue.add(event['type'], event['data'])
+
+class APIError(StandardError):
+    def __init__(self, code, message):
+        StandardError.__init__(self, message)
+        self.code = code
+        self.message = message
+
+class APIRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.0'
+
+    def log_message(self, format, *args):
+        logging.debug("jsonapi: %s - %s", self.address_string(),
+                format % args)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _check_request(self, method):
+        """Make sure a request is from a local client that knows the token.
+
+        :raises APIError: if it's not
+        """
+        host = self.headers.get('Host')
+        if host is None or host_name(host) not in self.server.allowed_hosts:
+            raise APIError(403, 'Bad Host header')
+        if not tokens_match(self.server.token,
+                self.headers.get(TOKEN_HEADER)):
+            raise APIError(401, 'Missing or invalid API token')
+        if method == 'POST':
+            content_type = self.headers.get('Content-Type', '')
+            if content_type.partition(';')[0].strip() != 'application/json':
+                raise APIError(415, 'Content-Type must be application/json')
+
+    def _dispatch(self, method):
+        try:
+            self._check_request(method)
+        except APIError, e:
+            self._send_error(e)
+            return
+        path, dummy, query = self.path.partition('?')
+        self.query = urlparse.parse_qs(query)
+        parts = [p for p in path.split('/') if p]
+        if len(parts) < 2 or parts[0] != 'api':
+            self._send_error(APIError(404, 'Not found'))
+            return
+        handler_name = '%s_%s' % (method.lower(), parts[1])
+        handler = getattr(self, handler_name, None)
+        if (handler is None or
+                not self._accepts_args(handler, len(parts) - 2)):
+            self._send_error(APIError(404, 'Not found'))
+            return
+        try:
+            rv = handler(*parts[2:])
+        except APIError, e:
+            self._send_error(e)
+        except StandardError:
+            logging.exception("Error handling %s %s", method, self.path)
+            self._send_error(APIError(500, 'Internal error'))
+        else:
+            if rv is not None:
+                self._send_json(200, rv)
+
+    def _accepts_args(self, handler, count):
+        args, varargs, varkw, defaults = inspect.getargspec(handler)
+        max_args = len(args) - 1
+        min_args = max_args - len(defaults or ())
+        return min_args <= count <= max_args
+
+    def _send_json(self, code, value):
+        body = json.dumps(value)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, error):
+        self._send_json(error.code, {'error': error.message})
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length == 0:
+            return {}
+        try:
+            value = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise APIError(400, 'Invalid JSON')
+        if not isinstance(value, dict):
+            raise APIError(400, 'Expected a JSON object')
+        # json gives us unicode keys, but keyword arguments need str
+        return dict((str(key), value) for key, value in value.items())
+
+    def _query_number(self, name, default, type_=int):
+        try:
+            return type_(self.query[name][0])
+        except KeyError:
+            return default
+        except ValueError:
+            raise APIError(400, 'Bad value for %s' % name)
+
+    def get_status(self):
+        handler = self.server.message_handler
+        return {
+            'started': handler.startup_event.isSet(),
+            'failure': handler.startup_failure,
+            'last_event': self.server.event_queue.last_seq,
+        }
+
+    def get_messages(self):
+        return describe_backend_messages()
+
+    def post_messages(self, name):
+        klass = backend_message_class(name)
+        if klass is None:
+            raise APIError(404, 'Unknown backend message: %s' % name)
+        kwargs = self._read_json()
+        try:
+            message = klass(**kwargs)
+        except TypeError, e:
+            raise APIError(400, 'Bad arguments for %s: %s' % (name, e))
+        message.send_to_backend()
+        return {'ok': True}
+
+    def get_events(self, stream=None):
+        if stream == 'stream':
+            self._stream_events()
+            return None
+        elif stream is not None:
+            raise APIError(404, 'Not found')
+        since = self._query_number('since', 0)
+        timeout = min(self._query_number('timeout', 0, float),
+                MAX_POLL_TIMEOUT)
+        events, last_seq, missed = self.server.event_queue.get_since(since,
+                timeout)
+        return {'events': events, 'last': last_seq, 'missed': missed}
+
+    def _stream_events(self):
+        since = self._query_number('since', 0)
+        queue = self.server.event_queue
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        try:
+            while not queue.closed:
+                events, since, missed = queue.get_since(since,
+                        STREAM_KEEPALIVE)
+                if missed:
+                    self.wfile.write('event: missed\ndata: {}\n\n')
+                if not events:
+                    self.wfile.write(': keepalive\n\n')
+                for event in events:
+                    self.wfile.write('id: %d\nevent: %s\ndata: %s\n\n' % (
+                        event['seq'], event['type'], json.dumps(event)))
+                self.wfile.flush()
+        except IOError:
+            # client went away
+            pass
+
+    def get_dialogs(self):
+        return self.server.pending_dialogs.list()
+
+    def post_dialogs(self, dialog_id):
+        kwargs = self._read_json()
+        button = kwargs.pop('button', None)
+        try:
+            self.server.pending_dialogs.answer(int(dialog_id), button,
+                    **kwargs)
+        except (KeyError, IndexError, ValueError):
+            raise APIError(404, 'Unknown dialog or button')
+        return {'ok': True}
+
+    def post_shutdown(self):
+        self._send_json(200, {'ok': True})
+        self.server.shutdown_event.set()
+
+class APIServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """HTTP server for the JSON API.
+
+    It installs itself as the FrontendMessage handler and listens for new
+    dialogs, so it sees everything a GUI frontend would.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host, port, token=None):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port),
+                APIRequestHandler)
+        if token is None:
+            token = generate_token()
+        self.token = token
+        # Host header values we accept.  Checking this stops DNS rebinding
+        # attacks, where a web page gets its own host name to resolve to
+        # our address.
+        self.allowed_hosts = set(['127.0.0.1', 'localhost', host.lower()])
+        self.event_queue = EventQueue()
+        self.pending_dialogs = PendingDialogs(self.event_queue)
+        self.message_handler = ServerMessageHandler(self.event_queue)
+        self.shutdown_event = threading.Event()
+        self.thread = None
+        self._dialog_handle = None
+
+    def connect_to_backend(self):
+        messages.FrontendMessage.install_handler(self.message_handler)
+        self._dialog_handle = signals.system.connect('new-dialog',
+                self._on_new_dialog)
+
+    def disconnect_from_backend(self):
+        if self._dialog_handle is not None:
+            signals.system.disconnect(self._dialog_handle)
+            self._dialog_handle = None
+
+    def _on_new_dialog(self, obj, dialog):
+        self.pending_dialogs.add(dialog)
+
+    def get_port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever,
+                name="JSON API server")
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        self.event_queue.close()
+        self.disconnect_from_backend()
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
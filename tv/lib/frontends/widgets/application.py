@@ -78,6 +78,7 @@ from miro.frontends.widgets import displays
 from miro.frontends.widgets import menus
 from miro.frontends.widgets import tablistmanager
 from miro.frontends.widgets import playback
+from miro.frontends.widgets import playsessions
 from miro.frontends.widgets import search
 from miro.frontends.widgets import rundialog
 from miro.frontends.widgets import watchedfolders
@@ -174,6 +175,8 @@ class Application:
                 itemlistcontroller.ItemListControllerManager()
         app.menu_manager = menus.MenuStateManager()
         app.playback_manager = playback.PlaybackManager()
+        app.play_session_tracker = playsessions.PlaySessionTracker(
+                app.playback_manager)
         app.search_manager = search.SearchManager()
         app.inline_search_memory = search.InlineSearchMemory()
         app.tabs = tablistmanager.TabListManager()
@@ -844,6 +847,22 @@ class Application:
                                    {"filename": filename}),
                                  dialogs.WARNING_MESSAGE)
 
+    def import_itunes_library(self):
+        title = _('Import iTunes Library')
+        filename = dialogs.ask_for_open_pathname(title,
+                filters=[(_('iTunes Library Files'), ['xml'])])
+        if not filename:
+            return
+
+        if os.path.isfile(filename):
+            messages.ImportITunesLibrary(
+                    os.path.dirname(filename)).send_to_backend()
+        else:
+            dialogs.show_message(_('Import iTunes Library - Error'),
+                                 _('File %(filename)s does not exist.',
+                                   {"filename": filename}),
+                                 dialogs.WARNING_MESSAGE)
+
     def export_feeds(self):
         title = _('Export OPML File')
         slug = app.config.get(prefs.SHORT_APP_NAME).lower()
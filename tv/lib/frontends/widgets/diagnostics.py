@@ -42,6 +42,7 @@ from miro.gtcache import gettext as _
 from miro.plat.frontends.widgets import widgetset
 from miro.frontends.widgets import widgetutil
 from miro.frontends.widgets import widgetconst
+from miro.frontends.widgets import imagepool
 from miro.frontends.widgets.dialogs import MainDialog
 from miro.dialogs import BUTTON_OK
 
@@ -76,6 +77,11 @@ def get_database_object_count():
     # should be a read-only endeavor, so it should be ok.
     return app.db.persistent_object_count()
 
+def get_image_cache_stats(name):
+    stats = imagepool.get_stats()[name]
+    return _("%(count)d cached, %(hits)d hits, %(misses)d misses, "
+             "%(evictions)d evicted", stats)
+
 SEPARATOR = None
 SHOW = _("Show")
 
@@ -130,6 +136,10 @@ def run_dialog():
                  get_database_size(), "0B", False)},
             {"label": _("Total db objects in memory:"),
              "data": lambda: "%d" % get_database_object_count()},
+            {"label": _("Image cache:"),
+             "data": lambda: get_image_cache_stats('images')},
+            {"label": _("Image surface cache:"),
+             "data": lambda: get_image_cache_stats('surfaces')},
 
             SEPARATOR,
 
@@ -33,18 +33,46 @@ filenames.
 imagepool handles creating Image and ImageSurface objects for image
 filenames.  It caches Image/ImageSurface objecsts so to avoid re-creating
 them.
+
+Scaled images are also saved to disk, keyed by the source path, its mtime and
+the target size, so that we only need to decode the full-sized source image
+once.  The disk cache is capped at DISK_CACHE_SIZE bytes, we remove the least
+recently used files once it gets bigger than that.  get_surface_async() does
+the decoding/scaling in a background thread so that it doesn't block the UI
+thread.
 """
 
+import hashlib
 import logging
+import os
+import threading
 import traceback
+import Queue
 
+from miro import app
+from miro import fileutil
+from miro import prefs
 from miro import util
 from miro.plat import resources
+from miro.plat.frontends.widgets import threads
 from miro.plat.frontends.widgets import widgetset
 
 broken_image = widgetset.Image(resources.path('images/broken-image.gif'))
 
-CACHE_SIZE = 2000 # number of objects to keep in memory
+# max number of pixels to keep in memory for each pool (about 64MB at 4
+# bytes per pixel)
+CACHE_SIZE = 16 * 1024 * 1024
+
+# max bytes of scaled images to keep on disk.  When we go over it, we prune
+# the cache down to DISK_CACHE_PRUNE_TARGET.
+DISK_CACHE_SIZE = 64 * 1024 * 1024
+DISK_CACHE_PRUNE_TARGET = 48 * 1024 * 1024
+# check the disk cache size after this many writes.  We also check on the
+# first write of each run.
+DISK_CACHE_PRUNE_INTERVAL = 100
+
+def _pixel_count(image):
+    return max(int(image.width * image.height), 1)
 
 def resize_image(image, dest_width, dest_height, upsize_threshold=1.5):
     # handle corner case of empty dest
@@ -85,25 +113,193 @@ def resize_one_dimension(image, width_scale, height_scale,
     # okay, give up on scaling and just return the image
     return image
 
-class ImagePool(util.Cache):
-    def create_new_value(self, (path, size)):
+def _disk_cache_directory():
+    return os.path.join(app.config.get(prefs.ICON_CACHE_DIRECTORY), 'scaled')
+
+def disk_cache_path(path, size):
+    """Get the path to store a scaled copy of an image.
+
+    :returns: filename, or None if path can't be stat()ed
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+    except (OSError, TypeError):
+        return None
+    if isinstance(path, unicode):
+        path = path.encode('utf-8')
+    key = '%s\0%r\0%dx%d' % (path, mtime, size[0], size[1])
+    return os.path.join(_disk_cache_directory(),
+            hashlib.md5(key).hexdigest() + '.png')
+
+_disk_cache_lock = threading.Lock()
+_writes_since_prune = DISK_CACHE_PRUNE_INTERVAL
+
+def prune_disk_cache(max_size=DISK_CACHE_SIZE,
+        target_size=DISK_CACHE_PRUNE_TARGET):
+    """Remove the least recently used scaled images from the disk cache.
+
+    Nothing is removed unless the cache is bigger than max_size.  Then we
+    remove files until it's no bigger than target_size.
+    """
+    cache_dir = _disk_cache_directory()
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return
+    files = []
+    total_size = 0
+    for name in names:
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+        total_size += stat.st_size
+    if total_size <= max_size:
+        return
+    files.sort()
+    removed = 0
+    for mtime, size, path in files:
+        if total_size <= target_size:
+            break
         try:
-            image = widgetset.Image(path)
-        except StandardError:
-            logging.warn("error loading image %s:\n%s", path,
-                    traceback.format_exc())
+            os.remove(path)
+        except OSError:
+            continue
+        total_size -= size
+        removed += 1
+    logging.info("imagepool: removed %d scaled images from the disk cache",
+            removed)
+
+def _disk_cache_written():
+    global _writes_since_prune
+    with _disk_cache_lock:
+        _writes_since_prune += 1
+        if _writes_since_prune < DISK_CACHE_PRUNE_INTERVAL:
+            return
+        _writes_since_prune = 0
+        prune_disk_cache()
+
+def _read_image(path):
+    try:
+        return widgetset.Image(path)
+    except StandardError:
+        logging.warn("error loading image %s:\n%s", path,
+                traceback.format_exc())
+        return None
+
+def _save_image(image, cache_path):
+    try:
+        fileutil.makedirs(os.path.dirname(cache_path))
+    except OSError:
+        pass
+    tmp_path = cache_path + '.part'
+    try:
+        image.save(tmp_path)
+        fileutil.rename(tmp_path, cache_path)
+    except (IOError, OSError):
+        logging.warn("error saving scaled image to %s:\n%s", cache_path,
+                traceback.format_exc())
+    else:
+        _disk_cache_written()
+
+def load_image(path, size=None):
+    """Load an Image for path, scaled to size.
+
+    Scaled images are read from the disk cache if possible.  If not, they get
+    saved there for next time.  This method doesn't touch the in-memory
+    caches, so it's safe to call from any thread.
+    """
+    if size is None or (size[0] * size[1]) == 0:
+        image = _read_image(path)
+        if image is None:
             image = broken_image
         if size is not None:
             image = resize_image(image, *size)
         return image
 
+    cache_path = disk_cache_path(path, size)
+    if cache_path is not None and fileutil.exists(cache_path):
+        image = _read_image(cache_path)
+        if image is not None:
+            # update the mtime, so that prune_disk_cache() knows we used it
+            try:
+                os.utime(cache_path, None)
+            except OSError:
+                pass
+            return image
+    image = _read_image(path)
+    if image is None:
+        return resize_image(broken_image, *size)
+    scaled = resize_image(image, *size)
+    if cache_path is not None and scaled is not image:
+        _save_image(scaled, cache_path)
+    return scaled
+
+class ImagePool(util.Cache):
+    def create_new_value(self, (path, size)):
+        return load_image(path, size)
+
 class ImageSurfacePool(util.Cache):
     def create_new_value(self, (path, size)):
         image = _imagepool.get((path, size))
         return widgetset.ImageSurface(image)
 
-_imagepool = ImagePool(CACHE_SIZE)
-_image_surface_pool = ImageSurfacePool(CACHE_SIZE)
+class ImageLoader(object):
+    """Decode and scale images in a background thread.
+
+    Requests are handled in the order they came in.  Once an image is
+    loaded, we add it to the ImagePool and call the callbacks for it in the
+    UI thread.
+    """
+    def __init__(self):
+        self.queue = Queue.Queue()
+        self.callbacks = {}
+        self.thread = None
+
+    def request(self, path, size, callback):
+        """Request that the image for (path, size) be loaded.
+
+        :param callback: function to call in the UI thread once the image is
+                         loaded.  It's passed no arguments.
+        """
+        key = (path, size)
+        if key in self.callbacks:
+            self.callbacks[key].append(callback)
+            return
+        self.callbacks[key] = [callback]
+        self.queue.put(key)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._thread_loop,
+                    name="Image Loader")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _thread_loop(self):
+        while True:
+            path, size = self.queue.get()
+            try:
+                image = load_image(path, size)
+            except StandardError:
+                logging.warn("error loading image %s:\n%s", path,
+                        traceback.format_exc())
+                image = resize_image(broken_image, *size)
+            threads.call_on_ui_thread(self._image_loaded, (path, size),
+                    image)
+
+    def _image_loaded(self, key, image):
+        _imagepool.set(key, image)
+        for callback in self.callbacks.pop(key, []):
+            try:
+                callback()
+            except StandardError:
+                logging.warn("error in image loaded callback:\n%s",
+                        traceback.format_exc())
+
+_imagepool = ImagePool(CACHE_SIZE, _pixel_count)
+_image_surface_pool = ImageSurfacePool(CACHE_SIZE, _pixel_count)
+_image_loader = ImageLoader()
 
 def get(path, size=None):
     """Returns an Image for path.
@@ -127,6 +323,35 @@ def get_surface(path, size=None):
     """
     return _image_surface_pool.get((path, size))
 
+def get_surface_async(path, size, callback):
+    """Returns an ImageSurface for path, without blocking to decode it.
+
+    If the scaled image isn't in memory yet, we start loading it in a
+    background thread and return None.  Callers should draw a placeholder
+    instead, then redraw when callback is called.
+
+    :param path: the filename for the image
+    :param size: size of the space the image needs to fit into
+    :param callback: function to call in the UI thread once the image is
+                     ready.  It's passed no arguments.
+    """
+    key = (path, size)
+    if key in _image_surface_pool or key in _imagepool:
+        return _image_surface_pool.get(key)
+    _image_loader.request(path, size, callback)
+    return None
+
+def get_stats():
+    """Get stats for the image caches.
+
+    :returns: dict mapping 'images' and 'surfaces' to the stats dicts from
+              util.Cache.get_stats()
+    """
+    return {
+        'images': _imagepool.get_stats(),
+        'surfaces': _image_surface_pool.get_stats(),
+    }
+
 def get_image_display(path, size=None):
     """Returns an ImageDisplay for path.
 
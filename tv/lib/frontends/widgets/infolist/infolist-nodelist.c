@@ -43,6 +43,8 @@
         PyErr_SetString(PyExc_ValueError, "node not in list"); \
         return error_rv; }
 
+#define TREE_SIZE(node) ((node) ? (node)->tree_size : 0)
+
 InfoListNode*
 infolist_node_new(PyObject* id,
                   PyObject* info,
@@ -62,6 +64,9 @@ infolist_node_new(PyObject* id,
         node->sort_key = sort_key;
         node->prev = node->next = NULL;
         node->group_hash = -1;
+        node->tree_parent = node->tree_left = node->tree_right = NULL;
+        node->tree_priority = 0;
+        node->tree_size = 0;
         return node;
 }
 
@@ -84,6 +89,9 @@ infolist_node_make_sentinals(InfoListNode* start, InfoListNode* end)
         start->sort_key = end->sort_key = NULL;
         start->next = end->next = end;
         end->prev = start->prev = start;
+        start->tree_parent = start->tree_left = start->tree_right = NULL;
+        end->tree_parent = end->tree_left = end->tree_right = NULL;
+        start->tree_size = end->tree_size = 0;
 }
 
 int
@@ -206,9 +214,8 @@ infolist_nodelist_new(void)
         nodelist->node_count = 0;
         infolist_node_make_sentinals(&nodelist->sentinal_start,
                                      &nodelist->sentinal_end);
-        nodelist->index_lookup = NULL;
-        nodelist->index_lookup_capacity = 0;
-        nodelist->index_lookup_dirty = 0;
+        nodelist->tree_root = NULL;
+        nodelist->tree_seed = 2463534242U;
         nodelist->node_positions_dirty = 0;
         nodelist->plat_data = nodelist->plat_data2 = nodelist->plat_data3 = NULL;
         return nodelist;
@@ -231,10 +238,145 @@ infolist_nodelist_free(InfoListNodeList* nodelist)
                 infolist_node_free(node);
                 node = next;
         }
-        PyMem_Free(nodelist->index_lookup);
         PyMem_Free(nodelist);
 }
 
+// Order-statistic tree functions.
+//
+// The tree is a treap: it's ordered by the node's position in the list and
+// heap-ordered by a random priority, which keeps it balanced (expected depth
+// O(log N)).  Each node stores the size of its subtree, so we can find the
+// nth node or the index of a node by walking a single path of the tree.
+
+static unsigned int
+infolist_nodelist_next_priority(InfoListNodeList* nodelist)
+{
+        // xorshift, we just need something cheap and well-distributed
+        unsigned int x;
+
+        x = nodelist->tree_seed;
+        x ^= x << 13;
+        x ^= x >> 17;
+        x ^= x << 5;
+        nodelist->tree_seed = x;
+        return x;
+}
+
+static void
+infolist_tree_update_size(InfoListNode* node)
+{
+        node->tree_size = (1 + TREE_SIZE(node->tree_left) +
+                           TREE_SIZE(node->tree_right));
+}
+
+// Replace old_child with new_child.  If parent is NULL, old_child is the
+// root of the tree.
+static void
+infolist_tree_replace_child(InfoListNodeList* nodelist,
+                            InfoListNode* parent,
+                            InfoListNode* old_child,
+                            InfoListNode* new_child)
+{
+        if(!parent) {
+                nodelist->tree_root = new_child;
+        } else if(parent->tree_left == old_child) {
+                parent->tree_left = new_child;
+        } else {
+                parent->tree_right = new_child;
+        }
+        if(new_child) new_child->tree_parent = parent;
+}
+
+// Rotate node so that it takes the place of its parent.
+static void
+infolist_tree_rotate_up(InfoListNodeList* nodelist,
+                        InfoListNode* node)
+{
+        InfoListNode* parent;
+        InfoListNode* moved;
+
+        parent = node->tree_parent;
+        infolist_tree_replace_child(nodelist, parent->tree_parent, parent,
+                                    node);
+        if(parent->tree_left == node) {
+                moved = node->tree_right;
+                parent->tree_left = moved;
+                node->tree_right = parent;
+        } else {
+                moved = node->tree_left;
+                parent->tree_right = moved;
+                node->tree_left = parent;
+        }
+        if(moved) moved->tree_parent = parent;
+        parent->tree_parent = node;
+        infolist_tree_update_size(parent);
+        infolist_tree_update_size(node);
+}
+
+// Insert new_node into the tree just before pos.  If pos is NULL, new_node
+// goes at the end.
+static void
+infolist_tree_insert_before(InfoListNodeList* nodelist,
+                            InfoListNode* pos,
+                            InfoListNode* new_node)
+{
+        InfoListNode* parent;
+        InfoListNode* node;
+
+        new_node->tree_left = new_node->tree_right = NULL;
+        new_node->tree_size = 1;
+        new_node->tree_priority = infolist_nodelist_next_priority(nodelist);
+        if(!nodelist->tree_root) {
+                new_node->tree_parent = NULL;
+                nodelist->tree_root = new_node;
+                return;
+        }
+        if(pos && !pos->tree_left) {
+                parent = pos;
+                parent->tree_left = new_node;
+        } else {
+                // new_node goes after the last node of pos's left subtree
+                // (or after the last node in the tree)
+                parent = pos ? pos->tree_left : nodelist->tree_root;
+                while(parent->tree_right) parent = parent->tree_right;
+                parent->tree_right = new_node;
+        }
+        new_node->tree_parent = parent;
+        for(node = parent; node; node = node->tree_parent) {
+                node->tree_size++;
+        }
+        while(new_node->tree_parent &&
+              new_node->tree_parent->tree_priority < new_node->tree_priority) {
+                infolist_tree_rotate_up(nodelist, new_node);
+        }
+}
+
+static void
+infolist_tree_remove(InfoListNodeList* nodelist,
+                     InfoListNode* node)
+{
+        InfoListNode* child;
+        InfoListNode* parent;
+
+        // rotate node down until it has at most 1 child
+        while(node->tree_left && node->tree_right) {
+                if(node->tree_left->tree_priority >
+                                node->tree_right->tree_priority) {
+                        infolist_tree_rotate_up(nodelist, node->tree_left);
+                } else {
+                        infolist_tree_rotate_up(nodelist, node->tree_right);
+                }
+        }
+        child = node->tree_left ? node->tree_left : node->tree_right;
+        parent = node->tree_parent;
+        infolist_tree_replace_child(nodelist, parent, node, child);
+        for(; parent; parent = parent->tree_parent) {
+                parent->tree_size--;
+        }
+        node->tree_parent = node->tree_left = node->tree_right = NULL;
+        node->tree_size = 0;
+}
+
 int
 infolist_nodelist_insert_before(InfoListNodeList* nodelist,
                                 InfoListNode* pos,
@@ -255,9 +397,11 @@ infolist_nodelist_insert_before(InfoListNodeList* nodelist,
         new_node->next = pos;
         pos->prev = new_node;
         old_prev->next = new_node;
+        infolist_tree_insert_before(nodelist,
+                                    infolist_node_is_sentinal(pos) ? NULL : pos,
+                                    new_node);
 
         nodelist->node_count++;
-        nodelist->index_lookup_dirty = 1;
         nodelist->node_positions_dirty = 1;
         return 0;
 }
@@ -281,9 +425,11 @@ infolist_nodelist_insert_after(InfoListNodeList* nodelist,
         new_node->next = old_next;
         pos->next = new_node;
         old_next->prev = new_node;
+        infolist_tree_insert_before(nodelist,
+                infolist_node_is_sentinal(old_next) ? NULL : old_next,
+                new_node);
 
         nodelist->node_count++;
-        nodelist->index_lookup_dirty = 1;
         nodelist->node_positions_dirty = 1;
         return 0;
 }
@@ -300,50 +446,13 @@ infolist_nodelist_remove(InfoListNodeList* nodelist,
         node->prev->next = node->next;
         node->next->prev = node->prev;
         node->prev = node->next = NULL;
+        infolist_tree_remove(nodelist, node);
 
         nodelist->node_count--;
-        nodelist->index_lookup_dirty = 1;
         nodelist->node_positions_dirty = 1;
         return 0;
 }
 
-static int
-infolist_nodelist_ensure_index_lookup_capacity(InfoListNodeList* nodelist)
-{
-        InfoListNode** new_index_lookup;
-        int new_capacity;
-        if(nodelist->index_lookup_capacity >= nodelist->node_count) return 0;
-
-        new_capacity = nodelist->node_count * 2;
-        new_index_lookup = PyMem_Resize(nodelist->index_lookup,
-                                        InfoListNode*,
-                                        new_capacity);
-        if(!new_index_lookup) {
-                PyErr_SetNone(PyExc_MemoryError);
-                return -1;
-        }
-        nodelist->index_lookup = new_index_lookup;
-        nodelist->index_lookup_capacity = new_capacity;
-        return 0;
-}
-
-static int
-infolist_nodelist_ensure_index_lookup(InfoListNodeList* nodelist)
-{
-        int i;
-        InfoListNode* node;
-
-        if(!nodelist->index_lookup_dirty) return 0;
-        if(infolist_nodelist_ensure_index_lookup_capacity(nodelist) == -1)
-                return -1;
-        node = infolist_nodelist_head(nodelist);
-        for(i = 0; i < nodelist->node_count; i++) {
-                nodelist->index_lookup[i] = node;
-                node = node->next;
-        }
-        return 0;
-}
-
 InfoListNode*
 infolist_nodelist_head(InfoListNodeList* nodelist)
 {
@@ -360,24 +469,47 @@ InfoListNode*
 infolist_nodelist_nth_node(InfoListNodeList* nodelist,
                            int n)
 {
+        InfoListNode* node;
+        int left_size;
+
         if(n < 0 || n >= nodelist->node_count) {
                 PyErr_SetString(PyExc_ValueError, "index out of range");
                 return NULL;
         }
-        // special-case this one
-        if(n == 0) return infolist_nodelist_head(nodelist);
-        if(infolist_nodelist_ensure_index_lookup(nodelist) == -1) return NULL;
-        return nodelist->index_lookup[n];
+        node = nodelist->tree_root;
+        while(1) {
+                left_size = TREE_SIZE(node->tree_left);
+                if(n < left_size) {
+                        node = node->tree_left;
+                } else if(n == left_size) {
+                        return node;
+                } else {
+                        n -= left_size + 1;
+                        node = node->tree_right;
+                }
+        }
 }
 
 int
 infolist_nodelist_node_index(InfoListNodeList* nodelist,
                              InfoListNode* node)
 {
+        int index;
+
         CHECK_IN_LIST(node, -1);
+        if(infolist_node_is_sentinal(node)) {
+                PyErr_SetString(PyExc_ValueError, "sentinals have no index");
+                return -1;
+        }
 
-        infolist_nodelist_calc_positions(nodelist);
-        return node->position;
+        index = TREE_SIZE(node->tree_left);
+        while(node->tree_parent) {
+                if(node->tree_parent->tree_right == node) {
+                        index += TREE_SIZE(node->tree_parent->tree_left) + 1;
+                }
+                node = node->tree_parent;
+        }
+        return index;
 }
 
 int
@@ -431,12 +563,40 @@ infolist_nodelist_check_nodes(InfoListNodeList* nodelist)
                 return -1;
         }
 
-        infolist_nodelist_ensure_index_lookup(nodelist);
+        if(nodelist->tree_root && nodelist->tree_root->tree_parent) {
+                PyErr_SetString(PyExc_AssertionError,
+                                "tree root has a parent");
+                return -1;
+        }
+        if(TREE_SIZE(nodelist->tree_root) != nodelist->node_count) {
+                PyErr_SetString(PyExc_AssertionError, "tree size wrong");
+                return -1;
+        }
         node = infolist_nodelist_head(nodelist);
         for(i = 0; i < nodelist->node_count; i++) {
-                if(nodelist->index_lookup[i] != node) {
+                if(node->tree_size != 1 + TREE_SIZE(node->tree_left) +
+                                TREE_SIZE(node->tree_right)) {
+                        PyErr_SetString(PyExc_AssertionError,
+                                        "tree_size wrong");
+                        return -1;
+                }
+                if((node->tree_left && node->tree_left->tree_parent != node) ||
+                   (node->tree_right &&
+                    node->tree_right->tree_parent != node)) {
+                        PyErr_SetString(PyExc_AssertionError,
+                                        "tree_parent wrong");
+                        return -1;
+                }
+                if(node->tree_parent &&
+                   node->tree_parent->tree_priority < node->tree_priority) {
+                        PyErr_SetString(PyExc_AssertionError,
+                                        "tree priority wrong");
+                        return -1;
+                }
+                if(infolist_nodelist_nth_node(nodelist, i) != node ||
+                   infolist_nodelist_node_index(nodelist, node) != i) {
                         PyErr_SetString(PyExc_AssertionError,
-                                        "index_lookup wrong");
+                                        "tree order wrong");
                         return -1;
                 }
                 node = node->next;
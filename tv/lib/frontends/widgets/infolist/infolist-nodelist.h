@@ -35,10 +35,11 @@
 // objects, as well as a sort key, and a dict to store attributes.
 //
 // InfoListNodeList is basically a simple linked list of InfoListNodes.
-// However, InfoListNodeList has some features to be able to lookup rows by
-// their index, and calculate the index of each row.  These operations are
-// O(N), but then O(1) until a node is inserted/removed.  Since we don't do
-// that all that often, this works well in practice.
+// However, InfoListNodeList also keeps the nodes in an order-statistic tree
+// to be able to lookup rows by their index, and calculate the index of each
+// row.  The tree is a treap ordered by list position, where each node stores
+// the size of its subtree.  Inserting, removing, looking up the nth node and
+// finding the index of a node are all O(log N).
 //
 // Error handling:
 //
@@ -65,6 +66,13 @@ struct InfoListNodeStruct
         long group_hash;
         // Call infolist_nodelist_calc_positions before using position
         unsigned int position;
+        // Order-statistic tree data.  tree_size is the number of nodes in
+        // the subtree rooted at this node.  Sentinals aren't in the tree.
+        struct InfoListNodeStruct *tree_parent;
+        struct InfoListNodeStruct *tree_left;
+        struct InfoListNodeStruct *tree_right;
+        unsigned int tree_priority;
+        int tree_size;
 };
 typedef struct InfoListNodeStruct InfoListNode;
 
@@ -120,9 +128,8 @@ struct InfoListNodeListStruct
         int node_count;
         InfoListNode sentinal_start, sentinal_end;
         // Handle index lookup
-        InfoListNode** index_lookup;
-        int index_lookup_capacity;
-        int index_lookup_dirty;
+        InfoListNode* tree_root;
+        unsigned int tree_seed;
         // Handle node positions
         int node_positions_dirty;
         // Place to store Platform-specific stuff
@@ -176,11 +183,12 @@ infolist_nodelist_node_index(InfoListNodeList* nodelist,
                              InfoListNode* node);
 
 // Calculate node positions
-// Set the position attribute for each node with it's current index
+// Set the position attribute for each node with it's current index.  This is
+// O(N), use it to take a snapshot of the positions before changing the list.
 int
 infolist_nodelist_calc_positions(InfoListNodeList* nodelist);
 
-// Debugging function, check that the linked list makes sense
+// Debugging function, check that the linked list and tree make sense
 int
 infolist_nodelist_check_nodes(InfoListNodeList* nodelist);
 
@@ -436,6 +436,7 @@ class ItemList(object):
         * ItemInfo (object)
         * show_details flag (boolean)
         * counter used to change the progress throbber (integer)
+        * flag set once a thumbnail loads in the background (boolean)
 
     filter_set -- ItemFilterSet for this item list
     resort_on_update -- Should we re-sort the list when items change?
@@ -528,6 +529,15 @@ class ItemList(object):
     def finish_throbber(self, item_id):
         self.model.unset_attr(item_id, 'throbber-value')
 
+    def thumbnail_loaded(self, item_id):
+        """Mark an item's row as changed after its thumbnail loaded.
+
+        This makes the views redraw just that row.
+
+        raises a KeyError if item_id is not in the model.
+        """
+        self.model.set_attr(item_id, 'thumbnail-loaded', True)
+
     def _insert_items(self, to_add):
         if len(to_add) == 0:
             return
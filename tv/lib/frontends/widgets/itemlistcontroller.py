@@ -421,6 +421,8 @@ class ItemListController(object):
         self.titlebar.connect_weak('resume-playing', self.on_resume_playing)
         self.standard_item_view.renderer.signals.connect_weak(
                 'throbber-drawn', self.on_throbber_drawn)
+        self.standard_item_view.renderer.signals.connect_weak(
+                'thumbnail-loaded', self.on_thumbnail_loaded)
 
     def set_view(self, _widget, view):
         if view == self.selected_view:
@@ -739,6 +741,15 @@ class ItemListController(object):
     def on_throbber_drawn(self, signaler, item_info):
         self.throbber_manager.start(item_info)
 
+    def on_thumbnail_loaded(self, signaler, item_info):
+        try:
+            self.item_list.thumbnail_loaded(item_info.id)
+        except KeyError:
+            # item was removed while the thumbnail was loading
+            return
+        for item_view in self.all_item_views():
+            item_view.model_changed()
+
     def on_key_press(self, view, key, mods):
         if key == menus.DELETE or key == menus.BKSPACE:
             return self.handle_delete()
@@ -47,7 +47,6 @@ from collections import defaultdict
 from miro import app
 from miro import prefs
 from miro import displaytext
-from miro import util
 from miro import eventloop
 from miro.gtcache import gettext as _
 from miro.frontends.widgets import imagepool
@@ -1002,7 +1001,6 @@ class ListView(ItemView, SorterOwner):
         self.set_row_spacing(5)
         self.set_grid_lines(False, False)
         self.set_alternate_row_backgrounds(True)
-        self.html_stripper = util.HTMLStripper()
         self.renderer_set = renderer_set
         self._width_allocated = None
         SorterOwner.__init__(self, sorts)
@@ -1020,7 +1018,7 @@ class ListView(ItemView, SorterOwner):
     def get_tooltip(self, iter_, column):
         if self.sorters.get('name', None) == column:
             info = self.item_list.model[iter_][0]
-            text, links = self.html_stripper.strip(info.description)
+            text, links = info.description_stripped
             if text:
                 if len(text) > 1000:
                     text = text[:994] + ' [...]'
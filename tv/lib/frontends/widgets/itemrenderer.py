@@ -28,6 +28,7 @@
 # statement from all source files in the program, then also delete it here.
 
 """Constants that define the look-and-feel."""
+import copy
 import math
 import os
 
@@ -180,9 +181,12 @@ class ItemRendererSignals(signals.SignalEmitter):
 
     signals:
         throbber-drawn (obj, item_info) -- a progress throbber was drawn
+        thumbnail-loaded (obj, item_info) -- a thumbnail that we drew a
+            placeholder for finished loading in the background
     """
     def __init__(self):
-        signals.SignalEmitter.__init__(self, 'throbber-drawn')
+        signals.SignalEmitter.__init__(self, 'throbber-drawn',
+                'thumbnail-loaded')
 
 _cached_images = {} # caches ImageSurface for get_image()
 def get_image(image_name):
@@ -207,19 +211,32 @@ def _load_image(image_name):
     path = os.path.join('images', filename)
     return imagepool.get_surface(resources.path(path))
 
+class LayoutCache(util.Cache):
+    """Cache of ItemRendererLayout objects for ItemRendererBase.
+
+    Values are (info, layout) tuples.  Since we don't know how to create new
+    layouts, get() raises a KeyError if there is no value for a key.
+    """
+    def create_new_value(self, key):
+        raise KeyError(key)
+
 class ItemRendererBase(widgetset.InfoListRenderer):
     MIN_WIDTH = 600
     HEIGHT = 147
+    # Number of layouts to keep around.  This should be enough to hold all
+    # visible rows, in both their normal and hover states.
+    LAYOUT_CACHE_SIZE = 200
 
     def __init__(self, wide_image=False):
         widgetset.InfoListRenderer.__init__(self)
         self.canvas = ItemRendererCanvas(wide_image)
+        self.layout_cache = LayoutCache(self.LAYOUT_CACHE_SIZE)
 
     def get_size(self, style, layout_manager):
         return self.MIN_WIDTH, self.HEIGHT
 
     def hotspot_test(self, style, layout_manager, x, y, width, height):
-        layout = self.layout_all(layout_manager, width, height, False, None)
+        layout = self.get_layout(layout_manager, width, height, False, None)
         hotspot_info = layout.find_hotspot(x, y)
         if hotspot_info is None:
             return None
@@ -238,10 +255,45 @@ class ItemRendererBase(widgetset.InfoListRenderer):
             return hotspot
 
     def render(self, context, layout_manager, selected, hotspot, hover):
-        layout = self.layout_all(layout_manager, context.width,
+        layout = self.get_layout(layout_manager, context.width,
                 context.height, selected, hotspot)
         layout.draw(context)
 
+    def get_layout(self, layout_manager, width, height, selected, hotspot):
+        """Get an ItemRendererLayout object for our cell.
+
+        Painting and hotspot tests happen much more often than our rows
+        change, so we cache the layouts that layout_all() creates.  Entries
+        are keyed by the item id, our geometry, and layout_state().  When
+        InfoList.update_infos() changes a row we get a new info object for
+        it, so we also check that the info matches before using an entry.
+        """
+        selected = bool(selected)
+        key = (self.info.id, layout_manager, width, height, selected,
+                hotspot, self.layout_state())
+        try:
+            info, layout = self.layout_cache.get(key)
+        except KeyError:
+            pass
+        else:
+            if info is self.info:
+                return layout
+        # Cached layouts draw using the canvas that created them, so switch
+        # to a copy before starting the new layout.
+        self.canvas = copy.copy(self.canvas)
+        layout = self.layout_all(layout_manager, width, height, selected,
+                hotspot)
+        self.layout_cache.set(key, (self.info, layout))
+        return layout
+
+    def layout_state(self):
+        """Get any state besides our info that affects our layout.
+
+        Subclasses should override this if layout_all() uses something other
+        than self.info.  The return value must be hashable.
+        """
+        return None
+
     def layout_all(self, layout_manager, width, height, selected, hotspot):
         """Create a ItemRendererLayout object for our cell."""
         raise NotImplementedError()
@@ -260,13 +312,22 @@ class ItemRenderer(ItemRendererBase):
                 SHOW_CONTENTS_TEXT)
         self.torrent_folder_description = util.HTMLStripper().strip(text)
 
+    def layout_state(self):
+        return (app.config.get(prefs.PLAY_IN_MIRO),
+                bool(app.playback_manager.is_playing_id(self.info.id)),
+                app.playback_manager.is_paused,
+                self.info.id in app.saved_items,
+                bool(self.should_resume_item()),
+                self.attrs.get('throbber-value', 0))
+
     def layout_all(self, layout_manager, width, height, selected, hotspot):
         download_mode = (self.info.state in ('downloading', 'paused'))
         self.canvas.start_new_cell(layout_manager, width, height, selected,
                 hotspot, download_mode)
         # add elements that are always present
         self.canvas.add_thumbnail(self.info.thumbnail,
-                self.calc_thumbnail_hotspot())
+                self.calc_thumbnail_hotspot(),
+                loaded_callback=self.thumbnail_loaded_callback())
         self.canvas.add_text(self.info.name, ITEM_TITLE_COLOR,
                 self.calc_description(), self.calc_extra_info())
         # add elements for download-mode or non-download-mode
@@ -394,6 +455,13 @@ class ItemRenderer(ItemRendererBase):
         )
         self.canvas.add_torrent_info(lines)
 
+    def thumbnail_loaded_callback(self):
+        """Get a function to call when our thumbnail finishes loading."""
+        info = self.info
+        def callback():
+            self.signals.emit('thumbnail-loaded', info)
+        return callback
+
     def calc_thumbnail_hotspot(self):
         """Decide what hotspot clicking on the thumbnail should activate."""
         if not self.info.downloaded:
@@ -627,15 +695,20 @@ class ItemRendererCanvas(object):
         self.layout_manager = None
         return rv
 
-    def add_thumbnail(self, thumbnail, hotspot, fraction=1.0):
+    def add_thumbnail(self, thumbnail, hotspot, fraction=1.0,
+            loaded_callback=None):
         """Add a thumbnail.
 
         :param thumbnail: image file to use
         :param hotspot: hotspot when the user clicks on the thumbnail.
+        :param loaded_callback: if given, load the thumbnail in the
+            background and call this once it's ready.  Until then we just
+            draw the thumbnail background.
         """
 
         self.thumbnail = thumbnail
         self.thumbnail_fraction = fraction
+        self.thumbnail_loaded_callback = loaded_callback
         self.layout.add_rect(self.image_rect, self.draw_thumbnail, hotspot)
         self.layout.add_rect(self.image_rect.past_right(1),
                 self.draw_thumbnail_separator)
@@ -1095,7 +1168,15 @@ class ItemRendererCanvas(object):
         context.fill()
 
     def draw_thumbnail(self, context, x, y, width, height):
-        icon = imagepool.get_surface(self.thumbnail, (width, height))
+        if self.thumbnail_loaded_callback is not None:
+            icon = imagepool.get_surface_async(self.thumbnail,
+                    (width, height), self.thumbnail_loaded_callback)
+            if icon is None:
+                # still loading, the thumbnail background works as a
+                # placeholder.
+                return
+        else:
+            icon = imagepool.get_surface(self.thumbnail, (width, height))
         icon_x = x + (width - icon.width) // 2
         icon_y = y + (height - icon.height) // 2
         # if our thumbnail is far enough to the left, we need to set a clip
@@ -1278,6 +1359,11 @@ class PlaylistItemRenderer(ItemRenderer):
     def remove_button_info(self):
         return ('remove-playlist', 'remove')
 
+    def layout_state(self):
+        # our description preface shows the playlist order
+        return (ItemRenderer.layout_state(self),
+                self.playlist_sorter.sort_key(self.info))
+
     def calc_description_preface(self):
         order_number = self.playlist_sorter.sort_key(self.info) + 1
         if self.info.description_stripped[0]:
@@ -228,6 +228,9 @@ def get_menu():
                             MenuItem(_("Choose Files...."),
                                      "ChooseFiles",
                                      groups=["NonPlaying"]),
+                            MenuItem(_("iTunes Library..."),
+                                     "ImportITunesLibrary",
+                                     groups=["NonPlaying"]),
                             ]),
                     Separator(),
                     MenuItem(_("Download from a URL"), "NewDownload",
@@ -572,6 +575,10 @@ def on_watch_a_folder():
 def on_search_all_my_files():
     app.widgetapp.import_search_all_my_files()
 
+@action_handler("ImportITunesLibrary")
+def on_import_itunes_library():
+    app.widgetapp.import_itunes_library()
+
 @action_handler("SearchInAFolder")
 def on_search_in_a_folder():
     app.widgetapp.import_search_in_folder()
@@ -79,6 +79,7 @@ class PlaybackManager (signals.SignalEmitter):
         self.create_signal('will-play-attached')
         self.create_signal('will-play-detached')
         self.create_signal('will-pause')
+        self.create_signal('will-seek')
         self.create_signal('will-stop')
         self.create_signal('did-stop')
         self.create_signal('will-fullscreen')
@@ -432,6 +433,7 @@ class PlaybackManager (signals.SignalEmitter):
         self.is_suspended = False
 
     def seek_to(self, progress):
+        self.emit('will-seek', progress)
         self.player.seek_to(progress)
         # Sigh.  We could seek past the end and require a stop, which
         # calls stop and destroys the player.  After we come back,
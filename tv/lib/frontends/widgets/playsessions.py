@@ -0,0 +1,125 @@
+# Miro - an RSS based video player application
+# Copyright (C) 2005, 2006, 2007, 2008, 2009, 2010, 2011
+# Participatory Culture Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# In addition, as a special exception, the copyright holders give
+# permission to link the code of portions of this program with the OpenSSL
+# library.
+#
+# You must obey the GNU General Public License in all respects for all of
+# the code used other than OpenSSL. If you modify file(s) with this
+# exception, you may extend this exception to your version of the file(s),
+# but you are not obligated to do so. If you do not wish to do so, delete
+# this exception statement from your version. If you delete this exception
+# statement from all source files in the program, then also delete it here.
+
+"""``miro.frontends.widgets.playsessions`` -- Report play sessions to the
+backend.
+
+PlaySessionTracker watches the PlaybackManager signals and sends a
+RecordPlaySession message each time the user stops playing an item (or
+moves on to the next one).  The backend uses them for the play history and
+stats in ``miro.playbackstats``.
+"""
+
+from datetime import datetime
+
+from miro import messages
+
+# Progress updates come every half second.  Anything bigger than this is a
+# jump, not playback, so we don't count it as watched time.
+MAX_PROGRESS_STEP = 5.0
+
+class PlaySession(object):
+    """Tracks a single item while it's playing."""
+    def __init__(self, item_info):
+        self.item_id = item_info.id
+        self.start_time = datetime.now()
+        if item_info.duration > 0:
+            self.duration = float(item_info.duration)
+        else:
+            self.duration = None
+        self.watched_time = 0.0
+        self.position = 0.0
+        self.last_elapsed = None
+        self.pause_count = 0
+        self.seek_count = 0
+
+    def update(self, elapsed, total):
+        if total > 0:
+            self.duration = float(total)
+        if self.last_elapsed is not None:
+            step = elapsed - self.last_elapsed
+            if 0 < step <= MAX_PROGRESS_STEP:
+                self.watched_time += step
+                # Only move the position forward for real playback.  The
+                # first update after a seek is the seek target, counting
+                # that would make seeking to the end complete the item.
+                self.position = max(self.position, elapsed)
+        self.last_elapsed = elapsed
+
+    def make_message(self):
+        return messages.RecordPlaySession(self.item_id, self.start_time,
+                datetime.now(), self.duration, self.watched_time,
+                self.position, self.pause_count, self.seek_count)
+
+class PlaySessionTracker(object):
+    def __init__(self, playback_manager):
+        self.session = None
+        playback_manager.connect('selecting-file', self.on_selecting_file)
+        playback_manager.connect('will-play', self.on_will_play)
+        playback_manager.connect('will-pause', self.on_will_pause)
+        playback_manager.connect('will-seek', self.on_will_seek)
+        playback_manager.connect('playback-did-progress', self.on_progress)
+        playback_manager.connect('cant-play-file', self.on_cant_play)
+        playback_manager.connect('will-stop', self.on_will_stop)
+
+    def finish_session(self):
+        if self.session is not None:
+            self.session.make_message().send_to_backend()
+            self.session = None
+
+    def on_selecting_file(self, playback_manager, item_info):
+        self.finish_session()
+        # we only keep stats for items in our database, not ones on
+        # devices or shares
+        if item_info.source_type == 'database':
+            self.session = PlaySession(item_info)
+
+    def on_will_play(self, playback_manager, duration):
+        if self.session is not None:
+            # we may be resuming from somewhere else in the item
+            self.session.last_elapsed = None
+
+    def on_will_pause(self, playback_manager):
+        if self.session is not None:
+            self.session.pause_count += 1
+
+    def on_will_seek(self, playback_manager, progress):
+        if self.session is not None:
+            self.session.seek_count += 1
+            self.session.last_elapsed = None
+
+    def on_progress(self, playback_manager, elapsed, total):
+        if self.session is not None and elapsed is not None:
+            self.session.update(elapsed, total)
+
+    def on_cant_play(self, playback_manager):
+        self.session = None
+
+    def on_will_stop(self, playback_manager):
+        self.finish_session()
@@ -40,6 +40,7 @@ import os
 import stat
 import threading
 import urllib
+import zlib
 import Queue
 from cStringIO import StringIO
 
@@ -60,13 +61,13 @@ from miro.plat import utils
 from miro.plat.resources import get_osname
 from miro.net import NetworkError, ConnectionError, ConnectionTimeout
 
-try:
-    import gzip
-except:
-    gzip = None
-
 REDIRECTION_LIMIT = 10
 MAX_AUTH_ATTEMPTS = 5
+# by default, content_check_callback only gets to see this much of the
+# response body
+CONTENT_CHECK_WINDOW = 64 * 1024
+# how much to read at once when sending file:// URLs to a sink
+FILE_URL_CHUNK_SIZE = 64 * 1024
 
 _logged_noproxy_error = False
 
@@ -318,6 +319,54 @@ class TransferOptions(object):
             self.post_data = data
             self.post_length = len(data)
 
+class MemorySink(object):
+    """Body sink that keeps the response in memory.
+
+    This is what grab_url() uses when neither write_file or sink is given.
+    The data ends up as the 'body' key of the info dict.
+    """
+    def __init__(self):
+        self.buffer = StringIO()
+
+    def write(self, data):
+        self.buffer.write(data)
+
+    def close(self):
+        pass
+
+    def getvalue(self):
+        return self.buffer.getvalue()
+
+class FileSink(object):
+    """Body sink that writes the response to a file object.
+
+    Unlike grab_url()'s write_file argument, the data is written after it's
+    been decoded and there's no support for resuming.
+    """
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def write(self, data):
+        self.fileobj.write(data)
+
+    def close(self):
+        self.fileobj.close()
+
+class ParserSink(object):
+    """Body sink that feeds the response to an incremental parser.
+
+    parser can be anything with feed() and close() methods, for example a
+    HTMLParser or an xml.sax IncrementalParser.
+    """
+    def __init__(self, parser):
+        self.parser = parser
+
+    def write(self, data):
+        self.parser.feed(data)
+
+    def close(self):
+        self.parser.close()
+
 class CurlTransfer(object):
     """A in-progress CURL download.
 
@@ -327,15 +376,24 @@ class CurlTransfer(object):
     """
 
     def __init__(self, options, callback, errback, header_callback=None,
-            content_check_callback=None):
+            content_check_callback=None, sink=None,
+            content_check_window=None):
         """Create a CurlTransfer object.
 
         :param options: TransferOptions object.  The object shouldn't be
             modified after passing it in.
         :param callback: function to call when the transfer succeeds
         :param errback: function to call when the transfer fails
+        :param sink: object to write the body to, if None we use a
+            MemorySink
+        :param content_check_window: max number of bytes to pass to
+            content_check_callback, if None we use CONTENT_CHECK_WINDOW
         """
         self.options = options
+        if content_check_window is None:
+            content_check_window = CONTENT_CHECK_WINDOW
+        self.content_check_window = content_check_window
+        self.custom_sink = sink
         self._reset_transfer_data()
         self.callback = callback
         self.header_callback = header_callback
@@ -353,7 +411,13 @@ class CurlTransfer(object):
         self.headers = {}
         self.handle = None
         self.current_auth_type = None
-        self.buffer = StringIO()
+        if self.custom_sink is not None:
+            self.sink = self.custom_sink
+        else:
+            self.sink = MemorySink()
+        self.decoder = None
+        self.saw_body_data = False
+        self.content_check_data = ''
         self.saw_temporary_redirect = False
         self.headers_finished = False
         self._filehandle = None
@@ -474,10 +538,8 @@ class CurlTransfer(object):
                 self.handle.setopt(pycurl.URL, self.last_url)
                 self._open_file()
                 self.handle.setopt(pycurl.WRITEFUNCTION, self._write_file)
-        elif self.content_check_callback is not None:
-            self.handle.setopt(pycurl.WRITEFUNCTION, self._call_content_check)
         else:
-            self.handle.setopt(pycurl.WRITEFUNCTION, self.buffer.write)
+            self.handle.setopt(pycurl.WRITEFUNCTION, self._write_body)
         self.handle.setopt(pycurl.HEADERFUNCTION, self.header_func)
         if self.should_debug_request():
             logging.warn("debugging request: %s", self.options.url)
@@ -525,12 +587,74 @@ class CurlTransfer(object):
                     str(app.config.get(prefs.HTTP_PROXY_AUTHORIZATION_USERNAME)),
                     str(app.config.get(prefs.HTTP_PROXY_AUTHORIZATION_PASSWORD))))
 
+    def _write_body(self, data):
+        # Don't send error pages to the sink, we will either retry the
+        # request or call the errback.
+        if (self.status_code is not None and
+                not self.check_response_code(self.status_code)):
+            return
+        if not self.saw_body_data:
+            self.saw_body_data = True
+            self._setup_decoder()
+        if self.decoder is not None:
+            data = self._decode(data)
+            if not data:
+                return
+        if (self.content_check_callback is not None and
+                not self._call_content_check(data)):
+            return
+        self.sink.write(data)
+
+    def _setup_decoder(self):
+        encoding = self.headers.get('content-encoding', '').lower()
+        if encoding in ('gzip', 'x-gzip'):
+            # the extra 16 tells zlib to expect a gzip header
+            self.decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self.decoder = zlib.decompressobj()
+
+    def _decode(self, data):
+        try:
+            return self.decoder.decompress(data)
+        except zlib.error:
+            logging.warning("Received header with content-encoding "
+                            "%s, but content is not encoded (%s)",
+                            self.headers.get('content-encoding'),
+                            self.options.url)
+            # pass the rest of the content through as-is
+            self.decoder = None
+            return data
+
+    def _flush_decoder(self):
+        if self.decoder is not None:
+            try:
+                data = self.decoder.flush()
+            except zlib.error:
+                logging.warning("Error decoding content (%s)",
+                                self.options.url)
+                data = ''
+            self.decoder = None
+            if data:
+                self.sink.write(data)
+
     def _call_content_check(self, data):
-        self.buffer.write(data)
+        """Pass the start of the body to content_check_callback.
+
+        The callback sees at most content_check_window bytes, after that we
+        stop calling it.
+
+        :returns: False if the transfer was canceled
+        """
+        needed = self.content_check_window - len(self.content_check_data)
+        if needed <= 0:
+            return True
+        self.content_check_data += data[:needed]
         rv = trap_call('content check callback', self.content_check_callback,
-                self.buffer.getvalue())
+                self.content_check_data)
         if rv == False or isinstance(rv, Exception):
             curl_manager.remove_transfer(self)
+            return False
+        return True
 
     def _open_file(self):
         if self.options.resume:
@@ -658,20 +782,17 @@ class CurlTransfer(object):
         info = self._make_callback_info()
         self.last_url = self.handle.getinfo(pycurl.EFFECTIVE_URL)
         if self.options.write_file is None:
-            if gzip and info.get('content-encoding', '') == 'gzip':
-                try:
-                    self.buffer.seek(0)
-                    info['body'] = gzip.GzipFile(
-                                       fileobj=self.buffer).read()
-                except IOError, e:
-                    info['body'] = self.buffer.getvalue()
-                    logging.warning("Received header with content-encoding "
-                                    "gzip, but content is not gzip encoded")
-            else:
-                info['body'] = self.buffer.getvalue()
+            self._flush_decoder()
+            if self.custom_sink is None:
+                info['body'] = self.sink.getvalue()
 
         if self.check_response_code(info['status']):
             if not self.trying_head_request:
+                if self.options.write_file is None:
+                    rv = trap_call('closing body sink', self.sink.close)
+                    if isinstance(rv, Exception):
+                        self.call_errback(rv)
+                        return
                 self.call_callback(info)
             else:
                 # we tried a HEAD request and it worked, now we can do the
@@ -1001,7 +1122,7 @@ def sanitize_url(url):
 def grab_url(url, callback, errback, header_callback=None,
         content_check_callback=None, write_file=None, etag=None, modified=None,
         default_mime_type=None, resume=False, post_vars=None,
-        post_files=None):
+        post_files=None, sink=None, content_check_window=None):
     """Quick way to download a network resource
 
     grab_url is a simple interface to the HTTPClient class.
@@ -1011,7 +1132,9 @@ def grab_url(url, callback, errback, header_callback=None,
     :param errback: function to call on error
     :param header_callback: function to call after we recieve the headers
     :param content_check_callback: function to call as we recieve content data
-        return False to cancel the transfer.  Note: this function runs in the
+        return False to cancel the transfer.  It's passed all the data
+        we've received so far, up to content_check_window bytes.  Once it's
+        seen that much, we stop calling it.  Note: this function runs in the
         libcurl thread.  Be mindful of threading issues when accessing data
     :param write_file: File path to write to
     :param etag: etag header to send
@@ -1022,11 +1145,20 @@ def grab_url(url, callback, errback, header_callback=None,
     :param post_vars: dictionary of variables to send as POST data
     :param post_files: files to send as POST data (see
         xhtmltools.multipart_encode for the format)
+    :param sink: object to send the body to as we receive it, instead of
+        storing it in memory (see MemorySink, FileSink and ParserSink).  The
+        body is decoded first if it's gzip or deflate encoded.  sink.write()
+        is called in the libcurl thread and sink.close() is called once the
+        transfer succeeds.
+    :param content_check_window: how many bytes of the body
+        content_check_callback gets to see (default: CONTENT_CHECK_WINDOW).
+        Callbacks that cancel transfers based on their size need a window
+        bigger than their limit.
 
     The callback will be passed a dictionary that contains all the HTTP
     headers, as well as the following keys:
         'status': HTTP response code
-        'body': The request body (if write_file is not given)
+        'body': The request body (if write_file and sink are not given)
         'content-length': Length of the downloads as an int
         'total-size': Total size of the download (this is different from
             content-length because it includes the data we are resuming from)
@@ -1040,18 +1172,21 @@ def grab_url(url, callback, errback, header_callback=None,
 
     :returns HTTPClient object
     """
+    if write_file is not None and sink is not None:
+        raise ValueError("write_file and sink can't both be given")
     url = sanitize_url(url)
     if url.startswith("file://"):
-        return _grab_file_url(url, callback, errback, default_mime_type)
+        return _grab_file_url(url, callback, errback, default_mime_type,
+                sink)
     else:
         options = TransferOptions(url, etag, modified, resume, post_vars,
                 post_files, write_file)
         transfer = CurlTransfer(options, callback, errback, header_callback,
-                content_check_callback)
+                content_check_callback, sink, content_check_window)
         transfer.start()
         return HTTPClient(transfer)
 
-def _grab_file_url(url, callback, errback, default_mime_type):
+def _grab_file_url(url, callback, errback, default_mime_type, sink=None):
     path = download_utils.get_file_url_path(url)
     try:
         f = file(path)
@@ -1060,16 +1195,25 @@ def _grab_file_url(url, callback, errback, default_mime_type):
                 args=(FileURLNotFoundError(path),))
     else:
         try:
-            data = f.read()
+            if sink is None:
+                data = f.read()
+            else:
+                while True:
+                    data = f.read(FILE_URL_CHUNK_SIZE)
+                    if not data:
+                        break
+                    sink.write(data)
+                sink.close()
         except IOError:
             eventloop.add_idle(errback, 'grab file url errback',
                     args=(FileURLReadError(path),))
         else:
-            info = {"body": data,
-                          "updated-url":url,
+            info = {"updated-url":url,
                           "redirected-url":url,
                           "content-type": default_mime_type,
                           }
+            if sink is None:
+                info['body'] = data
             eventloop.add_idle(callback, 'grab file url callback',
                     args=(info,))
 
@@ -28,48 +28,189 @@
 # statement from all source files in the program, then also delete it here.
 
 """``miro.importmedia`` -- functions for importing from other music jukeboxes.
+
+The iTunes importer streams through ``iTunes Music Library.xml`` and
+remembers each track it imports as an ITunesTrack, keyed by the track's
+iTunes persistent ID.  Importing the same library again only adds, updates
+or removes the tracks that changed since last time.
 """
 
 import os
 import urllib
+import logging
+from datetime import datetime
+
+from xml.parsers import expat
 
-import xml.sax
-import xml.sax.handler
-import xml.sax.saxutils
+from miro import app
+from miro import eventloop
+from miro import fileutil
+from miro import item
+from miro import models
+from miro.database import DDBObject, ObjectNotFoundError
+from miro.plat.utils import utf8_to_filename
 
 ITUNES_XML_FILE = "iTunes Music Library.xml"
 
-class iTunesMusicLibraryContentHandler(xml.sax.handler.ContentHandler):
-    """A very specific content handler for handling the iTunes music 
-       library file.
+# Number of bytes we read from the library file at a time
+ITUNES_READ_SIZE = 64 * 1024
+# Number of tracks we handle in a single database transaction
+ITUNES_BATCH_SIZE = 500
+
+class iTunesLibraryHandler(object):
+    """Handles expat callbacks while streaming through an iTunes library
+    file.
+
+    The file is a big plist.  Values at the top level go into the library
+    dict as we parse them, so "Music Folder" is available as soon as
+    we're past it.  Track and playlist dicts are appended to tracks and
+    playlists instead of being attached to the rest of the plist.
+    Callers should empty those lists as they go; that way memory use
+    doesn't grow with the size of the library.
 
-       We only care about snarfing the music path then we bail out.
-       This is done by getting the value <key>Music Folder</key>
-       which will appear as <string>...</string>.
+    We use expat directly rather than xml.sax, since the SAX layer more
+    than doubles the time it takes to get through a big library.
     """
 
-    MUSIC_FOLDER_KEYNAME = "Music Folder"
+    SCALAR_ELEMENTS = frozenset(['key', 'string', 'integer', 'real', 'date',
+        'data'])
 
     def __init__(self):
-        self.element_name = None
-        self.in_music_folder_key = False
-        self.music_path = None
+        self.library = {}
+        self.tracks = []
+        self.playlists = []
+        # list of [container, current dict key, name in parent] lists
+        self._stack = []
+        self._text = None
 
-    def startElement(self, name, attrs):
-        self.element_name = name
+    def make_parser(self):
+        # expat doesn't load external entities unless we set an
+        # ExternalEntityRefHandler, so it won't stall trying to fetch the
+        # DTD when there's no network.
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start_element
+        parser.EndElementHandler = self.end_element
+        parser.CharacterDataHandler = self.character_data
+        return parser
 
-    def characters(self, content):
-        if self.element_name == 'key' and content == self.MUSIC_FOLDER_KEYNAME:
-            self.in_music_folder_key = True
-            return
-        if self.in_music_folder_key and self.element_name == 'string':
-            # Must convert to string content - otherwise we get into unicode
-            # troubles when we unquote the URI escapes.
-            self.music_path = str(content)
-            self.in_music_folder_key = False
+    def start_element(self, name, attrs):
+        if name in self.SCALAR_ELEMENTS:
+            self._text = []
+        elif name == 'dict' or name == 'array':
+            if name == 'dict':
+                container = {}
+            else:
+                container = []
+            if not self._stack:
+                self.library = container
+            self._stack.append([container, None, self._child_name()])
+
+    def character_data(self, content):
+        if self._text is not None:
+            self._text.append(content)
+
+    def end_element(self, name):
+        if name == 'key':
+            self._stack[-1][1] = u''.join(self._text)
+            self._text = None
+        elif name in self.SCALAR_ELEMENTS:
+            text = u''.join(self._text)
+            self._text = None
+            self._add_value(self._convert(name, text))
+        elif name == 'dict' or name == 'array':
+            container = self._stack.pop()[0]
+            if len(self._stack) == 2:
+                parent_name = self._stack[1][2]
+                if parent_name == 'Tracks':
+                    self.tracks.append(container)
+                    return
+                elif parent_name == 'Playlists':
+                    self.playlists.append(container)
+                    return
+            self._add_value(container)
+        elif name == 'true':
+            self._add_value(True)
+        elif name == 'false':
+            self._add_value(False)
+
+    def _child_name(self):
+        if not self._stack:
+            return None
+        container, key = self._stack[-1][:2]
+        if isinstance(container, dict):
+            return key
+        else:
+            return len(container)
+
+    def _add_value(self, value):
+        if not self._stack:
             return
-        # Wasn't followed with a <string> as expected...
-        self.in_music_folder_key = False
+        frame = self._stack[-1]
+        if isinstance(frame[0], dict):
+            if frame[1] is not None:
+                frame[0][frame[1]] = value
+                frame[1] = None
+        else:
+            frame[0].append(value)
+
+    def _convert(self, element_name, text):
+        try:
+            if element_name == 'string':
+                return text
+            elif element_name == 'integer':
+                return int(text)
+            elif element_name == 'date':
+                return parse_itunes_date(text)
+            elif element_name == 'real':
+                return float(text)
+        except ValueError:
+            return None
+        # we don't use any binary data (smart playlist criteria, etc)
+        return None
+
+def parse_itunes_date(text):
+    """Convert an iTunes date like 2011-01-01T12:30:00Z to a datetime.
+
+    This is a lot faster than datetime.strptime(), which adds up when
+    there's a date for every track.
+    """
+    if len(text) != 20 or text[10] != 'T' or text[19] != 'Z':
+        raise ValueError("bad date: %r" % text)
+    return datetime(int(text[0:4]), int(text[5:7]), int(text[8:10]),
+            int(text[11:13]), int(text[14:16]), int(text[17:19]))
+
+def iter_itunes_library(path, handler=None):
+    """Stream the tracks and playlists in an iTunes library file.
+
+    Yields ('track', track_dict) and ('playlist', playlist_dict) tuples in
+    the order they appear in the file.  The file is read in chunks, so
+    this works in constant memory no matter how big the library is.
+
+    :param path: directory containing the library file
+    :param handler: iTunesLibraryHandler to use.  Pass one in to look at
+                    the top-level library values afterwards.
+
+    Raises IOError or expat.ExpatError if the file can't be read.
+    """
+    if handler is None:
+        handler = iTunesLibraryHandler()
+    parser = handler.make_parser()
+    f = open(os.path.join(path, ITUNES_XML_FILE), 'rb')
+    try:
+        while True:
+            data = f.read(ITUNES_READ_SIZE)
+            parser.Parse(data, not data)
+            for track in handler.tracks:
+                yield 'track', track
+            del handler.tracks[:]
+            for playlist in handler.playlists:
+                yield 'playlist', playlist
+            del handler.playlists[:]
+            if not data:
+                break
+    finally:
+        f.close()
 
 def file_path_xlat(path):
     """Convert iTunes path to what we can handle."""
@@ -85,22 +226,303 @@ def file_path_xlat(path):
     except StandardError:
         return None
 
+def track_filename(track):
+    """Get the filename for an iTunes track dict.
+
+    Returns None if the track isn't a local file.
+    """
+    location = track.get('Location')
+    if location is None or track.get('Track Type', u'File') != u'File':
+        return None
+    # Must convert to string content - otherwise we get into unicode
+    # troubles when we unquote the URI escapes.
+    try:
+        location = str(location)
+    except UnicodeError:
+        return None
+    path = file_path_xlat(location)
+    if path is None:
+        return None
+    return utf8_to_filename(path.encode('utf-8'))
+
 def import_itunes_path(path):
     """Look for a specified iTunes Music Library.xml file from the specified
        path.  Returns the path of the music library as specified in the
        iTunes settings or None if it cannot find the xml file, or does not
        contain the path for some reason."""
-    music_path = None
+    handler = iTunesLibraryHandler()
     try:
-        parser = xml.sax.make_parser()
-        handler = iTunesMusicLibraryContentHandler()
-        parser.setContentHandler(handler)
-        # Tell xml.sax that we don't want to parse external entities, as it
-        # will stall when no network is installed.
-        parser.setFeature(xml.sax.handler.feature_external_ges, False)
-        parser.setFeature(xml.sax.handler.feature_external_pes, False)
-        parser.parse(os.path.join(path, ITUNES_XML_FILE))
-        music_path = file_path_xlat(handler.music_path)
-        return music_path
-    except (IOError, xml.sax.SAXParseException):
-        pass
+        for dummy in iter_itunes_library(path, handler):
+            # the music folder comes before the tracks, so we don't need to
+            # read any further
+            break
+    except (IOError, expat.ExpatError):
+        return None
+    music_path = handler.library.get('Music Folder')
+    if not isinstance(music_path, unicode):
+        return None
+    try:
+        return file_path_xlat(str(music_path))
+    except UnicodeError:
+        return None
+
+class ITunesTrack(DDBObject):
+    """An iTunes track that we've imported.
+
+    persistent_id is the ID iTunes uses for the track.  date_modified,
+    play_count and skip_count are what the library file said the last
+    time we imported it, so that we can tell which tracks changed.
+    item_id is the Item we use for the track, or None if there isn't one
+    (for example because the file was missing).  created_item is True if
+    the importer made that item; items that were already there (from a
+    watched folder, or added by the user) get the play counts from iTunes,
+    but we never replace or remove them.
+    """
+    def setup_new(self, persistent_id, item_id, date_modified, play_count,
+            skip_count, created_item=False):
+        self.persistent_id = persistent_id
+        self.item_id = item_id
+        self.date_modified = date_modified
+        self.play_count = play_count
+        self.skip_count = skip_count
+        self.created_item = created_item
+
+    @classmethod
+    def get_by_persistent_id(cls, persistent_id):
+        return cls.make_view('persistent_id=?',
+                (persistent_id,)).get_singleton()
+
+class ITunesImporter(object):
+    """Imports tracks, play counts and playlists from an iTunes library.
+
+    Call run() and iterate through it; it yields after each batch of
+    tracks.  Afterwards the added, updated, removed and unchanged
+    attributes count what happened to the tracks, and playlists counts the
+    playlists we imported.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.added = 0
+        self.updated = 0
+        self.removed = 0
+        self.unchanged = 0
+        self.playlists = 0
+
+    def run(self):
+        """Import the library.
+
+        If the library file can't be read, we log a warning and leave the
+        tracks we've already imported alone.
+        """
+        self.manual_feed = models.Feed.get_manual_feed()
+        self._load_existing()
+        # maps iTunes track IDs to item ids for the tracks in this file.
+        # Track IDs aren't stable between library files, but playlists
+        # use them to refer to tracks.
+        self.track_item_ids = {}
+        self.seen_persistent_ids = set()
+        batch = []
+        try:
+            for kind, value in iter_itunes_library(self.path):
+                if kind == 'track':
+                    batch.append(value)
+                    if len(batch) >= ITUNES_BATCH_SIZE:
+                        self._run_in_transaction(self._import_tracks, batch)
+                        batch = []
+                        yield
+                else:
+                    if batch:
+                        self._run_in_transaction(self._import_tracks, batch)
+                        batch = []
+                    self._run_in_transaction(self._import_playlist, value)
+        except (IOError, expat.ExpatError), e:
+            logging.warn("Error reading iTunes library in %s: %s", self.path,
+                    e)
+            return
+        if batch:
+            self._run_in_transaction(self._import_tracks, batch)
+        self._run_in_transaction(self._remove_missing_tracks)
+        logging.info("iTunes import: %d added, %d updated, %d removed, "
+                "%d unchanged, %d playlists", self.added, self.updated,
+                self.removed, self.unchanged, self.playlists)
+
+    def _run_in_transaction(self, func, *args):
+        app.bulk_sql_manager.start()
+        try:
+            func(*args)
+        finally:
+            app.bulk_sql_manager.finish()
+
+    def _load_existing(self):
+        # Use select() rather than views, so that we don't have to create
+        # objects for the tracks and items that haven't changed.
+        self.known_tracks = {}
+        for row in ITunesTrack.select(['id', 'persistent_id', 'item_id',
+            'date_modified', 'play_count', 'skip_count', 'created_item']):
+            self.known_tracks[row[1]] = (row[0],) + tuple(row[2:])
+        self.item_ids = set()
+        self.item_ids_by_filename = {}
+        for item_id, filename in models.Item.select(['id', 'filename']):
+            self.item_ids.add(item_id)
+            if filename is not None:
+                self.item_ids_by_filename[filename] = item_id
+
+    def _import_tracks(self, tracks):
+        for track in tracks:
+            persistent_id = track.get('Persistent ID')
+            if persistent_id is None or persistent_id in \
+                    self.seen_persistent_ids:
+                continue
+            self.seen_persistent_ids.add(persistent_id)
+            item_id = self._import_track(persistent_id, track)
+            if item_id is not None and 'Track ID' in track:
+                self.track_item_ids[track['Track ID']] = item_id
+
+    def _import_track(self, persistent_id, track):
+        date_modified = track.get('Date Modified')
+        play_count = track.get('Play Count', 0)
+        skip_count = track.get('Skip Count', 0)
+        try:
+            known = self.known_tracks[persistent_id]
+        except KeyError:
+            item_id, created = self._make_item(track)
+            ITunesTrack(persistent_id, item_id, date_modified, play_count,
+                    skip_count, created)
+            self.added += 1
+            return item_id
+
+        (track_id, old_item_id, old_date_modified, old_play_count,
+                old_skip_count, created) = known
+        if old_item_id in self.item_ids:
+            item_id = old_item_id
+        else:
+            # either we couldn't make an item last time, or the user
+            # removed it.  In the second case we don't bring it back.
+            item_id = None
+            created = False
+        if (date_modified == old_date_modified and
+                play_count == old_play_count and
+                skip_count == old_skip_count):
+            self.unchanged += 1
+            return item_id
+
+        record = ITunesTrack.get_by_id(track_id)
+        if date_modified != old_date_modified:
+            if item_id is not None:
+                item_id, created = self._update_item(item_id, created, track)
+            elif old_item_id is None:
+                item_id, created = self._make_item(track)
+        elif item_id is not None:
+            self._update_counts(models.Item.get_by_id(item_id), track)
+        record.item_id = item_id
+        record.created_item = created
+        record.date_modified = date_modified
+        record.play_count = play_count
+        record.skip_count = skip_count
+        record.signal_change()
+        self.updated += 1
+        return item_id
+
+    def _make_item(self, track):
+        """Find or create the item for a track.
+
+        Returns (item_id, created), item_id is None if there's no file
+        for the track.
+        """
+        filename = track_filename(track)
+        if filename is None or not fileutil.exists(filename):
+            return None, False
+        item_id = self.item_ids_by_filename.get(filename)
+        if item_id is not None:
+            # we already have an item for the file, for example from a
+            # watched folder.  Use it, but don't take it over.
+            self._update_counts(models.Item.get_by_id(item_id), track)
+            return item_id, False
+        app.metadata_progress_updater.will_process_path(filename)
+        fp_values = item.fp_values_for_file(filename, track.get('Name'))
+        file_item = models.FileItem(filename, feed_id=self.manual_feed.id,
+                fp_values=fp_values, mark_seen=True)
+        if not file_item.id_exists():
+            return None, False
+        self._update_counts(file_item, track)
+        self.item_ids.add(file_item.id)
+        self.item_ids_by_filename[filename] = file_item.id
+        return file_item.id, True
+
+    def _update_item(self, item_id, created, track):
+        item_ = models.Item.get_by_id(item_id)
+        filename = track_filename(track)
+        if filename != item_.get_filename():
+            # The file moved.  Replace the item if we created it.
+            if created:
+                self._remove_item(item_)
+            return self._make_item(track)
+        self._update_counts(item_, track)
+        return item_id, created
+
+    def _update_counts(self, item_, track):
+        # Keep whichever count is bigger, so that we don't lose plays that
+        # happened in Miro.  This never lowers a count, so it's safe for
+        # items that the importer didn't create.
+        play_count = max(item_.play_count, track.get('Play Count', 0))
+        skip_count = max(item_.skip_count, track.get('Skip Count', 0))
+        if (play_count, skip_count) != (item_.play_count, item_.skip_count):
+            item_.play_count = play_count
+            item_.skip_count = skip_count
+            item_.signal_change()
+
+    def _remove_item(self, item_):
+        self.item_ids.discard(item_.id)
+        self.item_ids_by_filename.pop(item_.get_filename(), None)
+        item_.remove()
+
+    def _import_playlist(self, playlist_dict):
+        # skip the library, the built-in playlists, smart playlists and
+        # playlist folders
+        if (playlist_dict.get('Master') or
+                'Distinguished Kind' in playlist_dict or
+                'Smart Info' in playlist_dict or
+                playlist_dict.get('Folder')):
+            return
+        title = playlist_dict.get('Name')
+        if not title:
+            return
+        item_ids = []
+        for entry in playlist_dict.get('Playlist Items', []):
+            item_id = self.track_item_ids.get(entry.get('Track ID'))
+            if item_id is not None:
+                item_ids.append(item_id)
+        try:
+            playlist = models.SavedPlaylist.get_by_title(title)
+        except ObjectNotFoundError:
+            models.SavedPlaylist(title, item_ids)
+        else:
+            playlist.add_ids(item_ids)
+            # remove tracks that were taken out of the playlist in iTunes,
+            # but leave alone items that the user added in Miro
+            imported_ids = set(self.track_item_ids.values())
+            keep_ids = set(item_ids)
+            for item_id in models.PlaylistItemMap.get_item_ids(playlist.id):
+                if item_id in imported_ids and item_id not in keep_ids:
+                    playlist.remove_id(item_id)
+        self.playlists += 1
+
+    def _remove_missing_tracks(self):
+        """Remove tracks that are no longer in the library."""
+        for persistent_id, known in self.known_tracks.iteritems():
+            if persistent_id in self.seen_persistent_ids:
+                continue
+            track_id, item_id, created = known[0], known[1], known[-1]
+            if created and item_id in self.item_ids:
+                self._remove_item(models.Item.get_by_id(item_id))
+            ITunesTrack.get_by_id(track_id).remove()
+            self.removed += 1
+
+@eventloop.idle_iterator
+def import_itunes_library(path):
+    """Import or re-sync the iTunes library in path.
+
+    This runs in the event loop, a batch of tracks at a time.
+    """
+    for dummy in ITunesImporter(path).run():
+        yield
@@ -61,6 +61,7 @@ from miro import prefs
 from miro.plat import resources
 from miro import util
 from miro import moviedata
+from miro import filetags
 from miro import filetypes
 from miro import searchengines
 from miro import fileutil
@@ -68,9 +69,16 @@ from miro import signals
 from miro import search
 from miro import models
 from miro import metadata
+from miro import metadatacache
+from miro import sanitizer
+from miro import workerprocess
 
 _charset = locale.getpreferredencoding()
 
+# should we read metadata tags in check_media_file() instead of using our
+# worker process.  This is just used in the unittests to make things simpler
+_READ_METADATA_INLINE = False
+
 KNOWN_MIME_TYPES = (u'audio', u'video')
 KNOWN_MIME_SUBTYPES = (
     u'mov', u'wmv', u'mp4', u'mp3',
@@ -81,6 +89,12 @@ MIME_SUBSITUTIONS = {
     u'QUICKTIME': u'MOV',
 }
 
+# downloader states that the feed_downloaded_view() and
+# feed_downloading_view() queries count.  Item._calc_count_key() needs to
+# stay in sync with them.
+COUNT_DOWNLOADED_STATES = (u'finished', u'uploading', u'uploading-paused')
+COUNT_DOWNLOADING_STATES = (u'downloading', u'uploading')
+
 def _check_for_image(path, element):
     """Given an element (which is really a dict), traverses
     the path in the element and if that turns out to be an image,
@@ -391,6 +405,10 @@ class Item(DDBObject, iconcache.IconCacheOwnerMixin, metadata.Store):
         self.skip_count = 0
         # Initalize FileItem attributes to None
         self.deleted = self.shortFilename = self.offsetPath = None
+        # filled in by _update_stripped_description()
+        self.description_hash = None
+        self.description_stripped = None
+        self.description_links = None
 
         # linkNumber is a hack to make sure that scraped items at the
         # top of a page show up before scraped items at the bottom of
@@ -403,6 +421,7 @@ class Item(DDBObject, iconcache.IconCacheOwnerMixin, metadata.Store):
 
     def setup_restored(self):
         self.setup_common()
+        self._count_key = self._calc_count_key()
         self.setup_links()
 
     def setup_common(self):
@@ -413,12 +432,71 @@ class Item(DDBObject, iconcache.IconCacheOwnerMixin, metadata.Store):
         self.playing = False
 
     def after_setup_new(self):
+        self._update_stripped_description()
         app.item_info_cache.item_created(self)
+        self._count_key = None
+        self._update_feed_counts()
 
     def signal_change(self, needs_save=True):
         app.item_info_cache.item_changed(self)
+        if '_count_key' in self.__dict__:
+            self._update_feed_counts()
         DDBObject.signal_change(self, needs_save)
 
+    def _calc_count_key(self):
+        """Calculate the values that our feed's item counts depend on.
+
+        Feed.update_item_counts() compares these before and after we change
+        to keep its counts up to date without running COUNT queries.  The
+        feed's own attributes (last_viewed, getEverything, etc.) are checked
+        there.
+
+        :returns: tuple of values, or None if we aren't in a feed.
+        """
+        if self.feed_id is None:
+            return None
+        if self.downloader_id is not None:
+            dler_state, main_item_id = self._get_downloader_count_state()
+        else:
+            dler_state = main_item_id = None
+        downloaded = dler_state in COUNT_DOWNLOADED_STATES
+        downloading = (dler_state in COUNT_DOWNLOADING_STATES and
+                main_item_id == self.id)
+        unwatched = (not self.seen and
+                self.file_type in (u'audio', u'video') and
+                (self.is_file_item or downloaded))
+        available = (not self.autoDownloaded and
+                self.downloadedTime is None and
+                not self.is_file_item)
+        return (self.feed_id, downloaded, downloading, unwatched, available,
+                self.creationTime, not self.was_downloaded,
+                bool(self.eligibleForAutoDownload))
+
+    def _get_downloader_count_state(self):
+        """Get our downloader's (state, main_item_id) for _calc_count_key().
+
+        If the downloader isn't loaded we use
+        downloader.get_unloaded_count_state(), restoring it just to count
+        ourselves would be slow.
+        """
+        try:
+            dler = self._downloader
+        except AttributeError:
+            if not app.db.id_alive(self.downloader_id):
+                return downloader.get_unloaded_count_state(
+                        self.downloader_id)
+            dler = app.db.get_obj_by_id(self.downloader_id)
+        if dler is None:
+            return None, None
+        return dler.state, dler.main_item_id
+
+    def _update_feed_counts(self):
+        new_key = self._calc_count_key()
+        if new_key != self._count_key:
+            old_key = self._count_key
+            self._count_key = new_key
+            models.Feed.update_item_counts(old_key, new_key)
+
     @classmethod
     def auto_pending_view(cls):
         return cls.make_view('feed.autoDownloadable AND '
@@ -430,18 +508,23 @@ class Item(DDBObject, iconcache.IconCacheOwnerMixin, metadata.Store):
     def manual_pending_view(cls):
         return cls.make_view('pendingManualDL')
 
+    # The download views below select downloaders with a subquery rather
+    # than joining remote_downloader.  That way sqlite starts with the
+    # downloader_state index and then uses the item_downloader index,
+    # instead of scanning every item.
+
     @classmethod
     def auto_downloads_view(cls):
         return cls.make_view("item.autoDownloaded AND "
-                "rd.state in ('downloading', 'paused')",
-                joins={'remote_downloader rd': 'item.downloader_id=rd.id'})
+                "item.downloader_id IN (SELECT id FROM remote_downloader "
+                "WHERE state in ('downloading', 'paused'))")
 
     @classmethod
     def manual_downloads_view(cls):
         return cls.make_view("NOT item.autoDownloaded AND "
                 "NOT item.pendingManualDL AND "
-                "rd.state in ('downloading', 'paused')",
-                joins={'remote_downloader AS rd': 'item.downloader_id=rd.id'})
+                "item.downloader_id IN (SELECT id FROM remote_downloader "
+                "WHERE state in ('downloading', 'paused'))")
 
     @classmethod
     def download_tab_view(cls):
@@ -474,10 +557,12 @@ class Item(DDBObject, iconcache.IconCacheOwnerMixin, metadata.Store):
 
     @classmethod
     def unwatched_downloaded_items(cls):
+        # the unary + stops sqlite from using the item_parent index, almost
+        # all items have a NULL parent_id.
         return cls.make_view("NOT item.seen AND "
-                "item.parent_id IS NULL AND "
-                "rd.state in ('finished', 'uploading', 'uploading-paused')",
-                joins={'remote_downloader AS rd': 'item.downloader_id=rd.id'})
+                "+item.parent_id IS NULL AND "
+                "item.downloader_id IN (SELECT id FROM remote_downloader "
+                "WHERE state in ('finished', 'uploading', 'uploading-paused'))")
 
     @classmethod
     def newly_downloaded_view(cls):
@@ -491,9 +576,9 @@ class Item(DDBObject, iconcache.IconCacheOwnerMixin, metadata.Store):
 
     @classmethod
     def downloaded_view(cls):
-        return cls.make_view("rd.state in ('finished', 'uploading', "
-                "'uploading-paused')",
-                joins={'remote_downloader AS rd': 'item.downloader_id=rd.id'})
+        return cls.make_view("item.downloader_id IN "
+                "(SELECT id FROM remote_downloader "
+                "WHERE state in ('finished', 'uploading', 'uploading-paused'))")
 
     @classmethod
     def incomplete_mdp_view(cls, limit=10):
@@ -751,10 +836,10 @@ class Item(DDBObject, iconcache.IconCacheOwnerMixin, metadata.Store):
     @classmethod
     def recently_downloaded_view(cls):
         return cls.make_view("NOT seen AND "
-                "item.parent_id IS NULL AND "
+                "+item.parent_id IS NULL AND "
                 "NOT is_file_item AND downloadedTime AND "
-                "rd.state in ('finished', 'uploading', 'uploading-paused')",
-                joins={'remote_downloader AS rd': 'item.downloader_id=rd.id'})
+                "item.downloader_id IN (SELECT id FROM remote_downloader "
+                "WHERE state in ('finished', 'uploading', 'uploading-paused'))")
 
 
     @classmethod
@@ -914,6 +999,7 @@ class Item(DDBObject, iconcache.IconCacheOwnerMixin, metadata.Store):
     def on_signal_change(self):
         self.expiring = None
         self._sync_title()
+        self._update_stripped_description()
         if hasattr(self, "_state"):
             del self._state
         if hasattr(self, "_size"):
@@ -1432,6 +1518,33 @@ class Item(DDBObject, iconcache.IconCacheOwnerMixin, metadata.Store):
 
         return u''
 
+    def get_stripped_description(self):
+        """Returns the description with the HTML stripped out.
+
+        :returns: (text, links) tuple, like util.HTMLStripper.strip()
+        """
+        self._update_stripped_description()
+        return self.description_stripped, list(self.description_links)
+
+    def _update_stripped_description(self):
+        """Strip the HTML from our description, if it has changed since
+        the last time we did it.
+
+        The results are saved with the rest of the item, so normally this
+        only needs to do real work after a feed update changes the
+        description.  Rows from before we stored the stripped description
+        get filled in here and saved the next time the item changes.
+        """
+        description = self.get_description()
+        description_hash = sanitizer.content_hash(description)
+        if description_hash == self.description_hash:
+            return
+        text, links = sanitizer.strip_html(description, description_hash)
+        self.description_stripped = unicode(text)
+        self.description_links = [(start, end, unicode(href))
+                for start, end, href in links]
+        self.description_hash = description_hash
+
     def looks_like_torrent(self):
         """Returns true if we think this item is a torrent.  (For items that
         haven't been downloaded this uses the file extension which isn't
@@ -1800,8 +1913,11 @@ class Item(DDBObject, iconcache.IconCacheOwnerMixin, metadata.Store):
         self.recalc_feed_counts()
 
     def check_media_file(self):
-        """Begin metadata extraction for this item; runs mutagen synchonously,
-        if applicable, and then adds the item to mdp's queue.
+        """Begin metadata extraction for this item.
+
+        Mutagen runs in our worker process, so this returns before the tags
+        have been read.  Once they have, tags_read() adds the item to mdp's
+        queue.
         """
         if self.isContainerItem:
             self.file_type = u'other'
@@ -1811,8 +1927,9 @@ class Item(DDBObject, iconcache.IconCacheOwnerMixin, metadata.Store):
         # method without either:
         # - calling moviedata.movie_data_updater.request_update(self)
         # - calling _handle_invalid_media_file
+        # - sending the item to _tag_reader, which will call tags_read()
         try:
-            self._check_media_file()
+            read_inline = self._check_media_file()
         except IOError, e:
             # shouldn't generally happen, but probably something we have no
             # control over; likely another process has moved or deleted our file
@@ -1823,12 +1940,30 @@ class Item(DDBObject, iconcache.IconCacheOwnerMixin, metadata.Store):
             app.controller.failed_soft("check_media_file", str(e), True)
             self._handle_invalid_media_file()
         else:
-            moviedata.movie_data_updater.request_update(self)
-            if self.file_type is None:
-                # if this is not overridden by movie_data_updater,
-                # neither mutagen nor MDP could identify it
-                self.file_type = u'other'
-            self.signal_change()
+            if read_inline:
+                self._request_movie_data_update()
+
+    def tags_read(self, rv):
+        """Finish check_media_file() once _tag_reader has read our tags.
+
+        :param rv: return value of filetags.read_metadata(), or an IOError if
+            the worker process couldn't read the file
+        """
+        if isinstance(rv, IOError):
+            logging.warn("check_media_file failed: %s", rv)
+            self._handle_invalid_media_file()
+            return
+        self.set_metadata_from_tags(rv)
+        metadatacache.store_tags(self.get_filename(), rv)
+        self._request_movie_data_update()
+
+    def _request_movie_data_update(self):
+        moviedata.movie_data_updater.request_update(self)
+        if self.file_type is None:
+            # if this is not overridden by movie_data_updater,
+            # neither mutagen nor MDP could identify it
+            self.file_type = u'other'
+        self.signal_change()
 
     def _handle_invalid_media_file(self):
         """Failed to process a file in check_media_file; when this happens we:
@@ -1853,17 +1988,30 @@ class Item(DDBObject, iconcache.IconCacheOwnerMixin, metadata.Store):
     def _check_media_file(self):
         """Does the work for check_media_file()
 
+        :returns: True if we read the metadata, False if we sent the item to
+            _tag_reader
         :raises: CheckMediaError if we aren't able to check it
         """
-        # NOTE: it is very important (#7993) that there is no way to leave this
-        # method without either:
-        # - calling moviedata.movie_data_updater.request_update(self)
-        # - changing this item so that not self.in_incomplete_mdp_view
         filename = self.get_filename()
         if filename is None:
             raise CheckMediaError("item has no filename")
         self.file_type = filetypes.item_file_type_for_filename(filename)
-        self.read_metadata()
+        if self.file_type == u'other':
+            # read_metadata() doesn't run mutagen for other files, so there's
+            # no need to use the worker process
+            self.read_metadata()
+            return True
+        cached = metadatacache.lookup(filename)
+        if cached is not None and cached.has_tags():
+            self.set_metadata_from_tags(cached.get_tags())
+            return True
+        if _READ_METADATA_INLINE:
+            rv = filetags.read_metadata(filename)
+            self.set_metadata_from_tags(rv)
+            metadatacache.store_tags(filename, rv)
+            return True
+        _tag_reader.request_read(self)
+        return False
 
     def on_downloader_migrated(self, old_filename, new_filename):
         self.set_filename(new_filename)
@@ -1952,6 +2100,9 @@ class Item(DDBObject, iconcache.IconCacheOwnerMixin, metadata.Store):
         # need to call this after DDBObject.remove(), so that the item info is
         # there for ItemInfoFetcher to see.
         app.item_info_cache.item_removed(self)
+        old_key = self.__dict__.pop('_count_key', None)
+        if old_key is not None:
+            models.Feed.update_item_counts(old_key, None)
 
     def setup_links(self):
         self.split_item()
@@ -2563,6 +2714,78 @@ class DeviceItem(metadata.Store):
                 data[k] = v
         return data
 
+class TagReader(object):
+    """Reads metadata tags for items using our worker process.
+
+    Running mutagen on the backend thread blocks it for a long time when we
+    import lots of files.  Instead, check_media_file() hands items to us and
+    we send their paths to the worker process in batches.  The results for
+    each batch get applied inside a single BulkSQLManager transaction.
+    """
+    BATCH_SIZE = 100
+
+    def __init__(self):
+        # maps item ids -> paths for reads we haven't sent yet
+        self.to_send = {}
+        # item ids that we've sent to the worker process
+        self.in_progress = set()
+        # track if we have send_requests() scheduled as an idle callback
+        self.send_scheduled = False
+
+    def request_read(self, item):
+        if item.id in self.to_send or item.id in self.in_progress:
+            return
+        self.to_send[item.id] = item.get_filename()
+        if not self.send_scheduled:
+            eventloop.add_idle(self.send_requests, 'send tag read requests')
+            self.send_scheduled = True
+
+    def send_requests(self):
+        self.send_scheduled = False
+        requests = self.to_send.items()
+        self.to_send = {}
+        for start in xrange(0, len(requests), self.BATCH_SIZE):
+            batch = requests[start:start+self.BATCH_SIZE]
+            self.in_progress.update(id_ for id_, path in batch)
+            paths = [path for id_, path in batch]
+            workerprocess.run_read_metadata(paths,
+                    lambda results, batch=batch: self.on_results(batch,
+                        results),
+                    lambda error, batch=batch: self.on_error(batch, error))
+
+    def on_results(self, batch, results):
+        app.bulk_sql_manager.start()
+        try:
+            for (id_, path), rv in zip(batch, results):
+                self._apply_result(id_, path, rv)
+        finally:
+            app.bulk_sql_manager.finish()
+
+    def on_error(self, batch, error):
+        logging.warn("Error reading metadata in the worker process: %s",
+                     error)
+        # Act like mutagen couldn't read any of the files.  The movie data
+        # program can still figure out the duration and file type.
+        self.on_results(batch, [None] * len(batch))
+
+    def _apply_result(self, id_, path, rv):
+        self.in_progress.discard(id_)
+        try:
+            item = Item.get_by_id(id_)
+        except ObjectNotFoundError:
+            # item was removed while we were reading the tags
+            app.metadata_progress_updater.path_processed(path)
+            return
+        if item.get_filename() != path:
+            # item was moved while we were reading the tags.  Start again
+            # with the new path.
+            app.metadata_progress_updater.path_processed(path)
+            item.check_media_file()
+            return
+        item.tags_read(rv)
+
+_tag_reader = TagReader()
+
 _deleted_file_checker = None
 
 def setup_deleted_checker():
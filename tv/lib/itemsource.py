@@ -208,6 +208,7 @@ class DatabaseItemSource(ItemSource):
             'skip_count': item.skip_count,
             'auto_rating': item.get_auto_rating(),
             'is_playing': item.is_playing(),
+            'description_stripped': item.get_stripped_description(),
             }
         info.update(item.get_iteminfo_metadata())
         if item.isContainerItem:
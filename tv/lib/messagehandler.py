@@ -47,6 +47,7 @@ from miro import guide
 from miro import fileutil
 from miro import commandline
 from miro import item
+from miro import importmedia
 from miro import itemsource
 from miro import messages
 from miro import filetypes
@@ -795,6 +796,10 @@ class BackendMessageHandler(messages.MessageHandler):
         messages.CurrentSearchInfo(search_feed.engine,
                 search_feed.query).send_to_frontend()
 
+    def handle_query_event_loop_metrics(self, message):
+        messages.CurrentEventLoopMetrics(
+                eventloop.get_metrics()).send_to_frontend()
+
     def handle_track_channels(self, message):
         if not self.channel_tracker:
             self.channel_tracker = ChannelTracker()
@@ -881,6 +886,11 @@ class BackendMessageHandler(messages.MessageHandler):
     def handle_mark_item_skipped(self, message):
         itemsource.get_handler(message.info).mark_skipped(message.info)
 
+    def handle_record_play_session(self, message):
+        app.playback_stats.record(message.item_id, message.start_time,
+                message.end_time, message.duration, message.watched_time,
+                message.position, message.pause_count, message.seek_count)
+
     def handle_set_item_is_playing(self, message):
         itemsource.get_handler(message.info).set_is_playing(message.info,
                 message.is_playing)
@@ -966,6 +976,9 @@ class BackendMessageHandler(messages.MessageHandler):
     def handle_import_feeds(self, message):
         opml.Importer().import_subscriptions(message.filename)
 
+    def handle_import_itunes_library(self, message):
+        importmedia.import_itunes_library(message.path)
+
     def handle_export_subscriptions(self, message):
         opml.Exporter().export_subscriptions(message.filename)
 
@@ -1273,6 +1286,7 @@ New ids: %s""", playlist_item_ids, message.item_ids)
             logging.warn("AddVideosToPlaylist: Playlist not found -- %s",
                     message.playlist_id)
             return
+        ids_to_add = []
         for id_ in message.video_ids:
             try:
                 item_ = item.Item.get_by_id(id_)
@@ -1283,7 +1297,8 @@ New ids: %s""", playlist_item_ids, message.item_ids)
                 logging.warn("AddVideosToPlaylist: Item not downloaded (%s)",
                         item_)
             else:
-                playlist.add_item(item_)
+                ids_to_add.append(item_.id)
+        playlist.add_ids(ids_to_add)
 
     def handle_remove_videos_from_playlist(self, message):
         try:
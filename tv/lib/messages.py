@@ -50,6 +50,7 @@ from miro import app
 from miro import displaytext
 from miro import guide
 from miro import search
+from miro import sanitizer
 from miro import prefs
 from miro import util
 
@@ -101,6 +102,11 @@ class QuerySearchInfo(BackendMessage):
     """
     pass
 
+class QueryEventLoopMetrics(BackendMessage):
+    """Ask the backend to send a CurrentEventLoopMetrics message.
+    """
+    pass
+
 class TrackPlaylists(BackendMessage):
     """Begin tracking playlists.
 
@@ -312,6 +318,14 @@ class ImportFeeds(BackendMessage):
     def __init__(self, filename):
         self.filename = filename
 
+class ImportITunesLibrary(BackendMessage):
+    """Tell the backend to import (or re-sync) an iTunes library.
+
+    :param path: directory containing the iTunes Music Library.xml file
+    """
+    def __init__(self, path):
+        self.path = path
+
 class ExportSubscriptions(BackendMessage):
     """Tell the backend to export subscriptions to an .opml file.
 
@@ -378,6 +392,29 @@ class MarkItemSkipped(BackendMessage):
     def __init__(self, info):
         self.info = info
 
+class RecordPlaySession(BackendMessage):
+    """Record that the user played an item.
+
+    :param item_id: id of the database item that was played
+    :param start_time: datetime when playback started
+    :param end_time: datetime when playback stopped
+    :param duration: length of the item in seconds, or None if unknown
+    :param watched_time: seconds the user actually spent playing it
+    :param position: furthest position reached, in seconds
+    :param pause_count: number of times the user paused
+    :param seek_count: number of times the user seeked
+    """
+    def __init__(self, item_id, start_time, end_time, duration, watched_time,
+            position, pause_count, seek_count):
+        self.item_id = item_id
+        self.start_time = start_time
+        self.end_time = end_time
+        self.duration = duration
+        self.watched_time = watched_time
+        self.position = position
+        self.pause_count = pause_count
+        self.seek_count = seek_count
+
 class SetItemIsPlaying(BackendMessage):
     """Set when an item begins playing; unset when it stops.
     """
@@ -1180,22 +1217,21 @@ class ItemInfo(object):
     :param has_drm: True/False if known; None if unknown (usually means no)
     """
 
-    html_stripper = util.HTMLStripper()
-
     def __repr__(self):
         return "<ItemInfo %r>" % self.id
 
     def __getstate__(self):
         d = self.__dict__.copy()
         d['device'] = None
-        del d['description_stripped']
         del d['search_terms']
         return d
 
     def __setstate__(self, d):
         self.__dict__.update(d)
-        self.description_stripped = ItemInfo.html_stripper.strip(
-                self.description)
+        if 'description_stripped' not in d:
+            # pickled by an older version that didn't save it
+            self.description_stripped = sanitizer.strip_html(
+                    self.description)
         self.search_terms = search.calc_search_terms(self)
 
     def __init__(self, id_, **kwargs):
@@ -1206,7 +1242,7 @@ class ItemInfo(object):
 
         # stuff we can calculate from other attributes
         if not hasattr(self, 'description_stripped'):
-            self.description_stripped = ItemInfo.html_stripper.strip(
+            self.description_stripped = sanitizer.strip_html(
                 self.description)
         if not hasattr(self, 'search_terms'):
             self.search_terms = search.calc_search_terms(self)
@@ -1502,6 +1538,14 @@ class CurrentSearchInfo(FrontendMessage):
         self.engine = engine
         self.text = text
 
+class CurrentEventLoopMetrics(FrontendMessage):
+    """Sends the frontend a snapshot of the event loop metrics.
+
+    metrics is the dict returned by eventloop.get_metrics()
+    """
+    def __init__(self, metrics):
+        self.metrics = metrics
+
 class DownloadCountChanged(FrontendMessage):
     """Informs the frontend that number of downloads has changed. Includes the
     number of non downloading items which should be displayed.
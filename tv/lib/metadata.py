@@ -119,11 +119,20 @@ class Source(object):
         if self.file_type == u'other':
             return
 
-        path = self.get_filename()
-        rv = filetags.read_metadata(path)
+        self.set_metadata_from_tags(filetags.read_metadata(self.get_filename()))
+
+    def set_metadata_from_tags(self, rv):
+        """Set our metadata using the return value of filetags.read_metadata().
+
+        This lets us handle tags that were read outside of read_metadata(),
+        for example by the worker process.
+        """
+        self.metadata_version = filetags.METADATA_VERSION
         if not rv:
             return
 
+        path = self.get_filename()
+
         mediatype, duration, metadata, cover_art = rv
         self.file_type = mediatype
         # FIXME: duration isn't actually a attribute of metadata.Source.
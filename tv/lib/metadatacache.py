@@ -0,0 +1,290 @@
+# Miro - an RSS based video player application
+# Copyright (C) 2005, 2006, 2007, 2008, 2009, 2010, 2011
+# Participatory Culture Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# In addition, as a special exception, the copyright holders give
+# permission to link the code of portions of this program with the OpenSSL
+# library.
+#
+# You must obey the GNU General Public License in all respects for all of
+# the code used other than OpenSSL. If you modify file(s) with this
+# exception, you may extend this exception to your version of the file(s),
+# but you are not obligated to do so. If you do not wish to do so, delete
+# this exception statement from your version. If you delete this exception
+# statement from all source files in the program, then also delete it here.
+
+"""``miro.metadatacache`` -- Remember the metadata we've extracted from files.
+
+Reading tags with mutagen and running the movie data program are both slow.
+When an item gets recreated for a file we've already looked at (for example
+if a watched folder is removed then re-added, or the database sanity checks
+remove an item) we would normally do all that work again.  This module stores
+the results, keyed by the file's path, size and modification time, so that we
+can skip it.
+
+The cache keeps its own copy of any cover art and screenshots.  Items get a
+fresh copy when we apply a cache entry to them, since they delete their
+images when they're removed.
+"""
+
+import logging
+import os
+import shutil
+
+from miro import app
+from miro import coverart
+from miro import eventloop
+from miro import filetags
+from miro import fileutil
+from miro import prefs
+from miro import util
+from miro.database import DDBObject, ObjectNotFoundError, TooManyObjects
+from miro.plat.utils import filename_to_unicode
+
+# The movie data program often fails for reasons that have nothing to do with
+# the file (it hung because the system was busy, it crashed, ...).  Only
+# remember a failure once it's happened this many times in a row.
+MAX_MOVIE_DATA_FAILURES = 3
+
+# number of files prune_missing() checks before letting the event loop run
+PRUNE_BATCH_SIZE = 50
+
+class MetadataCacheEntry(DDBObject):
+    """Metadata that we extracted from a single file.
+
+    tags stores the (mediatype, duration, data) part of the value that
+    filetags.read_metadata() returned.  None means that mutagen couldn't read
+    the file.  tags_version is the filetags.METADATA_VERSION used to read the
+    tags, or None if we haven't read them yet.
+
+    mdp_state, mdp_duration, mdp_file_type and screenshot store the results
+    of the movie data program.  mdp_state is None if it hasn't run.
+    mdp_failures counts how many times in a row it failed.
+    """
+    def setup_new(self, path, size, mtime):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.tags_version = None
+        self.tags = None
+        self.cover_art = None
+        self.mdp_state = None
+        self.mdp_duration = None
+        self.mdp_file_type = None
+        self.screenshot = None
+        self.mdp_failures = 0
+
+    @classmethod
+    def get_by_path(cls, path):
+        return cls.make_view('path=?',
+                (filename_to_unicode(path),)).get_singleton()
+
+    def matches(self, size, mtime):
+        return self.size == size and self.mtime == mtime
+
+    def has_tags(self):
+        return (self.tags_version == filetags.METADATA_VERSION and
+                _image_exists(self.cover_art))
+
+    def has_movie_data(self):
+        return self.mdp_state is not None and _image_exists(self.screenshot)
+
+    def get_tags(self):
+        """Get the tags for this file.
+
+        :returns: a value in the same format as filetags.read_metadata().  If
+            there is cover art, it's a new copy that the caller owns.
+        """
+        if self.tags is None:
+            return None
+        mediatype, duration, data = self.tags
+        if self.cover_art is not None:
+            cover_art = coverart.Image.from_file(self.cover_art, self.path)
+        else:
+            cover_art = None
+        return mediatype, duration, dict(data), cover_art
+
+    def set_tags(self, rv):
+        self.tags_version = filetags.METADATA_VERSION
+        self._delete_image('cover_art')
+        if not rv:
+            self.tags = None
+            return
+        mediatype, duration, data, cover_art = rv
+        if mediatype is not None:
+            mediatype = unicode(mediatype)
+        self.tags = (mediatype, duration, data)
+        if cover_art:
+            self.cover_art = _copy_image(cover_art)
+
+    def set_movie_data(self, mdp_state, duration, file_type, screenshot):
+        self._delete_image('screenshot')
+        self.mdp_state = mdp_state
+        self.mdp_duration = duration
+        self.mdp_file_type = file_type
+        if screenshot:
+            self.screenshot = _copy_image(screenshot)
+
+    def _delete_image(self, attr):
+        path = getattr(self, attr)
+        if path is not None:
+            try:
+                fileutil.remove(path)
+            except (OSError, IOError):
+                pass
+            setattr(self, attr, None)
+
+    def remove(self):
+        self._delete_image('cover_art')
+        self._delete_image('screenshot')
+        DDBObject.remove(self)
+
+def _image_exists(path):
+    """Check that a cached image is still around.
+
+    If someone deleted the file, we need to re-extract the metadata to get it
+    back.  None means that there wasn't an image, which is fine.
+    """
+    return path is None or fileutil.exists(path)
+
+def _image_directory():
+    dir_ = os.path.join(app.config.get(prefs.ICON_CACHE_DIRECTORY),
+                        'metadata-cache')
+    try:
+        fileutil.makedirs(dir_)
+    except OSError:
+        pass
+    return dir_
+
+def _copy_image(source):
+    """Make a copy of an image for the cache to own.
+
+    :returns: path to the copy, or None if we couldn't make one
+    """
+    filename = '%s.%s' % (util.random_string(5), os.path.basename(source))
+    dest = os.path.join(_image_directory(), filename)
+    try:
+        shutil.copyfile(fileutil.expand_filename(source),
+                        fileutil.expand_filename(dest))
+    except (OSError, IOError), e:
+        logging.warn("metadatacache: error copying %s: %s", source, e)
+        return None
+    return dest
+
+def _stat_key(path):
+    stat = os.stat(fileutil.expand_filename(path))
+    return stat.st_size, stat.st_mtime
+
+def lookup(path):
+    """Find the cache entry for a file.
+
+    Entries for files that have changed since we stored them are removed.
+
+    :returns: a MetadataCacheEntry or None
+    """
+    try:
+        entry = MetadataCacheEntry.get_by_path(path)
+    except ObjectNotFoundError:
+        return None
+    except TooManyObjects:
+        _forget(path)
+        return None
+    try:
+        size, mtime = _stat_key(path)
+    except OSError:
+        return None
+    if not entry.matches(size, mtime):
+        entry.remove()
+        return None
+    return entry
+
+def _get_entry(path):
+    """Get the entry to store metadata for a file in, creating it if needed.
+
+    :returns: a MetadataCacheEntry or None if we can't stat the file
+    """
+    entry = lookup(path)
+    if entry is None:
+        try:
+            size, mtime = _stat_key(path)
+        except OSError:
+            return None
+        entry = MetadataCacheEntry(path, size, mtime)
+    return entry
+
+def _forget(path):
+    for entry in MetadataCacheEntry.make_view('path=?',
+            (filename_to_unicode(path),)):
+        entry.remove()
+
+def store_tags(path, rv):
+    """Store the value filetags.read_metadata() returned for path."""
+    entry = _get_entry(path)
+    if entry is not None:
+        entry.set_tags(rv)
+        entry.signal_change()
+
+def store_movie_data(path, mdp_state, duration, file_type, screenshot):
+    """Store the results of running the movie data program on path."""
+    entry = _get_entry(path)
+    if entry is not None:
+        entry.set_movie_data(mdp_state, duration, file_type, screenshot)
+        entry.mdp_failures = 0
+        entry.signal_change()
+
+def store_movie_data_failure(path, mdp_state):
+    """Record that the movie data program failed for path.
+
+    mdp_state only gets stored after MAX_MOVIE_DATA_FAILURES failures in a
+    row, until then we'll run the program again the next time.
+    """
+    entry = _get_entry(path)
+    if entry is not None:
+        entry.mdp_failures += 1
+        if entry.mdp_failures >= MAX_MOVIE_DATA_FAILURES:
+            entry.set_movie_data(mdp_state, None, None, None)
+        entry.signal_change()
+
+def iter_prune_missing():
+    """Remove cache entries for files that no longer exist.
+
+    Checking each file can be slow (the library might be on a network
+    share), so this yields after every PRUNE_BATCH_SIZE files.
+    """
+    rows = MetadataCacheEntry.select(['id', 'path'])
+    removed = 0
+    for start in xrange(0, len(rows), PRUNE_BATCH_SIZE):
+        for id_, path in rows[start:start+PRUNE_BATCH_SIZE]:
+            if fileutil.exists(path):
+                continue
+            try:
+                entry = MetadataCacheEntry.get_by_id(id_)
+            except ObjectNotFoundError:
+                # removed while we were waiting
+                continue
+            entry.remove()
+            removed += 1
+        yield
+    if removed:
+        logging.info("metadatacache: removed %d entries for missing files",
+                removed)
+
+@eventloop.idle_iterator
+def prune_missing():
+    """Run iter_prune_missing() from the event loop, a batch at a time."""
+    for dummy in iter_prune_missing():
+        yield
@@ -28,13 +28,17 @@
 # statement from all source files in the program, then also delete it here.
 
 from miro.eventloop import as_idle
+import os
 import os.path
 import re
+import select
+import shutil
 import subprocess
 import tempfile
 import time
 import traceback
 import threading
+import urllib
 import Queue
 import logging
 from contextlib import contextmanager
@@ -44,7 +48,10 @@ from miro import prefs
 from miro import signals
 from miro import util
 from miro import fileutil
+from miro import metadatacache
 from miro.plat.utils import (movie_data_program_info,
+                             movie_data_server_info,
+                             get_logical_cpu_count,
                              thread_body)
 from miro.errors import Shutdown
 
@@ -55,10 +62,16 @@ MOVIE_DATA_UTIL_TIMEOUT = 30
 # Time to sleep while we're polling the external movie command
 SLEEP_DELAY = 0.1
 
+# Time in seconds that we wait for the movie data server to quit after
+# we've closed its stdin.
+SHUTDOWN_TIMEOUT = 5
+
 DURATION_RE = re.compile("Miro-Movie-Data-Length: (\d+)")
 TYPE_RE = re.compile("Miro-Movie-Data-Type: (audio|video|other)")
 THUMBNAIL_SUCCESS_RE = re.compile("Miro-Movie-Data-Thumbnail: Success")
 TRY_AGAIN_RE = re.compile("Miro-Try-Again: True")
+# Line that the movie data server prints after the output for each job
+JOB_DONE_LINE = "Miro-Movie-Data-Done\n"
 
 class State(object):
     """Enum for tracking what we've looked at.
@@ -117,6 +130,109 @@ class MovieDataInfo(object):
 
 class ProcessHung(StandardError): pass
 
+class MovieDataServer(object):
+    """Long-running movie data program that handles many files.
+
+    Starting the movie data program can be expensive (on linux it means
+    initializing gstreamer), so on platforms that support it, we start the
+    program once and send it one job at a time over its stdin.  If a job
+    takes too long, we kill the program and start a new one for the next
+    job.
+    """
+    def __init__(self, updater, command_line, env):
+        self.updater = updater
+        self.command_line = command_line
+        self.env = env
+        self.pipe = None
+
+    def start(self):
+        self.pipe = subprocess.Popen(self.command_line,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=open(os.devnull, 'wb'), env=self.env,
+                startupinfo=util.no_console_startupinfo())
+
+    def is_running(self):
+        return self.pipe is not None and self.pipe.poll() is None
+
+    def run_job(self, video_path, thumbnail_path):
+        """Send a job to the server and wait for the results.
+
+        :returns: the output for the job, in the same format as the output
+            of the regular movie data program.
+        """
+        if not self.is_running():
+            self.start()
+        job = '%s %s\n' % (_quote_path(video_path),
+                           _quote_path(thumbnail_path))
+        try:
+            self.pipe.stdin.write(job)
+            self.pipe.stdin.flush()
+        except IOError:
+            # the server died before we could send the job
+            logging.warning("Movie data server exited unexpectedly")
+            self.kill()
+            return ''
+        return self._read_results()
+
+    def _read_results(self):
+        start_time = time.time()
+        fd = self.pipe.stdout.fileno()
+        output = ''
+        while True:
+            if self.updater.in_shutdown:
+                self.kill()
+                raise Shutdown
+            if time.time() - start_time > MOVIE_DATA_UTIL_TIMEOUT:
+                logging.warning("Movie data server hung, killing it")
+                self.kill()
+                raise ProcessHung
+            readable, _, _ = select.select([fd], [], [], SLEEP_DELAY)
+            if not readable:
+                continue
+            data = os.read(fd, 4096)
+            if not data:
+                logging.warning("Movie data server exited unexpectedly")
+                self.kill()
+                return output
+            output += data
+            # JOB_DONE_LINE is always the last thing printed for a job
+            if output.endswith(JOB_DONE_LINE):
+                return output[:-len(JOB_DONE_LINE)]
+
+    def kill(self):
+        if self.pipe is None:
+            return
+        if self.pipe.poll() is None:
+            try:
+                self.pipe.kill()
+                self.pipe.wait()
+            except OSError:
+                logging.warning("Error trying to kill the movie data "
+                                "server:\n%s", traceback.format_exc())
+        self.pipe = None
+
+    def shutdown(self):
+        """Stop the server after it finishes its current job."""
+        if self.pipe is None:
+            return
+        try:
+            # closing stdin tells the server to quit
+            self.pipe.stdin.close()
+        except IOError:
+            pass
+        start_time = time.time()
+        while self.pipe.poll() is None:
+            if time.time() - start_time > SHUTDOWN_TIMEOUT:
+                self.kill()
+                return
+            time.sleep(SLEEP_DELAY)
+        self.pipe = None
+
+def _quote_path(path):
+    if isinstance(path, unicode):
+        path = path.encode('utf-8')
+    return urllib.quote(path)
+
 class MovieDataUpdater(signals.SignalEmitter):
     def __init__ (self):
         signals.SignalEmitter.__init__(self, 'begin-loop', 'end-loop',
@@ -124,19 +240,30 @@ class MovieDataUpdater(signals.SignalEmitter):
         self.in_shutdown = False
         self.in_progress = set()
         self.queue = Queue.Queue()
-        self.thread = None
+        self.threads = []
+        # tracks which of our threads are processing an item
+        self.busy_count = 0
+        self.busy_lock = threading.Lock()
+        # stores the MovieDataServer for each thread
+        self.thread_local = threading.local()
 
     def start_thread(self):
-        self.thread = threading.Thread(name='Movie Data Thread',
-                                       target=thread_body,
-                                       args=[self.thread_loop])
-        self.thread.setDaemon(True)
-        self.thread.start()
+        """Start our worker threads.
+
+        We start one thread per CPU.  Each thread runs its own
+        movie data program, so files are processed in parallel.
+        """
+        for i in xrange(max(1, get_logical_cpu_count())):
+            thread = threading.Thread(name='Movie Data Thread %d' % i,
+                                      target=thread_body,
+                                      args=[self.thread_loop])
+            thread.setDaemon(True)
+            thread.start()
+            self.threads.append(thread)
 
     def process_with_movie_data_program(self, mdi):
-        command_line, env = mdi.program_info
         try:
-            stdout = self.run_movie_data_program(command_line, env)
+            stdout = self.run_movie_data_job(mdi)
         except StandardError:
             # check whether it's actually a Shutdown error, then raise
             if self.in_shutdown:
@@ -183,24 +310,47 @@ class MovieDataUpdater(signals.SignalEmitter):
             self.emit('end-loop')
 
     def thread_loop(self):
+        server_info = movie_data_server_info()
+        if server_info is not None:
+            command_line, env = server_info
+            self.thread_local.server = MovieDataServer(self, command_line,
+                                                       env)
         try:
-            while not self.in_shutdown:
-                with self.looping():
-                    self.process_item()
-        except Shutdown:
-            pass
+            try:
+                while not self.in_shutdown:
+                    with self.looping():
+                        self.process_item()
+            except Shutdown:
+                pass
+        finally:
+            if server_info is not None:
+                self.thread_local.server.shutdown()
 
     def process_item(self):
         try:
             mdi = self.queue.get(block=False)
         except Queue.Empty:
-            self.emit('queue-empty')
+            # Only emit queue-empty once all of our threads have run out of
+            # work.  Otherwise each idle thread would ask for more work.
+            with self.busy_lock:
+                all_idle = (self.busy_count == 0)
+            if all_idle:
+                self.emit('queue-empty')
             mdi = self.queue.get(block=True)
         # IMPORTANT: once we have popped an MDI off the queue, its mdp_state
         # *must* be set (by update_finished or update_failed) unless we shut
         # down before we could process it
         if mdi is None:
             raise Shutdown
+        with self.busy_lock:
+            self.busy_count += 1
+        try:
+            self._process_mdi(mdi)
+        finally:
+            with self.busy_lock:
+                self.busy_count -= 1
+
+    def _process_mdi(self, mdi):
         try:
             results = self.process_with_movie_data_program(mdi)
         except ProcessHung:
@@ -218,6 +368,21 @@ class MovieDataUpdater(signals.SignalEmitter):
         if hasattr(app, 'metadata_progress_updater'): # hack for unittests
             app.metadata_progress_updater.path_processed(mdi.video_path)
 
+    def run_movie_data_job(self, mdi):
+        """Run the movie data program for a MovieDataInfo.
+
+        If this thread has a MovieDataServer, we send the job to it,
+        otherwise we run a new movie data program process.
+
+        :returns: output from the movie data program
+        """
+        server = getattr(self.thread_local, 'server', None)
+        if server is not None:
+            return server.run_job(fileutil.expand_filename(mdi.video_path),
+                    fileutil.expand_filename(mdi.thumbnail_path))
+        command_line, env = mdi.program_info
+        return self.run_movie_data_program(command_line, env)
+
     def run_movie_data_program(self, command_line, env):
         start_time = time.time()
         # create tempfiles to catch output for the movie data program.  Using
@@ -282,34 +447,70 @@ class MovieDataUpdater(signals.SignalEmitter):
     def update_failed(self, item):
         self.in_progress.remove(item.id)
         if item.id_exists():
-            item.mdp_state = State.FAILED
-            if item.has_drm:
-                #17442#c7, part2: if mutagen called it potentially DRM'd and we
-                # couldn't read it, we consider it DRM'd; files that we consider
-                # DRM'd initially go in "Other"
-                item.file_type = u'other'
-            item.signal_change()
+            self._set_failed(item)
+            metadatacache.store_movie_data_failure(item.get_filename(),
+                    State.FAILED)
+
+    def _set_failed(self, item):
+        item.mdp_state = State.FAILED
+        if item.has_drm:
+            #17442#c7, part2: if mutagen called it potentially DRM'd and we
+            # couldn't read it, we consider it DRM'd; files that we consider
+            # DRM'd initially go in "Other"
+            item.file_type = u'other'
+        item.signal_change()
 
     @as_idle
     def update_finished(self, item, duration, screenshot, mediatype):
         self.in_progress.remove(item.id)
         if item.id_exists():
-            item.mdp_state = State.RAN
-            item.screenshot = screenshot
-            if duration is not None:
-                item.duration = duration
-                if duration != -1:
-                    # if mutagen thought it might have DRM but we got a
-                    # duration, override mutagen's guess
-                    item.has_drm = False
-            if item.has_drm:
-                #17442#c7, part2: if mutagen called it potentially DRM'd and we
-                # couldn't read it, we consider it DRM'd; files that we consider
-                # DRM'd initially go in "Other"
-                item.file_type = u'other'
-            elif mediatype is not None:
-                item.file_type = mediatype
-            item.signal_change()
+            self._set_finished(item, duration, screenshot, mediatype)
+            metadatacache.store_movie_data(item.get_filename(), State.RAN,
+                    duration, mediatype, screenshot)
+
+    def _set_finished(self, item, duration, screenshot, mediatype):
+        item.mdp_state = State.RAN
+        item.screenshot = screenshot
+        if duration is not None:
+            item.duration = duration
+            if duration != -1:
+                # if mutagen thought it might have DRM but we got a
+                # duration, override mutagen's guess
+                item.has_drm = False
+        if item.has_drm:
+            #17442#c7, part2: if mutagen called it potentially DRM'd and we
+            # couldn't read it, we consider it DRM'd; files that we consider
+            # DRM'd initially go in "Other"
+            item.file_type = u'other'
+        elif mediatype is not None:
+            item.file_type = mediatype
+        item.signal_change()
+
+    def _update_from_cache(self, item):
+        """Use results from the metadata cache instead of running the movie
+        data program.
+
+        :returns: True if the cache had results for item
+        """
+        cached = metadatacache.lookup(item.get_filename())
+        if cached is None or not cached.has_movie_data():
+            return False
+        if cached.mdp_state == State.FAILED:
+            self._set_failed(item)
+            return True
+        screenshot = None
+        if cached.screenshot is not None:
+            # give the item its own copy, since it deletes its screenshot
+            # when it's removed
+            screenshot = MovieDataInfo(item).thumbnail_path
+            try:
+                shutil.copyfile(fileutil.expand_filename(cached.screenshot),
+                                fileutil.expand_filename(screenshot))
+            except (IOError, OSError):
+                return False
+        self._set_finished(item, cached.mdp_duration, screenshot,
+                cached.mdp_file_type)
+        return True
 
     def update_skipped(self, item):
         item.mdp_state = State.SKIPPED
@@ -327,6 +528,10 @@ class MovieDataUpdater(signals.SignalEmitter):
             return
 
         if self._should_process_item(item):
+            if self._update_from_cache(item):
+                app.metadata_progress_updater.path_processed(
+                        item.get_filename())
+                return
             self.in_progress.add(item.id)
             self.queue.put(MovieDataInfo(item))
         else:
@@ -347,9 +552,10 @@ class MovieDataUpdater(signals.SignalEmitter):
 
     def shutdown(self):
         self.in_shutdown = True
-        # wake up our thread
-        self.queue.put(None)
-        if self.thread is not None:
-            self.thread.join()
+        # wake up our threads
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
 
 movie_data_updater = MovieDataUpdater()
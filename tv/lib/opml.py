@@ -28,6 +28,7 @@
 # statement from all source files in the program, then also delete it here.
 
 import os
+import time
 import logging
 
 from xml.dom import minidom
@@ -43,12 +44,25 @@ from miro import app
 from miro import folder
 from miro import dialogs
 from miro import eventloop
+from miro import messages
 from miro import tabs
 
 from miro.gtcache import gettext as _
 from miro.gtcache import ngettext
 from miro.plat.utils import filename_to_unicode
 
+def count_subscriptions(subscriptions):
+    """Count the feeds, sites and downloads in a list of subscriptions,
+    including the ones inside folders.
+    """
+    count = 0
+    for entry in subscriptions:
+        if entry['type'] == 'folder':
+            count += count_subscriptions(entry.get('children', []))
+        else:
+            count += 1
+    return count
+
 class Exporter(object):
     def __init__(self):
         self.io = StringIO()
@@ -183,10 +197,27 @@ class Exporter(object):
                 quoted_url))
 
 class Importer(object):
+    """Imports subscriptions from OPML files.
+
+    After an import, the summary attribute holds a dict describing what
+    happened, suitable for logging or handing to other programs:
+
+    - feeds_added, feeds_skipped: number of feeds we created and number
+      we skipped because they were already present
+    - sites_added, sites_skipped: the same for sites
+    - folders_added: number of folders we created
+    - downloads: number of downloads we started
+    - invalid: number of entries dropped because their URL was missing or
+      invalid
+    - duplicates: number of entries dropped because they were repeated in
+      the file
+    """
     def __init__(self):
         self.current_folder = None
         self.ignored_feeds = 0
         self.imported_feeds = 0
+        self.result = None
+        self.summary = None
 
     @eventloop.as_idle
     def import_subscriptions(self, pathname, show_summary=True):
@@ -201,12 +232,12 @@ class Importer(object):
 
         try:
             subscriptions = self.import_content(content)
-            self.result = subscription.Subscriber().add_subscriptions(
-                subscriptions)
-            if show_summary:
-                self.show_import_summary()
         except expat.ExpatError:
             self.show_xml_error()
+            return
+        self.add_subscriptions(subscriptions, show_progress=show_summary)
+        if show_summary:
+            self.show_import_summary()
 
     def import_content(self, content):
         dom = minidom.parseString(content)
@@ -220,6 +251,125 @@ class Importer(object):
         dom.unlink()
         return subscriptions
 
+    def add_subscriptions(self, subscriptions, show_progress=False):
+        """Add the subscriptions returned by import_content().
+
+        Entries are validated and deduplicated first.  Then everything
+        gets created in a single database transaction and new feeds wait
+        their turn in the feed update queue, rather than all being fetched
+        at once.
+
+        :returns: the summary dict (see the class docstring)
+        """
+        subscriptions, invalid, duplicates = self.clean_subscriptions(
+            subscriptions)
+        total = count_subscriptions(subscriptions)
+        progress_callback = None
+        if show_progress:
+            title = _('Importing Podcasts')
+            messages.ProgressDialogStart(title).send_to_frontend()
+            progress_state = {'count': 0, 'last_time': 0}
+            def progress_callback():
+                progress_state['count'] += 1
+                current_time = time.time()
+                if current_time > progress_state['last_time'] + 0.5:
+                    count = progress_state['count']
+                    text = '%s (%s/%s)' % (title, count, total)
+                    progress = float(count) / total
+                    messages.ProgressDialog(text, progress).send_to_frontend()
+                    progress_state['last_time'] = current_time
+
+        subscriber = subscription.Subscriber(queue_feed_updates=True,
+                progress_callback=progress_callback)
+        app.bulk_sql_manager.start()
+        try:
+            self.result = subscriber.add_subscriptions(subscriptions)
+        finally:
+            app.bulk_sql_manager.finish()
+            if show_progress:
+                messages.ProgressDialogFinished().send_to_frontend()
+
+        added, ignored = self.result
+        self.imported_feeds = len(added.get('feed', []))
+        self.ignored_feeds = len(ignored.get('feed', []))
+        self.summary = {
+            'feeds_added': self.imported_feeds,
+            'feeds_skipped': self.ignored_feeds,
+            'sites_added': len(added.get('site', [])),
+            'sites_skipped': len(ignored.get('site', [])),
+            'folders_added': len([s for s in subscriptions
+                                  if s['type'] == 'folder']),
+            'downloads': (len(added.get('download', [])) +
+                          len(ignored.get('download', []))),
+            'invalid': invalid,
+            'duplicates': duplicates,
+        }
+        logging.info("OPML import finished: %s", self.summary)
+        return self.summary
+
+    def clean_subscriptions(self, subscriptions):
+        """Validate and deduplicate subscriptions from import_content().
+
+        Entries without a usable URL and entries that we already saw
+        earlier in the file are dropped.  Nested folders are flattened into
+        their top-level folder, and sites and downloads are moved out of
+        folders, since Subscriber can't handle either.
+
+        :returns: (subscriptions, invalid_count, duplicate_count)
+        """
+        counts = {'invalid': 0, 'duplicates': 0}
+        seen = set()
+        def clean_entry(entry):
+            """Returns the cleaned-up entry, or None to drop it."""
+            url = entry.get('url')
+            if not url or not url.strip():
+                counts['invalid'] += 1
+                return None
+            url = url.strip()
+            if entry['type'] == 'feed':
+                url = feed.normalize_feed_url(url)
+            if not feed.validate_feed_url(url):
+                counts['invalid'] += 1
+                return None
+            key = (entry['type'], url, entry.get('search_term'))
+            if key in seen:
+                counts['duplicates'] += 1
+                return None
+            seen.add(key)
+            entry = entry.copy()
+            entry['url'] = url
+            return entry
+
+        def flatten_children(children, folder_entries, top_level_entries):
+            for child in children or []:
+                if child['type'] == 'folder':
+                    flatten_children(child.get('children'), folder_entries,
+                            top_level_entries)
+                    continue
+                child = clean_entry(child)
+                if child is None:
+                    continue
+                if child['type'] == 'feed':
+                    folder_entries.append(child)
+                else:
+                    top_level_entries.append(child)
+
+        cleaned = []
+        for entry in subscriptions or []:
+            if entry['type'] == 'folder':
+                children = []
+                moved = []
+                flatten_children(entry.get('children'), children, moved)
+                folder_entry = entry.copy()
+                folder_entry['children'] = children
+                cleaned.append(folder_entry)
+                cleaned.extend(moved)
+            else:
+                entry = clean_entry(entry)
+                if entry is not None:
+                    cleaned.append(entry)
+        return cleaned, counts['invalid'], counts['duplicates']
+
     def show_xml_error(self):
         title = _("OPML Import failed")
         message = _(
@@ -237,19 +387,26 @@ class Importer(object):
         dialog.run()
 
     def show_import_summary(self):
-        imported_feeds = len(self.result[0].get('feed', []))
-        ignored_feeds = len(self.result[1].get('feed', []))
+        imported_feeds = self.imported_feeds
+        ignored_feeds = self.ignored_feeds + self.summary['duplicates']
+        invalid = self.summary['invalid']
         title = _("OPML Import summary")
         message = ngettext("Successfully imported %(count)d podcast.",
                            "Successfully imported %(count)d podcasts.",
                            imported_feeds,
                            {"count": imported_feeds})
-        if self.ignored_feeds > 0:
+        if ignored_feeds > 0:
             message += "\n"
             message += ngettext("Skipped %(count)d podcast already present.",
                                 "Skipped %(count)d podcasts already present.",
                                 ignored_feeds,
                                 {"count": ignored_feeds})
+        if invalid > 0:
+            message += "\n"
+            message += ngettext("Skipped %(count)d invalid entry.",
+                                "Skipped %(count)d invalid entries.",
+                                invalid,
+                                {"count": invalid})
         dialog = dialogs.MessageBoxDialog(title, message)
         dialog.run()
 
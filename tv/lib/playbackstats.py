@@ -0,0 +1,220 @@
+# Miro - an RSS based video player application
+# Copyright (C) 2005, 2006, 2007, 2008, 2009, 2010, 2011
+# Participatory Culture Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# In addition, as a special exception, the copyright holders give
+# permission to link the code of portions of this program with the OpenSSL
+# library.
+#
+# You must obey the GNU General Public License in all respects for all of
+# the code used other than OpenSSL. If you modify file(s) with this
+# exception, you may extend this exception to your version of the file(s),
+# but you are not obligated to do so. If you do not wish to do so, delete
+# this exception statement from your version. If you delete this exception
+# statement from all source files in the program, then also delete it here.
+
+"""``miro.playbackstats`` -- Playback history and analytics.
+
+The frontend reports each play session (one item played from start to
+stop, or until the next item started) with the RecordPlaySession message.
+PlaybackStats stores the sessions in the play_session table, batching the
+writes, and the functions at the bottom of this module answer questions
+like "which feeds does the user watch the most" and "how often do they
+finish what they start".
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+from miro import app
+from miro import eventloop
+from miro import item
+from miro.database import DDBObject
+
+# A session counts as completed if the user got this far into the item
+COMPLETED_FRACTION = 0.9
+# A session that isn't completed counts as skipped if the user watched less
+# than this many seconds
+SKIP_SECONDS = 30
+# Sessions shorter than this aren't worth recording
+MIN_WATCHED_SECONDS = 1
+# Write pending sessions after this many seconds...
+FLUSH_DELAY = 60
+# ...or once this many sessions are waiting
+FLUSH_BATCH_SIZE = 50
+# Sessions older than this get pruned at startup
+MAX_SESSION_AGE = timedelta(days=365)
+
+class PlaySession(DDBObject):
+    """A single play session for an item."""
+    def setup_new(self, item_id, feed_id, start_time, end_time, duration,
+            watched_time, position, pause_count=0, seek_count=0):
+        self.item_id = item_id
+        self.feed_id = feed_id
+        self.start_time = start_time
+        self.end_time = end_time
+        if duration is not None:
+            duration = float(duration)
+        self.duration = duration
+        self.watched_time = float(watched_time)
+        self.position = float(position)
+        self.pause_count = pause_count
+        self.seek_count = seek_count
+        self.completion = calc_completion(self.position, duration)
+        self.completed = (self.completion is not None and
+                self.completion >= COMPLETED_FRACTION)
+        self.skipped = not self.completed and watched_time < SKIP_SECONDS
+
+def calc_completion(position, duration):
+    """Calculate how far into an item the user got, from 0.0 to 1.0.
+
+    :returns: the fraction, or None if we don't know the duration
+    """
+    if not duration or duration <= 0:
+        return None
+    return max(0.0, min(1.0, float(position) / duration))
+
+class PlaybackStats(object):
+    """Records play sessions for the backend.
+
+    Sessions are kept in memory and written in batches, either
+    FLUSH_DELAY seconds after the first one arrives or once
+    FLUSH_BATCH_SIZE of them are waiting.  The query functions call
+    flush() first, so they always see every recorded session.
+    """
+    def __init__(self):
+        self.pending = []
+        self.flush_timeout = None
+
+    def record(self, item_id, start_time, end_time, duration, watched_time,
+            position, pause_count=0, seek_count=0):
+        if watched_time < MIN_WATCHED_SECONDS:
+            return
+        self.pending.append((item_id, start_time, end_time, duration,
+            watched_time, position, pause_count, seek_count))
+        if len(self.pending) >= FLUSH_BATCH_SIZE:
+            self.flush()
+        elif self.flush_timeout is None:
+            self.flush_timeout = eventloop.add_timeout(FLUSH_DELAY,
+                    self.flush, "flush play sessions")
+
+    def flush(self):
+        if self.flush_timeout is not None:
+            self.flush_timeout.cancel()
+            self.flush_timeout = None
+        if not self.pending:
+            return
+        sessions, self.pending = self.pending, []
+        feed_ids = self._get_feed_ids(set(s[0] for s in sessions))
+        app.bulk_sql_manager.start()
+        try:
+            for session in sessions:
+                item_id = session[0]
+                PlaySession(item_id, feed_ids.get(item_id), *session[1:])
+        finally:
+            app.bulk_sql_manager.finish()
+        logging.debug("wrote %d play sessions", len(sessions))
+
+    def _get_feed_ids(self, item_ids):
+        # Look up the feeds now, so that the stats survive the items being
+        # deleted.
+        item_ids = list(item_ids)
+        feed_ids = {}
+        while item_ids:
+            chunk, item_ids = item_ids[:900], item_ids[900:]
+            where = 'id IN (%s)' % ', '.join('?' for i in chunk)
+            for item_id, feed_id in item.Item.select(['id', 'feed_id'],
+                    where, chunk):
+                feed_ids[item_id] = feed_id
+        return feed_ids
+
+    def prune(self, max_age=MAX_SESSION_AGE):
+        """Delete sessions older than max_age."""
+        PlaySession.delete('end_time < ?', (datetime.now() - max_age,))
+
+def _since_clause(since, extra_where=None):
+    wheres = []
+    values = []
+    if extra_where is not None:
+        wheres.append(extra_where)
+    if since is not None:
+        wheres.append('end_time >= ?')
+        values.append(since)
+    if wheres:
+        return 'WHERE %s' % ' AND '.join(wheres), values
+    return '', values
+
+def _run_query(sql, values):
+    if app.playback_stats is not None:
+        app.playback_stats.flush()
+    app.db.cursor.execute(sql, values)
+    return app.db.cursor.fetchall()
+
+def top_feeds(limit=10, since=None):
+    """Get the feeds the user plays the most.
+
+    :param limit: maximum number of feeds to return
+    :param since: only count sessions that ended after this datetime
+    :returns: list of (feed_id, play_count, watched_time) tuples, most
+              played first
+    """
+    where, values = _since_clause(since, 'feed_id IS NOT NULL')
+    sql = ("SELECT feed_id, COUNT(*), SUM(watched_time) FROM play_session "
+            "%s GROUP BY feed_id "
+            "ORDER BY COUNT(*) DESC, SUM(watched_time) DESC LIMIT ?" % where)
+    return [tuple(row) for row in _run_query(sql, values + [limit])]
+
+def completion_rates(since=None):
+    """Get how often the user finishes and skips the items in each feed.
+
+    :param since: only count sessions that ended after this datetime
+    :returns: dict mapping feed ids to (play_count, completed_rate,
+              skipped_rate) tuples, where the rates go from 0.0 to 1.0
+    """
+    where, values = _since_clause(since, 'feed_id IS NOT NULL')
+    sql = ("SELECT feed_id, COUNT(*), SUM(completed), SUM(skipped) "
+            "FROM play_session %s GROUP BY feed_id" % where)
+    rates = {}
+    for feed_id, count, completed, skipped in _run_query(sql, values):
+        rates[feed_id] = (count, float(completed) / count,
+                float(skipped) / count)
+    return rates
+
+def watched_time_by_feed(since=None):
+    """Get the total watching/listening time for each feed.
+
+    :param since: only count sessions that ended after this datetime
+    :returns: dict mapping feed ids to seconds
+    """
+    where, values = _since_clause(since, 'feed_id IS NOT NULL')
+    sql = ("SELECT feed_id, SUM(watched_time) FROM play_session "
+            "%s GROUP BY feed_id" % where)
+    return dict((row[0], row[1]) for row in _run_query(sql, values))
+
+def recently_watched(limit=20):
+    """Get the items the user played most recently.
+
+    Items that have since been deleted are left out.
+
+    :returns: list of item ids, most recently played first
+    """
+    sql = ("SELECT play_session.item_id, MAX(play_session.end_time) "
+            "FROM play_session "
+            "JOIN item ON item.id = play_session.item_id "
+            "GROUP BY play_session.item_id "
+            "ORDER BY MAX(play_session.end_time) DESC LIMIT ?")
+    return [row[0] for row in _run_query(sql, [limit])]
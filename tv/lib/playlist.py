@@ -33,6 +33,7 @@
 import logging
 
 from miro.gtcache import gettext as _
+from miro import app
 from miro import dialogs
 from miro import database
 from miro import models
@@ -43,14 +44,27 @@ class PlaylistItemMap(database.DDBObject):
     child items.
     """
 
-    def setup_new(self, playlist_id, item_id):
+    def setup_new(self, playlist_id, item_id, position=None):
         self.playlist_id = playlist_id
         self.item_id = item_id
-        rows = self.select(['MAX(position+1)'], 'playlist_id=?',
+        if position is None:
+            position = self.next_position(playlist_id)
+        self.position = position
+
+    @classmethod
+    def next_position(cls, playlist_id):
+        """Get the position for an item added to the end of a playlist."""
+        rows = cls.select(['MAX(position+1)'], 'playlist_id=?',
                 (playlist_id,), convert=False)
-        self.position = rows[0][0]
-        if self.position is None:
-            self.position = 0
+        if rows[0][0] is None:
+            return 0
+        return rows[0][0]
+
+    @classmethod
+    def get_item_ids(cls, playlist_id):
+        rows = cls.select(['item_id'], 'playlist_id=?', (playlist_id,),
+                convert=False)
+        return [row[0] for row in rows]
 
     @classmethod
     def playlist_view(cls, playlist_id):
@@ -64,10 +78,50 @@ class PlaylistItemMap(database.DDBObject):
     def add_item_id(cls, playlist_id, item_id):
         cls(playlist_id, item_id)
 
+    @classmethod
+    def add_item_ids(cls, playlist_id, item_ids):
+        """Add a list of items to the end of a playlist."""
+        position = cls.next_position(playlist_id)
+        for item_id in item_ids:
+            cls(playlist_id, item_id, position)
+            position += 1
+
     @classmethod
     def remove_item_id(cls, playlist_id, item_id):
         cls.delete('playlist_id=? AND item_id=?', (playlist_id, item_id))
 
+    @classmethod
+    def set_positions(cls, playlist_id, item_ids):
+        """Change the order of the items in a playlist.
+
+        Only the rows whose position actually changed get saved, and they
+        all get saved with LiveStorage.bulk_update().
+        """
+        maps = dict((map_.item_id, map_)
+                for map_ in cls.playlist_view(playlist_id))
+        changed = []
+        for position, item_id in enumerate(item_ids):
+            map_ = maps[item_id]
+            if map_.position != position:
+                map_.position = position
+                changed.append(map_)
+        app.db.bulk_update(changed)
+        for map_ in changed:
+            map_.signal_change(needs_save=False)
+
+def _run_in_bulk_transaction(func, *args):
+    """Run func inside a BulkSQLManager transaction.
+
+    If a transaction is already in progress, func just becomes part of it.
+    """
+    if app.bulk_sql_manager.active:
+        return func(*args)
+    app.bulk_sql_manager.start()
+    try:
+        return func(*args)
+    finally:
+        app.bulk_sql_manager.finish()
+
 class PlaylistMixin:
     """Class that handles basic playlist functionality.  PlaylistMixin
     is used by both SavedPlaylist and folder.PlaylistFolder.
@@ -88,6 +142,29 @@ class PlaylistMixin:
         if folder is not None:
             folder.add_id(item_id)
 
+    def add_ids(self, item_ids):
+        """Add a list of items to the end of the playlist.
+
+        This does the same thing as calling add_id() for each item, but
+        all the changes happen in a single BulkSQLManager transaction.
+        That way the view trackers get checked once and the frontend gets
+        one change message for the whole batch.
+        """
+        _run_in_bulk_transaction(self._add_ids, item_ids)
+
+    def _add_ids(self, item_ids):
+        if not item_ids:
+            return
+        self.MapClass.add_item_ids(self.id, item_ids)
+        app.db.ensure_objects_loaded(models.Item, item_ids)
+        for item_id in item_ids:
+            item = models.Item.get_by_id(item_id)
+            item.save(always_signal=True)
+
+        folder = self.get_folder()
+        if folder is not None:
+            folder._add_ids(item_ids)
+
     def remove_id(self, item_id, signal_change=True):
         """Remove an item from the playlist."""
         try:
@@ -120,11 +197,8 @@ class PlaylistMixin:
         """reorder items in the playlist.  new_order should contain a
         list of ids one for each item in the playlist.
         """
-        for i, item_id in enumerate(new_order):
-            map_ = self.MapClass.make_view('playlist_id=? AND item_id=?',
-                    (self.id, item_id)).get_singleton()
-            map_.position = i
-            map_.signal_change()
+        _run_in_bulk_transaction(self.MapClass.set_positions, self.id,
+                new_order)
 
 class SavedPlaylist(database.DDBObject, PlaylistMixin):
     """An ordered list of videos that the user has saved.
@@ -139,8 +213,7 @@ class SavedPlaylist(database.DDBObject, PlaylistMixin):
         self.title = title
         self.folder_id = None
         if item_ids is not None:
-            for id_ in item_ids:
-                self.add_id(id_)
+            self.add_ids(item_ids)
 
     @classmethod
     def folder_view(cls, id_):
@@ -157,6 +230,18 @@ class SavedPlaylist(database.DDBObject, PlaylistMixin):
         if view.count() == 0:
             PlaylistMixin.add_id(self, item_id)
 
+    def _add_ids(self, item_ids):
+        # Don't allow items to be added more than once, either because
+        # they're already in the playlist or because they're in item_ids
+        # twice.
+        seen = set(PlaylistItemMap.get_item_ids(self.id))
+        new_ids = []
+        for item_id in item_ids:
+            if item_id not in seen:
+                seen.add(item_id)
+                new_ids.append(item_id)
+        PlaylistMixin._add_ids(self, new_ids)
+
     get_title, set_title = make_simple_get_set('title')
 
     def get_folder(self):
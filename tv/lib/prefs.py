@@ -118,11 +118,18 @@ SHARE_WARN_ON_QUIT          = Pref(key='ShareWarnOnQuit',       default=True, pl
 SHARE_VIDEO                 = Pref(key='ShareVideo',            default=True, platformSpecific=False)
 SHARE_AUDIO                 = Pref(key='ShareAudio',            default=True, platformSpecific=False)
 SHARE_FEED                  = Pref(key='ShareFeed',             default=True, platformSpecific=False)
+SERVER_API_HOST             = Pref(key='ServerAPIHost',         default='127.0.0.1', platformSpecific=False)
+SERVER_API_PORT             = Pref(key='ServerAPIPort',         default=8766, platformSpecific=False)
 MUSIC_TAB_CLICKED           = Pref(key='musicTabClicked',       default=False, platformSpecific=False)
 SHOW_PODCASTS_IN_VIDEO      = Pref(key='showPodcastsInVideo', default=True, platformSpecific=False)
 SHOW_PODCASTS_IN_MUSIC      = Pref(key='showPodcastsInMusic', default=False, platformSpecific=False)
 REMEMBER_LAST_DISPLAY       = Pref(key='rememberLastDisplay', default=False, platformSpecific=False)
 PODCASTS_DEFAULT_VIEW       = Pref(key='podcastsDefaultView', default=0, platformSpecific=False)
+# seconds between writing the event loop metrics to eventloop-metrics.json in
+# the support directory.  0 disables it.
+EVENTLOOP_METRICS_DUMP_INTERVAL = Pref(key='eventloopMetricsDumpInterval', default=0, platformSpecific=False)
+# use a write-ahead log for the sqlite database if sqlite supports it
+DATABASE_WAL_MODE           = Pref(key='databaseWALMode',       default=True,  platformSpecific=False)
 # This doesn't need to be defined on the platform, but it can be overridden there if the platform wants to.
 SHOW_ERROR_DIALOG           = Pref(key='showErrorDialog',       default=True,  platformSpecific=True)
 
@@ -227,6 +234,13 @@ ENABLED_EXTENSIONS = \
     Pref(key='EnabledExtensions', default=[], platformSpecific=False)
 DISABLED_EXTENSIONS = \
     Pref(key='DisabledExtensions', default=[], platformSpecific=False)
+# default max seconds an extension hook function should take
+EXTENSION_HOOK_TIME_BUDGET = \
+    Pref(key='ExtensionHookTimeBudget', default=0.2, platformSpecific=False)
+# disable an extension after this many failed or over budget hook calls in
+# a row
+EXTENSION_HOOK_MAX_STRIKES = \
+    Pref(key='ExtensionHookMaxStrikes', default=5, platformSpecific=False)
 HTTP_PROXY_SCHEME = \
     Pref(key='HttpProxyScheme', default='http', platformSpecific=True)
 HTTP_PROXY_ACTIVE = \
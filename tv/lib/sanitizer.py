@@ -0,0 +1,149 @@
+# Miro - an RSS based video player application
+# Copyright (C) 2005, 2006, 2007, 2008, 2009, 2010, 2011
+# Participatory Culture Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# In addition, as a special exception, the copyright holders give
+# permission to link the code of portions of this program with the OpenSSL
+# library.
+#
+# You must obey the GNU General Public License in all respects for all of
+# the code used other than OpenSSL. If you modify file(s) with this
+# exception, you may extend this exception to your version of the file(s),
+# but you are not obligated to do so. If you do not wish to do so, delete
+# this exception statement from your version. If you delete this exception
+# statement from all source files in the program, then also delete it here.
+
+"""``miro.sanitizer`` -- Memoised HTML stripping and XHTML conversion.
+
+Stripping HTML out of item descriptions and converting HTML to XHTML both
+take a full parser pass.  Descriptions rarely change, but they get
+processed every time an item is updated from its feed or an ItemInfo is
+built for it.  HTMLSanitizer keeps the results in an LRU cache keyed by a
+hash of the input text, so each distinct description only gets parsed
+once.
+
+Item also stores the stripped description and the hash it was calculated
+from in the database, so the work survives restarts (see
+Item.get_stripped_description()).
+"""
+
+import hashlib
+import threading
+
+from miro import util
+from miro import xhtmltools
+
+# max number of results to keep for each kind of conversion
+CACHE_SIZE = 2000
+
+def content_hash(text):
+    """Calculate the hash we use to key results for text.
+
+    :returns: unicode hex digest
+    """
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    return unicode(hashlib.sha1(text).hexdigest())
+
+class HTMLSanitizer(object):
+    """Caches the results of util.HTMLStripper and xhtmltools.xhtmlify.
+
+    This class is threadsafe, so the backend and the frontend can share a
+    single instance.
+    """
+    def __init__(self, size=CACHE_SIZE):
+        self.strip_cache = util.Cache(size)
+        self.xhtmlify_cache = util.Cache(size)
+        self.lock = threading.Lock()
+
+    def _lookup(self, cache, key):
+        self.lock.acquire()
+        try:
+            if key in cache:
+                return cache.get(key)
+            cache.misses += 1
+            return None
+        finally:
+            self.lock.release()
+
+    def _store(self, cache, key, value):
+        self.lock.acquire()
+        try:
+            cache.set(key, value)
+        finally:
+            self.lock.release()
+
+    def strip(self, text, text_hash=None):
+        """Strip the HTML out of text.
+
+        :param text_hash: content_hash(text), if the caller already has it
+        :returns: (stripped_text, links) tuple, like HTMLStripper.strip()
+        """
+        if not isinstance(text, basestring):
+            return (u"", [])
+        if text_hash is None:
+            text_hash = content_hash(text)
+        result = self._lookup(self.strip_cache, text_hash)
+        if result is None:
+            # HTMLStripper isn't threadsafe, so we use a new one for each
+            # call rather than holding the lock while we parse.
+            result = util.HTMLStripper().strip(text)
+            self._store(self.strip_cache, text_hash, result)
+        stripped, links = result
+        # callers are allowed to modify links, so give them a copy
+        return stripped, list(links)
+
+    def xhtmlify(self, data, add_top_tags=False, filter_font_tags=False):
+        """Memoised version of xhtmltools.xhtmlify()."""
+        key = (content_hash(data), add_top_tags, filter_font_tags)
+        result = self._lookup(self.xhtmlify_cache, key)
+        if result is None:
+            result = xhtmltools.xhtmlify(data, add_top_tags,
+                    filter_font_tags)
+            self._store(self.xhtmlify_cache, key, result)
+        return result
+
+    def get_stats(self):
+        """Get the cache stats for strip() and xhtmlify().
+
+        :returns: dict mapping 'strip' and 'xhtmlify' to the
+                  util.Cache.get_stats() dict for that cache.
+        """
+        self.lock.acquire()
+        try:
+            return {
+                'strip': self.strip_cache.get_stats(),
+                'xhtmlify': self.xhtmlify_cache.get_stats(),
+            }
+        finally:
+            self.lock.release()
+
+_sanitizer = HTMLSanitizer()
+
+def strip_html(text, text_hash=None):
+    """Strip HTML from text using the shared HTMLSanitizer.
+
+    :returns: (stripped_text, links) tuple
+    """
+    return _sanitizer.strip(text, text_hash)
+
+def xhtmlify(data, add_top_tags=False, filter_font_tags=False):
+    """Convert HTML to XHTML using the shared HTMLSanitizer."""
+    return _sanitizer.xhtmlify(data, add_top_tags, filter_font_tags)
+
+def get_stats():
+    return _sanitizer.get_stats()
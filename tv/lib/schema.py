@@ -379,6 +379,7 @@ class MultiClassObjectSchema(ObjectSchema):
 
 from miro.database import DDBObject
 from miro.databaselog import DBLogEntry
+from miro.directorysnapshot import DirectorySnapshot
 from miro.downloader import RemoteDownloader
 from miro.feed import (Feed, FeedImpl, RSSFeedImpl, SavedSearchFeedImpl,
                        ScraperFeedImpl)
@@ -390,7 +391,11 @@ from miro.folder import (HideableTab, ChannelFolder, PlaylistFolder,
 from miro.guide import ChannelGuide
 from miro.item import Item, FileItem
 from miro.iconcache import IconCache
+from miro.importmedia import ITunesTrack
+from miro.metadatacache import MetadataCacheEntry
+from miro.playbackstats import PlaySession
 from miro.playlist import SavedPlaylist, PlaylistItemMap
+from miro.scraping import ScrapeCacheEntry
 from miro.tabs import TabOrder
 from miro.theme import ThemeHistory
 from miro.widgetstate import DisplayState, ViewState, GlobalState
@@ -472,6 +477,10 @@ class ItemSchema(MultiClassObjectSchema):
         ('skip_count', SchemaInt()),
         ('cover_art', SchemaFilename(noneOk=True)),
         ('mdp_state', SchemaInt(noneOk=True)),
+        ('description_hash', SchemaString(noneOk=True)),
+        ('description_stripped', SchemaString(noneOk=True)),
+        ('description_links', SchemaList(SchemaTuple(SchemaInt(),
+            SchemaInt(), SchemaString()), noneOk=True)),
         # metadata:
         ('metadata_version', SchemaInt()),
         ('title', SchemaString(noneOk=True)),
@@ -498,9 +507,14 @@ class ItemSchema(MultiClassObjectSchema):
             ('item_feed', ('feed_id',)),
             ('item_feed_visible', ('feed_id', 'deleted')),
             ('item_parent', ('parent_id',)),
-            ('item_downloader', ('downloader_id',)),
+            # covers the columns that the download views check
+            ('item_downloader', ('downloader_id', 'seen', 'parent_id',
+                'autoDownloaded', 'pendingManualDL')),
             ('item_feed_downloader', ('feed_id', 'downloader_id',)),
             ('item_file_type', ('file_type',)),
+            # covers incomplete_mdp_view
+            ('item_mdp_state', ('mdp_state', 'isContainerItem',
+                'is_file_item', 'deleted', 'downloader_id')),
     )
 
 class FeedSchema(DDBObjectSchema):
@@ -539,6 +553,9 @@ class FeedImplSchema(DDBObjectSchema):
         ('thumbURL', SchemaURL(noneOk=True)),
         ('updateFreq', SchemaInt()),
         ('initialUpdate', SchemaBool()),
+        ('next_update', SchemaDateTime(noneOk=True)),
+        ('unchanged_updates', SchemaInt()),
+        ('publish_interval', SchemaFloat(noneOk=True)),
     ]
 
 class RSSFeedImplSchema(FeedImplSchema):
@@ -630,6 +647,7 @@ class RemoteDownloaderSchema(DDBObjectSchema):
 
     indexes = (
         ('downloader_state', ('state',)),
+        ('downloader_dlid', ('dlid',)),
     )
 
     @staticmethod
@@ -682,6 +700,11 @@ class PlaylistItemMapSchema(DDBObjectSchema):
         ('position', SchemaInt()),
     ]
 
+    indexes = (
+        ('playlist_item_map_playlist', ('playlist_id', 'item_id')),
+        ('playlist_item_map_item', ('item_id',)),
+    )
+
 class PlaylistFolderItemMapSchema(DDBObjectSchema):
     klass = PlaylistFolderItemMap
     table_name = 'playlist_folder_item_map'
@@ -692,6 +715,11 @@ class PlaylistFolderItemMapSchema(DDBObjectSchema):
         ('count', SchemaInt()),
     ]
 
+    indexes = (
+        ('playlist_folder_item_map_playlist', ('playlist_id', 'item_id')),
+        ('playlist_folder_item_map_item', ('item_id',)),
+    )
+
 class TabOrderSchema(DDBObjectSchema):
     klass = TabOrder
     table_name = 'taborder_order'
@@ -804,8 +832,105 @@ class ViewStateSchema(DDBObjectSchema):
     def handle_malformed_column_widths(value):
         return None
 
+class MetadataCacheEntrySchema(DDBObjectSchema):
+    klass = MetadataCacheEntry
+    table_name = 'metadata_cache_entry'
+    fields = DDBObjectSchema.fields + [
+        ('path', SchemaFilename()),
+        ('size', SchemaInt()),
+        ('mtime', SchemaFloat()),
+        ('tags_version', SchemaInt(noneOk=True)),
+        ('tags', SchemaReprContainer(noneOk=True)),
+        ('cover_art', SchemaFilename(noneOk=True)),
+        ('mdp_state', SchemaInt(noneOk=True)),
+        ('mdp_duration', SchemaInt(noneOk=True)),
+        ('mdp_file_type', SchemaString(noneOk=True)),
+        ('screenshot', SchemaFilename(noneOk=True)),
+        ('mdp_failures', SchemaInt()),
+    ]
+
+    indexes = (
+        ('metadata_cache_entry_path', ('path',)),
+    )
+
+    @staticmethod
+    def handle_malformed_tags(value):
+        return None
+
+class DirectorySnapshotSchema(DDBObjectSchema):
+    klass = DirectorySnapshot
+    table_name = 'directory_snapshot'
+    fields = DDBObjectSchema.fields + [
+        ('feed_impl_id', SchemaInt()),
+        ('path', SchemaFilename()),
+        ('mtime', SchemaFloat(noneOk=True)),
+        ('files', SchemaList(SchemaFilename())),
+        ('subdirs', SchemaList(SchemaFilename())),
+    ]
+
+    indexes = (
+        ('directory_snapshot_feed_impl', ('feed_impl_id',)),
+    )
+
+class ITunesTrackSchema(DDBObjectSchema):
+    klass = ITunesTrack
+    table_name = 'itunes_track'
+    fields = DDBObjectSchema.fields + [
+        ('persistent_id', SchemaString()),
+        ('item_id', SchemaInt(noneOk=True)),
+        ('date_modified', SchemaDateTime(noneOk=True)),
+        ('play_count', SchemaInt()),
+        ('skip_count', SchemaInt()),
+        ('created_item', SchemaBool()),
+    ]
+
+    indexes = (
+        ('itunes_track_persistent_id', ('persistent_id',)),
+    )
+
+class PlaySessionSchema(DDBObjectSchema):
+    klass = PlaySession
+    table_name = 'play_session'
+    fields = DDBObjectSchema.fields + [
+        ('item_id', SchemaInt()),
+        ('feed_id', SchemaInt(noneOk=True)),
+        ('start_time', SchemaDateTime()),
+        ('end_time', SchemaDateTime()),
+        ('duration', SchemaFloat(noneOk=True)),
+        ('watched_time', SchemaFloat()),
+        ('position', SchemaFloat()),
+        ('completion', SchemaFloat(noneOk=True)),
+        ('completed', SchemaBool()),
+        ('skipped', SchemaBool()),
+        ('pause_count', SchemaInt()),
+        ('seek_count', SchemaInt()),
+    ]
+
+    indexes = (
+        ('play_session_item_id', ('item_id',)),
+        ('play_session_feed_id', ('feed_id',)),
+        ('play_session_end_time', ('end_time',)),
+    )
+
+class ScrapeCacheEntrySchema(DDBObjectSchema):
+    klass = ScrapeCacheEntry
+    table_name = 'scrape_cache'
+    fields = DDBObjectSchema.fields + [
+        ('url', SchemaURL()),
+        ('resolved_url', SchemaURL(noneOk=True)),
+        ('content_type', SchemaString(noneOk=True)),
+        ('title', SchemaString(noneOk=True)),
+        ('source_url', SchemaURL(noneOk=True)),
+        ('etag', SchemaString(noneOk=True)),
+        ('modified', SchemaString(noneOk=True)),
+        ('expires', SchemaDateTime()),
+    ]
+
+    indexes = (
+        ('scrape_cache_url', ('url',)),
+    )
 
-VERSION = 164
+VERSION = 176
 
 object_schemas = [
     IconCacheSchema, ItemSchema, FeedSchema,
@@ -817,5 +942,7 @@ object_schemas = [
     PlaylistSchema, HideableTabSchema, ChannelFolderSchema, PlaylistFolderSchema,
     PlaylistItemMapSchema, PlaylistFolderItemMapSchema,
     TabOrderSchema, ThemeHistorySchema, DisplayStateSchema, GlobalStateSchema,
-    DBLogEntrySchema, ViewStateSchema,
+    DBLogEntrySchema, ViewStateSchema, MetadataCacheEntrySchema,
+    DirectorySnapshotSchema, ITunesTrackSchema, PlaySessionSchema,
+    ScrapeCacheEntrySchema,
 ]
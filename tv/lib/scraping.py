@@ -0,0 +1,271 @@
+# Miro - an RSS based video player application
+# Copyright (C) 2005, 2006, 2007, 2008, 2009, 2010, 2011
+# Participatory Culture Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# In addition, as a special exception, the copyright holders give
+# permission to link the code of portions of this program with the OpenSSL
+# library.
+#
+# You must obey the GNU General Public License in all respects for all of
+# the code used other than OpenSSL. If you modify file(s) with this
+# exception, you may extend this exception to your version of the file(s),
+# but you are not obligated to do so. If you do not wish to do so, delete
+# this exception statement from your version. If you delete this exception
+# statement from all source files in the program, then also delete it here.
+
+"""``miro.scraping`` -- Shared support for scraping web pages.
+
+ScrapeQueue runs the HTTP requests for ScraperFeedImpl and flashscraper.
+It limits how many requests run at once, both in total and for each host,
+and if several callers ask for the same URL while a request is running,
+they all share that request.
+
+ScrapeCacheEntry remembers what a web page URL resolved to (for example
+the media URL flashscraper found for a video page).  Entries are stored in
+the database and expire after a time-to-live.  Expired entries keep the
+validators of the page they came from, so they can be revalidated with a
+conditional request instead of scraping again.
+"""
+
+import urlparse
+from datetime import datetime, timedelta
+
+from miro import httpclient
+from miro import trapcall
+from miro.database import DDBObject, ObjectNotFoundError
+
+# Max number of requests to run at once
+MAX_REQUESTS = 6
+# Max number of requests to run at once for a single host
+MAX_REQUESTS_PER_HOST = 2
+# How long to keep expired cache entries around for revalidation
+MAX_STALE_AGE = timedelta(days=30)
+
+class ScrapeRequest(object):
+    """A single HTTP request, possibly shared by several callers."""
+    def __init__(self, key, url, headers_only, kwargs):
+        self.key = key
+        self.url = url
+        self.host = urlparse.urlparse(url)[1].lower()
+        self.headers_only = headers_only
+        self.kwargs = kwargs
+        self.handles = []
+        self.client = None
+
+class ScrapeHandle(object):
+    """Returned by ScrapeQueue.grab_url() so callers can cancel."""
+    def __init__(self, queue, request, callback, errback):
+        self.queue = queue
+        self.request = request
+        self.callback = callback
+        self.errback = errback
+
+    def cancel(self):
+        self.queue.cancel(self)
+
+class ScrapeQueue(object):
+    def __init__(self, max_requests=MAX_REQUESTS,
+            max_requests_per_host=MAX_REQUESTS_PER_HOST):
+        self.max_requests = max_requests
+        self.max_requests_per_host = max_requests_per_host
+        # requests waiting to start, in order
+        self.pending = []
+        # maps request keys to requests that are pending or running
+        self.requests = {}
+        # maps hosts to the number of requests running for them
+        self.host_counts = {}
+        self.running_count = 0
+
+    def grab_url(self, url, callback, errback, etag=None, modified=None,
+            default_mime_type=None):
+        """Queue up a request for url.
+
+        This works like httpclient.grab_url(), except that the request may
+        not start right away.
+
+        :returns: ScrapeHandle
+        """
+        kwargs = {'etag': etag, 'modified': modified,
+                'default_mime_type': default_mime_type}
+        return self._add(url, False, kwargs, callback, errback)
+
+    def grab_headers(self, url, callback, errback):
+        """Queue up a request for the headers of url.
+
+        :returns: ScrapeHandle
+        """
+        return self._add(url, True, {}, callback, errback)
+
+    def _add(self, url, headers_only, kwargs, callback, errback):
+        key = (url, headers_only) + tuple(sorted(kwargs.items()))
+        try:
+            request = self.requests[key]
+        except KeyError:
+            request = ScrapeRequest(key, url, headers_only, kwargs)
+            self.requests[key] = request
+            self.pending.append(request)
+        handle = ScrapeHandle(self, request, callback, errback)
+        request.handles.append(handle)
+        self.run_queue()
+        return handle
+
+    def run_queue(self):
+        for request in list(self.pending):
+            if self.running_count >= self.max_requests:
+                break
+            if (self.host_counts.get(request.host, 0) >=
+                    self.max_requests_per_host):
+                continue
+            self._start(request)
+
+    def _start(self, request):
+        self.pending.remove(request)
+        self.running_count += 1
+        self.host_counts[request.host] = (
+                self.host_counts.get(request.host, 0) + 1)
+        callback = lambda info: self._on_finished(request, info, True)
+        errback = lambda error: self._on_finished(request, error, False)
+        if request.headers_only:
+            request.client = httpclient.grab_headers(request.url, callback,
+                    errback)
+        else:
+            request.client = httpclient.grab_url(request.url, callback,
+                    errback, **request.kwargs)
+
+    def _request_done(self, request):
+        del self.requests[request.key]
+        self.running_count -= 1
+        self.host_counts[request.host] -= 1
+        if self.host_counts[request.host] == 0:
+            del self.host_counts[request.host]
+
+    def _on_finished(self, request, result, success):
+        if self.requests.get(request.key) is not request:
+            # canceled
+            return
+        self._request_done(request)
+        # callbacks may cancel other handles, so iterate over a copy
+        for handle in list(request.handles):
+            if handle not in request.handles:
+                # canceled by an earlier callback
+                continue
+            if success:
+                func = handle.callback
+            else:
+                func = handle.errback
+            trapcall.trap_call("scrape callback for %s" % request.url, func,
+                    result)
+        self.run_queue()
+
+    def cancel(self, handle):
+        request = handle.request
+        if handle not in request.handles:
+            return
+        request.handles.remove(handle)
+        if request.handles:
+            # someone else still wants the result
+            return
+        if request in self.pending:
+            self.pending.remove(request)
+            del self.requests[request.key]
+        elif self.requests.get(request.key) is request:
+            if request.client is not None:
+                request.client.cancel()
+            self._request_done(request)
+            self.run_queue()
+
+_queue = ScrapeQueue()
+
+def grab_url(url, callback, errback, etag=None, modified=None,
+        default_mime_type=None):
+    """Fetch url through the global ScrapeQueue."""
+    return _queue.grab_url(url, callback, errback, etag=etag,
+            modified=modified, default_mime_type=default_mime_type)
+
+def grab_headers(url, callback, errback):
+    """Fetch the headers for url through the global ScrapeQueue."""
+    return _queue.grab_headers(url, callback, errback)
+
+class ScrapeCacheEntry(DDBObject):
+    """Remembers what a web page URL resolved to.
+
+    :param url: the URL that was scraped
+    :param resolved_url: what the URL resolved to
+    :param content_type: content type of resolved_url
+    :param title: title found while scraping, or None
+    :param ttl: how long the entry stays fresh (timedelta)
+    :param source_url: the URL whose contents we scraped, if any
+    :param etag: etag header from source_url
+    :param modified: last-modified header from source_url
+    """
+    def setup_new(self, url, resolved_url, content_type, title, ttl,
+            source_url=None, etag=None, modified=None):
+        self.url = url
+        self.expires = None
+        self._set_values(resolved_url, content_type, title, ttl,
+                source_url, etag, modified)
+
+    def _set_values(self, resolved_url, content_type, title, ttl,
+            source_url, etag, modified):
+        self.resolved_url = resolved_url
+        self.content_type = content_type
+        self.title = title
+        self.source_url = source_url
+        self.etag = etag
+        self.modified = modified
+        self.expires = datetime.now() + ttl
+
+    @classmethod
+    def get_by_url(cls, url):
+        try:
+            return cls.make_view('url=?', (url,)).get_singleton()
+        except ObjectNotFoundError:
+            return None
+
+    def is_fresh(self):
+        return datetime.now() < self.expires
+
+    def can_revalidate(self):
+        return (self.source_url is not None and
+                (self.etag is not None or self.modified is not None))
+
+    def update(self, resolved_url, content_type, title, ttl,
+            source_url=None, etag=None, modified=None):
+        self._set_values(resolved_url, content_type, title, ttl,
+                source_url, etag, modified)
+        self.signal_change()
+
+    def refresh(self, ttl):
+        """Mark the entry fresh again after revalidating it."""
+        self.expires = datetime.now() + ttl
+        self.signal_change()
+
+def store_cache_entry(url, resolved_url, content_type, title, ttl,
+        source_url=None, etag=None, modified=None):
+    """Add or replace the cache entry for url."""
+    entry = ScrapeCacheEntry.get_by_url(url)
+    if entry is None:
+        ScrapeCacheEntry(url, resolved_url, content_type, title, ttl,
+                source_url, etag, modified)
+    else:
+        entry.update(resolved_url, content_type, title, ttl, source_url,
+                etag, modified)
+
+def prune_cache(max_stale_age=MAX_STALE_AGE):
+    """Remove cache entries that expired long ago."""
+    ScrapeCacheEntry.delete('expires < ?',
+            (datetime.now() - max_stale_age,))
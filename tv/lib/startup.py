@@ -71,11 +71,14 @@ from miro import feed
 from miro import folder
 from miro import messages
 from miro import messagehandler
+from miro import metadatacache
 from miro import metadataprogress
 from miro import models
 from miro import moviedata
+from miro import playbackstats
 from miro import playlist
 from miro import prefs
+from miro import scraping
 import miro.plat.resources
 from miro.plat.utils import setup_logging
 from miro.plat import config as platformcfg
@@ -93,6 +96,8 @@ from miro.plat import devicetracker
 
 DEBUG_DB_MEM_USAGE = False
 mem_usage_test_event = threading.Event()
+# time that startup() was called, used by log_startup_checkpoint()
+_startup_time = None
 
 class StartupError(Exception):
     def __init__(self, summary, description):
@@ -237,6 +242,8 @@ def startup():
 
     initialize() must be called before startup().
     """
+    global _startup_time
+    _startup_time = time.time()
     logging.info("Starting up %s", app.config.get(prefs.LONG_APP_NAME))
     logging.info("Version:    %s", app.config.get(prefs.APP_VERSION))
     logging.info("Revision:   %s", app.config.get(prefs.APP_REVISION))
@@ -256,6 +263,12 @@ def startup():
         mem_usage_test_event.wait()
     load_extensions()
 
+def log_startup_checkpoint(name):
+    """Log how long it's been since startup() was called."""
+    if _startup_time is not None:
+        logging.timing("Startup checkpoint: %s (%.3f secs)", name,
+                time.time() - _startup_time)
+
 @startup_function
 def load_extensions():
     core_ext_dirs = miro.plat.resources.extension_core_roots()
@@ -296,6 +309,7 @@ def finish_startup(obj, thread):
                 app.db.startup_version, app.db.current_version)
     databaselog.print_old_log_entries()
     models.initialize()
+    log_startup_checkpoint("database ready")
     if DEBUG_DB_MEM_USAGE:
         util.db_mem_usage_test()
         mem_usage_test_event.set()
@@ -306,6 +320,12 @@ def finish_startup(obj, thread):
     app.item_info_cache = iteminfocache.ItemInfoCache()
     app.item_info_cache.load()
     dbupgradeprogress.upgrade_end()
+    app.playback_stats = playbackstats.PlaybackStats()
+    eventloop.add_idle(app.playback_stats.prune, "prune play sessions")
+    eventloop.add_idle(scraping.prune_cache, "prune scrape cache")
+    eventloop.add_idle(metadatacache.prune_missing,
+            "prune metadata cache")
+    log_startup_checkpoint("item info cache loaded")
 
     logging.info("Loading video converters...")
     conversions.conversion_manager.startup()
@@ -318,6 +338,7 @@ def finish_startup(obj, thread):
     fix_database_inconsistencies()
     logging.info("setup tabs...")
     setup_tabs()
+    log_startup_checkpoint("tabs restored")
     logging.info("setup theme...")
     setup_theme()
     install_message_handler()
@@ -406,6 +427,7 @@ def finish_backend_startup():
     reconnect_downloaders()
     guide.download_guides()
     feed.remove_orphaned_feed_impls()
+    log_startup_checkpoint("backend ready")
     messages.StartupSuccess().send_to_frontend()
 
 @eventloop.idle_iterator
@@ -413,10 +435,13 @@ def on_frontend_started():
     """Perform startup actions that should happen after the frontend is
     already up and running.
     """
+    log_startup_checkpoint("frontend started (time to interactive)")
     logging.info("Starting auto downloader...")
     autodler.start_downloader()
     yield None
     feed.expire_items()
+    eventloop.add_timeout(feed.COUNT_RECONCILE_INTERVAL, feed.reconcile_counts,
+            "Reconcile Feed Counts")
     yield None
     moviedata.movie_data_updater.start_thread()
     yield None
@@ -435,6 +460,7 @@ def on_frontend_started():
     eventloop.add_timeout(60, item.update_incomplete_movie_data,
             "update movie data")
     eventloop.add_timeout(90, clear_icon_cache_orphans, "clear orphans")
+    eventloop.start_metrics_dump()
 
 def setup_global_feeds():
     setup_global_feed(u'dtv:manualFeed', initiallyAutoDownloadable=False)
@@ -504,9 +530,9 @@ def is_movies_directory_gone():
 
     # at this point either there's no movies_dir or there is an empty
     # movies_dir.  we check to see if we think something is downloaded.
-    for downloader_ in downloader.RemoteDownloader.make_view():
-        if ((downloader_.is_finished()
-             and downloader_.get_filename().startswith(movies_dir))):
+    for filename in downloader.iter_downloader_filenames((u'finished',
+            u'uploading', u'uploading-paused')):
+        if filename.startswith(movies_dir):
             # we think something is downloaded, so it seems like the
             # movies directory is gone.
             logging.info("Directory there, but missing files.")
@@ -108,6 +108,20 @@ _sqlite_type_map = {
 }
 
 VERSION_KEY = "Democracy Version"
+# Stored in the copy of the database that we run upgrades on.  It describes
+# the database we copied, so that an interrupted upgrade can be resumed if
+# that database hasn't changed since.
+UPGRADE_SOURCE_KEY = "Upgrade Source"
+
+# Settings for write-ahead log mode.  BulkSQLManager commits can add
+# thousands of pages to the WAL at once.  We raise sqlite's automatic
+# checkpoint threshold so that those commits don't also have to copy the
+# WAL back into the database, and instead checkpoint from the event loop
+# a little while after the commit.
+WAL_AUTOCHECKPOINT_PAGES = 10000
+WAL_CHECKPOINT_DELAY = 5.0
+# truncate the WAL file back to this size after checkpoints
+WAL_SIZE_LIMIT = 8 * 1024 * 1024
 
 def split_values_for_sqlite(value_list):
     """Split a list of values into chunks that SQL can handle.
@@ -152,6 +166,8 @@ class LiveStorage:
         db_existed = os.path.exists(path)
         self.raise_load_errors = False # only gets set in unittests
         self._dc = None
+        self._checkpoint_dc = None
+        self.wal_enabled = False
         self._query_times = {}
         self.path = path
         self._quitting_from_operational_error = False
@@ -188,19 +204,72 @@ class LiveStorage:
                 detect_types=sqlite3.PARSE_DECLTYPES)
         self.cursor = self.connection.cursor()
         try:
-            self.cursor.execute("PRAGMA journal_mode=PERSIST");
+            self._set_journal_mode()
         except sqlite3.DatabaseError:
-            msg = "Error running 'PRAGMA journal_mode=PERSIST'"
+            msg = "Error setting the journal mode"
             self._show_corrupt_db_dialog()
             self._handle_load_error(msg)
             # rerun the command with our fresh database
-            self.cursor.execute("PRAGMA journal_mode=PERSIST");
+            self._set_journal_mode()
+
+    def _set_journal_mode(self):
+        """Pick the journal mode for our connection.
+
+        We use a write-ahead log if DATABASE_WAL_MODE is set and sqlite
+        supports it.  Older sqlite versions and in-memory databases don't,
+        for those we use PERSIST like we always have.
+        """
+        self.wal_enabled = False
+        if app.config.get(prefs.DATABASE_WAL_MODE):
+            self.cursor.execute("PRAGMA journal_mode=WAL")
+            if self.cursor.fetchone()[0].lower() == 'wal':
+                self.wal_enabled = True
+                # NORMAL is still safe from corruption in WAL mode, we
+                # just might lose the last transaction on a power failure.
+                self.cursor.execute("PRAGMA synchronous=NORMAL")
+                self.cursor.execute("PRAGMA wal_autocheckpoint=%d" %
+                        WAL_AUTOCHECKPOINT_PAGES)
+                self.cursor.execute("PRAGMA journal_size_limit=%d" %
+                        WAL_SIZE_LIMIT)
+                return
+        self.cursor.execute("PRAGMA journal_mode=PERSIST")
+
+    def _schedule_checkpoint(self):
+        if self._checkpoint_dc is None:
+            self._checkpoint_dc = eventloop.add_timeout(WAL_CHECKPOINT_DELAY,
+                    self.checkpoint, "WAL checkpoint")
+
+    def checkpoint(self):
+        """Copy the pages in the write-ahead log back into the database.
+
+        This is a passive checkpoint, so it never blocks on readers.  It
+        does nothing if we aren't in WAL mode.
+        """
+        if self._checkpoint_dc is not None:
+            self._checkpoint_dc.cancel()
+            self._checkpoint_dc = None
+        if not self.wal_enabled:
+            return
+        if self._statements_in_transaction:
+            # wait until the transaction is committed
+            self._schedule_checkpoint()
+            return
+        start = time.time()
+        try:
+            self.cursor.execute("PRAGMA wal_checkpoint")
+        except sqlite3.OperationalError, e:
+            logging.warn("WAL checkpoint failed: %s", e)
+            return
+        self._check_time("PRAGMA wal_checkpoint", time.time() - start)
 
     def close(self, ignore_vacuum_error=True):
         logging.info("closing database")
         if self._dc:
             self._dc.cancel()
             self._dc = None
+        if self._checkpoint_dc:
+            self._checkpoint_dc.cancel()
+            self._checkpoint_dc = None
         self.finish_transaction()
 
         # the unittests run in memory and vacuum causes a segfault if
@@ -253,10 +322,28 @@ class LiveStorage:
             logging.exception('error when upgrading database: %s', e)
             self._handle_upgrade_error()
 
+    def _checkpoint_for_copy(self):
+        """Get the database file ready to be copied.
+
+        In WAL mode the latest changes may only be in the -wal file.  Copy
+        them into the database and truncate the log.
+        """
+        if not self.wal_enabled:
+            return
+        try:
+            self.cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.DatabaseError, e:
+            logging.warn("WAL checkpoint failed: %s", e)
+
     def _backup_failed_upgrade_db(self):
         save_name = self._find_unused_db_name(self.path, "failed_upgrade_database")
         path = os.path.join(os.path.dirname(self.path), save_name)
+        self._checkpoint_for_copy()
         shutil.copyfile(self.path, path)
+        # if the checkpoint failed, some changes are still in the -wal
+        # file.  The -shm file gets rebuilt, so we don't need it.
+        if os.path.exists(self.path + '-wal'):
+            shutil.copyfile(self.path + '-wal', path + '-wal')
         logging.warn("upgrade failed. Backing up database to %s", path)
 
     def _handle_upgrade_error(self):
@@ -333,6 +420,83 @@ class LiveStorage:
         self.open_connection()
         del self._changed_db_path
 
+    def _calc_upgrade_source(self, version):
+        """Describe the database that we're about to upgrade.
+
+        This is the version, plus the row count and max id of each table.
+        It's cheap to calculate and will change if an older version of
+        Miro uses the database after an interrupted upgrade.
+        """
+        tables = []
+        for table in databaseupgrade.get_object_tables(self.cursor):
+            self.cursor.execute("SELECT COUNT(*), MAX(id) FROM %s" % table)
+            count, max_id = self.cursor.fetchone()
+            tables.append((table, count, max_id))
+        tables.sort()
+        return (version, tables)
+
+    def _find_interrupted_upgrade(self, version, upgrade_source):
+        """Look for a database copy left over from an interrupted upgrade.
+
+        Copies that can be resumed were made from a database that matches
+        upgrade_source.  Any other copies are deleted.
+
+        :returns: path to the copy to resume, or None
+        """
+        target_path = os.path.dirname(self.path)
+        prefix = "upgrading_database_%s" % version
+        resume_path = None
+        for name in sorted(os.listdir(target_path)):
+            if name != prefix and not (name.startswith(prefix + ".") and
+                    name[len(prefix) + 1:].isdigit()):
+                continue
+            path = os.path.join(target_path, name)
+            if (resume_path is None and
+                    self._can_resume_upgrade(path, upgrade_source)):
+                resume_path = path
+            else:
+                logging.info("removing stale upgrade database: %s", path)
+                for suffix in ('', '-journal', '-wal', '-shm'):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+        return resume_path
+
+    def _can_resume_upgrade(self, path, upgrade_source):
+        try:
+            connection = sqlite3.connect(path, isolation_level=None)
+            try:
+                cursor = connection.cursor()
+                values = {}
+                for key in (VERSION_KEY, UPGRADE_SOURCE_KEY):
+                    cursor.execute("SELECT serialized_value FROM "
+                            "dtv_variables WHERE name=?", (key,))
+                    row = cursor.fetchone()
+                    if row is None:
+                        return False
+                    values[key] = cPickle.loads(str(row[0]))
+            finally:
+                connection.close()
+        except (sqlite3.DatabaseError, cPickle.UnpicklingError):
+            # we probably crashed while copying the database
+            return False
+        return (values[UPGRADE_SOURCE_KEY] == upgrade_source and
+                upgrade_source[0] <= values[VERSION_KEY] <=
+                self._schema_version)
+
+    def _resume_database_file(self, path):
+        """Switch to a database copy from an interrupted upgrade.
+
+        This works like _change_database_file(), but uses the copy we
+        already made.  The backup was made the first time around.
+        """
+        logging.info("resuming database upgrade with %s", path)
+        self.close(ignore_vacuum_error=False)
+        self._changed_db_path = path
+        self.open_connection(self._changed_db_path)
+
+    def _upgrade_checkpoint(self, cursor, version):
+        self._set_version(version)
+
     def _upgrade_database(self):
         self.startup_version = current_version = self._get_version()
 
@@ -349,11 +513,21 @@ class LiveStorage:
             # _upgrade_20_database will have done an upgrade
             dbupgradeprogress.doing_new_style_upgrade()
             current_version = self._get_version()
-            self._change_database_file(current_version)
+            upgrade_source = self._calc_upgrade_source(current_version)
+            resume_path = self._find_interrupted_upgrade(current_version,
+                    upgrade_source)
+            if resume_path is not None:
+                self._resume_database_file(resume_path)
+            else:
+                self._change_database_file(current_version)
+                self.set_variable(UPGRADE_SOURCE_KEY, upgrade_source)
             databaseupgrade.new_style_upgrade(self.cursor,
-                                              current_version,
-                                              self._schema_version)
+                                              self._get_version(),
+                                              self._schema_version,
+                                              self._upgrade_checkpoint)
             self._set_version()
+            self.cursor.execute("DELETE FROM dtv_variables WHERE name=?",
+                    (UPGRADE_SOURCE_KEY,))
             self._change_database_file_back()
         self.current_version = self._schema_version
 
@@ -466,6 +640,50 @@ class LiveStorage:
         """Update a DDBObject on disk."""
 
         obj_schema = self._schema_map[obj.__class__]
+        setters, values = self._changes_for_obj(obj_schema, obj)
+        if values:
+            sql = "UPDATE %s SET %s WHERE id=%s" % (obj_schema.table_name,
+                    ', '.join(setters), obj.id)
+            self._execute(sql, values, is_update=True)
+            if (self.cursor.rowcount != 1 and not
+                    self._quitting_from_operational_error):
+                if self.cursor.rowcount == 0:
+                    raise KeyError("Updating non-existent row (id: %s)" %
+                            obj.id)
+                else:
+                    raise ValueError("Update changed multiple rows "
+                            "(id: %s, count: %s)" %
+                            (obj.id, self.cursor.rowcount))
+
+    def bulk_update(self, objects):
+        """Update a list of objects in one go.
+
+        Objects that changed the same columns get saved with a single
+        executemany() call.  Throws a ValueError if the objects don't all
+        use the same database table.
+        """
+        if len(objects) == 0:
+            return
+        obj_schema = self._schema_map[objects[0].__class__]
+        updates = {}
+        for obj in objects:
+            if obj_schema != self._schema_map[obj.__class__]:
+                raise ValueError("Incompatible types for bulk update")
+            setters, values = self._changes_for_obj(obj_schema, obj)
+            if values:
+                values.append(obj.id)
+                updates.setdefault(tuple(setters), []).append(values)
+        for setters, value_list in updates.items():
+            sql = "UPDATE %s SET %s WHERE id=?" % (obj_schema.table_name,
+                    ', '.join(setters))
+            self._execute(sql, value_list, is_update=True, many=True)
+
+    def _changes_for_obj(self, obj_schema, obj):
+        """Get the SQL needed to save the changes to an object.
+
+        :returns: (setters, values) where setters is a list of
+        "column=?" strings and values is a list of the values to use.
+        """
         setters = []
         values = []
         for name, schema_item in obj_schema.fields:
@@ -483,19 +701,7 @@ class LiveStorage:
             values.append(self._converter.to_sql(obj_schema, name,
                 schema_item, value))
         obj.reset_changed_attributes()
-        if values:
-            sql = "UPDATE %s SET %s WHERE id=%s" % (obj_schema.table_name,
-                    ', '.join(setters), obj.id)
-            self._execute(sql, values, is_update=True)
-            if (self.cursor.rowcount != 1 and not
-                    self._quitting_from_operational_error):
-                if self.cursor.rowcount == 0:
-                    raise KeyError("Updating non-existent row (id: %s)" %
-                            obj.id)
-                else:
-                    raise ValueError("Update changed multiple rows "
-                            "(id: %s, count: %s)" %
-                            (obj.id, self.cursor.rowcount))
+        return setters, values
 
     def remove_obj(self, obj):
         """Remove a DDBObject from disk."""
@@ -715,6 +921,8 @@ class LiveStorage:
         if not self._quitting_from_operational_error:
             if commit:
                 self.cursor.execute("COMMIT TRANSACTION")
+                if self.wal_enabled:
+                    self._schedule_checkpoint()
             else:
                 self.cursor.execute("ROLLBACK TRANSACTION")
         self._statements_in_transaction = []
@@ -934,7 +1142,14 @@ class LiveStorage:
         target_path = os.path.dirname(self.path)
         save_name = self._find_unused_db_name(
             target_path, "corrupt_database")
-        os.rename(self.path, os.path.join(target_path, save_name))
+        save_path = os.path.join(target_path, save_name)
+        os.rename(self.path, save_path)
+        # Keep the write-ahead log with the database it belongs to.  If we
+        # left it behind, sqlite would apply it to the new database.
+        if os.path.exists(self.path + '-wal'):
+            os.rename(self.path + '-wal', save_path + '-wal')
+        if os.path.exists(self.path + '-shm'):
+            os.remove(self.path + '-shm')
 
     def _find_unused_db_name(self, target_path, save_name):
         org_save_name = save_name
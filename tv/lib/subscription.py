@@ -130,6 +130,17 @@ class Subscriber(object):
     handlers (OPML import, one-click links in the Guide, and
     command-line additions).
     """
+    def __init__(self, queue_feed_updates=False, progress_callback=None):
+        """
+        If queue_feed_updates is True, new feeds wait for their turn in the
+        feed update queue before being fetched, rather than all being
+        fetched at once.
+
+        progress_callback, if given, is called with no arguments after
+        each feed, site or download subscription is handled.
+        """
+        self.queue_feed_updates = queue_feed_updates
+        self.progress_callback = progress_callback
 
     def add_subscriptions(self, subscriptions_list, parent_folder=None):
         """
@@ -174,6 +185,9 @@ class Subscriber(object):
                 else:
                     ignored.setdefault(subscription_type, [])
                     ignored[subscription_type].append(subscription)
+                if (subscription_type != 'folder' and
+                        self.progress_callback is not None):
+                    self.progress_callback()
             else:
                 raise ValueError('unknown subscription type: %s' %
                                  subscription_type)
@@ -213,7 +227,8 @@ class Subscriber(object):
         search_term = feed_dict.get('search_term')
         f = feed.lookup_feed(url, search_term)
         if f is None:
-            f = feed.Feed(url, search_term=search_term)
+            f = feed.Feed(url, search_term=search_term,
+                    queue_generate=self.queue_feed_updates)
             title = feed_dict.get('title')
             if title is not None and title != '':
                 f.set_title(title)
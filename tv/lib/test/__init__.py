@@ -60,12 +60,17 @@ from miro.test.httpclienttest import *
 from miro.test.httpdownloadertest import *
 from miro.test.httpauthtoolstest import *
 from miro.test.feedtest import *
+from miro.test.feedupdatetest import *
 from miro.test.feedparsertest import *
 from miro.test.parseurltest import *
 from miro.test.utiltest import *
 from miro.test.playlisttest import *
 from miro.test.signalstest import *
 from miro.test.messagetest import *
+from miro.test.serverapitest import *
+from miro.test.playbackstatstest import *
+from miro.test.sanitizertest import *
+from miro.test.scrapingtest import *
 from miro.test.strippertest import *
 from miro.test.xhtmltest import *
 from miro.test.iconcachetest import *
@@ -79,6 +84,7 @@ from miro.test.fileobjecttest import *
 from miro.test.fastresumetest import *
 from miro.test.widgetstateconstantstest import *
 from miro.test.metadatatest import *
+from miro.test.metadatacachetest import *
 from miro.test.tableselectiontest import *
 from miro.test.filetagstest import *
 from miro.test.watchedfoldertest import *
@@ -110,19 +116,21 @@ class MiroTestLoader(unittest.TestLoader):
         return unittest.TestLoader.loadTestsFromNames(self, names, module)
 
     def _check_for_performance_tests(self, names, module):
-        # Only run the performance tests if they are specifically listed in
-        # arguments.
+        # Only run the performance tests and benchmarks if they are
+        # specifically listed in arguments.
         from miro import test as my_module
         if module is my_module:
             for name in names:
                 if 'performancetest' in name:
-                    self._add_performance_tests()
-                    break
-
-    def _add_performance_tests(self):
-        from miro.test import performancetest
-        for name in dir(performancetest):
-            obj = getattr(performancetest, name)
+                    self._add_performance_tests('performancetest')
+                if 'benchmarktest' in name:
+                    self._add_performance_tests('benchmarktest')
+
+    def _add_performance_tests(self, module_name):
+        test_module = __import__('miro.test.%s' % module_name,
+                fromlist=[module_name])
+        for name in dir(test_module):
+            obj = getattr(test_module, name)
             globals()[name] = obj
 
 def stop_on_failure(runner, result, meth):
@@ -0,0 +1,89 @@
+"""benchmarkcompare.py -- Compare two benchmarktest result files.
+
+This module only depends on the standard library, so it can be run
+directly on result files copied off another machine:
+
+    python benchmarkcompare.py old-results.json new-results.json
+"""
+
+import sys
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+# Changes smaller than this fraction of the old time are considered noise
+DEFAULT_THRESHOLD = 0.10
+
+def load_results(path):
+    f = open(path)
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+def compare_results(old, new):
+    """Compare two benchmark result dicts.
+
+    :returns: list of (size, name, old_time, new_time, change) tuples for
+    every timing present in both results.  change is the relative change
+    from old_time to new_time, or None if old_time was 0.
+    """
+    rows = []
+    old_results = old['results']
+    new_results = new['results']
+    sizes = [size for size in new_results if size in old_results]
+    sizes.sort(key=int)
+    for size in sizes:
+        old_timings = old_results[size]
+        new_timings = new_results[size]
+        names = [name for name in new_timings if name in old_timings]
+        names.sort()
+        for name in names:
+            old_time = old_timings[name]
+            new_time = new_timings[name]
+            if old_time:
+                change = (new_time - old_time) / old_time
+            else:
+                change = None
+            rows.append((size, name, old_time, new_time, change))
+    return rows
+
+def find_regressions(rows, threshold=DEFAULT_THRESHOLD):
+    """Get the rows from compare_results() that got slower by more than
+    threshold.
+    """
+    return [row for row in rows
+            if row[4] is not None and row[4] > threshold]
+
+def format_comparison(rows, threshold=DEFAULT_THRESHOLD):
+    lines = ['%8s %-32s %10s %10s %8s' % ('items', 'benchmark', 'old',
+        'new', 'change')]
+    for size, name, old_time, new_time, change in rows:
+        if change is None:
+            change_str = '-'
+        else:
+            change_str = '%+.1f%%' % (change * 100)
+            if change > threshold:
+                change_str += ' !'
+        lines.append('%8s %-32s %10.4f %10.4f %8s' % (size, name, old_time,
+            new_time, change_str))
+    return '\n'.join(lines)
+
+def main(argv):
+    if len(argv) not in (3, 4):
+        print 'usage: %s OLD NEW [THRESHOLD]' % argv[0]
+        return 2
+    if len(argv) == 4:
+        threshold = float(argv[3])
+    else:
+        threshold = DEFAULT_THRESHOLD
+    rows = compare_results(load_results(argv[1]), load_results(argv[2]))
+    print format_comparison(rows, threshold)
+    if find_regressions(rows, threshold):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,388 @@
+"""benchmarktest.py -- Synthetic large-library benchmarks.
+
+Like performancetest, these only run when they are specifically listed on
+the command line (./run.sh --unittest benchmarktest).  For every library
+size we build a database of feeds, items and downloaders using the normal
+model classes, then time the operations that get slow as libraries grow:
+
+* upgrading a synthetic old database with every upgrade function
+* restoring objects from a freshly opened database
+* loading the item info cache (both the quick and failsafe paths)
+* creating item trackers
+* building the search index and running searches
+* updating a feed, served by the local test HTTP server
+* storms of downloader status updates
+
+The timings are written out as JSON, so that runs can be compared with
+benchmarkcompare.py.  The following environment variables control the
+run:
+
+* MIRO_BENCHMARK_SIZES -- comma separated list of item counts
+  (default: 10000,100000,500000)
+* MIRO_BENCHMARK_OUTPUT -- where to write the results
+  (default: benchmark-results.json in the current directory)
+* MIRO_BENCHMARK_BASELINE -- results from a previous run to compare
+  against
+"""
+
+import os
+import random
+import shutil
+import sys
+import time
+from xml.sax.saxutils import escape
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from miro import app
+from miro import databaseupgrade
+from miro import eventloop
+from miro import messagehandler
+from miro import messages
+from miro import models
+from miro import prefs
+from miro import schema
+from miro import search
+from miro.clock import clock
+from miro.item import FeedParserValues
+from miro.singleclick import _build_entry
+from miro.fileobject import FilenameType
+from miro.plat import resources
+from miro.test.framework import EventLoopTest, uses_httpclient
+from miro.test import benchmarkcompare
+from miro.test import messagetest
+
+DEFAULT_SIZES = (10000, 100000, 500000)
+DEFAULT_OUTPUT = 'benchmark-results.json'
+# version of the JSON format that we write out
+RESULTS_FORMAT = 1
+
+ITEMS_PER_FEED = 250
+# every Nth item gets a downloader
+ITEMS_PER_DOWNLOADER = 10
+# number of entries in the benchmark feed that aren't in the database yet
+NEW_FEED_ENTRIES = 50
+STATUS_STORM_ROUNDS = 3
+# upgrade benchmarks start from this database, upgraded to version 80 and
+# then filled with copies of its items and downloaders.
+UPGRADE_FIXTURE = 'testdata/olddatabase.v79'
+UPGRADE_FIXTURE_VERSION = 80
+# tables that get copied, and the columns in them that refer to other
+# copied rows
+UPGRADE_FIXTURE_TABLES = {
+    'item': ('id', 'parent_id', 'downloader_id'),
+    'remote_downloader': ('id',),
+}
+SEARCH_TERMS = [u'space', u'engine news', u'laundry -station', u'zzzz']
+
+WORDS = [u'space', u'station', u'engine', u'laundry', u'astronaut',
+        u'eclipse', u'mars', u'rocket', u'liftoff', u'news', u'culture',
+        u'protocol', u'orbit', u'launch', u'module', u'crew', u'mission',
+        u'shuttle', u'telescope', u'planet']
+
+def get_sizes():
+    sizes = os.environ.get('MIRO_BENCHMARK_SIZES')
+    if not sizes:
+        return DEFAULT_SIZES
+    return [int(size) for size in sizes.split(',')]
+
+def entry_guid(item_number):
+    return u'urn:miro-benchmark:%s' % item_number
+
+def entry_url(item_number):
+    return u'http://example.com/benchmark/%s.mp4' % item_number
+
+def entry_title(rng):
+    return u' '.join(rng.choice(WORDS) for i in xrange(4))
+
+class LibraryBenchmark(EventLoopTest):
+    def setUp(self):
+        EventLoopTest.setUp(self)
+        self.test_handler = messagetest.TestFrontendMessageHandler()
+        messages.FrontendMessage.install_handler(self.test_handler)
+        self.start_http_server()
+        self.feed_dir = self.make_temp_dir_path()
+        self.httpserver.serve_directory(self.feed_dir)
+        self.results = {}
+
+    def tearDown(self):
+        self.stop_http_server()
+        EventLoopTest.tearDown(self)
+
+    @uses_httpclient
+    def test_library_sizes(self):
+        for size in get_sizes():
+            self.timings = self.results[str(size)] = {}
+            self.run_benchmarks(size)
+        self.write_results()
+
+    def write_results(self):
+        results = {
+            'format': RESULTS_FORMAT,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'platform': app.config.get(prefs.APP_PLATFORM),
+            'python': sys.version.split()[0],
+            'schema_version': schema.VERSION,
+            'results': self.results,
+        }
+        output_path = os.environ.get('MIRO_BENCHMARK_OUTPUT',
+                DEFAULT_OUTPUT)
+        f = open(output_path, 'w')
+        try:
+            json.dump(results, f, indent=2, sort_keys=True)
+        finally:
+            f.close()
+        print 'benchmark results written to %s' % output_path
+        baseline_path = os.environ.get('MIRO_BENCHMARK_BASELINE')
+        if baseline_path:
+            baseline = benchmarkcompare.load_results(baseline_path)
+            rows = benchmarkcompare.compare_results(baseline, results)
+            print benchmarkcompare.format_comparison(rows)
+
+    def time_call(self, name, func, *args):
+        start = clock()
+        rv = func(*args)
+        self.timings[name] = clock() - start
+        return rv
+
+    def run_benchmarks(self, size):
+        print 'benchmarking %d items' % size
+        self.benchmark_upgrade(size)
+        db_path = FilenameType(self.make_temp_path(extension=".db"))
+        if os.path.exists(db_path):
+            os.unlink(db_path)
+        self.reload_database(db_path)
+        self.setup_new_item_info_cache()
+        self.time_call('generate', self.generate_library, size)
+        app.item_info_cache.save()
+
+        self.time_call('open_database', self.reload_database, db_path)
+        self.time_call('restore_feeds', list, models.Feed.make_view())
+        self.time_call('restore_items', list, models.Item.make_view())
+        self.time_call('restore_downloaders', list,
+                models.RemoteDownloader.make_view())
+        self.benchmark_item_info_cache()
+        self.benchmark_trackers()
+        self.benchmark_search()
+        self.benchmark_feed_update()
+        self.benchmark_status_storm()
+        self.shutdown_database()
+
+    def make_upgrade_fixture(self, path, size):
+        """Make a version 80 database with about size items."""
+        shutil.copy(resources.path(UPGRADE_FIXTURE), path)
+        self.shutdown_database()
+        self.setup_new_database(path, UPGRADE_FIXTURE_VERSION, None)
+        app.db.upgrade_database()
+        cursor = app.db.cursor
+        offset = databaseupgrade.get_next_id(cursor)
+        cursor.execute("SELECT COUNT(*) FROM item")
+        copies = max(1, size // max(1, cursor.fetchone()[0]))
+        cursor.execute("BEGIN TRANSACTION")
+        for table, id_columns in UPGRADE_FIXTURE_TABLES.items():
+            cursor.execute("PRAGMA table_info('%s')" % table)
+            columns = [row[1] for row in cursor.fetchall()]
+            select_columns = []
+            for column in columns:
+                if column in id_columns:
+                    select_columns.append('%s + ?' % column)
+                else:
+                    select_columns.append(column)
+            sql = "INSERT INTO %s (%s) SELECT %s FROM %s WHERE id < ?" % (
+                    table, ', '.join(columns), ', '.join(select_columns),
+                    table)
+            for i in xrange(1, copies):
+                values = ((offset * i,) * len(id_columns)) + (offset,)
+                cursor.execute(sql, values)
+        cursor.execute("COMMIT TRANSACTION")
+        self.shutdown_database()
+
+    def timed_upgrade_func(self, version):
+        upgrade_func = databaseupgrade.get_upgrade_func(version)
+        def timed_upgrade(cursor):
+            start = clock()
+            upgrade_func(cursor)
+            self.timings['upgrade_%d' % version] = clock() - start
+        return timed_upgrade
+
+    def benchmark_upgrade(self, size):
+        db_path = FilenameType(self.make_temp_path(extension=".db"))
+        self.make_upgrade_fixture(db_path, size)
+        for version in xrange(UPGRADE_FIXTURE_VERSION + 1,
+                schema.VERSION + 1):
+            databaseupgrade._upgrade_overide[version] = \
+                    self.timed_upgrade_func(version)
+        try:
+            self.time_call('upgrade_database', self.reload_database,
+                    db_path)
+        finally:
+            databaseupgrade._upgrade_overide = {}
+        self.shutdown_database()
+        os.unlink(db_path)
+
+    def generate_library(self, size):
+        rng = random.Random(size)
+        # Feeds can't be created in bulk mode, since they set up their
+        # FeedImpl after they're inserted into the DB.
+        models.Feed(u'dtv:search')
+        self.feeds = [self.make_feed(feed_number)
+                for feed_number in xrange(max(1, size // ITEMS_PER_FEED))]
+        app.bulk_sql_manager.start()
+        try:
+            for item_number in xrange(size):
+                feed = self.feeds[item_number % len(self.feeds)]
+                entry = _build_entry(entry_url(item_number), u'video/mp4', {
+                    'title': entry_title(rng),
+                    'description': entry_title(rng),
+                })
+                entry['id'] = entry_guid(item_number)
+                item = models.Item(FeedParserValues(entry), feed_id=feed.id)
+                if item_number % ITEMS_PER_DOWNLOADER == 0:
+                    item.set_downloader(models.RemoteDownloader(
+                        entry_url(item_number), item, u'video/mp4'))
+        finally:
+            app.bulk_sql_manager.finish()
+
+    def make_feed(self, feed_number):
+        url = unicode(self.httpserver.build_url('feed%d.rss' % feed_number))
+        feed = models.Feed(url)
+        # Skip the initial download that Feed does to figure out what kind
+        # of feed it is.  We know it's RSS.
+        if feed.download is not None:
+            feed.download.cancel()
+            feed.download = None
+        feed.finish_generate_feed(models.RSSFeedImpl(url, feed))
+        feed.actualFeed.cancel_update_events()
+        return feed
+
+    def get_benchmark_feed(self):
+        return models.Feed.get_by_url(self.feeds[0].origURL)
+
+    def benchmark_item_info_cache(self):
+        self.time_call('item_info_cache_load',
+                self.setup_new_item_info_cache)
+        app.db.cursor.execute("DELETE FROM item_info_cache")
+        self.clear_ddb_object_cache()
+        self.time_call('item_info_cache_failsafe_load',
+                self.setup_new_item_info_cache)
+
+    def track_items(self, typ, id_):
+        messages.TrackItems(typ, id_).send_to_backend()
+        self.runUrgentCalls()
+
+    def benchmark_trackers(self):
+        self.backend_message_handler = messagehandler.BackendMessageHandler(
+            None)
+        messages.BackendMessage.install_handler(self.backend_message_handler)
+        feed = self.get_benchmark_feed()
+        self.time_call('track_all_feeds', self.track_items, 'feed',
+                u'feed-base-tab')
+        self.time_call('track_feed', self.track_items, 'feed', feed.id)
+        self.time_call('track_videos', self.track_items, 'videos', None)
+        self.time_call('track_downloading', self.track_items, 'downloading',
+                None)
+
+    def benchmark_search(self):
+        infos = app.item_info_cache.all_infos()
+        searcher = search.ItemSearcher()
+        start = clock()
+        for info in infos:
+            searcher.add_item(info)
+        self.timings['search_index_build'] = clock() - start
+
+        start = clock()
+        for term in SEARCH_TERMS:
+            searcher.search(term)
+        self.timings['search_index_query'] = ((clock() - start) /
+                len(SEARCH_TERMS))
+
+        start = clock()
+        for term in SEARCH_TERMS:
+            list(search.list_matches(infos, term))
+        self.timings['search_list_matches'] = ((clock() - start) /
+                len(SEARCH_TERMS))
+
+    def write_feed_xml(self, feed, path):
+        """Write an RSS file with all of a feed's items, plus some new
+        ones.
+        """
+        rng = random.Random(feed.id)
+        entries = []
+        for item in feed.items:
+            entries.append((item.get_rss_id(), item.get_url(),
+                item.get_title()))
+        for i in xrange(NEW_FEED_ENTRIES):
+            item_number = 'new-%d-%d' % (feed.id, i)
+            entries.append((entry_guid(item_number), entry_url(item_number),
+                entry_title(rng)))
+        f = open(path, 'w')
+        try:
+            f.write('<?xml version="1.0" encoding="utf-8"?>\n'
+                    '<rss version="2.0"><channel>'
+                    '<title>Benchmark Feed</title>'
+                    '<link>http://example.com/benchmark/</link>'
+                    '<description>Benchmark Feed</description>\n')
+            for guid, url, title in entries:
+                f.write('<item><title>%s</title><guid>%s</guid>'
+                        '<enclosure url="%s" type="video/mp4" '
+                        'length="1000"/></item>\n' % (
+                            escape(title).encode('utf-8'),
+                            escape(guid).encode('utf-8'),
+                            escape(url).encode('utf-8')))
+            f.write('</channel></rss>\n')
+        finally:
+            f.close()
+
+    def update_feed(self, feed):
+        def check_finished():
+            if feed.actualFeed.updating:
+                eventloop.add_timeout(0.01, check_finished,
+                        'check feed update')
+            else:
+                self.stopEventLoop(abnormal=False)
+        feed.actualFeed.update()
+        eventloop.add_timeout(0.01, check_finished, 'check feed update')
+        self.runEventLoop()
+
+    def benchmark_feed_update(self):
+        feed = self.get_benchmark_feed()
+        filename = feed.origURL.rsplit('/', 1)[1]
+        self.write_feed_xml(feed, os.path.join(self.feed_dir, filename))
+        # the first update adds NEW_FEED_ENTRIES items, the second one only
+        # has to match up entries with existing items.
+        self.time_call('feed_update', self.update_feed, feed)
+        self.time_call('feed_update_unchanged', self.update_feed, feed)
+
+    def make_status_rounds(self, downloaders):
+        rounds = []
+        for i in xrange(STATUS_STORM_ROUNDS):
+            status_list = []
+            for downloader in downloaders:
+                status_list.append({
+                    'dlid': downloader.dlid,
+                    'url': downloader.url,
+                    'state': u'downloading',
+                    'currentSize': 1000 * (i + 1),
+                    'totalSize': 1000 * (STATUS_STORM_ROUNDS + 1),
+                    'rate': 1000,
+                    'upRate': 0,
+                    'eta': STATUS_STORM_ROUNDS - i,
+                })
+            rounds.append(status_list)
+        return rounds
+
+    def benchmark_status_storm(self):
+        downloaders = list(models.RemoteDownloader.make_view())
+        start = clock()
+        for status_list in self.make_status_rounds(downloaders):
+            for data in status_list:
+                models.RemoteDownloader.update_status(data)
+        self.timings['status_storm'] = clock() - start
+
+        start = clock()
+        for status_list in self.make_status_rounds(downloaders):
+            models.RemoteDownloader.bulk_update_status(status_list)
+        self.timings['status_storm_bulk'] = clock() - start
@@ -146,6 +146,36 @@ class ViewTrackerTest(DatabaseTestCase):
         self.assertEquals(self.remove_callbacks, [self.i2])
         self.assertEquals(self.change_callbacks, [self.i1])
 
+    def test_changes_with_bulk(self):
+        self.setup_view(item.Item.make_view("feed.userTitle='booya'",
+                joins={'feed': 'feed.id=item.feed_id'}))
+        app.bulk_sql_manager.start()
+        self.i1.set_title(u"new title")
+        self.i1.set_title(u"newer title")
+        self.i2.set_title(u"another title")
+        self.i2.remove()
+        # view trackers shouldn't be checked until finish() is called
+        self.assertEquals(self.change_callbacks, [])
+        app.bulk_sql_manager.finish()
+        self.assertEquals(self.add_callbacks, [])
+        self.assertEquals(self.remove_callbacks, [self.i2])
+        self.assertEquals(self.change_callbacks, [self.i1])
+
+    def test_many_changes_with_bulk(self):
+        self.setup_view(item.Item.make_view("feed.userTitle='booya'",
+                joins={'feed': 'feed.id=item.feed_id'}))
+        new_items = [item.Item(item.FeedParserValues({'title': u'item'}),
+                               feed_id=self.feed.id) for i in xrange(150)]
+        self.add_callbacks = []
+        app.bulk_sql_manager.start()
+        for i in new_items:
+            i.set_title(u"new title")
+        self.i3.signal_change()
+        app.bulk_sql_manager.finish()
+        self.assertEquals(self.add_callbacks, [])
+        self.assertEquals(self.remove_callbacks, [])
+        self.assertSameSet(self.change_callbacks, new_items)
+
     def test_unlink(self):
         self.tracker.unlink()
         self.feed2.set_title(u"booya")
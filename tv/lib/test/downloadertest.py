@@ -5,7 +5,10 @@ from miro import downloader
 from miro import eventloop
 from miro import models
 from miro import prefs
-from miro.test.framework import EventLoopTest, uses_httpclient
+from miro.fileobject import FilenameType
+from miro.item import FeedParserValues
+from miro.singleclick import _build_entry
+from miro.test.framework import MiroTestCase, EventLoopTest, uses_httpclient
 
 class DownloaderTest(EventLoopTest):
     """Test feeds that download things.
@@ -75,3 +78,65 @@ class DownloaderTest(EventLoopTest):
     ## def test_resume_fail(self):
     ##     # FIXME - implement this
     ##     pass
+
+class StartupRestoreTest(MiroTestCase):
+    """Test that starting up doesn't restore downloaders it doesn't need.
+    """
+    def setUp(self):
+        MiroTestCase.setUp(self)
+        self.feed = models.Feed(u'http://example.com/feed',
+                initiallyAutoDownloadable=False)
+        self.ids = {}
+        self.filenames = {}
+        for i, state in enumerate((u'downloading', u'uploading', u'finished',
+                u'failed')):
+            url = u'http://example.com/feed/%d.mp4' % i
+            item = models.Item(FeedParserValues(_build_entry(url,
+                'video/mp4')), feed_id=self.feed.id)
+            dler = models.RemoteDownloader(url, item)
+            item.set_downloader(dler)
+            dler.status['state'] = state
+            dler.status['filename'] = FilenameType('/videos/%d.mp4' % i)
+            dler.signal_change()
+            self.ids[state] = dler.id
+            self.filenames[state] = dler.status['filename']
+        self.clear_ddb_object_cache()
+
+    def check_not_loaded(self, *states):
+        for state in states:
+            self.assert_(not app.db.id_alive(self.ids[state]))
+
+    def test_startup_ids(self):
+        starter = downloader.DownloadDaemonStarter()
+        self.assertSameSet(starter.downloads_at_startup,
+                [self.ids[u'downloading'], self.ids[u'uploading']])
+        self.check_not_loaded(u'downloading', u'uploading', u'finished',
+                u'failed')
+
+    def test_restart_downloads(self):
+        restarted = []
+        def restart_on_startup_if_needed(dler):
+            restarted.append(dler.id)
+        klass = models.RemoteDownloader
+        old_restart = klass.restart_on_startup_if_needed
+        klass.restart_on_startup_if_needed = restart_on_startup_if_needed
+        try:
+            starter = downloader.DownloadDaemonStarter()
+            starter.restart_downloads()
+        finally:
+            klass.restart_on_startup_if_needed = old_restart
+        self.assertSameSet(restarted,
+                [self.ids[u'downloading'], self.ids[u'uploading']])
+        self.check_not_loaded(u'finished', u'failed')
+
+    def test_downloader_filenames(self):
+        states = (u'finished', u'uploading')
+        self.assertSameSet(downloader.iter_downloader_filenames(states),
+                [self.filenames[u'finished'], self.filenames[u'uploading']])
+        self.check_not_loaded(*states)
+        # loaded downloaders should be checked in memory
+        dler = models.RemoteDownloader.get_by_id(self.ids[u'finished'])
+        dler.status['filename'] = FilenameType('/videos/moved.mp4')
+        self.assertSameSet(downloader.iter_downloader_filenames(states),
+                [FilenameType('/videos/moved.mp4'),
+                    self.filenames[u'uploading']])
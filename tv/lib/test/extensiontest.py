@@ -3,6 +3,9 @@ import logging
 
 from miro import api
 from miro import app
+from miro import extensionmanager
+from miro import prefs
+from miro import workerprocess
 
 from miro.test.framework import MiroTestCase
 from miro.test import mock
@@ -102,7 +105,7 @@ class ExtensionStorageTest(ExtensionTestBase):
         cursor.execute("SELECT a, b FROM foo ORDER BY a ASC")
         self.assertEquals(cursor.fetchall(), [(1, 'two'), (3, 'four')])
 
-class ExtensionHookTest(ExtensionTestBase):
+class ExtensionHookTestBase(ExtensionTestBase):
     def setUp(self):
         ExtensionTestBase.setUp(self)
         # Make a Mock object to use as a hook function.  Nest inside another
@@ -122,6 +125,7 @@ class ExtensionHookTest(ExtensionTestBase):
                 'miro.test.extensiontest:hook_holder.hook_func')
         return config
 
+class ExtensionHookTest(ExtensionHookTestBase):
     def test_hook_invoke(self):
         # test calling hook functions
         self.load_extension()
@@ -167,3 +171,191 @@ class ExtensionHookTest(ExtensionTestBase):
         results = api.hook_invoke('test_hook')
         self.assertEquals(self.mock_hook.call_count, 0)
         self.assertEquals(results, [])
+
+class FakeClock(object):
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+class ExtensionHookDispatchTest(ExtensionHookTestBase):
+    def setUp(self):
+        ExtensionHookTestBase.setUp(self)
+        self.clock = FakeClock()
+        self.old_clock = extensionmanager.clock
+        extensionmanager.clock = self.clock
+        workerprocess.clock = self.clock
+        self.old_run_hook = workerprocess.run_hook
+        workerprocess.run_hook = self.fake_run_hook
+        self.sandboxed_calls = []
+        self.queue_wait = 0.0
+        app.config.set(prefs.EXTENSION_HOOK_MAX_STRIKES, 3)
+        app.extension_manager.set_hook_budget('test_hook', 1.0)
+        self.load_extension()
+        self.ext = app.extension_manager.get_extension_by_name(
+                "Unittest Extension")
+
+    def tearDown(self):
+        extensionmanager.clock = self.old_clock
+        workerprocess.clock = self.old_clock
+        workerprocess.run_hook = self.old_run_hook
+        ExtensionHookTestBase.tearDown(self)
+
+    def fake_run_hook(self, ext_dir, hook_string, args, kwargs, callback,
+            errback):
+        self.sandboxed_calls.append((hook_string, args, kwargs))
+        # time spent waiting for the worker process
+        self.clock.time += self.queue_wait
+        # run the task like the worker process would
+        msg = workerprocess.HookTask(ext_dir, hook_string, args, kwargs)
+        handler = workerprocess.WorkerProcessHandler()
+        try:
+            retval = handler.handle_hook_task(msg)
+        except StandardError, e:
+            errback(e)
+        else:
+            callback(retval)
+
+    def make_hook_take(self, seconds, return_value=None):
+        def hook_func(*args, **kwargs):
+            self.clock.time += seconds
+            return return_value
+        self.mock_hook.side_effect = hook_func
+
+    def test_stats(self):
+        self.make_hook_take(0.5, 123)
+        api.hook_invoke('test_hook')
+        self.make_hook_take(0.25, 123)
+        api.hook_invoke('test_hook')
+        stats = api.hook_stats()
+        self.assertEquals(len(stats), 1)
+        self.assertEquals(stats[0]['hook'], 'test_hook')
+        self.assertEquals(stats[0]['extension'], 'Unittest Extension')
+        self.assertEquals(stats[0]['calls'], 2)
+        self.assertEquals(stats[0]['errors'], 0)
+        self.assertEquals(stats[0]['over_budget'], 0)
+        self.assertEquals(stats[0]['total_time'], 0.75)
+        self.assertEquals(stats[0]['average_time'], 0.375)
+        self.assertEquals(stats[0]['max_time'], 0.5)
+
+    def test_default_budget(self):
+        app.extension_manager.set_hook_budget('test_hook', None)
+        self.assertEquals(
+                app.extension_manager.get_hook_budget('test_hook'),
+                app.config.get(prefs.EXTENSION_HOOK_TIME_BUDGET))
+        self.assert_(
+                app.extension_manager.get_hook_budget('item_list_filters') <
+                app.config.get(prefs.EXTENSION_HOOK_TIME_BUDGET))
+
+    def test_slow_hook_disabled(self):
+        self.make_hook_take(2.0, 123)
+        for i in range(2):
+            self.assertEquals(api.hook_invoke('test_hook'), [123])
+        # a fast call should reset the strike count
+        self.make_hook_take(0.5, 123)
+        api.hook_invoke('test_hook')
+        self.make_hook_take(2.0, 123)
+        for i in range(3):
+            self.assertEquals(api.hook_invoke('test_hook'), [123])
+        # 3 slow calls in a row should disable the extension
+        self.assertEquals(self.ext.loaded, False)
+        self.assertEquals(api.hook_invoke('test_hook'), [])
+        self.assertEquals(self.mock_hook.call_count, 6)
+        self.assertEquals(api.hook_stats()[0]['over_budget'], 5)
+
+    def test_failing_hook_disabled(self):
+        self.mock_hook.side_effect = ValueError("Bad Value")
+        for i in range(3):
+            self.assertEquals(api.hook_invoke('test_hook'), [])
+        self.assertEquals(self.ext.loaded, False)
+        self.assertEquals(api.hook_stats()[0]['errors'], 3)
+        api.hook_invoke('test_hook')
+        self.assertEquals(self.mock_hook.call_count, 3)
+
+    def test_disabled_for_session_only(self):
+        app.extension_manager.enable_extension(self.ext)
+        self.mock_hook.side_effect = ValueError("Bad Value")
+        for i in range(3):
+            api.hook_invoke('test_hook')
+        self.assertEquals(self.ext.loaded, False)
+        self.assert_(self.ext.name not in
+                app.config.get(prefs.DISABLED_EXTENSIONS))
+        self.assert_(self.ext.name in
+                app.config.get(prefs.ENABLED_EXTENSIONS))
+        # after a restart, the extension should be loaded again
+        app.extension_manager = extensionmanager.ExtensionManager(
+                [self.tempdir], [])
+        app.extension_manager.load_extensions()
+        ext = app.extension_manager.get_extension_by_name(
+                "Unittest Extension")
+        self.assertEquals(ext.loaded, True)
+        self.mock_hook.side_effect = None
+        self.mock_hook.return_value = 123
+        self.assertEquals(api.hook_invoke('test_hook'), [123])
+
+    def test_invoke_async(self):
+        self.mock_hook.return_value = 123
+        results = []
+        api.hook_invoke_async('test_hook', results.append, 1, foo=2)
+        self.assertEquals(results, [[123]])
+        self.assertEquals(self.mock_hook.call_args, ((1,), {'foo': 2}))
+        # the hook isn't sandboxed, so we shouldn't use the worker process
+        self.assertEquals(self.sandboxed_calls, [])
+
+    def test_sandboxed(self):
+        self.ext.sandboxed_hooks.add('test_hook')
+        self.mock_hook.return_value = 123
+        results = []
+        api.hook_invoke_async('test_hook', results.append, 1, foo=2)
+        self.assertEquals(self.sandboxed_calls, [
+            ('miro.test.extensiontest:hook_holder.hook_func', (1,),
+                {'foo': 2})])
+        self.assertEquals(results, [[123]])
+        self.assertEquals(api.hook_stats()[0]['calls'], 1)
+
+    def test_sandboxed_queue_wait(self):
+        # time waiting in the worker's queue shouldn't count for the hook
+        self.ext.sandboxed_hooks.add('test_hook')
+        self.queue_wait = 5.0
+        self.make_hook_take(0.5, 123)
+        for i in range(3):
+            api.hook_invoke_async('test_hook', lambda results: None)
+        self.assertEquals(self.ext.loaded, True)
+        stats = api.hook_stats()[0]
+        self.assertEquals(stats['over_budget'], 0)
+        self.assertEquals(stats['total_time'], 1.5)
+
+    def test_sandboxed_error_time(self):
+        self.ext.sandboxed_hooks.add('test_hook')
+        self.queue_wait = 5.0
+        def hook_func(*args, **kwargs):
+            self.clock.time += 0.25
+            raise ValueError("Bad Value")
+        self.mock_hook.side_effect = hook_func
+        api.hook_invoke_async('test_hook', lambda results: None)
+        self.assertEquals(api.hook_stats()[0]['total_time'], 0.25)
+
+    def test_sandboxed_error(self):
+        self.ext.sandboxed_hooks.add('test_hook')
+        self.mock_hook.side_effect = ValueError("Bad Value")
+        self.log_filter.reset_records()
+        results = []
+        api.hook_invoke_async('test_hook', results.append)
+        self.assertEquals(results, [[]])
+        self.log_filter.check_record_count(1)
+        self.log_filter.check_record_level(logging.ERROR)
+        self.assertEquals(api.hook_stats()[0]['errors'], 1)
+
+class ExtensionConfigTest(ExtensionTestBase):
+    def make_extension_config(self):
+        config = ExtensionTestBase.make_extension_config(self)
+        config.set('extension', 'sandboxed_hooks', 'hook1, hook2')
+        return config
+
+    def test_sandboxed_hooks(self):
+        self.create_extension()
+        ext = app.extension_manager.get_extension_by_name(
+                "Unittest Extension")
+        self.assertEquals(ext.sandboxed_hooks, set(['hook1', 'hook2']))
+        self.assertEquals(ext.ext_dir, self.tempdir)
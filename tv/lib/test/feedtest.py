@@ -1,13 +1,17 @@
 import os
 import unittest
+from datetime import datetime, timedelta
 from time import sleep
 
 from miro import app
 from miro import prefs
 from miro import dialogs
+from miro import feed
 from miro import feedparserutil
-from miro.item import Item
+from miro import models
+from miro.item import Item, FeedParserValues
 from miro.feed import validate_feed_url, normalize_feed_url, Feed
+from miro.singleclick import _build_entry
 
 from miro.test.framework import MiroTestCase, EventLoopTest
 
@@ -203,6 +207,28 @@ Instead, astronauts have other options.</description>
         self.assertEqual(len(items), 1)
         my_feed.remove()
 
+    def test_update_tracking(self):
+        my_feed = self.make_feed()
+        feed_impl = my_feed.actualFeed
+        self.assertEquals(feed_impl.unchanged_updates, 0)
+        # the median time between the entries in our feed
+        self.assertEquals(feed_impl.publish_interval, 340359)
+        self.assert_(feed_impl.next_update > datetime.now())
+        # updating again doesn't find anything new
+        self.update_feed(my_feed)
+        self.assertEquals(feed_impl.unchanged_updates, 1)
+
+    def test_restore_uses_next_update(self):
+        my_feed = self.make_feed()
+        feed_impl = my_feed.actualFeed
+        feed_impl.next_update = datetime.now() + timedelta(seconds=600)
+        feed_impl.signal_change()
+        my_feed = self.reload_object(my_feed)
+        my_feed.update_after_restore()
+        # the feed shouldn't be updated right away
+        self.assert_(my_feed.actualFeed.next_update > datetime.now() +
+                timedelta(seconds=500))
+
 class MultiFeedExpireTest(FeedTestCase):
     def write_files(self, subfeed_count, feed_item_count):
         all_urls = []
@@ -529,6 +555,172 @@ by-nd/1.0</creativeCommons:license>
         self.save_then_restore_db()
         self.assertEquals(self.item.get_title(), "new title")
 
+class FeedCountTest(MiroTestCase):
+    def setUp(self):
+        MiroTestCase.setUp(self)
+        self.feed = Feed(u'http://example.com/feed',
+                initiallyAutoDownloadable=False)
+        self.items = [self.make_item(i) for i in range(4)]
+        # make the feed calculate its counts, after that they should be
+        # updated without running queries.
+        self.feed.num_downloaded()
+        self.feed.num_downloading()
+        self.feed.num_unwatched()
+        self.feed.num_available()
+
+    def make_item(self, number):
+        url = u'http://example.com/feed/%d.mp4' % number
+        item = Item(FeedParserValues(_build_entry(url, 'video/mp4')),
+                feed_id=self.feed.id)
+        item.file_type = u'video'
+        item.signal_change()
+        return item
+
+    def unexpected_query(self, attr):
+        raise AssertionError("%s calculated using SQL" % attr)
+
+    def check_counts(self, expect_queries=False):
+        if not expect_queries:
+            self.feed._query_count = self.unexpected_query
+        try:
+            counts = [self.feed.num_downloaded(), self.feed.num_downloading(),
+                    self.feed.num_unwatched(), self.feed.num_available()]
+        finally:
+            if not expect_queries:
+                del self.feed._query_count
+        self.assertEquals(counts, [Feed._query_count(self.feed, attr)
+            for attr in Feed.COUNT_ATTRS])
+        return counts
+
+    def start_download(self, item):
+        downloader = models.RemoteDownloader(item.get_url(), item)
+        item.set_downloader(downloader)
+        return downloader
+
+    def set_downloader_state(self, downloader, state):
+        downloader.status['state'] = state
+        downloader.signal_change()
+
+    def test_new_items(self):
+        self.assertEquals(self.check_counts(), [0, 0, 0, 4])
+        self.make_item(4)
+        self.assertEquals(self.check_counts(), [0, 0, 0, 5])
+
+    def test_download(self):
+        downloader = self.start_download(self.items[0])
+        self.set_downloader_state(downloader, u'downloading')
+        self.assertEquals(self.check_counts()[:3], [0, 1, 0])
+        self.set_downloader_state(downloader, u'finished')
+        self.assertEquals(self.check_counts()[:3], [1, 0, 1])
+        self.items[0].mark_item_seen()
+        self.assertEquals(self.check_counts()[:3], [1, 0, 0])
+        self.items[0].mark_item_unseen()
+        self.assertEquals(self.check_counts()[:3], [1, 0, 1])
+
+    def test_remove(self):
+        downloader = self.start_download(self.items[0])
+        self.set_downloader_state(downloader, u'finished')
+        self.items[0].remove()
+        self.items[1].remove()
+        self.assertEquals(self.check_counts(), [0, 0, 0, 2])
+
+    def test_restored_items(self):
+        downloader = self.start_download(self.items[0])
+        self.set_downloader_state(downloader, u'downloading')
+        self.feed = self.reload_object(self.feed)
+        self.check_counts(expect_queries=True)
+        downloader = self.reload_object(downloader)
+        item = self.reload_object(self.items[0])
+        self.set_downloader_state(downloader, u'finished')
+        item.signal_change()
+        self.assertEquals(self.check_counts()[:3], [1, 0, 1])
+
+    def test_unloaded_downloader(self):
+        downloaders = [self.start_download(item) for item in self.items[:2]]
+        for downloader in downloaders:
+            self.set_downloader_state(downloader, u'finished')
+        self.assertEquals(self.check_counts()[:3], [2, 0, 2])
+        # split_item() has already run for downloaded items, otherwise it
+        # would load the downloader.
+        for item in self.items[:2]:
+            item.isContainerItem = False
+            item.signal_change()
+        # restore the items without their downloaders, like we do after
+        # startup
+        for downloader in downloaders:
+            del app.db._object_map[downloader.id]
+            app.db._ids_loaded.remove(downloader.id)
+        selects = []
+        old_select = app.db.select
+        def counting_select(klass, *args, **kwargs):
+            if klass is models.RemoteDownloader:
+                selects.append(args)
+            return old_select(klass, *args, **kwargs)
+        app.db.select = counting_select
+        try:
+            items = [self.reload_object(item) for item in self.items[:2]]
+            for downloader in downloaders:
+                self.assert_(not app.db.id_alive(downloader.id))
+            for item in items:
+                item.signal_change()
+        finally:
+            app.db.select = old_select
+        # we should read the downloader states in a single query
+        self.assertEquals(len(selects), 1)
+        for item in items:
+            self.assertEquals(item._count_key[1:3], (True, False))
+        # the feed shouldn't need to recalculate its counts
+        self.feed.invalidate_counts = lambda: self.fail("counts invalidated")
+        items[0].mark_item_seen()
+        del self.feed.invalidate_counts
+        self.assertEquals(self.check_counts()[:3], [2, 0, 1])
+
+    def test_feed_changes(self):
+        # changing the feed can change which items are available, which
+        # means we need to query the database again
+        self.feed.set_auto_download_mode(u'all')
+        self.check_counts(expect_queries=True)
+        self.items[0].cancel_auto_download()
+        self.check_counts()
+        self.feed.set_auto_download_mode(u'off')
+        self.feed.mark_as_viewed()
+        self.assertEquals(self.check_counts(expect_queries=True)[3], 0)
+        self.make_item(4)
+        self.check_counts()
+
+    def test_folder(self):
+        folder = models.ChannelFolder(u'folder')
+        other_feed = Feed(u'http://example.com/feed2')
+        self.feed.set_folder(folder)
+        other_feed.set_folder(folder)
+        self.assertEquals(folder.num_downloaded(), 0)
+        self.assertEquals(folder.num_unwatched(), 0)
+        self.assertEquals(folder.num_available(), 4)
+        downloader = self.start_download(self.items[0])
+        self.set_downloader_state(downloader, u'finished')
+        self.make_item(4)
+        # the folder should be updated without looking at its children
+        folder.get_children_view = lambda: self.fail("children queried")
+        self.assertEquals(folder.num_downloaded(), 1)
+        self.assertEquals(folder.num_unwatched(), 1)
+        self.assertEquals(folder.num_available(), 5)
+        self.assert_(folder.has_downloaded_items())
+        del folder.get_children_view
+        other_feed.set_folder(None)
+        self.feed.set_folder(None)
+        self.assertEquals(folder.num_available(), 0)
+
+    def test_reconcile(self):
+        self.assertEquals(self.feed.reconcile_counts(), False)
+        self.feed._num_unwatched = 10
+        self.assertEquals(self.feed.reconcile_counts(), True)
+        self.check_counts()
+
+    def test_reconcile_all_feeds(self):
+        self.feed._num_available = 10
+        feed.reconcile_counts()
+        self.check_counts()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+
+from miro import feedupdate
+from miro import signals
+from miro.test.framework import MiroTestCase
+
+class FakeFeed(signals.SignalEmitter):
+    def __init__(self, id_, url):
+        signals.SignalEmitter.__init__(self, 'update-finished', 'removed')
+        self.id = id_
+        self.url = url
+
+    def get_url(self):
+        return self.url
+
+    def get_title(self):
+        return self.url
+
+class UpdateDelayTest(MiroTestCase):
+    def test_publish_interval(self):
+        start = datetime(2011, 1, 1)
+        dates = [start + timedelta(hours=i * 6) for i in range(5)]
+        self.assertEquals(feedupdate.estimate_publish_interval(dates),
+                6 * 60 * 60)
+
+    def test_publish_interval_median(self):
+        # one big gap shouldn't throw off our estimate
+        start = datetime(2011, 1, 1)
+        dates = [start, start + timedelta(hours=1),
+                start + timedelta(hours=2), start + timedelta(days=30)]
+        self.assertEquals(feedupdate.estimate_publish_interval(dates),
+                60 * 60)
+
+    def test_publish_interval_not_enough_dates(self):
+        self.assertEquals(feedupdate.estimate_publish_interval([]), None)
+        self.assertEquals(feedupdate.estimate_publish_interval(
+            [datetime(2011, 1, 1)] * 3), None)
+
+    def test_update_delay(self):
+        self.assertEquals(feedupdate.calc_update_delay(1800, None, 0), 1800)
+        # feeds that publish every 6 hours get checked every 3 hours
+        self.assertEquals(feedupdate.calc_update_delay(1800, 6 * 3600, 0),
+                3 * 3600)
+        # we never check more often than the update frequency
+        self.assertEquals(feedupdate.calc_update_delay(1800, 60, 0), 1800)
+
+    def test_backoff(self):
+        delays = [feedupdate.calc_update_delay(1800, None, i)
+                for i in range(feedupdate.MAX_BACKOFF_STEPS + 2)]
+        self.assertEquals(delays[1], 1800 * feedupdate.BACKOFF_FACTOR)
+        self.assertEquals(delays[-1], delays[-2])
+        self.assertEquals(delays, sorted(delays))
+
+    def test_max_delay(self):
+        self.assertEquals(feedupdate.calc_update_delay(1800, 1e9, 10),
+                feedupdate.MAX_UPDATE_DELAY)
+        # if the feed wants a longer update frequency, we use it
+        self.assertEquals(feedupdate.calc_update_delay(1e6, None, 0), 1e6)
+
+class FeedUpdateQueueTest(MiroTestCase):
+    def setUp(self):
+        MiroTestCase.setUp(self)
+        self.queue = feedupdate.FeedUpdateQueue()
+        self.updated = []
+        self.feed_count = 0
+
+    def make_feed(self, url):
+        self.feed_count += 1
+        return FakeFeed(self.feed_count, url)
+
+    def add_to_queue(self, feed):
+        self.queue.update_queue.append((feed,
+            lambda: self.updated.append(feed)))
+
+    def test_max_updates(self):
+        feeds = [self.make_feed(u'http://example%d.com/' % i)
+                for i in range(feedupdate.MAX_UPDATES + 1)]
+        for feed in feeds:
+            self.add_to_queue(feed)
+        self.queue.run_update_queue()
+        self.assertEquals(self.updated, feeds[:-1])
+        self.queue.update_finished(feeds[0])
+        self.queue.run_update_queue()
+        self.assertEquals(self.updated, feeds)
+
+    def test_host_limit(self):
+        f1 = self.make_feed(u'http://example.com/1')
+        f2 = self.make_feed(u'http://EXAMPLE.com/2')
+        f3 = self.make_feed(u'http://example.org/3')
+        for feed in (f1, f2, f3):
+            self.add_to_queue(feed)
+        self.queue.run_update_queue()
+        # f2 has to wait for f1, but f3 is on a different host
+        self.assertEquals(self.updated, [f1, f3])
+        self.assertEquals(list(self.queue.update_queue),
+                [(f2, self.queue.update_queue[0][1])])
+
+    def test_host_spacing(self):
+        f1 = self.make_feed(u'http://example.com/1')
+        f2 = self.make_feed(u'http://example.com/2')
+        self.add_to_queue(f1)
+        self.add_to_queue(f2)
+        self.queue.run_update_queue()
+        self.queue.update_finished(f1)
+        self.queue.run_update_queue()
+        # f1 just started, so we need to wait a bit before starting f2
+        self.assertEquals(self.updated, [f1])
+        self.assert_(self.queue.retry_timeout is not None)
+        self.queue.host_last_update[u'example.com'] -= (
+                feedupdate.HOST_UPDATE_SPACING)
+        self.queue.run_update_queue()
+        self.assertEquals(self.updated, [f1, f2])
+
+    def test_non_network_feeds(self):
+        # feeds without a host shouldn't be limited
+        f1 = self.make_feed(u'dtv:manualFeed')
+        f2 = self.make_feed(u'file:///tmp/feed.rss')
+        f3 = self.make_feed(u'file:///tmp/feed2.rss')
+        for feed in (f1, f2, f3):
+            self.add_to_queue(feed)
+        self.queue.run_update_queue()
+        self.assertEquals(self.updated, [f1, f2, f3])
@@ -272,8 +272,10 @@ class MiroTestCase(unittest.TestCase):
         self.metadata_progress_updater = FakeMetadataProgressUpdater()
         app.metadata_progress_updater = self.metadata_progress_updater
         moviedata.movie_data_updater = moviedata.MovieDataUpdater()
-        # Skip worker proccess for feedparser
+        # Skip worker proccess for feedparser and mutagen
         feed._RUN_FEED_PARSER_INLINE = True
+        item._READ_METADATA_INLINE = True
+        item._tag_reader = item.TagReader()
         # reload config and initialize it to temprary
         config.load_temporary()
         self.platform = app.config.get(prefs.APP_PLATFORM)
@@ -12,6 +12,7 @@ from miro import eventloop
 from miro import httpauth
 from miro import httpclient
 from miro import signals
+from miro import util
 from miro.plat import resources
 from miro.test import mock
 from miro.test.framework import EventLoopTest, uses_httpclient
@@ -79,6 +80,20 @@ class HTTPClientTestBase(EventLoopTest):
         fp.write(self.test_response_data[:bytes])
         fp.close()
 
+class FakeParser(object):
+    def __init__(self):
+        self.fed = []
+        self.closed = False
+        self.fail_on_close = False
+
+    def feed(self, data):
+        self.fed.append(data)
+
+    def close(self):
+        if self.fail_on_close:
+            raise ValueError("bad data")
+        self.closed = True
+
 class HTTPClientTest(HTTPClientTestBase):
     @uses_httpclient
     def test_simple_get(self):
@@ -106,6 +121,51 @@ class HTTPClientTest(HTTPClientTestBase):
         self.grab_url(self.httpserver.build_url('test.txt.gz'))
         self.assertEquals(self.grab_url_info['body'], self.test_response_data)
 
+    @uses_httpclient
+    def test_gzip_not_encoded(self):
+        # if the server lies about the encoding, we should just use the
+        # content as-is
+        self.httpserver.add_header("content-encoding", "gzip")
+        self.grab_url(self.httpserver.build_url('test.txt'))
+        self.assertEquals(self.grab_url_info['body'], self.test_response_data)
+
+    @uses_httpclient
+    def test_parser_sink(self):
+        parser = FakeParser()
+        self.httpserver.add_header("content-encoding", "gzip")
+        self.grab_url(self.httpserver.build_url('test.txt.gz'),
+                sink=httpclient.ParserSink(parser))
+        self.assert_('body' not in self.grab_url_info)
+        self.assertEquals(''.join(parser.fed), self.test_response_data)
+        self.assert_(parser.closed)
+
+    @uses_httpclient
+    def test_file_sink(self):
+        filename = self.make_temp_path(".txt")
+        self.grab_url(self.httpserver.build_url('test.txt'),
+                sink=httpclient.FileSink(open(filename, 'wb')))
+        self.assert_('body' not in self.grab_url_info)
+        self.assertEquals(open(filename).read(), self.test_response_data)
+
+    @uses_httpclient
+    def test_file_url_sink(self):
+        parser = FakeParser()
+        path = resources.path("testdata/httpserver/test.txt")
+        self.grab_url("file://" + path, sink=httpclient.ParserSink(parser))
+        self.assert_('body' not in self.grab_url_info)
+        self.assertEquals(''.join(parser.fed), self.test_response_data)
+        self.assert_(parser.closed)
+
+    @uses_httpclient
+    def test_parser_sink_error(self):
+        parser = FakeParser()
+        parser.fail_on_close = True
+        self.error_signal_okay = True
+        self.expecting_errback = True
+        self.grab_url(self.httpserver.build_url('test.txt'),
+                sink=httpclient.ParserSink(parser))
+        self.check_errback_called()
+
     @uses_httpclient
     def test_unicode_url(self):
         self.grab_url(unicode(self.httpserver.build_url('test.txt')))
@@ -382,6 +442,60 @@ class HTTPClientTest(HTTPClientTestBase):
         self.assertEquals(self.check_content_data, 'Miro ')
         self.assert_(self.saw_error)
 
+    @uses_httpclient
+    def test_content_checker_window(self):
+        self.check_content_data = []
+        def check_content(data):
+            self.check_content_data.append(data)
+            return True
+        self.grab_url(self.httpserver.build_url('test.txt'),
+                content_check_callback=check_content,
+                content_check_window=10)
+        # the checker should only see the start of the content, but we
+        # should still get all of it
+        self.assertEquals(self.check_content_data[-1],
+                self.test_response_data[:10])
+        self.assertEquals(self.grab_url_info['body'], self.test_response_data)
+
+    @uses_httpclient
+    def test_content_checker_oversized_torrent(self):
+        # BTDownloader.check_description() cancels .torrent downloads that
+        # are bigger than MAX_TORRENT_SIZE.  Make sure that a window big
+        # enough for that lets it see the extra data.
+        root = self.make_temp_dir_path()
+        f = open(os.path.join(root, 'big.torrent'), 'wb')
+        f.write('d' + 'x' * (util.MAX_TORRENT_SIZE + 100 * 1024))
+        f.close()
+        self.httpserver.serve_directory(root)
+        self.check_content_sizes = []
+        def check_content(data):
+            self.check_content_sizes.append(len(data))
+            if len(data) > util.MAX_TORRENT_SIZE or data[0] != 'd':
+                eventloop.add_timeout(0.2, self.stopEventLoop,
+                        'stop download', args=(False,))
+                return False
+            return True
+        self.grab_url(self.httpserver.build_url('big.torrent'),
+                content_check_callback=check_content,
+                content_check_window=util.MAX_TORRENT_SIZE + 1)
+        self.assertEquals(self.grab_url_info, None)
+        self.assertEquals(self.grab_url_error, None)
+        self.assertEquals(self.check_content_sizes[-1],
+                util.MAX_TORRENT_SIZE + 1)
+
+    @uses_httpclient
+    def test_content_checker_gzip(self):
+        # content checkers should see the decoded data
+        self.check_content_data = None
+        def check_content(data):
+            self.check_content_data = data
+            return True
+        self.httpserver.add_header("content-encoding", "gzip")
+        self.grab_url(self.httpserver.build_url('test.txt.gz'),
+                content_check_callback=check_content)
+        self.assertEquals(self.check_content_data, self.test_response_data)
+        self.assertEquals(self.grab_url_info['body'], self.test_response_data)
+
     @uses_httpclient
     def test_write_file(self):
         filename = self.make_temp_path(".txt")
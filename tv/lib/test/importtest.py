@@ -3,6 +3,8 @@ import urllib
 from miro.test.framework import MiroTestCase
 from miro.plat.utils import filename_to_unicode
 
+from miro import importmedia
+from miro import models
 from miro.importmedia import import_itunes_path
 
 # Provide a file template which we can use to replace with different paths
@@ -424,3 +426,233 @@ class TestImportITunes(MiroTestCase):
         self.assertEquals(path, filename_to_unicode(
                 urllib.url2pathname(path3)))
 
+
+library_template = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE plist PUBLIC "-//Apple Computer//DTD PLIST 1.0//EN" \
+"http://www.apple.com/DTDs/PropertyList-1.0.dtd">
+<plist version="1.0">
+<dict>
+	<key>Major Version</key><integer>1</integer>
+	<key>Music Folder</key><string>file://localhost/Music/</string>
+	<key>Tracks</key>
+	<dict>
+%(tracks)s
+	</dict>
+	<key>Playlists</key>
+	<array>
+		<dict>
+			<key>Name</key><string>Library</string>
+			<key>Master</key><true/>
+			<key>Playlist Items</key>
+			<array>
+%(all_items)s
+			</array>
+		</dict>
+%(playlists)s
+	</array>
+</dict>
+</plist>
+"""
+
+track_template = """		<key>%(track_id)d</key>
+		<dict>
+			<key>Track ID</key><integer>%(track_id)d</integer>
+			<key>Name</key><string>%(name)s</string>
+			<key>Date Modified</key><date>%(date_modified)s</date>
+			<key>Play Count</key><integer>%(play_count)d</integer>
+			<key>Persistent ID</key><string>%(persistent_id)s</string>
+			<key>Track Type</key><string>File</string>
+			<key>Location</key><string>%(location)s</string>
+		</dict>
+"""
+
+playlist_template = """		<dict>
+			<key>Name</key><string>%(name)s</string>
+			<key>Playlist Items</key>
+			<array>
+%(items)s
+			</array>
+		</dict>
+"""
+
+playlist_item_template = """				<dict>
+					<key>Track ID</key><integer>%d</integer>
+				</dict>
+"""
+
+class TestITunesImporter(MiroTestCase):
+    def setUp(self):
+        MiroTestCase.setUp(self)
+        self.library_dir = os.path.join(self.tempdir, 'itunes')
+        os.mkdir(self.library_dir)
+        models.Feed(u'dtv:manualFeed')
+        # maps persistent id -> track values
+        self.tracks = {}
+        self.playlists = {}
+        self.next_track_id = 100
+
+    def add_track(self, persistent_id, play_count=0,
+            date_modified='2011-01-01T00:00:00Z'):
+        path = os.path.join(self.tempdir, '%s.mp3' % persistent_id)
+        open(path, 'wb').write('data')
+        self.next_track_id += 1
+        self.tracks[persistent_id] = {
+            'track_id': self.next_track_id,
+            'name': 'Song %s' % persistent_id,
+            'date_modified': date_modified,
+            'play_count': play_count,
+            'persistent_id': persistent_id,
+            'location': 'file://localhost' + urllib.pathname2url(path),
+        }
+        return path
+
+    def write_library(self):
+        tracks = [track_template % values for values in
+                  self.tracks.values()]
+        all_items = [playlist_item_template % values['track_id']
+                     for values in self.tracks.values()]
+        playlists = []
+        for name, persistent_ids in self.playlists.items():
+            items = [playlist_item_template % self.tracks[p]['track_id']
+                     for p in persistent_ids]
+            playlists.append(playlist_template % {'name': name,
+                'items': ''.join(items)})
+        f = open(os.path.join(self.library_dir,
+            importmedia.ITUNES_XML_FILE), 'w')
+        f.write(library_template % {
+            'tracks': ''.join(tracks),
+            'all_items': ''.join(all_items),
+            'playlists': ''.join(playlists)})
+        f.close()
+
+    def run_import(self):
+        self.write_library()
+        importer = importmedia.ITunesImporter(self.library_dir)
+        for dummy in importer.run():
+            pass
+        return importer
+
+    def check_counts(self, importer, added=0, updated=0, removed=0,
+            unchanged=0):
+        self.assertEquals((importer.added, importer.updated,
+            importer.removed, importer.unchanged),
+            (added, updated, removed, unchanged))
+
+    def item_for_track(self, persistent_id):
+        track = importmedia.ITunesTrack.get_by_persistent_id(persistent_id)
+        return models.Item.get_by_id(track.item_id)
+
+    def playlist_item_ids(self, title):
+        playlist = models.SavedPlaylist.get_by_title(title)
+        maps = list(models.PlaylistItemMap.playlist_view(playlist.id))
+        maps.sort(key=lambda map_: map_.position)
+        return [map_.item_id for map_ in maps]
+
+    def test_stream_library(self):
+        self.add_track('A1')
+        self.add_track('B2')
+        self.playlists['Mix'] = ['B2']
+        self.write_library()
+        handler = importmedia.iTunesLibraryHandler()
+        values = list(importmedia.iter_itunes_library(self.library_dir,
+            handler))
+        self.assertEquals([kind for kind, value in values],
+                ['track', 'track', 'playlist', 'playlist'])
+        self.assertSameSet([value['Persistent ID'] for kind, value in
+            values[:2]], ['A1', 'B2'])
+        self.assertEquals(values[3][1]['Playlist Items'],
+                [{'Track ID': self.tracks['B2']['track_id']}])
+        # tracks and playlists shouldn't be kept around after we've
+        # handed them out
+        self.assertEquals(handler.library['Tracks'], {})
+        self.assertEquals(handler.library['Playlists'], [])
+        self.assertEquals(handler.tracks, [])
+
+    def test_import(self):
+        path = self.add_track('A1', play_count=3)
+        self.add_track('B2')
+        self.playlists['Mix'] = ['B2', 'A1']
+        importer = self.run_import()
+        self.check_counts(importer, added=2)
+        self.assertEquals(importer.playlists, 1)
+        item_a = self.item_for_track('A1')
+        self.assertEquals(item_a.get_filename(), path)
+        self.assertEquals(item_a.get_title(), u'Song A1')
+        self.assertEquals(item_a.play_count, 3)
+        self.assertEquals(self.playlist_item_ids(u'Mix'),
+                [self.item_for_track('B2').id, item_a.id])
+
+    def test_reimport(self):
+        self.add_track('A1')
+        self.add_track('B2')
+        self.add_track('C3')
+        self.playlists['Mix'] = ['A1', 'B2']
+        self.run_import()
+        item_b = self.item_for_track('B2')
+        self.assertEquals(self.run_import().unchanged, 3)
+
+        del self.tracks['A1']
+        self.tracks['B2']['play_count'] = 5
+        self.add_track('D4')
+        self.playlists['Mix'] = ['B2', 'D4']
+        importer = self.run_import()
+        self.check_counts(importer, added=1, updated=1, removed=1,
+                unchanged=1)
+        self.assertEquals(importmedia.ITunesTrack.make_view().count(), 3)
+        self.assertEquals(models.Item.make_view().count(), 3)
+        self.assertEquals(self.item_for_track('B2'), item_b)
+        self.assertEquals(item_b.play_count, 5)
+        self.assertEquals(self.playlist_item_ids(u'Mix'),
+                [item_b.id, self.item_for_track('D4').id])
+
+    def test_bad_library_keeps_tracks(self):
+        self.add_track('A1')
+        self.run_import()
+        f = open(os.path.join(self.library_dir,
+            importmedia.ITUNES_XML_FILE), 'w')
+        f.write('JUNKJUNKJUNK')
+        f.close()
+        importer = importmedia.ITunesImporter(self.library_dir)
+        for dummy in importer.run():
+            pass
+        self.assertEquals(importer.removed, 0)
+        self.assertEquals(importmedia.ITunesTrack.make_view().count(), 1)
+        self.assertEquals(models.Item.make_view().count(), 1)
+
+    def test_existing_item_left_alone(self):
+        path = self.add_track('A1', play_count=2)
+        manual_feed = models.Feed.get_manual_feed()
+        user_item = models.FileItem(path, feed_id=manual_feed.id)
+        self.run_import()
+        self.assertEquals(self.item_for_track('A1'), user_item)
+        track = importmedia.ITunesTrack.get_by_persistent_id('A1')
+        self.assertEquals(track.created_item, False)
+        # we should still import the play count
+        self.assertEquals(user_item.play_count, 2)
+        self.tracks['A1']['play_count'] = 4
+        self.run_import()
+        self.assertEquals(user_item.play_count, 4)
+        # but never lower it
+        self.tracks['A1']['play_count'] = 1
+        self.run_import()
+        self.assertEquals(user_item.play_count, 4)
+
+        # the file moving in iTunes shouldn't remove the user's item
+        self.tracks['A1']['location'] = ('file://localhost' +
+                urllib.pathname2url(self.add_track('B2')))
+        del self.tracks['B2']
+        self.tracks['A1']['date_modified'] = '2011-02-01T00:00:00Z'
+        self.run_import()
+        self.assert_(user_item.id_exists())
+        self.assertNotEquals(self.item_for_track('A1'), user_item)
+
+        # and neither should the track going away
+        self.tracks['C3'] = self.tracks.pop('A1')
+        self.tracks['C3']['persistent_id'] = 'C3'
+        self.tracks['C3']['location'] = ('file://localhost' +
+                urllib.pathname2url(path))
+        importer = self.run_import()
+        self.check_counts(importer, added=1, removed=1)
+        self.assert_(user_item.id_exists())
+        # the item we made for the moved file is gone though
+        self.assertEquals(models.Item.make_view().count(), 1)
@@ -1,4 +1,5 @@
 import itertools
+import random
 import weakref
 
 from miro.test.framework import (MiroTestCase, skip_for_platforms,
@@ -55,10 +56,11 @@ class InfoListTestBase(MiroTestCase):
                     self.infolist.info_list()], [self.sorter(i) for i in
                         check_against])
 
-        # test index_of_id(), get_prev_info() and get_next_info()
+        # test index_of_id(), nth_row(), get_prev_info() and get_next_info()
         list_of_infos = self.infolist.info_list()
         for i, info in enumerate(list_of_infos):
             self.assertEquals(self.infolist.index_of_id(info.id), i)
+            self.assertEquals(self.infolist.nth_row(i)[0], info)
             if i > 0:
                 self.assertEquals(self.infolist.get_prev_info(info.id),
                         list_of_infos[i-1])
@@ -262,6 +264,31 @@ class InfoListDataTest(InfoListTestBase):
         # test grouping is correct after changing the sort
         self.check_update_sort(lambda info: info.name)
 
+    def test_random_operations(self):
+        # do a bunch of random inserts, removes and resorting updates,
+        # checking the positions of every row against a plain python list
+        # after each one.
+        rand = random.Random(16113)
+        def random_name():
+            return ''.join(rand.choice('abcdefg') for i in xrange(3))
+        for i in xrange(150):
+            choice = rand.random()
+            if choice < 0.5 or len(self.correct_infos) < 5:
+                count = rand.randint(1, 5)
+                self.check_insert(self.make_infos(
+                    *[random_name() for j in xrange(count)]))
+            elif choice < 0.75:
+                to_remove = rand.sample(self.correct_infos,
+                        rand.randint(1, 3))
+                self.check_remove(*[info.id for info in to_remove])
+            else:
+                to_update = rand.sample(self.correct_infos,
+                        rand.randint(1, 3))
+                args = []
+                for info in to_update:
+                    args.extend([info.id, random_name()])
+                self.check_update(resort=True, *args)
+
 class InfoListMemoryTest(InfoListTestBase):
     def test_objects_released(self):
         self.check_insert(self.make_infos('m', 'i', 'r', 'o'))
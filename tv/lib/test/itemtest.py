@@ -4,7 +4,12 @@ import shutil
 import tempfile
 
 from miro import app
+from miro import filetags
+from miro import item
+from miro import moviedata
 from miro import prefs
+from miro import workerprocess
+from miro.plat import resources
 from miro.feed import Feed
 from miro.item import Item, FileItem, FeedParserValues
 from miro.fileobject import FilenameType
@@ -264,3 +269,51 @@ class DeletedItemTest(MiroTestCase):
         app.controller.failed_soft_okay = True
         Item._allow_nonexistent_paths = False
         FileItem("/non/existent/path/", feed.id)
+
+class TagReaderTest(MiroTestCase):
+    def setUp(self):
+        MiroTestCase.setUp(self)
+        item._READ_METADATA_INLINE = False
+        self.feed = Feed(u'dtv:manualFeed', initiallyAutoDownloadable=False)
+        path = resources.path("testdata/metadata/mp3-0.mp3")
+        self.item = FileItem(path, self.feed.id)
+
+    def tearDown(self):
+        workerprocess._task_queue.reset()
+        MiroTestCase.tearDown(self)
+
+    def send_results(self, results):
+        item._tag_reader.send_requests()
+        tasks = workerprocess._task_queue.tasks_in_progress.values()
+        self.assertEquals(len(tasks), 1)
+        msg, callback, errback = tasks[0]
+        self.assertEquals(msg.paths, [self.item.get_filename()])
+        callback(results)
+
+    def test_read_later(self):
+        # check_media_file() shouldn't read the tags itself
+        self.assertEquals(self.item.file_type, u'audio')
+        self.assertEquals(self.item.metadata_version, 0)
+        self.send_results([(u'audio', 1000, {'title': u'Tagged'}, None)])
+        self.assertEquals(self.item.metadata_version,
+                          filetags.METADATA_VERSION)
+        self.assertEquals(self.item.title_tag, u'Tagged')
+        self.assertEquals(self.item.duration, 1000)
+        self.assertEquals(self.item.file_type, u'audio')
+
+    def test_no_duplicate_requests(self):
+        self.item.check_media_file()
+        self.send_results([None])
+        self.assertEquals(self.item.metadata_version,
+                          filetags.METADATA_VERSION)
+
+    def test_io_error(self):
+        self.send_results([IOError("Simulated Error")])
+        self.assertEquals(self.item.file_type, u'other')
+        self.assertEquals(self.item.mdp_state, moviedata.State.SKIPPED)
+
+    def test_item_removed(self):
+        path = self.item.get_filename()
+        self.item.remove()
+        self.send_results([(u'audio', 1000, {}, None)])
+        self.assert_(path in self.metadata_progress_updater.paths_processed)
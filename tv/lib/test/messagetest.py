@@ -572,6 +572,22 @@ class PlaylistItemTrackTest(TrackerTest):
         self.assertEquals(len(self.test_handler.messages), 2)
         self.check_changed_message(1, removed=[self.items[1]])
 
+    def test_add_ids(self):
+        new_items = []
+        for i in xrange(3):
+            entry = _build_entry(u'http://example.com/new-%d' % i,
+                    'video/x-unknown')
+            new_items.append(Item(FeedParserValues(entry),
+                feed_id=self.feed.id))
+        self.runUrgentCalls()
+        self.test_handler.messages = []
+        self.playlist.add_ids([i.id for i in new_items])
+        self.runUrgentCalls()
+        # all the items should be sent in a single message
+        self.assertEquals(len(self.test_handler.messages), 1)
+        self.test_handler.messages[0].added.sort(key=lambda i: i.id)
+        self.check_changed_message(0, added=new_items)
+
     def test_stop(self):
         messages.StopTrackingItems(
             'playlist', self.playlist.id).send_to_backend()
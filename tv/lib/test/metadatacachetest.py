@@ -0,0 +1,147 @@
+import os
+
+from miro import app
+from miro import metadatacache
+from miro import moviedata
+from miro.feed import Feed
+from miro.item import FileItem
+from miro.test.framework import MiroTestCase
+
+class MetadataCacheTest(MiroTestCase):
+    def setUp(self):
+        MiroTestCase.setUp(self)
+        self.path = self.make_temp_path('.mp3')
+        self.tags = (u'audio', 1000, {u'title': u'Cached Title'}, None)
+
+    def make_image(self):
+        path = self.make_temp_path('.png')
+        f = open(path, 'wb')
+        f.write("fake image data")
+        f.close()
+        return path
+
+    def test_lookup(self):
+        self.assertEquals(metadatacache.lookup(self.path), None)
+        metadatacache.store_tags(self.path, self.tags)
+        entry = metadatacache.lookup(self.path)
+        self.assert_(entry.has_tags())
+        self.assert_(not entry.has_movie_data())
+        self.assertEquals(entry.get_tags(), self.tags)
+
+    def test_no_tags(self):
+        metadatacache.store_tags(self.path, None)
+        entry = metadatacache.lookup(self.path)
+        self.assert_(entry.has_tags())
+        self.assertEquals(entry.get_tags(), None)
+
+    def test_file_changed(self):
+        metadatacache.store_tags(self.path, self.tags)
+        stat = os.stat(self.path)
+        os.utime(self.path, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEquals(metadatacache.lookup(self.path), None)
+        self.assertEquals(metadatacache.MetadataCacheEntry.make_view().count(),
+                          0)
+
+    def test_file_removed(self):
+        metadatacache.store_tags(self.path, self.tags)
+        os.remove(self.path)
+        self.assertEquals(metadatacache.lookup(self.path), None)
+
+    def test_cover_art_copies(self):
+        cover_art = self.make_image()
+        metadatacache.store_tags(self.path, self.tags[:3] + (cover_art,))
+        # the item that owned the cover art deletes it when it's removed
+        os.remove(cover_art)
+        entry = metadatacache.lookup(self.path)
+        self.assert_(entry.has_tags())
+        rv = entry.get_tags()
+        self.assertNotEquals(rv[3], cover_art)
+        self.assertNotEquals(rv[3], entry.cover_art)
+        self.assertEquals(open(rv[3], 'rb').read(), "fake image data")
+
+    def test_missing_cover_art(self):
+        metadatacache.store_tags(self.path, self.tags[:3] +
+                                 (self.make_image(),))
+        entry = metadatacache.lookup(self.path)
+        os.remove(entry.cover_art)
+        self.assert_(not entry.has_tags())
+
+    def test_remove_deletes_images(self):
+        metadatacache.store_movie_data(self.path, moviedata.State.RAN, 1000,
+                                       u'video', self.make_image())
+        entry = metadatacache.lookup(self.path)
+        screenshot = entry.screenshot
+        self.assert_(os.path.exists(screenshot))
+        entry.remove()
+        self.assert_(not os.path.exists(screenshot))
+
+    def test_movie_data_failures(self):
+        # a single failure might be temporary, so we should try again
+        for i in range(metadatacache.MAX_MOVIE_DATA_FAILURES - 1):
+            metadatacache.store_movie_data_failure(self.path,
+                                                   moviedata.State.FAILED)
+            self.assert_(not metadatacache.lookup(self.path).has_movie_data())
+        metadatacache.store_movie_data_failure(self.path,
+                                               moviedata.State.FAILED)
+        entry = metadatacache.lookup(self.path)
+        self.assert_(entry.has_movie_data())
+        self.assertEquals(entry.mdp_state, moviedata.State.FAILED)
+
+    def test_movie_data_success_resets_failures(self):
+        metadatacache.store_movie_data_failure(self.path,
+                                               moviedata.State.FAILED)
+        metadatacache.store_movie_data(self.path, moviedata.State.RAN, 1000,
+                                       u'video', None)
+        self.assertEquals(metadatacache.lookup(self.path).mdp_failures, 0)
+
+    def test_prune_missing(self):
+        other_path = self.make_temp_path('.mp3')
+        metadatacache.store_tags(self.path, self.tags)
+        metadatacache.store_movie_data(other_path, moviedata.State.RAN,
+                                       1000, u'video', self.make_image())
+        screenshot = metadatacache.lookup(other_path).screenshot
+        os.remove(other_path)
+        for dummy in metadatacache.iter_prune_missing():
+            pass
+        self.assertEquals(metadatacache.MetadataCacheEntry.make_view().count(),
+                          1)
+        self.assert_(metadatacache.lookup(self.path).has_tags())
+        self.assert_(not os.path.exists(screenshot))
+
+class MetadataCacheItemTest(MiroTestCase):
+    def setUp(self):
+        MiroTestCase.setUp(self)
+        self.feed = Feed(u'dtv:manualFeed', initiallyAutoDownloadable=False)
+
+    def test_tags_from_cache(self):
+        path = self.make_temp_path('.mp3')
+        metadatacache.store_tags(path, (u'audio', 1000,
+                                        {u'title': u'Cached Title'}, None))
+        item = FileItem(path, self.feed.id)
+        self.assertEquals(item.title_tag, u'Cached Title')
+        self.assertEquals(item.duration, 1000)
+        self.assertEquals(item.file_type, u'audio')
+
+    def test_tags_stored(self):
+        path = self.make_temp_path('.mp3')
+        FileItem(path, self.feed.id)
+        self.assert_(metadatacache.lookup(path).has_tags())
+
+    def test_movie_data_from_cache(self):
+        app.testing_mdp = True # hack to override moviedata's in_unit_tests hack
+        try:
+            path = self.make_temp_path('.avi')
+            screenshot = self.make_temp_path('.png')
+            metadatacache.store_movie_data(path, moviedata.State.RAN, 5000,
+                                           u'video', screenshot)
+            item = FileItem(path, self.feed.id)
+        finally:
+            del app.testing_mdp
+        self.assert_(moviedata.movie_data_updater.queue.empty())
+        self.assertEquals(item.mdp_state, moviedata.State.RAN)
+        self.assertEquals(item.duration, 5000)
+        self.assertEquals(item.file_type, u'video')
+        self.assertNotEquals(item.screenshot, None)
+        self.assertNotEquals(item.screenshot, screenshot)
+        self.assert_(os.path.exists(item.screenshot))
+        self.assert_(path in self.metadata_progress_updater.paths_processed)
@@ -16,6 +16,7 @@ from miro import filetypes
 from miro.feed import Feed
 from miro.plat import resources
 from miro.plat import renderers
+from miro.plat.utils import movie_data_server_info
 from miro.fileobject import FilenameType
 
 import time
@@ -177,3 +178,45 @@ class MovieDataRequestTest(MiroTestCase):
 # mp4-0 test case expected to have a screenshot")
 # drm.m4v test case expected to have a screenshot")
 # webm-0.assertEqual(item.duration, *something*)
+
+class MovieDataServerTest(MiroTestCase):
+    """Test running the movie data program as a long-lived server."""
+    def setUp(self):
+        MiroTestCase.setUp(self)
+        self.mdu = moviedata.MovieDataUpdater()
+        command_line, env = movie_data_server_info()
+        self.server = moviedata.MovieDataServer(self.mdu, command_line, env)
+
+    def tearDown(self):
+        self.server.shutdown()
+        MiroTestCase.tearDown(self)
+
+    def run_job(self, mdi):
+        return self.server.run_job(mdi.video_path, mdi.thumbnail_path)
+
+    def test_same_output_as_program(self):
+        for filename in ('mp3-0.mp3', 'webm-0.webm'):
+            mdi = moviedata.MovieDataInfo(FakeItem(filename))
+            server_output = self.run_job(mdi)
+            command_line, env = mdi.program_info
+            program_output = self.mdu.run_movie_data_program(command_line,
+                                                             env)
+            self.assertEquals(self.mdu.parse_duration(server_output),
+                              self.mdu.parse_duration(program_output))
+            self.assertEquals(self.mdu.parse_type(server_output),
+                              self.mdu.parse_type(program_output))
+
+    def test_reuses_process(self):
+        self.run_job(moviedata.MovieDataInfo(FakeItem('mp3-0.mp3')))
+        pipe = self.server.pipe
+        self.run_job(moviedata.MovieDataInfo(FakeItem('mp3-1.mp3')))
+        self.assert_(self.server.pipe is pipe)
+
+    def test_restart(self):
+        mdi = moviedata.MovieDataInfo(FakeItem('mp3-0.mp3'))
+        first_output = self.run_job(mdi)
+        # simulate the server getting killed after a hang.  The next job
+        # should start a new one.
+        self.server.kill()
+        self.assertEquals(self.run_job(mdi), first_output)
+        self.assert_(self.server.is_running())
@@ -2,11 +2,13 @@ import unittest
 
 from miro import autodiscover
 from miro import feed
+from miro import feedupdate
+from miro import httpclient
 from miro import opml
 
 from miro.fileobject import FilenameType
 
-from miro.test.framework import MiroTestCase
+from miro.test.framework import MiroTestCase, EventLoopTest
 
 URL_1 = "http://www.domain-1.com/videos/rss.xml"
 URL_2  = "http://www.domain-2.com/videos/rss.xml"
@@ -15,11 +17,9 @@ URL_4 = "http://www.domain-2.com/videos/atom.xml"
 
 # -----------------------------------------------------------------------------
 
-def _get_subs(entry):
-    """Removes most of the boilerplate for getting subscriptions given
-    some specific entry or entries in the <body> ... </body> section.
-    """
-    teststring = u"""\
+def _get_opml(entry):
+    """Wraps entry or entries in an OPML document."""
+    return u"""\
 <?xml version="1.0" encoding="utf-8" ?>
 <!-- OPML generated by Miro v3.1-git on Thu Jul 22 15:23:10 2010 -->
 <opml version="2.0"
@@ -32,7 +32,11 @@ def _get_subs(entry):
 </body>
 </opml>""" % entry
 
-    return autodiscover.parse_content(teststring)
+def _get_subs(entry):
+    """Removes most of the boilerplate for getting subscriptions given
+    some specific entry or entries in the <body> ... </body> section.
+    """
+    return autodiscover.parse_content(_get_opml(entry))
 
 class TestImporter(unittest.TestCase):
     def test_simple_flat(self):
@@ -271,3 +275,84 @@ class TestExporter(MiroTestCase):
     # FIXME - add more export tests
     # FIXME - test folders
     # FIXME - test sites
+
+class TestImportSubscriptions(EventLoopTest):
+    def setUp(self):
+        EventLoopTest.setUp(self)
+        self.grabs = []
+        self.old_grab_url = feed.grab_url
+        feed.grab_url = self.fake_grab_url
+        self.old_update_queue = feedupdate.global_update_queue
+        feedupdate.global_update_queue = feedupdate.FeedUpdateQueue()
+        self.importer = opml.Importer()
+
+    def tearDown(self):
+        feed.grab_url = self.old_grab_url
+        feedupdate.global_update_queue = self.old_update_queue
+        EventLoopTest.tearDown(self)
+
+    def fake_grab_url(self, url, callback, errback, **kwargs):
+        self.grabs.append((url, callback, errback))
+
+    def import_entries(self, entries):
+        subscriptions = self.importer.import_content(_get_opml(entries))
+        return self.importer.add_subscriptions(subscriptions)
+
+    def test_import(self):
+        summary = self.import_entries("""\
+  <outline type="rss" text="Feed 1" xmlUrl="%s" />
+  <outline type="rss" text="Feed 1 again" xmlUrl="%s" />
+  <outline type="rss" text="No URL" xmlUrl="" />
+  <outline type="rss" text="Bad URL" xmlUrl="javascript:alert(1)" />
+  <outline text="Folder">
+    <outline type="rss" text="Feed 2" xmlUrl="%s" />
+    <outline text="Nested folder">
+      <outline type="rss" text="Feed 3" xmlUrl="%s" />
+    </outline>
+  </outline>
+""" % (URL_1, URL_1, URL_2, URL_3))
+        self.assertDictEquals(summary, {
+            'feeds_added': 3,
+            'feeds_skipped': 0,
+            'sites_added': 0,
+            'sites_skipped': 0,
+            'folders_added': 1,
+            'downloads': 0,
+            'invalid': 2,
+            'duplicates': 1,
+        })
+        feeds = dict((f.get_url(), f) for f in feed.Feed.make_view())
+        self.assertSameSet(feeds.keys(), [URL_1, URL_2, URL_3])
+        self.assertEquals(feeds[URL_1].get_folder(), None)
+        folder_ = feeds[URL_2].get_folder()
+        self.assertEquals(folder_.get_title(), u"Folder")
+        # the nested folder gets flattened into its parent
+        self.assertEquals(feeds[URL_3].get_folder(), folder_)
+        self.assertEquals(feeds[URL_2].get_title(), u"Feed 2")
+
+    def test_skip_existing(self):
+        feed.Feed(unicode(URL_1))
+        self.grabs = []
+        summary = self.import_entries("""\
+  <outline type="rss" text="Feed 1" xmlUrl="%s" />
+  <outline type="rss" text="Feed 2" xmlUrl="%s" />
+""" % (URL_1, URL_2))
+        self.assertEquals(summary['feeds_added'], 1)
+        self.assertEquals(summary['feeds_skipped'], 1)
+        self.assertEquals(feed.Feed.make_view().count(), 2)
+
+    def test_fetches_queued(self):
+        urls = [u'http://example%d.com/feed.rss' % i
+                for i in range(feedupdate.MAX_UPDATES + 2)]
+        self.import_entries('\n'.join(
+            '<outline type="rss" text="Feed" xmlUrl="%s" />' % url
+            for url in urls))
+        # only MAX_UPDATES feeds should be fetching right away
+        self.assertEquals([grab[0] for grab in self.grabs],
+                          urls[:feedupdate.MAX_UPDATES])
+        # when a fetch finishes, the next one should start
+        url, callback, errback = self.grabs[0]
+        errback(httpclient.ConnectionError('test'))
+        self.runPendingIdles()
+        self.assertEquals([grab[0] for grab in self.grabs],
+                          urls[:feedupdate.MAX_UPDATES + 1])
@@ -0,0 +1,201 @@
+from datetime import datetime, timedelta
+
+from miro import app
+from miro import messages
+from miro import playbackstats
+from miro import signals
+from miro.feed import Feed
+from miro.item import Item, FeedParserValues
+from miro.frontends.widgets import playsessions
+from miro.test.framework import MiroTestCase
+
+class PlaybackStatsTest(MiroTestCase):
+    def setUp(self):
+        MiroTestCase.setUp(self)
+        app.playback_stats = playbackstats.PlaybackStats()
+        self.feed = Feed(u'http://example.com/feed.rss')
+        self.feed2 = Feed(u'http://example.com/feed2.rss')
+        self.items = [self.make_item(self.feed, i) for i in range(3)]
+        self.items.append(self.make_item(self.feed2, 3))
+        self.now = datetime.now()
+
+    def tearDown(self):
+        app.playback_stats = None
+        MiroTestCase.tearDown(self)
+
+    def make_item(self, feed, i):
+        return Item(FeedParserValues({'title': u'item%d' % i}),
+                feed_id=feed.id)
+
+    def record(self, item, watched_time, position, duration=100.0,
+            age=timedelta(0)):
+        end = self.now - age
+        app.playback_stats.record(item.id, end - timedelta(seconds=60),
+                end, duration, watched_time, position)
+
+    def test_batched_writes(self):
+        self.record(self.items[0], 50, 50)
+        self.assertEquals(playbackstats.PlaySession.make_view().count(), 0)
+        self.assert_(app.playback_stats.flush_timeout is not None)
+        app.playback_stats.flush()
+        self.assertEquals(playbackstats.PlaySession.make_view().count(), 1)
+        for i in xrange(playbackstats.FLUSH_BATCH_SIZE):
+            self.record(self.items[0], 50, 50)
+        # a full batch gets written right away
+        self.assertEquals(playbackstats.PlaySession.make_view().count(),
+                playbackstats.FLUSH_BATCH_SIZE + 1)
+        self.assertEquals(app.playback_stats.pending, [])
+
+    def test_session_values(self):
+        self.record(self.items[0], 95, 95)
+        self.record(self.items[1], 10, 80)
+        self.record(self.items[2], 40, 40, duration=None)
+        # too short to record
+        self.record(self.items[2], 0.5, 0.5)
+        app.playback_stats.flush()
+        sessions = dict((s.item_id, s)
+                for s in playbackstats.PlaySession.make_view())
+        self.assertEquals(len(sessions), 3)
+        first = sessions[self.items[0].id]
+        self.assertEquals(first.feed_id, self.feed.id)
+        self.assertAlmostEquals(first.completion, 0.95)
+        self.assertEquals((first.completed, first.skipped), (True, False))
+        # seeked to 80%, but only watched 10 seconds
+        second = sessions[self.items[1].id]
+        self.assertEquals((second.completed, second.skipped), (False, True))
+        third = sessions[self.items[2].id]
+        self.assertEquals(third.completion, None)
+        self.assertEquals((third.completed, third.skipped), (False, False))
+
+    def test_queries(self):
+        self.record(self.items[0], 95, 95)
+        self.record(self.items[1], 10, 10)
+        self.record(self.items[2], 40, 40, age=timedelta(days=10))
+        self.record(self.items[3], 100, 100)
+        # the queries should flush the pending sessions
+        self.assertEquals(playbackstats.top_feeds(), [
+            (self.feed.id, 3, 145.0), (self.feed2.id, 1, 100.0)])
+        self.assertEquals(playbackstats.top_feeds(limit=1),
+                [(self.feed.id, 3, 145.0)])
+        since = self.now - timedelta(days=1)
+        self.assertEquals(playbackstats.top_feeds(since=since)[0],
+                (self.feed.id, 2, 105.0))
+        rates = playbackstats.completion_rates()
+        self.assertEquals(rates[self.feed.id], (3, 1.0 / 3, 1.0 / 3))
+        self.assertEquals(rates[self.feed2.id], (1, 1.0, 0.0))
+        self.assertEquals(playbackstats.watched_time_by_feed(since=since),
+                {self.feed.id: 105.0, self.feed2.id: 100.0})
+        self.assertEquals(playbackstats.recently_watched()[-1],
+                self.items[2].id)
+
+    def test_recently_watched(self):
+        self.record(self.items[0], 50, 50, age=timedelta(hours=3))
+        self.record(self.items[1], 50, 50, age=timedelta(hours=2))
+        self.record(self.items[0], 50, 50, age=timedelta(hours=1))
+        self.assertEquals(playbackstats.recently_watched(),
+                [self.items[0].id, self.items[1].id])
+        # deleted items are left out, but still count for their feed
+        self.items[0].remove()
+        self.assertEquals(playbackstats.recently_watched(),
+                [self.items[1].id])
+        self.assertEquals(playbackstats.top_feeds(),
+                [(self.feed.id, 3, 150.0)])
+
+    def test_prune(self):
+        self.record(self.items[0], 50, 50, age=timedelta(days=400))
+        self.record(self.items[1], 50, 50)
+        app.playback_stats.flush()
+        app.playback_stats.prune()
+        self.assertEquals([s.item_id for s in
+            playbackstats.PlaySession.make_view()], [self.items[1].id])
+
+class FakePlaybackManager(signals.SignalEmitter):
+    def __init__(self):
+        signals.SignalEmitter.__init__(self, 'selecting-file', 'will-play',
+                'will-pause', 'will-seek', 'playback-did-progress',
+                'cant-play-file', 'will-stop')
+
+class FakeItemInfo(object):
+    def __init__(self, id_, duration=None, source_type='database'):
+        self.id = id_
+        self.duration = duration
+        self.source_type = source_type
+
+class TestBackendHandler(messages.MessageHandler):
+    def __init__(self):
+        messages.MessageHandler.__init__(self)
+        self.messages = []
+
+    def handle(self, message):
+        self.messages.append(message)
+
+class PlaySessionTrackerTest(MiroTestCase):
+    def setUp(self):
+        MiroTestCase.setUp(self)
+        self.handler = TestBackendHandler()
+        messages.BackendMessage.install_handler(self.handler)
+        self.manager = FakePlaybackManager()
+        self.tracker = playsessions.PlaySessionTracker(self.manager)
+
+    def tearDown(self):
+        messages.BackendMessage.reset_handler()
+        MiroTestCase.tearDown(self)
+
+    def play(self, start, end, total=100.0):
+        position = start
+        while position <= end:
+            self.manager.emit('playback-did-progress', position, total)
+            position += 0.5
+
+    def test_session(self):
+        self.manager.emit('selecting-file', FakeItemInfo(1))
+        self.manager.emit('will-play', 100.0)
+        self.play(0, 10)
+        self.manager.emit('will-pause')
+        self.manager.emit('will-play', 100.0)
+        self.play(10, 20)
+        # seeking ahead shouldn't count as watched time
+        self.manager.emit('will-seek', 0.8)
+        self.play(80, 90)
+        self.manager.emit('will-stop')
+        self.assertEquals(len(self.handler.messages), 1)
+        message = self.handler.messages[0]
+        self.assertEquals(message.item_id, 1)
+        self.assertEquals(message.duration, 100.0)
+        self.assertEquals(message.watched_time, 30.0)
+        self.assertEquals(message.position, 90.0)
+        self.assertEquals(message.pause_count, 1)
+        self.assertEquals(message.seek_count, 1)
+        self.assert_(message.start_time <= message.end_time)
+
+    def test_seek_near_end(self):
+        self.manager.emit('selecting-file', FakeItemInfo(1))
+        self.manager.emit('will-play', 100.0)
+        self.play(0, 10)
+        # the playback manager sends a progress update for the seek target
+        self.manager.emit('will-seek', 0.95)
+        self.manager.emit('playback-did-progress', 95.0, 100.0)
+        self.manager.emit('will-stop')
+        message = self.handler.messages[0]
+        self.assertEquals(message.position, 10.0)
+        self.assertEquals(message.watched_time, 10.0)
+        self.assert_(playbackstats.calc_completion(message.position,
+            message.duration) < playbackstats.COMPLETED_FRACTION)
+
+    def test_next_item(self):
+        self.manager.emit('selecting-file', FakeItemInfo(1))
+        self.play(0, 5)
+        self.manager.emit('selecting-file', FakeItemInfo(2))
+        self.play(0, 5)
+        self.manager.emit('will-stop')
+        self.assertEquals([m.item_id for m in self.handler.messages], [1, 2])
+
+    def test_skipped_sessions(self):
+        # items on devices/shares aren't in our database
+        self.manager.emit('selecting-file', FakeItemInfo(1,
+            source_type='device'))
+        self.play(0, 5)
+        self.manager.emit('selecting-file', FakeItemInfo(2))
+        self.manager.emit('cant-play-file')
+        self.manager.emit('will-stop')
+        self.assertEquals(self.handler.messages, [])
@@ -63,6 +63,20 @@ class PlaylistTestCase(PlaylistTestBase):
         playlist.remove_item(self.i3)
         self.check_list(playlist, [self.i4, self.i1])
 
+    def test_add_ids(self):
+        playlist = SavedPlaylist(u"rocketboom", [self.i2.id])
+        playlist.add_ids([self.i4.id, self.i1.id, self.i2.id, self.i4.id])
+        self.check_list(playlist, [self.i2, self.i4, self.i1])
+        self.assert_(self.i4.keep)
+        self.assert_(self.i1.keep)
+
+    def test_reorder_saves_positions(self):
+        playlist = SavedPlaylist(u"rocketboom",
+                [self.i1.id, self.i2.id, self.i3.id])
+        playlist.reorder([self.i3.id, self.i1.id, self.i2.id])
+        self.clear_ddb_object_cache()
+        self.check_list(playlist, [self.i3, self.i1, self.i2])
+
     def test_initial_list(self):
         initialList = [self.i1, self.i2, self.i3]
         playlist = SavedPlaylist(u"rocketboom", [i.id for i in initialList])
@@ -153,6 +167,17 @@ class PlaylistFolderTestCase(PlaylistTestBase):
         self.folder.reorder([self.i4.id, self.i3.id, self.i2.id, self.i1.id])
         self.check_list([self.i4, self.i3, self.i2, self.i1])
 
+    def test_add_ids(self):
+        p4 = SavedPlaylist(u"p4")
+        p4.set_folder(self.folder)
+        p4.add_ids([self.i2.id, self.i4.id])
+        self.check_list([self.i1, self.i3, self.i4, self.i2])
+        # i2 and i4 are still in p4, so removing p3 shouldn't remove them
+        self.p3.remove()
+        self.check_list([self.i1, self.i3, self.i4, self.i2])
+        p4.remove()
+        self.check_list([self.i1, self.i3, self.i4])
+
     def test_remove_folder_removes_playlist(self):
         self.folder.remove()
         self.assertEquals(SavedPlaylist.make_view().count(), 0)
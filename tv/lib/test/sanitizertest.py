@@ -0,0 +1,100 @@
+from miro import app
+from miro import sanitizer
+from miro import util
+from miro.feed import Feed
+from miro.item import Item, FeedParserValues
+from miro.test.framework import MiroTestCase
+
+DESCRIPTION = (u'<p>Watch <a href="http://example.com/">this</a></p>'
+        u'<p>second&nbsp;line</p>')
+
+class HTMLSanitizerTest(MiroTestCase):
+    def setUp(self):
+        MiroTestCase.setUp(self)
+        self.sanitizer = sanitizer.HTMLSanitizer(size=2)
+
+    def test_strip(self):
+        self.assertEquals(self.sanitizer.strip(DESCRIPTION),
+                util.HTMLStripper().strip(DESCRIPTION))
+        self.assertEquals(self.sanitizer.strip(None), (u'', []))
+
+    def test_strip_cached(self):
+        first = self.sanitizer.strip(DESCRIPTION)
+        second = self.sanitizer.strip(DESCRIPTION)
+        self.assertEquals(first, second)
+        stats = self.sanitizer.get_stats()['strip']
+        self.assertEquals(stats['misses'], 1)
+        self.assertEquals(stats['hits'], 1)
+        # changing the returned links shouldn't change the cached ones
+        second[1].append((0, 0, u'http://example.org/'))
+        self.assertEquals(self.sanitizer.strip(DESCRIPTION), first)
+
+    def test_strip_eviction(self):
+        for i in range(3):
+            self.sanitizer.strip(u'<b>%d</b>' % i)
+        self.sanitizer.strip(u'<b>0</b>')
+        stats = self.sanitizer.get_stats()['strip']
+        self.assertEquals(stats['misses'], 4)
+        self.assertEquals(stats['count'], 2)
+
+    def test_xhtmlify(self):
+        html = u'<p>foo<br>bar'
+        self.assertEquals(self.sanitizer.xhtmlify(html, add_top_tags=True),
+                sanitizer.xhtmltools.xhtmlify(html, add_top_tags=True))
+        self.sanitizer.xhtmlify(html, add_top_tags=True)
+        # different arguments are cached separately
+        self.sanitizer.xhtmlify(html)
+        stats = self.sanitizer.get_stats()['xhtmlify']
+        self.assertEquals(stats['misses'], 2)
+        self.assertEquals(stats['hits'], 1)
+
+class StrippedDescriptionTest(MiroTestCase):
+    def setUp(self):
+        MiroTestCase.setUp(self)
+        self.feed = Feed(u'http://example.com/feed.rss')
+        self.item = Item(FeedParserValues({'description': DESCRIPTION}),
+                feed_id=self.feed.id)
+        self.strip_calls = []
+        self.old_strip_html = sanitizer.strip_html
+        sanitizer.strip_html = self.counting_strip_html
+
+    def tearDown(self):
+        sanitizer.strip_html = self.old_strip_html
+        MiroTestCase.tearDown(self)
+
+    def counting_strip_html(self, text, text_hash=None):
+        self.strip_calls.append(text)
+        return self.old_strip_html(text, text_hash)
+
+    def test_stripped_on_create(self):
+        self.assertEquals(self.item.get_stripped_description(),
+                util.HTMLStripper().strip(DESCRIPTION))
+        self.assertEquals(self.item.description_hash,
+                sanitizer.content_hash(DESCRIPTION))
+
+    def test_persisted(self):
+        item = self.reload_object(self.item)
+        self.assertEquals(item.get_stripped_description(),
+                util.HTMLStripper().strip(DESCRIPTION))
+        self.assertEquals(self.strip_calls, [])
+
+    def test_unchanged_description(self):
+        self.item.signal_change()
+        self.item.get_stripped_description()
+        self.assertEquals(self.strip_calls, [])
+
+    def test_changed_description(self):
+        self.item.entry_description = u'<i>new description</i>'
+        self.item.signal_change()
+        self.assertEquals(self.strip_calls, [u'<i>new description</i>'])
+        item = self.reload_object(self.item)
+        self.assertEquals(item.get_stripped_description(),
+                (u'new description', []))
+
+    def test_missing_stripped_description(self):
+        # items from before we stored the stripped description
+        app.db.cursor.execute("UPDATE item SET description_hash=NULL, "
+                "description_stripped=NULL, description_links=NULL")
+        item = self.reload_object(self.item)
+        self.assertEquals(item.get_stripped_description(),
+                util.HTMLStripper().strip(DESCRIPTION))
@@ -1,4 +1,6 @@
 from time import time, sleep
+import json
+import os
 import threading
 
 from miro import eventloop
@@ -57,3 +59,62 @@ class SchedulerTest(EventLoopTest):
         self.runEventLoop()
         totalCalls = len(timeouts) * threadCount + 1
         self.assertEquals(len(self.got_args), totalCalls)
+
+class EventLoopMetricsTest(EventLoopTest):
+    def setUp(self):
+        EventLoopTest.setUp(self)
+        eventloop.metrics.reset()
+
+    def test_histogram(self):
+        histogram = eventloop.LatencyHistogram()
+        for duration in (0.0005, 0.002, 0.002, 0.7, 10.0):
+            histogram.add(duration)
+        info = histogram.to_dict()
+        self.assertEquals(info['count'], 5)
+        self.assertEquals(info['max'], 10.0)
+        self.assertAlmostEqual(info['total'], 10.7045)
+        buckets = dict(info['buckets'])
+        self.assertEquals(buckets[0.001], 1)
+        self.assertEquals(buckets[0.005], 2)
+        self.assertEquals(buckets[1.0], 1)
+        self.assertEquals(buckets[None], 1)
+
+    def test_callbacks(self):
+        start_depth = eventloop.get_metrics()['queue_depths']['idle']
+        eventloop.add_idle(lambda: None, "foo")
+        eventloop.add_idle(lambda: None, "foo")
+        eventloop.add_timeout(0, lambda: None, "bar")
+        self.assertEquals(eventloop.get_metrics()['queue_depths']['idle'],
+                start_depth + 2)
+        self.runPendingIdles()
+        self.run_pending_timeouts()
+        stats = eventloop.get_metrics()
+        self.assertEquals(stats['callbacks']['idle (foo)']['count'], 2)
+        self.assertEquals(stats['callbacks']['timeout (bar)']['count'], 1)
+        self.assertEquals(stats['queue_depths']['idle'], 0)
+        self.assertEquals(stats['peak_queue_depths']['idle'],
+                start_depth + 2)
+
+    def test_too_many_names(self):
+        for i in xrange(eventloop.MAX_METRICS_NAMES + 5):
+            eventloop.metrics.record_callback("callback %d" % i, 0.1)
+        callbacks = eventloop.get_metrics()['callbacks']
+        self.assertEquals(len(callbacks), eventloop.MAX_METRICS_NAMES + 1)
+        self.assertEquals(
+                callbacks[eventloop.OTHER_CALLBACKS_NAME]['count'], 5)
+
+    def test_thread_pool_wait(self):
+        def callback(result):
+            eventloop.shutdown()
+        eventloop.call_in_thread(callback, callback, lambda: None,
+                                 "test thread pool wait")
+        self.runEventLoop()
+        stats = eventloop.get_metrics()
+        self.assertEquals(stats['thread_pool_wait']['count'], 1)
+
+    def test_dump(self):
+        path = os.path.join(self.tempdir, 'metrics.json')
+        eventloop.metrics.record_callback("foo", 0.1)
+        eventloop.dump_metrics(path)
+        stats = json.load(open(path))
+        self.assertEquals(stats['callbacks']['foo']['count'], 1)
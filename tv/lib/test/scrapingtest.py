@@ -0,0 +1,271 @@
+import os
+import re
+from datetime import datetime, timedelta
+
+from miro import dialogs
+from miro import flashscraper
+from miro import scraping
+from miro import signals
+from miro.feed import Feed, ScraperFeedImpl
+from miro.item import Item
+from miro.test.framework import MiroTestCase, EventLoopTest, uses_httpclient
+
+class FakeClient(object):
+    def __init__(self, url, callback, errback, kwargs):
+        self.url = url
+        self.callback = callback
+        self.errback = errback
+        self.kwargs = kwargs
+        self.canceled = False
+
+    def cancel(self):
+        self.canceled = True
+
+class ScrapeQueueTest(MiroTestCase):
+    def setUp(self):
+        MiroTestCase.setUp(self)
+        self.clients = []
+        self.results = []
+        self.queue = scraping.ScrapeQueue(max_requests=3,
+                max_requests_per_host=2)
+        self.old_grab_url = scraping.httpclient.grab_url
+        scraping.httpclient.grab_url = self.fake_grab_url
+
+    def tearDown(self):
+        scraping.httpclient.grab_url = self.old_grab_url
+        MiroTestCase.tearDown(self)
+
+    def fake_grab_url(self, url, callback, errback, **kwargs):
+        client = FakeClient(url, callback, errback, kwargs)
+        self.clients.append(client)
+        return client
+
+    def grab(self, url):
+        return self.queue.grab_url(url,
+                lambda info: self.results.append((url, info)),
+                lambda error: self.results.append((url, error)))
+
+    def started_urls(self):
+        return [c.url for c in self.clients]
+
+    def test_host_limit(self):
+        for i in range(3):
+            self.grab(u'http://example.com/%d' % i)
+        self.grab(u'http://example.org/')
+        # the 3rd example.com request has to wait
+        self.assertEquals(self.started_urls(), [u'http://example.com/0',
+            u'http://example.com/1', u'http://example.org/'])
+        self.clients[0].callback({'body': 'foo'})
+        self.assertEquals(self.results,
+                [(u'http://example.com/0', {'body': 'foo'})])
+        self.assertEquals(self.started_urls()[-1], u'http://example.com/2')
+
+    def test_max_requests(self):
+        for host in ('a', 'b', 'c', 'd'):
+            self.grab(u'http://%s.com/' % host)
+        self.assertEquals(len(self.clients), 3)
+        self.clients[1].errback('error')
+        self.assertEquals(self.results, [(u'http://b.com/', 'error')])
+        self.assertEquals(self.started_urls()[-1], u'http://d.com/')
+
+    def test_dedupe(self):
+        self.grab(u'http://example.com/')
+        self.grab(u'http://example.com/')
+        self.assertEquals(len(self.clients), 1)
+        self.clients[0].callback({'body': 'foo'})
+        self.assertEquals(len(self.results), 2)
+        # once the request is done, we fetch the url again
+        self.grab(u'http://example.com/')
+        self.assertEquals(len(self.clients), 2)
+
+    def test_dedupe_different_validators(self):
+        self.queue.grab_url(u'http://example.com/', None, None)
+        self.queue.grab_url(u'http://example.com/', None, None, etag='abc')
+        self.assertEquals(len(self.clients), 2)
+
+    def test_cancel(self):
+        handle1 = self.grab(u'http://example.com/')
+        handle2 = self.grab(u'http://example.com/')
+        handle1.cancel()
+        # handle2 still wants the result
+        self.assertEquals(self.clients[0].canceled, False)
+        handle2.cancel()
+        self.assertEquals(self.clients[0].canceled, True)
+        self.assertEquals(self.queue.requests, {})
+        self.assertEquals(self.queue.running_count, 0)
+
+    def test_cancel_from_callback(self):
+        # callbacks can cancel handles while we're calling them
+        handles = []
+        def first_callback(info):
+            self.results.append(('first', info))
+            handles[0].cancel()
+        def second_callback(info):
+            self.results.append(('second', info))
+            handles[2].cancel()
+        for callback in (first_callback, second_callback,
+                lambda info: self.results.append(('third', info))):
+            handles.append(self.queue.grab_url(u'http://example.com/',
+                callback, None))
+        self.clients[0].callback({})
+        self.assertEquals(self.results, [('first', {}), ('second', {})])
+
+    def test_cancel_pending(self):
+        for i in range(3):
+            self.grab(u'http://example.com/%d' % i)
+        handle = self.grab(u'http://example.com/3')
+        handle.cancel()
+        self.clients[0].callback({})
+        self.clients[1].callback({})
+        self.assertEquals(self.started_urls(), [u'http://example.com/0',
+            u'http://example.com/1', u'http://example.com/2'])
+
+class ScrapeCacheTest(EventLoopTest):
+    def setUp(self):
+        EventLoopTest.setUp(self)
+        self.start_http_server()
+        self.page_fetches = 0
+        self.results = []
+        self.old_scraper_info_map = flashscraper.SCRAPER_INFO_MAP
+        flashscraper.SCRAPER_INFO_MAP = [{
+            'pattern': re.compile(r'http://video.example.com/'),
+            'func': self.scrape,
+        }]
+
+    def tearDown(self):
+        flashscraper.SCRAPER_INFO_MAP = self.old_scraper_info_map
+        EventLoopTest.tearDown(self)
+
+    def scrape(self, url, callback):
+        def on_page(info):
+            self.page_fetches += 1
+            callback(u'http://media.example.com/video.mp4',
+                    content_type=u'video/mp4', title=u'Video')
+        def on_error(error):
+            callback(None)
+        flashscraper._grab_url(
+                unicode(self.httpserver.build_url('test.txt')),
+                callback, on_page, on_error)
+
+    def scrape_callback(self, new_url, contentType=None, title=None):
+        self.results.append((new_url, contentType, title))
+        self.stopEventLoop(abnormal=False)
+
+    def try_scraping(self, url=u'http://video.example.com/1'):
+        flashscraper.try_scraping_url(url, self.scrape_callback)
+
+    def expire_cache(self, url=u'http://video.example.com/1'):
+        entry = scraping.ScrapeCacheEntry.get_by_url(url)
+        entry.expires = datetime.now() - timedelta(seconds=1)
+        entry.signal_change()
+
+    @uses_httpclient
+    def test_cache(self):
+        self.try_scraping()
+        self.runEventLoop()
+        self.assertEquals(self.results, [(u'http://media.example.com/video.mp4',
+            u'video/mp4', u'Video')])
+        # the second time, we should use the cached value right away
+        self.try_scraping()
+        self.assertEquals(len(self.results), 2)
+        self.assertEquals(self.results[0], self.results[1])
+        self.assertEquals(self.httpserver.requested_paths(), ['/test.txt'])
+        entry = scraping.ScrapeCacheEntry.get_by_url(
+                u'http://video.example.com/1')
+        self.assertEquals(entry.source_url,
+                self.httpserver.build_url('test.txt'))
+        self.assertNotEquals(entry.modified, None)
+
+    @uses_httpclient
+    def test_in_flight(self):
+        self.try_scraping()
+        self.try_scraping()
+        self.runEventLoop()
+        self.assertEquals(len(self.results), 2)
+        self.assertEquals(self.page_fetches, 1)
+        self.assertEquals(self.httpserver.requested_paths(), ['/test.txt'])
+
+    @uses_httpclient
+    def test_revalidate(self):
+        self.httpserver.allow_not_modified()
+        self.try_scraping()
+        self.runEventLoop()
+        self.expire_cache()
+        self.try_scraping()
+        self.runEventLoop()
+        # the page was unchanged, so we shouldn't have scraped it again
+        self.assertEquals(self.page_fetches, 1)
+        self.assertEquals(len(self.httpserver.requested_paths()), 2)
+        self.assertEquals(self.results[0], self.results[1])
+        entry = scraping.ScrapeCacheEntry.get_by_url(
+                u'http://video.example.com/1')
+        self.assert_(entry.is_fresh())
+
+    @uses_httpclient
+    def test_revalidate_changed(self):
+        self.try_scraping()
+        self.runEventLoop()
+        self.expire_cache()
+        self.try_scraping()
+        self.runEventLoop()
+        # without a 304 response, we scrape the page again
+        self.assertEquals(self.page_fetches, 2)
+
+    def test_prune(self):
+        scraping.ScrapeCacheEntry(u'http://video.example.com/old',
+                u'http://media.example.com/old.mp4', u'video/mp4', None,
+                -scraping.MAX_STALE_AGE - timedelta(days=1))
+        scraping.ScrapeCacheEntry(u'http://video.example.com/new',
+                u'http://media.example.com/new.mp4', u'video/mp4', None,
+                timedelta(days=1))
+        scraping.prune_cache()
+        self.clear_ddb_object_cache()
+        self.assertEquals([e.url for e in
+            scraping.ScrapeCacheEntry.make_view()],
+            [u'http://video.example.com/new'])
+
+class ScraperFeedTest(EventLoopTest):
+    def setUp(self):
+        EventLoopTest.setUp(self)
+        self.start_http_server()
+        self.root = self.make_temp_dir_path()
+        self.httpserver.serve_directory(self.root)
+        self.write_page('index.html', [self.httpserver.build_url(name)
+            for name in ('page1.html', 'page2.html', 'page3.html')])
+        for i in range(1, 4):
+            self.write_page('page%d.html' % i,
+                    [self.httpserver.build_url('video%d.mp4' % i)])
+
+    def write_page(self, name, links):
+        f = open(os.path.join(self.root, name), 'w')
+        try:
+            f.write('<html><head><title>%s</title></head><body>' % name)
+            for link in links:
+                f.write('<a href="%s">%s</a>' % (link, link))
+            f.write('</body></html>')
+        finally:
+            f.close()
+
+    @uses_httpclient
+    def test_scrape(self):
+        url = unicode(self.httpserver.build_url('index.html'))
+        # index.html isn't a feed, so we get asked whether to scrape it
+        def dialog_handler(obj, dialog):
+            if dialogs.BUTTON_YES in dialog.buttons:
+                dialog.run_callback(dialogs.BUTTON_YES)
+        signals.system.connect('new-dialog', dialog_handler)
+        feed = Feed(url)
+        for i in range(40):
+            self.runEventLoop(timeout=0.25, timeoutNormal=True)
+            if Item.make_view().count() == 3 and not feed.is_updating():
+                break
+        self.assertSameSet([i.get_url() for i in Item.make_view()],
+                [self.httpserver.build_url('video%d.mp4' % i)
+                    for i in range(1, 4)])
+        self.assert_(isinstance(feed.actualFeed, ScraperFeedImpl))
+        # the scraper should reuse the HTML we downloaded to figure out the
+        # feed type, and fetch each linked page once.
+        paths = self.httpserver.requested_paths()
+        self.assertSameSet(paths, ['/index.html', '/page1.html',
+            '/page2.html', '/page3.html'])
+        self.assertEquals(len(paths), 4)
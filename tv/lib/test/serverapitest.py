@@ -0,0 +1,216 @@
+import httplib
+import os
+import stat
+import threading
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from miro import dialogs
+from miro import messages
+from miro.frontends.server import jsonapi
+from miro.test.framework import MiroTestCase
+
+class TestBackendHandler(messages.MessageHandler):
+    def __init__(self):
+        messages.MessageHandler.__init__(self)
+        self.messages = []
+
+    def handle(self, message):
+        self.messages.append(message)
+
+class EventQueueTest(MiroTestCase):
+    def test_get_since(self):
+        queue = jsonapi.EventQueue()
+        queue.add('One', {})
+        queue.add('Two', {})
+        events, last_seq, missed = queue.get_since(0)
+        self.assertEquals([e['type'] for e in events], ['One', 'Two'])
+        self.assertEquals(last_seq, 2)
+        self.assertEquals(missed, False)
+        self.assertEquals(queue.get_since(2), ([], 2, False))
+
+    def test_dropped_events(self):
+        queue = jsonapi.EventQueue(max_events=2)
+        for i in range(4):
+            queue.add('Event', {'i': i})
+        events, last_seq, missed = queue.get_since(1)
+        self.assertEquals([e['data']['i'] for e in events], [2, 3])
+        self.assertEquals(missed, True)
+        self.assertEquals(queue.get_since(2)[2], False)
+
+    def test_wait(self):
+        queue = jsonapi.EventQueue()
+        timer = threading.Timer(0.05, queue.add, ('Event', {}))
+        timer.start()
+        events, last_seq, missed = queue.get_since(0, timeout=5)
+        timer.join()
+        self.assertEquals(len(events), 1)
+
+class ServerAPITest(MiroTestCase):
+    def setUp(self):
+        MiroTestCase.setUp(self)
+        self.backend_handler = TestBackendHandler()
+        messages.BackendMessage.install_handler(self.backend_handler)
+        self.server = jsonapi.APIServer('127.0.0.1', 0)
+        self.server.connect_to_backend()
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        messages.BackendMessage.reset_handler()
+        messages.FrontendMessage.reset_handler()
+        MiroTestCase.tearDown(self)
+
+    def request(self, method, path, body=None, headers=None):
+        conn = httplib.HTTPConnection('127.0.0.1', self.server.get_port(),
+                timeout=10)
+        request_headers = {jsonapi.TOKEN_HEADER: self.server.token}
+        if method == 'POST':
+            request_headers['Content-Type'] = 'application/json'
+        if headers is not None:
+            request_headers.update(headers)
+        # let the test remove headers by setting them to None
+        for key, value in request_headers.items():
+            if value is None:
+                del request_headers[key]
+        try:
+            if body is not None:
+                body = json.dumps(body)
+            conn.request(method, path, body, request_headers)
+            response = conn.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            conn.close()
+
+    def test_status(self):
+        status, data = self.request('GET', '/api/status')
+        self.assertEquals(status, 200)
+        self.assertEquals(data['started'], False)
+        messages.StartupSuccess().send_to_frontend()
+        status, data = self.request('GET', '/api/status')
+        self.assertEquals(data['started'], True)
+
+    def test_list_messages(self):
+        status, data = self.request('GET', '/api/messages')
+        self.assertEquals(status, 200)
+        self.assertEquals(data['TrackItems']['args'], ['typ', 'id_'])
+        self.assert_('ItemList' not in data)
+
+    def test_send_message(self):
+        status, data = self.request('POST', '/api/messages/TrackItems',
+                {'typ': 'feed', 'id_': 12})
+        self.assertEquals(status, 200)
+        self.assertEquals(len(self.backend_handler.messages), 1)
+        message = self.backend_handler.messages[0]
+        self.assert_(isinstance(message, messages.TrackItems))
+        self.assertEquals((message.type, message.id), ('feed', 12))
+
+    def test_send_bad_message(self):
+        status, data = self.request('POST', '/api/messages/NotAMessage', {})
+        self.assertEquals(status, 404)
+        # frontend messages can't be sent to the backend
+        status, data = self.request('POST', '/api/messages/ItemList', {})
+        self.assertEquals(status, 404)
+        status, data = self.request('POST', '/api/messages/TrackItems',
+                {'foo': 1})
+        self.assertEquals(status, 400)
+        self.assertEquals(self.backend_handler.messages, [])
+
+    def test_events(self):
+        messages.TabsChanged('feed', [], [], [3]).send_to_frontend()
+        messages.ItemsChanged('feed', 12, [], [], [4, 5]).send_to_frontend()
+        status, data = self.request('GET', '/api/events?since=0')
+        self.assertEquals(status, 200)
+        self.assertEquals([e['type'] for e in data['events']],
+                ['TabsChanged', 'ItemsChanged'])
+        items_changed = data['events'][1]['data']
+        self.assertEquals(items_changed['id'], 12)
+        self.assertEquals(items_changed['removed'], [4, 5])
+        status, data = self.request('GET', '/api/events?since=%d' %
+                data['last'])
+        self.assertEquals(data['events'], [])
+
+    def test_long_poll(self):
+        message = messages.ItemList('feed', 12, [])
+        timer = threading.Timer(0.1, message.send_to_frontend)
+        timer.start()
+        status, data = self.request('GET', '/api/events?since=0&timeout=5')
+        timer.join()
+        self.assertEquals([e['type'] for e in data['events']], ['ItemList'])
+
+    def test_dialogs(self):
+        dialog = dialogs.ChoiceDialog(u'Title', u'Description',
+                dialogs.BUTTON_YES, dialogs.BUTTON_NO)
+        dialog.run(None)
+        status, data = self.request('GET', '/api/dialogs')
+        self.assertEquals(len(data), 1)
+        self.assertEquals(data[0]['buttons'], [dialogs.BUTTON_YES.text,
+            dialogs.BUTTON_NO.text])
+        status, data = self.request('POST', '/api/dialogs/%d' % data[0]['id'],
+                {'button': 1})
+        self.assertEquals(status, 200)
+        self.assertEquals(dialog.choice, dialogs.BUTTON_NO)
+        status, data = self.request('GET', '/api/dialogs')
+        self.assertEquals(data, [])
+
+    def test_missing_token(self):
+        status, data = self.request('GET', '/api/events?since=0',
+                headers={jsonapi.TOKEN_HEADER: None})
+        self.assertEquals(status, 401)
+        status, data = self.request('POST', '/api/shutdown', {},
+                headers={jsonapi.TOKEN_HEADER: None})
+        self.assertEquals(status, 401)
+        self.assertEquals(self.server.shutdown_event.isSet(), False)
+
+    def test_wrong_token(self):
+        status, data = self.request('GET', '/api/status',
+                headers={jsonapi.TOKEN_HEADER: 'x' * len(self.server.token)})
+        self.assertEquals(status, 401)
+
+    def test_bad_host(self):
+        # a DNS rebinding attack would send its own host name
+        status, data = self.request('GET', '/api/events?since=0',
+                headers={'Host': 'evil.example.com:8766'})
+        self.assertEquals(status, 403)
+        status, data = self.request('GET', '/api/status',
+                headers={'Host': 'localhost:8766'})
+        self.assertEquals(status, 200)
+
+    def test_bad_content_type(self):
+        # web pages can send text/plain POSTs without a CORS preflight
+        status, data = self.request('POST', '/api/messages/TrackItems',
+                {'typ': 'feed', 'id_': 12},
+                headers={'Content-Type': 'text/plain'})
+        self.assertEquals(status, 415)
+        status, data = self.request('POST', '/api/shutdown', None,
+                headers={'Content-Type': None})
+        self.assertEquals(status, 415)
+        self.assertEquals(self.backend_handler.messages, [])
+        self.assertEquals(self.server.shutdown_event.isSet(), False)
+
+class TokenTest(MiroTestCase):
+    def test_generate_token(self):
+        token = jsonapi.generate_token()
+        self.assertEquals(len(token), 32)
+        self.assertNotEquals(token, jsonapi.generate_token())
+
+    def test_tokens_match(self):
+        self.assert_(jsonapi.tokens_match('abcd', 'abcd'))
+        self.assert_(not jsonapi.tokens_match('abcd', 'abce'))
+        self.assert_(not jsonapi.tokens_match('abcd', 'abc'))
+        self.assert_(not jsonapi.tokens_match('abcd', None))
+
+    def test_write_token_file(self):
+        path = os.path.join(self.tempdir, jsonapi.TOKEN_FILENAME)
+        jsonapi.write_token_file(path, 'old')
+        jsonapi.write_token_file(path, 'abcd')
+        self.assertEquals(open(path).read(), 'abcd')
+        self.assertEquals(stat.S_IMODE(os.stat(path).st_mode), 0600)
+
+    def test_host_name(self):
+        self.assertEquals(jsonapi.host_name('LocalHost:8766'), 'localhost')
+        self.assertEquals(jsonapi.host_name('127.0.0.1'), '127.0.0.1')
+        self.assertEquals(jsonapi.host_name('[::1]:8766'), '::1')
@@ -1,5 +1,7 @@
 from datetime import datetime
+import inspect
 import os
+import re
 import unittest
 import time
 
@@ -13,6 +15,7 @@ from miro import feed
 from miro import folder
 from miro import widgetstate
 from miro import guide
+from miro import prefs
 from miro import schema
 from miro import signals
 from miro import tabs
@@ -293,6 +296,20 @@ class DiskTest(FakeSchemaTest):
         self.reload_test_database()
         self.check_database()
 
+    def test_bulk_update(self):
+        bob = Human(u"bob", 30, 1.2, [], {})
+        self.db.append(bob)
+        self.lee.name = u'LEE'
+        bob.name = u'BOB'
+        bob.age = 31
+        app.db.bulk_update([self.lee, bob])
+        self.reload_test_database()
+        self.check_database()
+
+    def test_bulk_update_incompatible(self):
+        self.assertRaises(ValueError, app.db.bulk_update,
+                [self.lee, self.joe])
+
     def test_update_then_remove(self):
         self.joe.name = u'JO MAMA'
         self.joe.remove()
@@ -552,6 +569,215 @@ class CorruptReprTest(FakeSchemaTest):
                               "WHERE name='ben'")
         self.assertRaises(SyntaxError, self.reload_object, self.ben)
 
+class UpgradeResumeTest(FakeSchemaTest):
+    def setUp(self):
+        FakeSchemaTest.setUp(self)
+        self.upgrades_run = []
+        databaseupgrade._upgrade_overide[1] = self.make_upgrade(1)
+        databaseupgrade._upgrade_overide[2] = self.crash_upgrade
+
+    def make_upgrade(self, version):
+        def upgrade(cursor):
+            self.upgrades_run.append(version)
+            cursor.execute("UPDATE human SET age=age+1")
+        return upgrade
+
+    def crash_upgrade(self, cursor):
+        raise SystemError("crashed during upgrade")
+
+    def crash_during_upgrade(self):
+        self.assertRaises(SystemError, self.reload_test_database, version=2)
+        # simulate a crash by closing the connection without committing
+        app.db.connection.close()
+        databaseupgrade._upgrade_overide[2] = self.make_upgrade(2)
+
+    def upgrade_files(self):
+        return [name for name in os.listdir(os.path.dirname(self.save_path))
+                if name.startswith('upgrading_database_')]
+
+    def check_ages(self, lee_age):
+        app.db.cursor.execute("SELECT age FROM human WHERE name='lee'")
+        self.assertEquals(app.db.cursor.fetchone()[0], lee_age)
+
+    def test_resume(self):
+        self.crash_during_upgrade()
+        self.reload_test_database(version=2)
+        # upgrade1 finished before the crash, so it shouldn't run again
+        self.assertEquals(self.upgrades_run, [1, 2])
+        self.check_ages(27)
+        self.assertEquals(self.upgrade_files(), [])
+        self.assertRaises(KeyError, app.db.get_variable,
+                storedatabase.UPGRADE_SOURCE_KEY)
+
+    def test_source_changed(self):
+        self.crash_during_upgrade()
+        # if the database changes after the crash, we need to start over
+        self.reload_test_database(version=0)
+        Human(u"bob", 30, 1.2, [], {})
+        self.reload_test_database(version=2)
+        self.assertEquals(self.upgrades_run, [1, 1, 2])
+        self.check_ages(27)
+        self.assertEquals(self.upgrade_files(), [])
+
+    def test_corrupt_upgrade_file(self):
+        path = os.path.join(os.path.dirname(self.save_path),
+                'upgrading_database_0')
+        open(path, 'wb').write("BOGUS DATA")
+        databaseupgrade._upgrade_overide[2] = self.make_upgrade(2)
+        self.reload_test_database(version=2)
+        self.assertEquals(self.upgrades_run, [1, 2])
+        self.assertEquals(self.upgrade_files(), [])
+
+    def test_iter_row_batches(self):
+        Human(u"bob", 30, 1.2, [], {})
+        Human(u"carl", 40, 1.2, [], {})
+        app.db.finish_transaction()
+        batches = list(databaseupgrade.iter_row_batches(app.db.cursor,
+            'human', ['name'], batch_size=2))
+        self.assertEquals([len(batch) for batch in batches], [2, 1])
+        self.assertEquals([row[1] for batch in batches for row in batch],
+                [u'lee', u'bob', u'carl'])
+
+class WALModeTest(StoreDatabaseTest):
+    def check_journal_mode(self, correct_mode):
+        app.db.cursor.execute("PRAGMA journal_mode")
+        self.assertEquals(app.db.cursor.fetchone()[0].lower(), correct_mode)
+
+    def test_wal_mode(self):
+        self.check_journal_mode('wal')
+        self.assert_(app.db.wal_enabled)
+
+    def test_wal_mode_disabled(self):
+        app.config.set(prefs.DATABASE_WAL_MODE, False)
+        self.reload_test_database()
+        self.check_journal_mode('persist')
+        self.assert_(not app.db.wal_enabled)
+
+    def test_in_memory(self):
+        self.reload_database()
+        self.assert_(not app.db.wal_enabled)
+
+    def test_checkpoint(self):
+        feed.Feed(u"http://example.com/1")
+        app.db.finish_transaction()
+        self.assert_(app.db._checkpoint_dc is not None)
+        app.db.checkpoint()
+        self.assert_(app.db._checkpoint_dc is None)
+
+    def test_checkpoint_in_transaction(self):
+        feed.Feed(u"http://example.com/1")
+        # we shouldn't try to checkpoint with uncommitted statements
+        app.db.checkpoint()
+        self.assert_(app.db._checkpoint_dc is not None)
+
+    def test_backup_failed_upgrade_db(self):
+        f = feed.Feed(u"http://example.com/1")
+        app.db.finish_transaction()
+        # the feed is only in the WAL until we checkpoint
+        app.db._backup_failed_upgrade_db()
+        backup_path = os.path.join(os.path.dirname(self.save_path),
+                'failed_upgrade_database')
+        connection = storedatabase.sqlite3.connect(backup_path)
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT id FROM feed")
+            self.assertEquals(cursor.fetchall(), [(f.id,)])
+        finally:
+            connection.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(backup_path + suffix):
+                os.remove(backup_path + suffix)
+
+    def test_save_invalid_db(self):
+        app.db.connection.close()
+        open(self.save_path + '-wal', 'wb').write("WAL DATA")
+        open(self.save_path + '-shm', 'wb').write("SHM DATA")
+        app.db.save_invalid_db()
+        corrupt_path = os.path.join(os.path.dirname(self.save_path),
+                'corrupt_database')
+        self.assert_(not os.path.exists(self.save_path + '-wal'))
+        self.assert_(not os.path.exists(self.save_path + '-shm'))
+        self.assertEquals(open(corrupt_path + '-wal', 'rb').read(),
+                "WAL DATA")
+        os.remove(corrupt_path + '-wal')
+        app.db.open_connection()
+
+class QueryPlanTest(StoreDatabaseTest):
+    """Check that our views don't scan through entire tables.
+
+    These scans get very slow for users with large libraries.
+    """
+
+    # tables that are always small enough to scan
+    SMALL_TABLES = set([
+        'feed', 'channel_guide', 'playlist', 'playlist_folder',
+        'channel_folder', 'feed_impl', 'rss_feed_impl',
+        'saved_search_feed_impl', 'scraper_feed_impl', 'search_feed_impl',
+        'directory_feed_impl', 'directory_watch_feed_impl',
+        'search_downloads_feed_impl', 'manual_feed_impl',
+    ])
+
+    # views that need to check every row
+    SCAN_VIEWS = set([
+        'IconCache.orphaned_view',
+        'RemoteDownloader.orphaned_view',
+        'Item.auto_pending_view',
+        'Item.containers_view',
+        'Item.download_tab_view',
+        'Item.file_items_view',
+        'Item.manual_pending_view',
+        'Item.watchable_view',
+        'Item.watchable_other_view',
+    ])
+
+    # other methods that return views
+    EXTRA_VIEW_METHODS = ['unwatched_downloaded_items']
+
+    def get_views(self):
+        for object_schema in schema.object_schemas:
+            for klass in object_schema.ddb_object_classes():
+                # only check views defined on the class itself, subclasses
+                # get checked through their parents
+                for name in klass.__dict__:
+                    if not (name.endswith('_view') and name != 'make_view'
+                            or name in self.EXTRA_VIEW_METHODS):
+                        continue
+                    try:
+                        method = getattr(klass, name)
+                    except AttributeError:
+                        # class properties that only work on instances
+                        continue
+                    if (not inspect.ismethod(method) or
+                            method.im_self is not klass):
+                        continue
+                    args, varargs, kwargs, defaults = inspect.getargspec(
+                            method)
+                    arg_count = len(args) - 1 - len(defaults or ())
+                    view_name = '%s.%s' % (klass.__name__, name)
+                    yield view_name, method(*([1] * arg_count))
+
+    def get_scanned_tables(self, view):
+        sql = "EXPLAIN QUERY PLAN SELECT %s.id %s" % (view.table_name,
+                app.db._get_query_bottom(view.table_name, view.where,
+                    view.joins, view.order_by, view.limit))
+        app.db.cursor.execute(sql, view.values)
+        for row in app.db.cursor.fetchall():
+            # older sqlite versions say "SCAN TABLE foo"
+            match = re.match(r'SCAN (?:TABLE )?(\w+)', row[-1])
+            if match:
+                yield match.group(1)
+
+    def test_no_table_scans(self):
+        problems = []
+        for view_name, view in self.get_views():
+            if view_name in self.SCAN_VIEWS:
+                continue
+            for table in self.get_scanned_tables(view):
+                if table not in self.SMALL_TABLES:
+                    problems.append("%s scans %s" % (view_name, table))
+        if problems:
+            raise AssertionError("Table scans: %s" % ', '.join(problems))
+
 class ConverterTest(StoreDatabaseTest):
     def test_convert_repr(self):
         converter = storedatabase.SQLiteConverter()
@@ -74,6 +74,7 @@ class MiroHTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
                 'headers': self.headers,
                 'method': 'GET',
         }
+        self.server.requested_paths.append(self.path)
         self.send_request()
 
     def do_HEAD(self):
@@ -86,6 +87,7 @@ class MiroHTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
                 'headers': self.headers,
                 'method': 'HEAD',
         }
+        self.server.requested_paths.append(self.path)
         self.send_request(send_body=False)
 
     def do_POST(self):
@@ -228,10 +230,18 @@ class MiroHTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
         except IOError:
             self.send_error(404, "File not found")
             return None
+        fs = os.fstat(f.fileno())
+        last_modified = self.date_time_string(fs.st_mtime)
+        if (self.server.allow_not_modified and code == 200 and
+                self.headers.get('if-modified-since') == last_modified):
+            f.close()
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
         self.send_response(code)
         if location_header is not None:
             self.send_header("Location", location_header)
-        fs = os.fstat(f.fileno())
         length = fs[6]
         if self.end_pos > 0:
             length = min(self.end_pos, length)
@@ -239,7 +249,7 @@ class MiroHTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
             length -= self.start_pos
         if 'content-length' not in self.server.headers_to_send:
             self.send_header("Content-Length", str(length))
-        self.send_header("Last-Modified", self.date_time_string(fs.st_mtime))
+        self.send_header("Last-Modified", last_modified)
         for key, value in self.server.headers_to_send:
             self.send_header(key, value)
         for key, value in headers_to_send:
@@ -277,6 +287,8 @@ class MiroHTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
         path = path.split('?',1)[0]
         path = path.split('#',1)[0]
         path = posixpath.normpath(urllib.unquote(path))
+        if self.server.root is not None:
+            return os.path.join(self.server.root, path.lstrip('/'))
         return resources.path("testdata/httpserver/%s" % path)
 
     def log_request(self, code):
@@ -314,6 +326,9 @@ class HTTPServer(threading.Thread):
         self.httpserver.close_connection = False
         self.httpserver.allow_resume = True
         self.httpserver.pause_after = -1
+        self.httpserver.root = None
+        self.httpserver.allow_not_modified = False
+        self.httpserver.requested_paths = []
         self.event.set()
         try:
             self.httpserver.serve_forever()
@@ -365,3 +380,15 @@ class HTTPServer(threading.Thread):
 
     def pause_after(self, bytes):
         self.httpserver.pause_after = bytes
+
+    def allow_not_modified(self):
+        """Send 304 responses for up to date If-Modified-Since requests."""
+        self.httpserver.allow_not_modified = True
+
+    def requested_paths(self):
+        """Get the paths of all the GET/HEAD requests so far."""
+        return list(self.httpserver.requested_paths)
+
+    def serve_directory(self, path):
+        """Serve files from path instead of the httpserver test data."""
+        self.httpserver.root = path
@@ -684,6 +684,74 @@ class MatrixTest(unittest.TestCase):
         self.assertEquals(m[0,0], 1)
         self.assertEquals(m[0,1], None)
 
+class LengthCache(util.Cache):
+    def __init__(self, size, weight_func=None):
+        util.Cache.__init__(self, size, weight_func)
+        self.created = []
+
+    def create_new_value(self, key):
+        self.created.append(key)
+        return 'x' * key
+
+class CacheTest(unittest.TestCase):
+    def test_get(self):
+        cache = LengthCache(3)
+        self.assertEquals(cache.get(2), 'xx')
+        self.assertEquals(cache.get(2), 'xx')
+        self.assertEquals(cache.created, [2])
+        self.assertEquals(cache.get_stats(), {'hits': 1, 'misses': 1,
+            'evictions': 0, 'count': 1, 'weight': 1})
+
+    def test_lru(self):
+        cache = LengthCache(3)
+        for key in (1, 2, 3):
+            cache.get(key)
+        # using 1 should make 2 the least recently used key
+        cache.get(1)
+        cache.get(4)
+        self.assert_(2 not in cache)
+        self.assertEquals(len(cache), 3)
+        cache.get(5)
+        self.assert_(3 not in cache)
+        for key in (1, 4, 5):
+            self.assert_(key in cache)
+        self.assertEquals(cache.get_stats()['evictions'], 2)
+
+    def test_set(self):
+        cache = LengthCache(2)
+        cache.set(1, 'a')
+        cache.set(1, 'b')
+        self.assertEquals(len(cache), 1)
+        self.assertEquals(cache.get(1), 'b')
+        self.assertEquals(cache.created, [])
+
+    def test_remove(self):
+        cache = LengthCache(2, len)
+        cache.get(2)
+        cache.remove(2)
+        self.assert_(2 not in cache)
+        self.assertEquals(cache.get_stats()['weight'], 0)
+        self.assertRaises(KeyError, cache.remove, 2)
+
+    def test_weight(self):
+        cache = LengthCache(10, len)
+        cache.get(4)
+        cache.get(5)
+        self.assertEquals(cache.get_stats()['weight'], 9)
+        # adding 3 more should evict 4, but not 5
+        cache.get(3)
+        self.assert_(4 not in cache)
+        self.assert_(5 in cache)
+        self.assertEquals(cache.get_stats()['weight'], 8)
+        # values that are too big by themselves are kept until something
+        # else is added
+        cache.get(20)
+        self.assertEquals(len(cache), 1)
+        self.assert_(20 in cache)
+        cache.get(1)
+        self.assertEquals(len(cache), 1)
+        self.assert_(1 in cache)
+
 class TestGatherSubtitlesFiles(unittest.TestCase):
     def setUp(self):
         unittest.TestCase.setUp(self)
@@ -1,7 +1,9 @@
 import os
 import shutil
+import time
 
 from miro import app
+from miro import directorysnapshot
 from miro import models
 from miro import signals
 from miro.test import mock
@@ -107,6 +109,84 @@ class WatchedFolderTest(EventLoopTest):
         self.run_pending_timeouts()
         self.check_items('b.mp3')
 
+    def age_directory(self, path):
+        """Make a directory look like it hasn't changed for a while.
+
+        Use a whole number of seconds, so that the mtime survives being
+        read back with os.stat() and set again with os.utime().
+        """
+        old_time = int(time.time()) - 60
+        os.utime(path, (old_time, old_time))
+
+    def snapshots(self):
+        return list(directorysnapshot.DirectorySnapshot.feed_impl_view(
+            self.feed.actualFeed.id))
+
+    def test_snapshot_reused(self):
+        os.mkdir(os.path.join(self.dir, 'sub'))
+        self.copy_new_file('a.mp3')
+        self.copy_new_file(os.path.join('sub', 'b.mp3'))
+        self.age_directory(os.path.join(self.dir, 'sub'))
+        self.age_directory(self.dir)
+        self.run_feed_update()
+        self.check_items('a.mp3', os.path.join('sub', 'b.mp3'))
+        self.assertEquals(len(self.snapshots()), 2)
+        # sneak a file into sub without changing its mtime.  We should use
+        # the snapshot rather than listing the directory, so we shouldn't
+        # notice it.
+        sub_mtime = int(os.stat(os.path.join(self.dir, 'sub')).st_mtime)
+        self.copy_new_file(os.path.join('sub', 'c.mp3'))
+        os.utime(os.path.join(self.dir, 'sub'), (sub_mtime, sub_mtime))
+        self.run_feed_update()
+        self.check_items('a.mp3', os.path.join('sub', 'b.mp3'))
+        # changing the mtime should make us list it again
+        os.utime(os.path.join(self.dir, 'sub'), None)
+        self.run_feed_update()
+        self.check_items('a.mp3', os.path.join('sub', 'b.mp3'),
+                         os.path.join('sub', 'c.mp3'))
+
+    def test_snapshot_recent_changes(self):
+        # if a directory changed recently, we shouldn't trust the snapshot,
+        # since its mtime might not change for the next modification
+        self.copy_new_file('a.mp3')
+        self.run_feed_update()
+        self.assertEquals([s.mtime for s in self.snapshots()], [None])
+        self.copy_new_file('b.mp3')
+        self.run_feed_update()
+        self.check_items('a.mp3', 'b.mp3')
+
+    def test_snapshot_removed_directory(self):
+        os.mkdir(os.path.join(self.dir, 'sub'))
+        self.copy_new_file(os.path.join('sub', 'a.mp3'))
+        self.copy_new_file('b.mp3')
+        self.run_feed_update()
+        self.assertEquals(len(self.snapshots()), 2)
+        shutil.rmtree(os.path.join(self.dir, 'sub'))
+        self.run_feed_update()
+        self.check_items('b.mp3')
+        self.assertEquals(len(self.snapshots()), 1)
+
+    def test_watcher_invalidates_snapshot(self):
+        self.copy_new_file('a.mp3')
+        self.age_directory(self.dir)
+        self.run_feed_update()
+        self.assertNotEquals(self.snapshots()[0].mtime, None)
+        self.copy_new_file('b.mp3')
+        self.age_directory(self.dir)
+        self.send_watcher_signal("added", "b.mp3")
+        self.run_pending_timeouts()
+        self.check_items('a.mp3', 'b.mp3')
+        self.assertEquals(self.snapshots()[0].mtime, None)
+
+    def test_snapshots_removed_with_feed(self):
+        self.copy_new_file('a.mp3')
+        self.run_feed_update()
+        self.assertEquals(len(self.snapshots()), 1)
+        feed_impl_id = self.feed.actualFeed.id
+        self.feed.remove()
+        self.assertEquals(directorysnapshot.DirectorySnapshot.feed_impl_view(
+            feed_impl_id).count(), 0)
+
     def test_double_update(self):
         # call update twice on our feed and check that we only scan the
         # directory once.
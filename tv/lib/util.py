@@ -35,7 +35,6 @@ any other Miro modules.
 
 from hashlib import sha1 as sha
 from StringIO import StringIO
-import itertools
 import logging
 import os
 import random
@@ -1093,39 +1092,124 @@ class DebuggingTimer:
         logging.timing("total time: %0.3f", clock() - self.start_time)
 
 class Cache(object):
-    def __init__(self, size):
+    """LRU cache.
+
+    Subclasses should implement create_new_value(), which get() calls to
+    create values for keys that aren't in the cache.
+
+    Entries are kept in a doubly linked list ordered by when they were last
+    used, so lookups, inserts and evictions are all O(1).
+
+    By default size is the max number of entries to keep.  If weight_func
+    is given, it's called with each value and size limits the total weight
+    of the values instead.  For example, an image cache could use the pixel
+    count of each image as its weight.
+
+    The cache tracks hits, misses and evictions.  Use get_stats() to get
+    them.
+    """
+    # indexes into the lists that we use as linked list nodes
+    PREV, NEXT, KEY, VALUE, WEIGHT = range(5)
+
+    def __init__(self, size, weight_func=None):
         self.size = size
+        self.weight_func = weight_func
         self.dict = {}
-        self.counter = itertools.count()
-        self.access_times = {}
+        # root of our circular linked list.  root[NEXT] is the least
+        # recently used entry, root[PREV] is the most recently used.
+        self.root = []
+        self.root[:] = [self.root, self.root, None, None, 0]
+        self.total_weight = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self.dict
+
+    def __len__(self):
+        return len(self.dict)
 
     def get(self, key):
-        if key in self.dict:
-            self.access_times[key] = self.counter.next()
-            return self.dict[key]
-        else:
+        try:
+            link = self.dict[key]
+        except KeyError:
+            self.misses += 1
             value = self.create_new_value(key)
             self.set(key, value)
             return value
+        else:
+            self.hits += 1
+            self._unlink(link)
+            self._append(link)
+            return link[self.VALUE]
 
     def set(self, key, value):
-        if len(self.dict) == self.size:
-            self.shrink_size()
-        self.access_times[key] = self.counter.next()
-        self.dict[key] = value
+        if key in self.dict:
+            self._remove_link(self.dict.pop(key))
+        if self.weight_func is not None:
+            weight = self.weight_func(value)
+        else:
+            weight = 1
+        link = [None, None, key, value, weight]
+        self.dict[key] = link
+        self._append(link)
+        self.total_weight += weight
+        self.shrink_size()
+
+    def remove(self, key):
+        """Remove key from the cache.
+
+        :raises KeyError: key is not in the cache
+        """
+        self._remove_link(self.dict.pop(key))
+
+    def clear(self):
+        self.dict = {}
+        self.root[:] = [self.root, self.root, None, None, 0]
+        self.total_weight = 0
 
     def shrink_size(self):
-        # shrink by LRU
-        to_sort = self.access_times.items()
-        to_sort.sort(key=lambda m: m[1])
-        new_dict = {}
-        new_access_times = {}
-        latest_times = to_sort[len(self.dict) // 2:]
-        for (key, time) in latest_times:
-            new_dict[key] = self.dict[key]
-            new_access_times[key] = time
-        self.dict = new_dict
-        self.access_times = new_access_times
+        """Evict least recently used entries until we fit in size.
+
+        We always keep the most recently used entry, even if it's too big
+        to fit by itself.
+        """
+        root = self.root
+        while self.total_weight > self.size and len(self.dict) > 1:
+            link = root[self.NEXT]
+            del self.dict[link[self.KEY]]
+            self._remove_link(link)
+            self.evictions += 1
+
+    def get_stats(self):
+        """Get a dict with stats about how the cache is doing.
+
+        Keys are hits, misses, evictions, count and weight.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'count': len(self.dict),
+            'weight': self.total_weight,
+        }
+
+    def _append(self, link):
+        # add link to the most recently used end of the list
+        root = self.root
+        last = root[self.PREV]
+        link[self.PREV] = last
+        link[self.NEXT] = root
+        last[self.NEXT] = root[self.PREV] = link
+
+    def _unlink(self, link):
+        link[self.PREV][self.NEXT] = link[self.NEXT]
+        link[self.NEXT][self.PREV] = link[self.PREV]
+
+    def _remove_link(self, link):
+        self._unlink(link)
+        self.total_weight -= link[self.WEIGHT]
+        # break references so the value can be freed right away
+        link[:] = []
 
     def create_new_value(self, val):
         raise NotImplementedError()
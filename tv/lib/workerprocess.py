@@ -30,15 +30,20 @@
 """```workerprocess.py``` -- Miro worker subprocess
 
 To avoid UI freezing due to the GIL, we farm out all CPU-intensive backend
-tasks to this process.  See #17328 for more details.  Right now this just
-includes feedparser, but we could pretty easily extend this to other tasks.
+tasks to this process.  See #17328 for more details.  Right now this
+includes feedparser, reading metadata tags with mutagen and extension hooks
+that ask to be sandboxed, but we could pretty easily extend this to other
+tasks.
 """
 
 import itertools
+import sys
 
 from miro import feedparserutil
+from miro import filetags
 from miro import subprocessmanager
 from miro import util
+from miro.clock import clock
 
 # define messages/handlers
 
@@ -54,6 +59,19 @@ class FeedparserTask(TaskMessage):
         TaskMessage.__init__(self)
         self.html = html
 
+class ReadMetadataTask(TaskMessage):
+    def __init__(self, paths):
+        TaskMessage.__init__(self)
+        self.paths = paths
+
+class HookTask(TaskMessage):
+    def __init__(self, ext_dir, hook_string, args, kwargs):
+        TaskMessage.__init__(self)
+        self.ext_dir = ext_dir
+        self.hook_string = hook_string
+        self.args = args
+        self.kwargs = kwargs
+
 class TaskResult(subprocessmanager.SubprocessResponse):
     def __init__(self, task_id, result):
         self.task_id = task_id
@@ -76,6 +94,34 @@ class WorkerProcessHandler(subprocessmanager.SubprocessHandler):
         parsed_feed['bozo_exception'] = None
         return parsed_feed
 
+    def handle_read_metadata_task(self, msg):
+        # Return a result for each path.  An IOError for one file shouldn't
+        # stop us from reading the rest of the batch.
+        results = []
+        for path in msg.paths:
+            try:
+                results.append(filetags.read_metadata(path))
+            except IOError, e:
+                results.append(e)
+        return results
+
+    def handle_hook_task(self, msg):
+        # import here, since extensionmanager imports us
+        from miro import extensionmanager
+        # extensions usually live outside of our normal sys.path
+        if msg.ext_dir is not None and msg.ext_dir not in sys.path:
+            sys.path.insert(0, msg.ext_dir)
+        hook_func = extensionmanager.load_hook_func(msg.hook_string)
+        # Time the call here, so that the time the task spent waiting in
+        # the queue doesn't count against the hook's budget.
+        start = clock()
+        try:
+            retval = hook_func(*msg.args, **msg.kwargs)
+        except StandardError, e:
+            e.hook_time = clock() - start
+            raise
+        return retval, clock() - start
+
 class WorkerProcessResponder(subprocessmanager.SubprocessResponder):
     def on_startup(self):
         _task_queue.run_pending_tasks()
@@ -131,3 +177,28 @@ def run_feedparser(html, callback, errback):
     """Run feedparser on a chunk of html."""
     msg = FeedparserTask(html)
     _task_queue.add_task(msg, callback, errback)
+
+def run_read_metadata(paths, callback, errback):
+    """Read the metadata tags for a list of files.
+
+    callback will be passed a list containing a result for each path.  Each
+    result is either the return value of filetags.read_metadata(), or an
+    IOError if the file couldn't be read.
+    """
+    msg = ReadMetadataTask(paths)
+    _task_queue.add_task(msg, callback, errback)
+
+def run_hook(ext_dir, hook_string, args, kwargs, callback, errback):
+    """Call an extension hook function.
+
+    :param ext_dir: directory the extension lives in
+    :param hook_string: string specifying the hook function, see
+                        extensionmanager.load_hook_func()
+
+    callback will be passed a (return value, seconds) tuple, where seconds
+    is how long the hook function took to run.  If the hook function raised
+    an exception, errback gets it with the time taken stored in its
+    hook_time attribute.
+    """
+    msg = HookTask(ext_dir, hook_string, args, kwargs)
+    _task_queue.add_task(msg, callback, errback)
@@ -56,6 +56,8 @@ def set_renderer(modname):
         module = getattr(pkg.plat.renderers, modname)
         app.audio_renderer, app.video_renderer = module.make_renderers()
         app.movie_data_program_info = module.movie_data_program_info
+        app.movie_data_server_info = getattr(module,
+                                             'movie_data_server_info', None)
         app.get_item_type = module.get_item_type
         logging.info("set_renderer: successfully loaded %s", modname)
     except StandardError:
@@ -73,6 +73,8 @@ class Extractor:
         self.grabit = False
         self.first_pause = True
         self.doing_thumbnailing = False
+        self.finished = False
+        self.timeout_id = None
         self.success = False
         self.duration = -1
         self.buffer_probes = {}
@@ -86,6 +88,7 @@ class Extractor:
         self.pipeline.set_property("audio-sink", self.audiosink)
 
         self.thumbnail_pipeline = None
+        self.thumbnail_bus = None
 
         self.bus = self.pipeline.get_bus()
         self.bus.add_signal_watch()
@@ -131,10 +134,19 @@ class Extractor:
                         self.done()
 
     def taking_too_long(self):
+        self.timeout_id = None
         self.disconnect()
         self.done()
+        return False
 
     def done(self):
+        # done() can be triggered more than once, for example by
+        # taking_too_long() firing after we've already made the
+        # thumbnail.  Only report the first result.
+        if self.finished:
+            return
+        self.finished = True
+        self.cleanup_thumbnail_pipeline()
         if self.saw_video_tag:
             media_type = 'video'
         elif self.saw_audio_tag:
@@ -206,7 +218,7 @@ class Extractor:
         # so we cap that at 3 seconds and if we hit that point, we
         # just quit out with whatever we have.
 
-        gobject.timeout_add(3000, self.taking_too_long)
+        self.timeout_id = gobject.timeout_add(3000, self.taking_too_long)
 
         return False
 
@@ -218,6 +230,8 @@ class Extractor:
     def buffer_probe_handler_real(self, pad, buff, name):
         """Capture buffers as gdk_pixbufs when told to.
         """
+        if self.finished:
+            return False
         try:
             caps = buff.caps
             if caps is None:
@@ -270,8 +284,63 @@ class Extractor:
 
         if self.bus is not None:
             self.bus.disconnect(self.watch_id)
+            self.bus.remove_signal_watch()
             self.bus = None
 
+    def cleanup_thumbnail_pipeline(self):
+        """Free up the thumbnailing resources.
+
+        When we're running as a server, the process sticks around after
+        we're done with a file, so we can't count on exiting to do this.
+        """
+        if self.timeout_id is not None:
+            gobject.source_remove(self.timeout_id)
+            self.timeout_id = None
+        if self.thumbnail_bus is not None:
+            self.thumbnail_bus.disconnect(self.thumbnail_watch_id)
+            self.thumbnail_bus.remove_signal_watch()
+            self.thumbnail_bus = None
+        if self.thumbnail_pipeline is not None:
+            self.thumbnail_pipeline.set_state(gst.STATE_NULL)
+            self.thumbnail_pipeline = None
+
+
+class ExtractorServer:
+    """Handles extraction jobs from Miro for the lifetime of the process.
+
+    Each job is a single line on stdin, containing the URL-quoted media
+    path and thumbnail path separated by a space.  We print the same
+    output as we do when handling a single file, followed by a
+    "Miro-Movie-Data-Done" line.  Jobs are handled one at a time.  We
+    quit when stdin is closed.
+    """
+    def __init__(self):
+        self.extractor = None
+        gobject.io_add_watch(sys.stdin, gobject.IO_IN | gobject.IO_HUP,
+                             self.on_stdin)
+
+    def on_stdin(self, source, condition):
+        line = sys.stdin.readline()
+        if not line:
+            gtk.main_quit()
+            return False
+        try:
+            movie_path, thumbnail_path = [urllib.unquote(path)
+                                          for path in line.split()]
+        except ValueError:
+            print "Miro-Movie-Data-Done"
+            sys.stdout.flush()
+            return True
+        self.extractor = Extractor(movie_path, thumbnail_path,
+                                   self.handle_result)
+        return True
+
+    def handle_result(self, duration, success, media_type):
+        self.extractor = None
+        print_result(duration, success, media_type)
+        print "Miro-Movie-Data-Done"
+        sys.stdout.flush()
+
 
 def make_verbose():
     import logging
@@ -290,7 +359,7 @@ def make_verbose():
             Extractor.__dict__[mem] = wrap_func(fun)
 
 
-def handle_result(duration, success, media_type):
+def print_result(duration, success, media_type):
     if duration != -1:
         print "Miro-Movie-Data-Length: %s" % (duration / 1000000)
     else:
@@ -300,6 +369,10 @@ def handle_result(duration, success, media_type):
     else:
         print "Miro-Movie-Data-Thumbnail: Failure"
     print "Miro-Movie-Data-Type: %s" % media_type
+
+
+def handle_result(duration, success, media_type):
+    print_result(duration, success, media_type)
     sys.exit(0)
 
 
@@ -308,8 +381,16 @@ def main(argv):
         make_verbose()
         argv.remove("--verbose")
 
+    if "--server" in argv:
+        os.nice(19)
+        server = ExtractorServer()
+        gtk.gdk.threads_init()
+        gtk.main()
+        return 0
+
     if len(argv) < 2:
-        print "Syntax: gst_extractor.py <media-file> [path-to-thumbnail]"
+        print ("Syntax: gst_extractor.py <media-file> [path-to-thumbnail]\n"
+               "        gst_extractor.py --server")
         return 1
 
     if len(argv) < 3:
@@ -50,6 +50,11 @@ def movie_data_program_info(movie_path, thumbnail_path):
     return ((sys.executable, extractor_path, movie_path, thumbnail_path),
             None)
 
+def movie_data_server_info():
+    extractor_path = os.path.join(os.path.split(__file__)[0],
+            "gst_extractor.py")
+    return ((sys.executable, extractor_path, "--server"), None)
+
 class LinuxSinkFactory(renderer.SinkFactory):
     """Linux class to create gstreamer audio/video sinks.
 
@@ -330,6 +330,23 @@ def movie_data_program_info(movie_path, thumbnail_path):
     from miro import app
     return app.movie_data_program_info(movie_path, thumbnail_path)
 
+def movie_data_server_info():
+    """Returns the information needed to run the media item info
+    extractor program as a long-lived server.
+
+    The server reads one job per line from stdin.  Each line contains the
+    media item path and the thumbnail path, URL-quoted and separated by a
+    space.  The server prints the same output that the regular program
+    does, followed by a ``Miro-Movie-Data-Done`` line.
+
+    :returns: tuple of ``(command-line, environment)``, or None if the
+        current renderer doesn't support server mode.
+    """
+    from miro import app
+    if app.movie_data_server_info is None:
+        return None
+    return app.movie_data_server_info()
+
 def miro_helper_program_info():
     """Get the command line to launch miro_helper.py """
 
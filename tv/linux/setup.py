@@ -566,6 +566,7 @@ setup(name='miro',
         'miro.frontends',
         'miro.frontends.cli',
         'miro.frontends.profilewidgets',
+        'miro.frontends.server',
         'miro.frontends.shell',
         'miro.frontends.widgets',
         'miro.frontends.widgets.gst',
@@ -99,6 +99,15 @@ class Image(object):
         ratio = min(width / self.width, height / self.height)
         return self.resize(ratio * self.width, ratio * self.height)
 
+    def save(self, path):
+        """Save the image to path in PNG format."""
+        rep = NSBitmapImageRep.imageRepWithData_(
+                self.nsimage.TIFFRepresentation())
+        data = rep.representationUsingType_properties_(NSPNGFileType, None)
+        if data is None or not data.writeToFile_atomically_(
+                filename_to_unicode(path), YES):
+            raise IOError("error saving image to %s" % path)
+
 class ResizedImage(Image):
     def __init__(self, image, width, height):
         nsimage = image.nsimage.copy()
@@ -449,6 +449,10 @@ def movie_data_program_info(movie_path, thumbnail_path):
     cmd_line, env = _get_cmd_line_and_env_for_script('qt_extractor.py')
     return (cmd_line + (movie_path, thumbnail_path), env)
 
+def movie_data_server_info():
+    # qt_extractor.py only handles one file per process
+    return None
+
 def miro_helper_program_info():
     cmd_line = _app_command_line() + [u'--miro-helper']
     env = {
@@ -284,6 +284,7 @@ class MiroBuild (py2app):
             'miro.frontends',
             'miro.frontends.cli',
             'miro.frontends.profilewidgets',
+            'miro.frontends.server',
             'miro.frontends.shell',
             'miro.frontends.widgets',
             'pyechonest',
@@ -402,6 +402,10 @@ def movie_data_program_info(movie_path, thumbnail_path):
     env = None
     return (cmd_line, env)
 
+def movie_data_server_info():
+    # Miro_MovieData.exe only handles one file per process
+    return None
+
 def get_logical_cpu_count():
     try:
         import multiprocessing